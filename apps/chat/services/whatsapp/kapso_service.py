@@ -3,6 +3,8 @@ from typing import Dict, List
 from django.conf import settings
 import logging
 
+from apps.core.http import get_shared_session
+
 logger = logging.getLogger(__name__)
 
 
@@ -11,6 +13,9 @@ class KapsoAPIService:
     Servicio para interactuar con la API de Kapso WhatsApp Business
     """
 
+    # Timeout de conexión; cada llamada define su timeout de lectura
+    CONNECT_TIMEOUT = 5
+
     def __init__(self, api_token: str, base_url: str = None):
         self.api_token = api_token
         self.base_url = base_url or getattr(settings, 'KAPSO_API_BASE_URL', 'https://app.kapso.ai/api/v1')
@@ -18,6 +23,9 @@ class KapsoAPIService:
             'X-API-Key': api_token,
             'Content-Type': 'application/json'
         }
+        # Sesión compartida por el proceso (pool de conexiones keep-alive).
+        # Los envíos no son idempotentes: solo se reintentan errores de conexión.
+        self.session = get_shared_session('kapso', pool_maxsize=10)
 
     def send_text_message(self, phone_number: str, message: str, conversation_id: str) -> Dict:
         """
@@ -41,11 +49,11 @@ class KapsoAPIService:
         try:
             url = f'{self.base_url}/whatsapp_conversations/{conversation_id}/whatsapp_messages'
 
-            response = requests.post(
+            response = self.session.post(
                 url,
                 headers=self.headers,
                 json=payload,
-                timeout=30
+                timeout=(self.CONNECT_TIMEOUT, 30)
             )
 
             if response.status_code in [200, 201]:
@@ -92,11 +100,11 @@ class KapsoAPIService:
         try:
             url = f'{self.base_url}/whatsapp_conversations/{conversation_id}/whatsapp_messages'
 
-            response = requests.post(
+            response = self.session.post(
                 url,
                 headers=self.headers,
                 json=payload,
-                timeout=60  # Timeout mayor para media
+                timeout=(self.CONNECT_TIMEOUT, 60)  # Timeout mayor para media
             )
 
             if response.status_code in [200, 201]:
@@ -141,11 +149,11 @@ class KapsoAPIService:
         }
 
         try:
-            response = requests.post(
+            response = self.session.post(
                 f'{self.base_url}/whatsapp/messages',
                 headers=self.headers,
                 json=payload,
-                timeout=30
+                timeout=(self.CONNECT_TIMEOUT, 30)
             )
 
             if response.status_code in [200, 201]:
@@ -173,10 +181,10 @@ class KapsoAPIService:
             Dict con información de la conversación
         """
         try:
-            response = requests.get(
+            response = self.session.get(
                 f'{self.base_url}/whatsapp_conversations/{conversation_id}',
                 headers=self.headers,
-                timeout=30
+                timeout=(self.CONNECT_TIMEOUT, 30)
             )
 
             if response.status_code == 200:
@@ -198,10 +206,10 @@ class KapsoAPIService:
             Dict con estado del mensaje
         """
         try:
-            response = requests.get(
+            response = self.session.get(
                 f'{self.base_url}/whatsapp_messages/{message_id}',
                 headers=self.headers,
-                timeout=30
+                timeout=(self.CONNECT_TIMEOUT, 30)
             )
 
             if response.status_code == 200:
@@ -229,11 +237,11 @@ class KapsoAPIService:
         }
 
         try:
-            response = requests.post(
+            response = self.session.post(
                 f'{self.base_url}/whatsapp_conversations',
                 headers=self.headers,
                 json=payload,
-                timeout=30
+                timeout=(self.CONNECT_TIMEOUT, 30)
             )
 
             if response.status_code in [200, 201]:
@@ -267,11 +275,11 @@ class KapsoAPIService:
                 'limit': limit
             }
 
-            response = requests.get(
+            response = self.session.get(
                 f'{self.base_url}/whatsapp_conversations',
                 headers=self.headers,
                 params=params,
-                timeout=30
+                timeout=(self.CONNECT_TIMEOUT, 30)
             )
 
             if response.status_code == 200:
@@ -318,10 +326,10 @@ class KapsoAPIService:
             Dict con estado del servicio
         """
         try:
-            response = requests.get(
+            response = self.session.get(
                 f'{self.base_url}/health',
                 headers=self.headers,
-                timeout=10
+                timeout=(self.CONNECT_TIMEOUT, 10)
             )
 
             return {
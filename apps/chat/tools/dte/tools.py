@@ -9,6 +9,7 @@ from datetime import datetime, timedelta
 import logging
 
 from apps.documents.models import Document, DocumentType
+from apps.documents.rollups import summarize
 from apps.companies.models import Company
 
 logger = logging.getLogger(__name__)
@@ -205,7 +206,7 @@ def search_documents_by_criteria(
                 }
 
         # Limitar resultados
-        documents = queryset.order_by('-issue_date')[:limit]
+        documents = queryset.select_related('document_type').order_by('-issue_date')[:limit]
 
         results = []
         for doc in documents:
@@ -240,6 +241,100 @@ def search_documents_by_criteria(
         }
 
 
+def _companies_matching_rut(companies: List[Company], rut: str) -> List[Company]:
+    """Empresas cuyo RUT (con o sin dígito verificador) coincide con `rut`"""
+    clean_rut = rut.replace('.', '').replace('-', '').upper()
+    return [
+        company for company in companies
+        if clean_rut in (company.tax_id.split('-')[0], company.tax_id.replace('-', '').upper())
+    ]
+
+
+def _grouped_document_rows(queryset) -> List[Dict[str, Any]]:
+    """
+    Totales de documentos en una sola consulta agrupada por tipo de documento y
+    estado, con las mismas claves que las filas de summarize().
+    """
+    return list(
+        queryset.order_by().values('document_type', 'status').annotate(
+            count=Count('id'),
+            total=Sum('total_amount'),
+            net=Sum('net_amount'),
+            tax=Sum('tax_amount')
+        )
+    )
+
+
+def _fold_document_rows(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Acumula filas agrupadas por (document_type, status) en totales por estado,
+    por tipo de documento activo y generales.
+
+    Returns:
+        Dict con by_status ({status: count}), by_type ([(DocumentType, count, total)])
+        y amounts ({total, net, tax})
+    """
+    status_counts = {}
+    type_counts = {}
+    type_totals = {}
+    amounts = {'total': 0, 'net': 0, 'tax': 0}
+    for row in rows:
+        status_counts[row['status']] = status_counts.get(row['status'], 0) + row['count']
+        type_counts[row['document_type']] = type_counts.get(row['document_type'], 0) + row['count']
+        type_totals[row['document_type']] = type_totals.get(row['document_type'], 0) + (row['total'] or 0)
+        for metric in amounts:
+            amounts[metric] += row[metric] or 0
+
+    by_type = [
+        (doc_type, type_counts[doc_type.id], type_totals[doc_type.id])
+        for doc_type in DocumentType.objects.filter(id__in=type_counts.keys(), is_active=True)
+    ]
+
+    return {
+        'by_status': status_counts,
+        'by_type': by_type,
+        'amounts': amounts
+    }
+
+
+def _document_stats(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Estadísticas de documentos a partir de filas agrupadas por tipo de documento
+    y estado, vengan del rollup mensual (summarize) o de _grouped_document_rows.
+
+    Args:
+        rows: Filas con document_type, status, count, total, net y tax
+
+    Returns:
+        Dict con total_documents, by_status, by_type y amounts
+    """
+    folded = _fold_document_rows(rows)
+
+    return {
+        'total_documents': sum(folded['by_status'].values()),
+        'by_status': {
+            status_code: {
+                'name': status_name,
+                'count': folded['by_status'].get(status_code, 0)
+            }
+            for status_code, status_name in Document.STATUS_CHOICES
+        },
+        'by_type': [
+            {
+                'code': doc_type.code,
+                'name': doc_type.name,
+                'count': count
+            }
+            for doc_type, count, _ in folded['by_type']
+        ],
+        'amounts': {
+            'total_amount': float(folded['amounts']['total']),
+            'net_amount': float(folded['amounts']['net']),
+            'tax_amount': float(folded['amounts']['tax'])
+        }
+    }
+
+
 @tool
 def get_document_stats_summary(
     company_rut: Optional[str] = None,
@@ -272,58 +367,32 @@ def get_document_stats_summary(
                 'stats': {}
             }
 
-        # RESTRICCIÓN DE SEGURIDAD: Filtrar solo por empresas del usuario usando FK
-        queryset = Document.objects.filter(company_id__in=user_companies)
-
-        # Filtrar por empresa específica (si se proporciona por RUT)
-        if company_rut:
-            clean_rut = company_rut.replace('.', '').replace('-', '')
-            queryset = queryset.filter(
-                Q(issuer_company_rut=clean_rut) | Q(recipient_rut=clean_rut)
-            )
-
-        # Estadísticas generales
-        total_docs = queryset.count()
-
-        # Por estado
-        status_stats = {}
-        for status_code, status_name in Document.STATUS_CHOICES:
-            count = queryset.filter(status=status_code).count()
-            status_stats[status_code] = {
-                'name': status_name,
-                'count': count
-            }
+        # RESTRICCIÓN DE SEGURIDAD: Filtrar solo por empresas del usuario
+        companies = list(Company.objects.filter(id__in=user_companies))
 
-        # Por tipo de documento
-        type_stats = []
-        for doc_type in DocumentType.objects.filter(is_active=True):
-            count = queryset.filter(document_type=doc_type).count()
-            if count > 0:
-                type_stats.append({
-                    'code': doc_type.code,
-                    'name': doc_type.name,
-                    'count': count
-                })
-
-        # Montos totales
-        totals = queryset.aggregate(
-            total_amount=Sum('total_amount'),
-            net_amount=Sum('net_amount'),
-            tax_amount=Sum('tax_amount')
-        )
+        if not company_rut:
+            stats = _document_stats(summarize(companies, group_by=('document_type', 'status')))
+        else:
+            own_companies = _companies_matching_rut(companies, company_rut)
+
+            if own_companies:
+                # RUT de una empresa del usuario: sus documentos emitidos y recibidos
+                stats = _document_stats(summarize(
+                    own_companies,
+                    group_by=('document_type', 'status'),
+                    direction__in=('issued', 'received')
+                ))
+            else:
+                # RUT de una contraparte: el rollup no guarda contrapartes, se agrupa sobre documentos
+                clean_rut = company_rut.replace('.', '').replace('-', '').upper()
+                queryset = Document.objects.filter(company_id__in=user_companies).filter(
+                    Q(issuer_company_rut=clean_rut) | Q(recipient_rut=clean_rut)
+                )
+                stats = _document_stats(_grouped_document_rows(queryset))
 
         return {
             'success': True,
-            'stats': {
-                'total_documents': total_docs,
-                'by_status': status_stats,
-                'by_type': type_stats,
-                'amounts': {
-                    'total_amount': float(totals['total_amount'] or 0),
-                    'net_amount': float(totals['net_amount'] or 0),
-                    'tax_amount': float(totals['tax_amount'] or 0)
-                }
-            }
+            'stats': stats
         }
     except Exception as e:
         logger.error(f"Error getting document stats: {e}")
@@ -458,39 +527,29 @@ def get_recent_documents_summary(
         # Calcular fecha desde
         date_from = (datetime.now() - timedelta(days=days_back)).date()
 
-        queryset = Document.objects.filter(issue_date__gte=date_from)
-
         # RESTRICCIÓN DE SEGURIDAD: Filtrar solo por empresas del usuario
-        if user_companies:
-            company_filter = Q()
-            for user_company_rut in user_companies:
-                company_filter |= (
-                    Q(issuer_company_rut=user_company_rut) | Q(recipient_rut=user_company_rut)
-                )
-            queryset = queryset.filter(company_filter)
+        queryset = Document.objects.filter(company_id__in=user_companies, issue_date__gte=date_from)
 
         # Filtrar por empresa específica (si se proporciona)
         if company_rut:
-            clean_rut = company_rut.replace('.', '').replace('-', '')
             # Verificar que el usuario tenga acceso a esta empresa
-            if user_companies and clean_rut not in user_companies:
+            own_companies = _companies_matching_rut(
+                list(Company.objects.filter(id__in=user_companies)), company_rut
+            )
+            if not own_companies:
                 return {
                     'success': False,
                     'error': 'No tienes acceso a los documentos de esta empresa',
                     'recent_documents': []
                 }
+            queryset = queryset.filter(company__in=own_companies)
 
-            if document_type == 'received':
-                queryset = queryset.filter(recipient_rut=clean_rut)
-            elif document_type == 'issued':
-                queryset = queryset.filter(issuer_company_rut=clean_rut)
-            else:
-                queryset = queryset.filter(
-                    Q(issuer_company_rut=clean_rut) | Q(recipient_rut=clean_rut)
-                )
+        # Filtrar por dirección persistida (recibidos / emitidos)
+        if document_type in ('received', 'issued'):
+            queryset = queryset.filter(direction=document_type)
 
         # Ordenar por fecha más reciente
-        recent_docs = queryset.order_by('-issue_date', '-created_at')[:limit]
+        recent_docs = queryset.select_related('document_type').order_by('-issue_date', '-created_at')[:limit]
 
         # Detalles de documentos
         documents_detail = []
@@ -520,39 +579,27 @@ def get_recent_documents_summary(
                 'days_ago': (datetime.now().date() - doc.issue_date).days
             })
 
-        # Estadísticas del período
-        period_stats = queryset.aggregate(
-            total_documents=Count('id'),
-            total_amount=Sum('total_amount'),
-            net_amount=Sum('net_amount'),
-            tax_amount=Sum('tax_amount')
-        )
+        # Estadísticas del período, por tipo y por estado en una sola consulta agrupada
+        folded = _fold_document_rows(_grouped_document_rows(queryset))
 
-        # Resumen por tipo
-        type_summary = []
-        for doc_type in DocumentType.objects.filter(is_active=True):
-            count = queryset.filter(document_type=doc_type).count()
-            if count > 0:
-                type_total = queryset.filter(document_type=doc_type).aggregate(
-                    total=Sum('total_amount')
-                )['total'] or 0
-
-                type_summary.append({
-                    'code': doc_type.code,
-                    'name': doc_type.name,
-                    'count': count,
-                    'total_amount': float(type_total)
-                })
-
-        # Resumen por estado
-        status_summary = {}
-        for status_code, status_name in Document.STATUS_CHOICES:
-            count = queryset.filter(status=status_code).count()
-            if count > 0:
-                status_summary[status_code] = {
-                    'name': status_name,
-                    'count': count
-                }
+        type_summary = [
+            {
+                'code': doc_type.code,
+                'name': doc_type.name,
+                'count': count,
+                'total_amount': float(total)
+            }
+            for doc_type, count, total in folded['by_type']
+        ]
+
+        status_summary = {
+            status_code: {
+                'name': status_name,
+                'count': folded['by_status'][status_code]
+            }
+            for status_code, status_name in Document.STATUS_CHOICES
+            if folded['by_status'].get(status_code)
+        }
 
         return {
             'success': True,
@@ -562,10 +609,10 @@ def get_recent_documents_summary(
                 'date_to': datetime.now().date().strftime('%Y-%m-%d')
             },
             'summary': {
-                'total_documents': period_stats['total_documents'],
-                'total_amount': float(period_stats['total_amount'] or 0),
-                'net_amount': float(period_stats['net_amount'] or 0),
-                'tax_amount': float(period_stats['tax_amount'] or 0)
+                'total_documents': sum(folded['by_status'].values()),
+                'total_amount': float(folded['amounts']['total']),
+                'net_amount': float(folded['amounts']['net']),
+                'tax_amount': float(folded['amounts']['tax'])
             },
             'by_type': type_summary,
             'by_status': status_summary,
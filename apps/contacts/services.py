@@ -0,0 +1,316 @@
+"""
+Derivación de contactos (clientes y proveedores) desde documentos tributarios
+
+Los contactos se derivan por lotes: se juntan las contrapartes únicas de un
+conjunto de documentos y se escriben con un solo upsert por empresa, en vez
+de un get_or_create por documento guardado.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
+
+from django.db import transaction
+from django.db.models import Max, QuerySet
+from django.utils import timezone
+
+from apps.documents.models import Document
+from .models import Contact
+
+logger = logging.getLogger(__name__)
+
+# Campos que el upsert puede modificar en un contacto existente. Los roles
+# (is_client / is_provider) no se sobrescriben: se activan aparte con un UPDATE aditivo
+UPSERT_FIELDS = ['name', 'address', 'category', 'updated_at']
+CONTACT_ROLES = ('is_client', 'is_provider')
+
+_signal_state = threading.local()
+
+
+@contextmanager
+def suppress_contact_signal():
+    """
+    Desactiva la derivación de contactos del post_save de Document en el hilo actual.
+
+    Se usa en la ingesta masiva, que deriva los contactos del lote completo al final.
+    """
+    previous = getattr(_signal_state, 'suppressed', False)
+    _signal_state.suppressed = True
+    try:
+        yield
+    finally:
+        _signal_state.suppressed = previous
+
+
+def contact_signal_suppressed() -> bool:
+    """True si la señal de contactos está desactivada en el hilo actual"""
+    return getattr(_signal_state, 'suppressed', False)
+
+
+def format_rut(rut, dv) -> str:
+    """
+    Formatea el RUT al formato estándar XX.XXX.XXX-X
+    """
+    try:
+        # Limpiar y formatear RUT
+        clean_rut = str(rut).strip().replace('.', '').replace('-', '')
+        clean_dv = str(dv).strip().upper()
+
+        # Formatear con puntos
+        if len(clean_rut) >= 7:
+            formatted = f"{clean_rut[:-6]}.{clean_rut[-6:-3]}.{clean_rut[-3:]}-{clean_dv}"
+        else:
+            formatted = f"{clean_rut}-{clean_dv}"
+
+        return formatted
+    except (ValueError, IndexError):
+        return f"{rut}-{dv}"
+
+
+def is_valid_rut(tax_id: str) -> bool:
+    """
+    Validación básica de formato de RUT chileno
+    """
+    if not tax_id:
+        return False
+
+    # Verificar formato básico
+    parts = tax_id.split('-')
+    if len(parts) != 2:
+        return False
+
+    rut_part = parts[0].replace('.', '')
+    dv_part = parts[1].upper()
+
+    # Verificar que la parte numérica sea válida
+    if not rut_part.isdigit() or len(rut_part) < 7 or len(rut_part) > 8:
+        return False
+
+    # Verificar que el DV sea válido
+    if len(dv_part) != 1 or dv_part not in '0123456789K':
+        return False
+
+    return True
+
+
+def document_contact_direction(document: Document) -> str:
+    """
+    Dirección del documento para derivar contactos: la persistida por DTEMapper,
+    o la calculada si el documento no la tiene.
+    """
+    if document.direction != 'unknown':
+        return document.direction
+    return document.document_direction
+
+
+def add_counterparty(
+    counterparties: Dict[str, Dict],
+    direction: str,
+    rut,
+    dv,
+    name: Optional[str] = '',
+    address: Optional[str] = '',
+    category: Optional[str] = ''
+) -> bool:
+    """
+    Acumula una contraparte en el dict del lote, fusionando roles y datos.
+
+    En documentos emitidos la contraparte (receptor) es cliente; en los
+    recibidos la contraparte (emisor) es proveedor.
+
+    Returns:
+        False si el RUT es inválido o la dirección no permite asignar un rol
+    """
+    if direction not in ('issued', 'received'):
+        return False
+
+    tax_id = format_rut(rut, dv)
+    if not is_valid_rut(tax_id):
+        logger.debug(f"RUT de contraparte inválido: {tax_id}")
+        return False
+
+    entry = counterparties.setdefault(tax_id, {
+        'name': '',
+        'address': '',
+        'category': '',
+        'is_client': False,
+        'is_provider': False,
+    })
+    if direction == 'issued':
+        entry['is_client'] = True
+    else:
+        entry['is_provider'] = True
+
+    for field, value in (('name', name), ('address', address), ('category', category)):
+        if value and not entry[field]:
+            entry[field] = value
+    return True
+
+
+def counterparties_from_documents(documents: Iterable[Document]) -> Dict[str, Dict]:
+    """
+    Contrapartes únicas de documentos ya cargados en memoria (p. ej. un lote de DTEs).
+
+    Returns:
+        Dict tax_id -> datos de la contraparte
+    """
+    counterparties: Dict[str, Dict] = {}
+    for document in documents:
+        direction = document_contact_direction(document)
+        if direction == 'issued':
+            add_counterparty(
+                counterparties, direction,
+                document.recipient_rut, document.recipient_dv,
+                document.recipient_name, document.recipient_address
+            )
+        elif direction == 'received':
+            add_counterparty(
+                counterparties, direction,
+                document.issuer_company_rut, document.issuer_company_dv,
+                document.issuer_name, document.issuer_address, document.issuer_activity
+            )
+    return counterparties
+
+
+def counterparties_from_queryset(documents: QuerySet) -> Dict[str, Dict]:
+    """
+    Contrapartes únicas de un queryset de documentos, agregadas en la base de datos.
+
+    Agrupa por RUT de la contraparte (una fila por RUT y dirección) en vez de
+    recorrer cada documento. Los documentos sin dirección conocida se omiten;
+    ver `manage.py backfill_document_direction`.
+
+    Returns:
+        Dict tax_id -> datos de la contraparte
+    """
+    counterparties: Dict[str, Dict] = {}
+    documents = documents.order_by()
+
+    clients = documents.filter(direction='issued').values('recipient_rut', 'recipient_dv').annotate(
+        name=Max('recipient_name'),
+        address=Max('recipient_address'),
+    )
+    for row in clients:
+        add_counterparty(
+            counterparties, 'issued',
+            row['recipient_rut'], row['recipient_dv'], row['name'], row['address']
+        )
+
+    providers = documents.filter(direction='received').values('issuer_company_rut', 'issuer_company_dv').annotate(
+        name=Max('issuer_name'),
+        address=Max('issuer_address'),
+        category=Max('issuer_activity'),
+    )
+    for row in providers:
+        add_counterparty(
+            counterparties, 'received',
+            row['issuer_company_rut'], row['issuer_company_dv'],
+            row['name'], row['address'], row['category']
+        )
+
+    return counterparties
+
+
+def _merge_contact(contact: Contact, data: Dict) -> bool:
+    """
+    Aplica los datos de la contraparte a un contacto existente.
+
+    Los roles son aditivos y los datos solo se completan si están vacíos,
+    para no pisar lo que el usuario editó.
+
+    Returns:
+        True si el contacto cambió
+    """
+    changed = False
+    for role in CONTACT_ROLES:
+        if data[role] and not getattr(contact, role):
+            setattr(contact, role, True)
+            changed = True
+    for field in ('name', 'address', 'category'):
+        if data[field] and not getattr(contact, field):
+            setattr(contact, field, data[field])
+            changed = True
+    return changed
+
+
+def upsert_contacts(company, counterparties: Dict[str, Dict], dry_run: bool = False) -> Dict[str, int]:
+    """
+    Crea o actualiza los contactos de una empresa en un solo upsert.
+
+    Lee en una consulta los contactos existentes de esos RUTs (bloqueados con
+    select_for_update hasta escribir), fusiona en memoria y escribe solo los
+    nuevos o modificados con bulk_create(update_conflicts=True) sobre
+    (company, tax_id). Los roles se activan después con un UPDATE que nunca
+    los desactiva, así dos ingestiones concurrentes no se pisan.
+
+    Args:
+        company: Empresa propietaria de los contactos
+        counterparties: Dict tax_id -> datos (de counterparties_from_*)
+        dry_run: Si True, calcula los cambios sin escribir
+
+    Returns:
+        Dict con contactos creados y actualizados
+    """
+    stats = {'created': 0, 'updated': 0}
+    if not counterparties:
+        return stats
+
+    with transaction.atomic():
+        existing_contacts = Contact.objects.filter(company=company, tax_id__in=list(counterparties))
+        if not dry_run:
+            existing_contacts = existing_contacts.select_for_update()
+        existing = {contact.tax_id: contact for contact in existing_contacts}
+        rows = _contact_rows(company, counterparties, existing, stats)
+
+        if rows and not dry_run:
+            Contact.objects.bulk_create(
+                rows,
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=['company', 'tax_id'],
+                update_fields=UPSERT_FIELDS,
+            )
+            # Roles aditivos en SQL: cubre también un contacto que otra
+            # ingestión insertó después de la lectura
+            for role in CONTACT_ROLES:
+                tax_ids = [row.tax_id for row in rows if getattr(row, role)]
+                if tax_ids:
+                    Contact.objects.filter(
+                        company=company, tax_id__in=tax_ids, **{role: False}
+                    ).update(**{role: True})
+
+    if rows:
+        logger.info(
+            f"👥 Contactos de {company.tax_id}: {stats['created']} creados, {stats['updated']} actualizados"
+        )
+    return stats
+
+
+def _contact_rows(company, counterparties: Dict[str, Dict], existing: Dict[str, Contact], stats: Dict[str, int]):
+    """Filas a escribir (solo contactos nuevos o modificados), contando en `stats`"""
+    now = timezone.now()
+    rows = []
+    for tax_id, data in counterparties.items():
+        contact = existing.get(tax_id)
+        if contact is None:
+            contact = Contact(company=company, tax_id=tax_id, is_active=True, created_at=now)
+            _merge_contact(contact, data)
+            stats['created'] += 1
+        elif _merge_contact(contact, data):
+            stats['updated'] += 1
+        else:
+            continue
+
+        rows.append(Contact(
+            company=company,
+            tax_id=tax_id,
+            name=contact.name[:255],
+            address=contact.address,
+            category=contact.category[:100],
+            is_client=contact.is_client,
+            is_provider=contact.is_provider,
+            is_active=contact.is_active,
+            created_at=contact.created_at or now,
+            updated_at=now,
+        ))
+    return rows
@@ -1,3 +1,89 @@
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+
 from django.test import TestCase
 
-# Create your tests here.
+from apps.companies.models import Company
+from apps.documents.models import Document, DocumentType
+from .models import Contact
+from . import services
+from .services import counterparties_from_queryset, suppress_contact_signal, upsert_contacts
+
+
+class ContactDerivationTestCase(TestCase):
+    """
+    Tests de la derivación de contactos por lote desde documentos
+    """
+
+    def setUp(self):
+        self.company = Company.objects.create(
+            business_name='Test Company',
+            tax_id='76543210-K',
+            email='test@company.com'
+        )
+        self.document_type = DocumentType.objects.create(code=33, name='Factura Electrónica', category='invoice')
+
+    def create_document(self, folio, counterparty, issued=True, name='Contraparte'):
+        own = ('76543210', 'K')
+        issuer, recipient = (own, counterparty) if issued else (counterparty, own)
+        return Document.objects.create(
+            company=self.company,
+            issuer_company_rut=issuer[0],
+            issuer_company_dv=issuer[1],
+            issuer_name=name if not issued else 'Test Company',
+            issuer_address='Dirección',
+            issuer_activity='Servicios' if not issued else '',
+            recipient_rut=recipient[0],
+            recipient_dv=recipient[1],
+            recipient_name=name if issued else 'Test Company',
+            document_type=self.document_type,
+            folio=folio,
+            issue_date=date(2024, 1, 5),
+            direction='issued' if issued else 'received',
+            total_amount=Decimal('1000'),
+        )
+
+    def test_signal_creates_contact(self):
+        self.create_document(1, ('11111111', '1'), issued=True)
+
+        contact = Contact.objects.get(company=self.company, tax_id='11.111.111-1')
+        self.assertTrue(contact.is_client)
+        self.assertFalse(contact.is_provider)
+
+    def test_suppressed_signal_and_batch_upsert(self):
+        with suppress_contact_signal():
+            self.create_document(1, ('11111111', '1'), issued=True)
+            self.create_document(2, ('11111111', '1'), issued=False)
+            self.create_document(3, ('22222222', '2'), issued=False, name='Proveedor')
+        self.assertFalse(Contact.objects.exists())
+
+        Contact.objects.create(company=self.company, tax_id='22.222.222-2', name='Nombre editado', is_client=True)
+        result = upsert_contacts(self.company, counterparties_from_queryset(Document.objects.filter(company=self.company)))
+
+        self.assertEqual(result, {'created': 1, 'updated': 1})
+        both = Contact.objects.get(tax_id='11.111.111-1')
+        self.assertTrue(both.is_client and both.is_provider)
+        edited = Contact.objects.get(tax_id='22.222.222-2')
+        self.assertEqual(edited.name, 'Nombre editado')
+        self.assertTrue(edited.is_client and edited.is_provider)
+        self.assertEqual(edited.category, 'Servicios')
+
+    def test_roles_stay_additive_when_another_ingestion_writes_first(self):
+        """Un contacto insertado por otra ingestión después de la lectura conserva su rol"""
+        merge_contact = services._merge_contact
+
+        def concurrent_insert(contact, data):
+            # La otra ingestión guarda el mismo RUT como cliente entre la lectura y el upsert
+            Contact.objects.create(company=self.company, tax_id='22.222.222-2', name='Otra ingestión', is_client=True)
+            return merge_contact(contact, data)
+
+        counterparties = {'22.222.222-2': {
+            'name': 'Proveedor', 'address': '', 'category': '', 'is_client': False, 'is_provider': True
+        }}
+        with mock.patch.object(services, '_merge_contact', side_effect=concurrent_insert):
+            upsert_contacts(self.company, counterparties)
+
+        contact = Contact.objects.get(company=self.company, tax_id='22.222.222-2')
+        self.assertTrue(contact.is_client)
+        self.assertTrue(contact.is_provider)
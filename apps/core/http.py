@@ -0,0 +1,92 @@
+"""
+Sesiones HTTP compartidas con pool de conexiones, keep-alive y reintentos.
+
+Cada cliente externo (SII, Kapso, ...) obtiene una sesión por nombre que se
+reutiliza entre llamadas dentro del mismo proceso, evitando un handshake
+TCP+TLS por petición.
+"""
+import os
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from typing import Dict, Iterable, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+_sessions: Dict[Tuple[str, int], requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def build_session(
+    pool_connections: int = 10,
+    pool_maxsize: int = 20,
+    retries: int = 3,
+    backoff_factor: float = 0.5,
+    status_forcelist: Iterable[int] = (502, 503, 504),
+    allowed_methods: Iterable[str] = ('HEAD', 'GET', 'OPTIONS'),
+    persist_cookies: bool = False,
+) -> requests.Session:
+    """
+    Crea una sesión HTTP con pool de conexiones y reintentos con backoff.
+    
+    Args:
+        pool_connections: Cantidad de pools (hosts) a mantener
+        pool_maxsize: Conexiones keep-alive máximas por host
+        retries: Reintentos ante errores de conexión o status_forcelist
+        backoff_factor: Factor de backoff exponencial entre reintentos
+        status_forcelist: Códigos HTTP que gatillan reintento
+        allowed_methods: Métodos reintentables ante error de lectura/status
+                         (los errores de conexión se reintentan siempre)
+        persist_cookies: Si False, la sesión no guarda ni envía cookies propias;
+                         necesario cuando se comparte entre distintas cuentas
+    
+    Returns:
+        requests.Session configurada
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=tuple(status_forcelist),
+        allowed_methods=frozenset(method.upper() for method in allowed_methods),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=retry,
+    )
+    
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    
+    if not persist_cookies:
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    
+    return session
+
+
+def get_shared_session(name: str, **kwargs) -> requests.Session:
+    """
+    Retorna la sesión compartida `name` del proceso actual, creándola si no existe.
+    
+    Las sesiones se indexan también por PID para no compartir sockets entre
+    procesos hijos (workers prefork de Celery/Gunicorn).
+    
+    Args:
+        name: Nombre del cliente (ej: 'sii', 'kapso')
+        **kwargs: Parámetros para build_session en la primera creación
+    """
+    key = (name, os.getpid())
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = build_session(**kwargs)
+                _sessions[key] = session
+    return session
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import DocumentType, Document
+from .models import DocumentType, Document, DocumentMonthlyRollup
 
 
 @admin.register(DocumentType)
@@ -15,7 +15,7 @@ class DocumentAdmin(admin.ModelAdmin):
     list_display = ('document_type', 'folio', 'issue_date', 'recipient_name', 'total_amount', 'status', 'company')
     list_filter = ('document_type', 'status', 'issue_date', 'company')
     search_fields = ('folio', 'recipient_name', 'recipient_rut', 'issuer_name')
-    readonly_fields = ('issuer_full_rut', 'recipient_full_rut', 'document_direction')
+    readonly_fields = ('issuer_full_rut', 'recipient_full_rut', 'document_direction', 'raw_data')
     
     fieldsets = (
         ('Empresa', {
@@ -34,9 +34,17 @@ class DocumentAdmin(admin.ModelAdmin):
             'fields': ('net_amount', 'tax_amount', 'exempt_amount', 'total_amount')
         }),
         ('SII', {
-            'fields': ('sii_track_id', 'sii_response', 'xml_data', 'pdf_file')
+            'fields': ('sii_track_id', 'sii_response', 'xml_data', 'pdf_file', 'raw_data')
         }),
         ('Referencias', {
             'fields': ('reference_document', 'reference_reason', 'reference_folio', 'reference_folio_type')
         })
     )
+
+
+@admin.register(DocumentMonthlyRollup)
+class DocumentMonthlyRollupAdmin(admin.ModelAdmin):
+    list_display = ('company', 'month', 'direction', 'document_type', 'status', 'document_count', 'total_amount')
+    list_filter = ('direction', 'status', 'document_type', 'month')
+    search_fields = ('company__tax_id', 'company__business_name')
+    readonly_fields = ('updated_at',)
@@ -3,3 +3,11 @@ from django.apps import AppConfig
 class UdocumentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.documents'
+
+    def ready(self):
+        """
+        Conectar la invalidación del registro de tipos de documento
+        y el recálculo de rollups mensuales
+        """
+        import apps.documents.registry  # noqa
+        import apps.documents.rollups  # noqa
@@ -0,0 +1,222 @@
+"""
+Exportación de libros de compras y ventas (CSV / XLSX)
+
+Las filas se leen con `.values().iterator(chunk_size=...)` y se escriben a
+medida que llegan, por lo que la memoria se mantiene constante sin importar
+la cantidad de documentos:
+- CSV: se genera línea a línea para un StreamingHttpResponse
+- XLSX: openpyxl en modo write-only sobre un archivo temporal
+"""
+import csv
+import tempfile
+from datetime import date
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+from django.conf import settings
+
+from .models import Document
+
+# Documentos leídos por viaje a la base de datos
+EXPORT_CHUNK_SIZE = getattr(settings, 'DOCUMENT_EXPORT_CHUNK_SIZE', 2000)
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+
+# Prefijo de los task_id de exportaciones asíncronas (export-status solo acepta estos)
+EXPORT_TASK_PREFIX = 'documents-export-'
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Libro -> dirección del documento y columnas (encabezado, campo de values())
+BOOK_LAYOUTS = {
+    'sales': {
+        'title': 'Libro de Ventas',
+        'direction': 'issued',
+        'columns': (
+            ('Tipo Doc', 'document_type__code'),
+            ('Folio', 'folio'),
+            ('Fecha Emisión', 'issue_date'),
+            ('RUT Receptor', 'recipient_full_rut'),
+            ('Razón Social Receptor', 'recipient_name'),
+            ('Monto Exento', 'exempt_amount'),
+            ('Monto Neto', 'net_amount'),
+            ('Monto IVA', 'tax_amount'),
+            ('Monto Total', 'total_amount'),
+            ('Estado', 'status'),
+        ),
+    },
+    'purchases': {
+        'title': 'Libro de Compras',
+        'direction': 'received',
+        'columns': (
+            ('Tipo Doc', 'document_type__code'),
+            ('Folio', 'folio'),
+            ('Fecha Emisión', 'issue_date'),
+            ('RUT Proveedor', 'issuer_full_rut'),
+            ('Razón Social Proveedor', 'issuer_name'),
+            ('Monto Exento', 'exempt_amount'),
+            ('Monto Neto', 'net_amount'),
+            ('Monto IVA', 'tax_amount'),
+            ('Monto Total', 'total_amount'),
+            ('Estado', 'status'),
+        ),
+    },
+}
+
+# Columnas calculadas a partir de rut + dv
+_RUT_COLUMNS = {
+    'recipient_full_rut': ('recipient_rut', 'recipient_dv'),
+    'issuer_full_rut': ('issuer_company_rut', 'issuer_company_dv'),
+}
+
+
+def get_layout(book: str) -> dict:
+    """Layout del libro pedido. Lanza ValueError si no existe"""
+    try:
+        return BOOK_LAYOUTS[book]
+    except KeyError:
+        raise ValueError(f"Libro no soportado: {book}. Opciones: {', '.join(BOOK_LAYOUTS)}")
+
+
+def book_queryset(
+    company_ids: Sequence[int],
+    book: str,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+):
+    """
+    Documentos del libro para las empresas y el rango de fechas indicados,
+    en el orden del libro (fecha, tipo, folio).
+    """
+    queryset = Document.objects.filter(company_id__in=company_ids, direction=get_layout(book)['direction'])
+    if start_date:
+        queryset = queryset.filter(issue_date__gte=start_date)
+    if end_date:
+        queryset = queryset.filter(issue_date__lte=end_date)
+    return queryset.order_by('issue_date', 'document_type__code', 'folio', 'id')
+
+
+def book_header(book: str) -> List[str]:
+    return [header for header, _ in get_layout(book)['columns']]
+
+
+def iter_book_rows(queryset, book: str, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[list]:
+    """
+    Filas del libro como listas de valores, leídas por bloques de `chunk_size`.
+    """
+    columns = [field for _, field in get_layout(book)['columns']]
+    fields = []
+    for field in columns:
+        fields.extend(_RUT_COLUMNS.get(field, (field,)))
+
+    for row in queryset.values(*fields).iterator(chunk_size=chunk_size):
+        values = []
+        for field in columns:
+            if field in _RUT_COLUMNS:
+                rut, dv = _RUT_COLUMNS[field]
+                values.append(f"{row[rut]}-{row[dv]}")
+            else:
+                values.append(row[field])
+        yield values
+
+
+class _Echo:
+    """Pseudo-buffer para csv.writer: devuelve la línea en vez de guardarla"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(header: List[str], rows: Iterable[list]) -> Iterator[str]:
+    """
+    Genera el CSV línea a línea (para StreamingHttpResponse).
+    Incluye BOM para que Excel detecte UTF-8.
+    """
+    writer = csv.writer(_Echo())
+    yield '\ufeff' + writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def write_csv(header: List[str], rows: Iterable[list], target) -> int:
+    """
+    Escribe el CSV en un archivo binario abierto.
+
+    Returns:
+        Cantidad de filas de datos escritas
+    """
+    count = -1
+    for count, line in enumerate(stream_csv(header, rows)):
+        target.write(line.encode('utf-8'))
+    return max(count, 0)
+
+
+def write_xlsx(header: List[str], rows: Iterable[list], target, title: str = 'Documentos') -> int:
+    """
+    Escribe el XLSX con openpyxl en modo write-only (las filas no quedan en memoria).
+
+    Args:
+        header: Encabezados de columna
+        rows: Filas de valores
+        target: Ruta o archivo binario donde guardar el libro
+        title: Nombre de la hoja
+
+    Returns:
+        Cantidad de filas de datos escritas
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=title[:31])
+    sheet.append(header)
+
+    count = 0
+    for row in rows:
+        sheet.append(row)
+        count += 1
+
+    workbook.save(target)
+    return count
+
+
+def export_book(queryset, book: str, export_format: str, target) -> int:
+    """
+    Escribe el libro completo en `target` en el formato pedido.
+
+    Returns:
+        Cantidad de documentos exportados
+    """
+    header = book_header(book)
+    rows = iter_book_rows(queryset, book)
+    if export_format == 'xlsx':
+        return write_xlsx(header, rows, target, title=get_layout(book)['title'])
+    if export_format == 'csv':
+        return write_csv(header, rows, target)
+    raise ValueError(f"Formato no soportado: {export_format}. Opciones: {', '.join(EXPORT_FORMATS)}")
+
+
+def export_book_to_tempfile(queryset, book: str, export_format: str):
+    """
+    Exporta el libro a un archivo temporal y lo deja posicionado al inicio.
+    El archivo se elimina al cerrarse.
+
+    Returns:
+        (archivo temporal, cantidad de documentos exportados)
+    """
+    target = tempfile.TemporaryFile()
+    try:
+        count = export_book(queryset, book, export_format, target)
+    except Exception:
+        target.close()
+        raise
+    target.seek(0)
+    return target, count
+
+
+def export_filename(book: str, export_format: str, start_date: Optional[date], end_date: Optional[date]) -> str:
+    """Nombre de archivo del libro, p. ej. libro_ventas_2024-01-01_2024-12-31.csv"""
+    name = 'libro_ventas' if book == 'sales' else 'libro_compras'
+    period = '_'.join(value.isoformat() for value in (start_date, end_date) if value)
+    return f"{name}_{period}.{export_format}" if period else f"{name}.{export_format}"
@@ -0,0 +1,60 @@
+"""
+Comando Django para recalcular la dirección persistida (emitido/recibido) de los documentos
+"""
+from django.core.management.base import BaseCommand, CommandError
+from apps.companies.models import Company
+from apps.documents.models import Document
+from apps.documents.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recalcula Document.direction (issued/received) respecto de la empresa propietaria'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--company-id',
+            type=int,
+            action='append',
+            dest='company_ids',
+            help='ID de empresa específica para procesar (se puede repetir)'
+        )
+        parser.add_argument(
+            '--skip-rollups',
+            action='store_true',
+            help='No reconstruir los rollups mensuales de las empresas con cambios'
+        )
+
+    def handle(self, *args, **options):
+        company_ids = options.get('company_ids')
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                '🧭 Recalculando dirección de documentos...'
+            )
+        )
+
+        companies = Company.objects.all()
+        if company_ids:
+            companies = companies.filter(id__in=company_ids)
+
+        try:
+            changed_companies = []
+            updated = 0
+            for company in companies.iterator():
+                count = Document.backfill_direction(company)
+                if count:
+                    changed_companies.append(company.id)
+                    updated += count
+                    self.stdout.write(f'   {company.tax_id}: {count} documentos actualizados')
+
+            # Los rollups agrupan por dirección: se reconstruyen los de las empresas con cambios
+            if changed_companies and not options.get('skip_rollups'):
+                rebuild_rollups(changed_companies)
+        except Exception as e:
+            raise CommandError(f'Error ejecutando comando: {str(e)}')
+
+        self.stdout.write(
+            self.style.SUCCESS('🎉 Dirección recalculada:')
+        )
+        self.stdout.write(f'   Documentos actualizados: {updated}')
+        self.stdout.write(f'   Empresas con cambios: {len(changed_companies)}')
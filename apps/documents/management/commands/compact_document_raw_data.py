@@ -0,0 +1,86 @@
+"""
+Comando Django para recodificar los datos originales del SII (DocumentRawData)
+como JSON comprimido con zlib o como JSON plano
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from apps.documents.models import DocumentRawData
+
+
+class Command(BaseCommand):
+    help = 'Comprime (o descomprime) los datos originales del SII guardados en DocumentRawData'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--company-id',
+            type=int,
+            action='append',
+            dest='company_ids',
+            help='ID de empresa específica para procesar (se puede repetir)'
+        )
+        mode = parser.add_mutually_exclusive_group()
+        mode.add_argument(
+            '--compress',
+            action='store_true',
+            help='Guardar comprimido (por defecto según DOCUMENT_RAW_DATA_COMPRESSION)'
+        )
+        mode.add_argument(
+            '--decompress',
+            action='store_true',
+            help='Guardar como JSON plano'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Filas recodificadas por lote (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        if options['compress']:
+            compress = True
+        elif options['decompress']:
+            compress = False
+        else:
+            compress = getattr(settings, 'DOCUMENT_RAW_DATA_COMPRESSION', False)
+        batch_size = max(1, options['batch_size'])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"🗜️ {'Comprimiendo' if compress else 'Descomprimiendo'} datos originales de documentos..."
+            )
+        )
+
+        # Solo las filas que no están ya en la codificación pedida
+        pending = DocumentRawData.objects.filter(compressed_data__isnull=compress)
+        if options.get('company_ids'):
+            pending = pending.filter(document__company_id__in=options['company_ids'])
+
+        updated = 0
+        last_id = 0
+        try:
+            while True:
+                batch = list(pending.filter(document_id__gt=last_id).order_by('document_id')[:batch_size])
+                if not batch:
+                    break
+
+                for raw in batch:
+                    values = DocumentRawData.encode(raw.payload, compress=compress)
+                    raw.data = values['data']
+                    raw.compressed_data = values['compressed_data']
+
+                with transaction.atomic():
+                    DocumentRawData.objects.bulk_update(batch, ['data', 'compressed_data'])
+
+                updated += len(batch)
+                last_id = batch[-1].document_id
+                self.stdout.write(f'   {updated} filas recodificadas')
+        except Exception as e:
+            raise CommandError(f'Error ejecutando comando: {str(e)}')
+
+        self.stdout.write(
+            self.style.SUCCESS('🎉 Recodificación completada:')
+        )
+        self.stdout.write(f'   Filas actualizadas: {updated}')
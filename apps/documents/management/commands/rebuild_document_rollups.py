@@ -0,0 +1,41 @@
+"""
+Comando Django para reconstruir los totales mensuales de documentos
+"""
+from django.core.management.base import BaseCommand, CommandError
+from apps.documents.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye la tabla document_monthly_rollups desde los documentos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--company-id',
+            type=int,
+            action='append',
+            dest='company_ids',
+            help='ID de empresa específica para procesar (se puede repetir)'
+        )
+
+    def handle(self, *args, **options):
+        company_ids = options.get('company_ids')
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                '📊 Reconstruyendo rollups mensuales de documentos...'
+            )
+        )
+
+        if company_ids:
+            self.stdout.write(f'   Empresas ID: {", ".join(str(company_id) for company_id in company_ids)}')
+
+        try:
+            result = rebuild_rollups(company_ids)
+        except Exception as e:
+            raise CommandError(f'Error ejecutando comando: {str(e)}')
+
+        self.stdout.write(
+            self.style.SUCCESS('🎉 Reconstrucción completada:')
+        )
+        self.stdout.write(f'   Empresas procesadas: {result["companies"]}')
+        self.stdout.write(f'   Filas escritas: {result["rows"]}')
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.11 on 2026-10-16 19:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0002_backgroundtasktracker'),
+        ('documents', '0004_alter_document_reference_folio_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentMonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='Primer día del mes')),
+                ('direction', models.CharField(choices=[('issued', 'Emitido'), ('received', 'Recibido'), ('unknown', 'Desconocido')], max_length=10)),
+                ('status', models.CharField(choices=[('draft', 'Borrador'), ('pending', 'Pendiente'), ('signed', 'Firmado'), ('sent', 'Enviado al SII'), ('accepted', 'Aceptado por SII'), ('rejected', 'Rechazado por SII'), ('cancelled', 'Anulado'), ('processed', 'Procesado')], max_length=20)),
+                ('document_count', models.PositiveIntegerField(default=0)),
+                ('net_amount', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('tax_amount', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('exempt_amount', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_rollups', to='companies.company')),
+                ('document_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='documents.documenttype')),
+            ],
+            options={
+                'verbose_name': 'Document Monthly Rollup',
+                'verbose_name_plural': 'Document Monthly Rollups',
+                'db_table': 'document_monthly_rollups',
+                'ordering': ['-month'],
+                'indexes': [models.Index(fields=['company', 'month'], name='document_mo_company_c8dcd8_idx')],
+                'unique_together': {('company', 'month', 'direction', 'document_type', 'status')},
+            },
+        ),
+    ]
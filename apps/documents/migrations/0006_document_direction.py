@@ -0,0 +1,42 @@
+# Generated by Django 4.2.11 on 2026-10-16 19:30
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def backfill_direction(apps, schema_editor):
+    """Asigna la dirección de los documentos existentes con UPDATE por empresa"""
+    Company = apps.get_model('companies', 'Company')
+    Document = apps.get_model('documents', 'Document')
+
+    for company_id, tax_id in Company.objects.values_list('id', 'tax_id'):
+        rut_parts = tax_id.split('-')
+        if len(rut_parts) != 2:
+            continue
+        rut, dv = rut_parts[0], rut_parts[1].upper()
+        is_issuer = Q(issuer_company_rut=rut, issuer_company_dv__iexact=dv)
+        is_recipient = Q(recipient_rut=rut, recipient_dv__iexact=dv)
+
+        documents = Document.objects.filter(company_id=company_id)
+        documents.filter(is_issuer).update(direction='issued')
+        documents.filter(is_recipient).exclude(is_issuer).update(direction='received')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0005_document_monthly_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='direction',
+            field=models.CharField(choices=[('issued', 'Emitido'), ('received', 'Recibido'), ('unknown', 'Desconocido')], default='unknown', help_text='Emitido o recibido respecto de la empresa propietaria (lo asigna DTEMapper)', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['company', 'direction', 'issue_date'], name='documents_company_de4b23_idx'),
+        ),
+        migrations.RunPython(backfill_direction, migrations.RunPython.noop),
+    ]
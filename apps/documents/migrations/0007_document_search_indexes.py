@@ -0,0 +1,36 @@
+# Generated by Django 4.2.11 on 2026-10-16 19:32
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0006_document_direction'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['company', 'folio'], name='documents_company_folio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['recipient_rut'], name='documents_recipient_rut_like', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['issuer_company_rut'], name='documents_issuer_rut_like', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['recipient_name'], name='documents_recipient_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['issuer_name'], name='documents_issuer_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.11 on 2026-10-16 19:41
+
+import json
+import zlib
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def move_raw_data(apps, schema_editor):
+    """Copia documents.raw_data no vacío a document_raw_data en un solo INSERT ... SELECT"""
+    empty = "'{}'::jsonb" if schema_editor.connection.vendor == 'postgresql' else "'{}'"
+    schema_editor.execute(
+        "INSERT INTO document_raw_data (document_id, data, updated_at) "
+        f"SELECT id, raw_data, updated_at FROM documents WHERE raw_data IS NOT NULL AND raw_data <> {empty}"
+    )
+
+
+def restore_raw_data(apps, schema_editor):
+    """Devuelve los datos originales a documents.raw_data"""
+    Document = apps.get_model('documents', 'Document')
+    DocumentRawData = apps.get_model('documents', 'DocumentRawData')
+
+    for raw in DocumentRawData.objects.iterator(chunk_size=1000):
+        if raw.compressed_data is not None:
+            payload = json.loads(zlib.decompress(bytes(raw.compressed_data)))
+        else:
+            payload = raw.data or {}
+        Document.objects.filter(id=raw.document_id).update(raw_data=payload)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_document_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentRawData',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='raw_payload', serialize=False, to='documents.document')),
+                ('data', models.JSONField(blank=True, help_text='Datos originales del SII sin procesar', null=True)),
+                ('compressed_data', models.BinaryField(blank=True, help_text='Mismos datos como JSON comprimido con zlib', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Document Raw Data',
+                'verbose_name_plural': 'Document Raw Data',
+                'db_table': 'document_raw_data',
+            },
+        ),
+        migrations.RunPython(move_raw_data, restore_raw_data),
+        migrations.RemoveField(
+            model_name='document',
+            name='raw_data',
+        ),
+    ]
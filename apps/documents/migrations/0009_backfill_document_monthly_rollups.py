@@ -0,0 +1,55 @@
+from django.db import migrations
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import TruncMonth
+
+
+AMOUNT_FIELDS = ('net_amount', 'tax_amount', 'exempt_amount', 'total_amount')
+
+
+def backfill_rollups(apps, schema_editor):
+    """
+    Carga los totales mensuales de los documentos existentes (mismo cálculo que
+    rollups.rebuild_rollups), para que los resúmenes no lean ceros en los meses
+    completos hasta que alguien ejecute rebuild_document_rollups.
+    """
+    Document = apps.get_model('documents', 'Document')
+    DocumentMonthlyRollup = apps.get_model('documents', 'DocumentMonthlyRollup')
+
+    company_ids = list(
+        Document.objects.exclude(company=None).order_by().values_list('company_id', flat=True).distinct()
+    )
+    for company_id in company_ids:
+        rows = (
+            Document.objects.filter(company_id=company_id)
+            .annotate(month=TruncMonth('issue_date', output_field=DateField()))
+            .order_by()
+            .values('month', 'direction', 'document_type', 'status')
+            .annotate(count=Count('id'), **{field: Sum(field) for field in AMOUNT_FIELDS})
+        )
+        DocumentMonthlyRollup.objects.filter(company_id=company_id).delete()
+        DocumentMonthlyRollup.objects.bulk_create(
+            [
+                DocumentMonthlyRollup(
+                    company_id=company_id,
+                    month=row['month'],
+                    direction=row['direction'],
+                    document_type_id=row['document_type'],
+                    status=row['status'],
+                    document_count=row['count'],
+                    **{field: row[field] or 0 for field in AMOUNT_FIELDS}
+                )
+                for row in rows
+            ],
+            batch_size=500
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0008_document_raw_data'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
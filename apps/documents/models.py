@@ -1,3 +1,8 @@
+import json
+import zlib
+
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 from apps.core.models import TimeStampedModel
 
@@ -62,6 +67,12 @@ class Document(TimeStampedModel):
         ('processed', 'Procesado'),
     ]
     
+    DIRECTION_CHOICES = [
+        ('issued', 'Emitido'),
+        ('received', 'Recibido'),
+        ('unknown', 'Desconocido'),
+    ]
+    
     # Relación con Company (empresa propietaria del documento)
     company = models.ForeignKey(
         'companies.Company',
@@ -90,6 +101,12 @@ class Document(TimeStampedModel):
     folio = models.IntegerField()
     issue_date = models.DateField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft')
+    direction = models.CharField(
+        max_length=10,
+        choices=DIRECTION_CHOICES,
+        default='unknown',
+        help_text="Emitido o recibido respecto de la empresa propietaria (lo asigna DTEMapper)"
+    )
     
     # Montos
     net_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
@@ -102,7 +119,7 @@ class Document(TimeStampedModel):
     sii_response = models.JSONField(default=dict)
     xml_data = models.TextField(blank=True)
     pdf_file = models.FileField(upload_to='documents/pdfs/', blank=True, null=True)
-    raw_data = models.JSONField(default=dict, blank=True, help_text="Datos originales del SII sin procesar")
+    # Los datos originales del SII viven en DocumentRawData (ver raw_data)
     
     # Referencias (notas de crédito/débito)
     reference_folio = models.CharField(max_length=255, blank=True, null=True)
@@ -123,6 +140,13 @@ class Document(TimeStampedModel):
             models.Index(fields=['document_type', 'folio']),
             models.Index(fields=['issue_date']),
             models.Index(fields=['status']),
+            models.Index(fields=['company', 'direction', 'issue_date']),
+            # Búsqueda del listado (apps/documents/search.py)
+            models.Index(fields=['company', 'folio'], name='documents_company_folio_idx'),
+            models.Index(fields=['recipient_rut'], opclasses=['varchar_pattern_ops'], name='documents_recipient_rut_like'),
+            models.Index(fields=['issuer_company_rut'], opclasses=['varchar_pattern_ops'], name='documents_issuer_rut_like'),
+            GinIndex(fields=['recipient_name'], opclasses=['gin_trgm_ops'], name='documents_recipient_name_trgm'),
+            GinIndex(fields=['issuer_name'], opclasses=['gin_trgm_ops'], name='documents_issuer_name_trgm'),
         ]
     
     def __str__(self):
@@ -136,6 +160,17 @@ class Document(TimeStampedModel):
     def recipient_full_rut(self):
         return f"{self.recipient_rut}-{self.recipient_dv}"
     
+    @property
+    def raw_data(self):
+        """
+        Datos originales del SII sin procesar.
+        Se leen de DocumentRawData con una consulta aparte, solo al acceder (vistas de detalle).
+        """
+        try:
+            return self.raw_payload.payload
+        except DocumentRawData.DoesNotExist:
+            return {}
+    
     @property
     def is_issued_by_company(self):
         """True if this document was issued by the related company"""
@@ -158,6 +193,48 @@ class Document(TimeStampedModel):
         else:
             return 'unknown'
     
+    @staticmethod
+    def compute_direction(company_tax_id, issuer_rut, issuer_dv, recipient_rut, recipient_dv):
+        """
+        Dirección de un documento respecto de una empresa: 'issued' si la empresa
+        es el emisor, 'received' si es el receptor y 'unknown' en otro caso.
+        """
+        rut_parts = (company_tax_id or '').split('-')
+        if len(rut_parts) != 2:
+            return 'unknown'
+        rut, dv = rut_parts[0], rut_parts[1].upper()
+        if str(issuer_rut) == rut and str(issuer_dv).upper() == dv:
+            return 'issued'
+        if str(recipient_rut) == rut and str(recipient_dv).upper() == dv:
+            return 'received'
+        return 'unknown'
+    
+    @classmethod
+    def backfill_direction(cls, company):
+        """
+        Asigna la dirección persistida de los documentos de una empresa con
+        un UPDATE por conjunto para cada dirección.
+        
+        Returns:
+            Cantidad de documentos actualizados
+        """
+        rut_parts = company.tax_id.split('-')
+        if len(rut_parts) != 2:
+            return 0
+        rut, dv = rut_parts[0], rut_parts[1].upper()
+        is_issuer = models.Q(issuer_company_rut=rut, issuer_company_dv__iexact=dv)
+        is_recipient = models.Q(recipient_rut=rut, recipient_dv__iexact=dv)
+        
+        documents = cls.objects.filter(company=company)
+        issued = documents.filter(is_issuer).exclude(direction='issued').update(direction='issued')
+        received = documents.filter(is_recipient).exclude(is_issuer).exclude(
+            direction='received'
+        ).update(direction='received')
+        unknown = documents.exclude(is_issuer | is_recipient).exclude(
+            direction='unknown'
+        ).update(direction='unknown')
+        return issued + received + unknown
+    
     @classmethod
     def get_company_for_document(cls, issuer_rut, issuer_dv, recipient_rut, recipient_dv):
         """
@@ -183,3 +260,119 @@ class Document(TimeStampedModel):
         return None
 
 
+
+
+class DocumentMonthlyRollup(models.Model):
+    """
+    Totales mensuales precalculados de documentos por empresa.
+
+    Una fila por (empresa, mes, dirección, tipo de documento, estado). La mantiene
+    DTEProcessor al crear/actualizar documentos y se puede reconstruir con
+    `manage.py rebuild_document_rollups`.
+    """
+    company = models.ForeignKey(
+        'companies.Company',
+        on_delete=models.CASCADE,
+        related_name='document_rollups'
+    )
+    month = models.DateField(help_text="Primer día del mes")
+    direction = models.CharField(max_length=10, choices=Document.DIRECTION_CHOICES)
+    document_type = models.ForeignKey(DocumentType, on_delete=models.CASCADE, related_name='rollups')
+    status = models.CharField(max_length=20, choices=Document.STATUS_CHOICES)
+
+    document_count = models.PositiveIntegerField(default=0)
+    net_amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    tax_amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    exempt_amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    total_amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'document_monthly_rollups'
+        verbose_name = 'Document Monthly Rollup'
+        verbose_name_plural = 'Document Monthly Rollups'
+        unique_together = ['company', 'month', 'direction', 'document_type', 'status']
+        ordering = ['-month']
+        indexes = [
+            models.Index(fields=['company', 'month']),
+        ]
+
+    def __str__(self):
+        return f"{self.company_id} {self.month:%Y-%m} {self.direction} {self.document_type_id} {self.status}"
+
+
+class DocumentRawData(models.Model):
+    """
+    Datos originales del SII de un documento, fuera de la tabla documents.
+
+    Así los listados y agregados sobre Document no arrastran el payload. Se
+    guarda como JSON o, con DOCUMENT_RAW_DATA_COMPRESSION, comprimido con zlib;
+    `manage.py compact_document_raw_data` recodifica los existentes.
+    """
+    document = models.OneToOneField(
+        Document,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='raw_payload'
+    )
+    data = models.JSONField(null=True, blank=True, help_text="Datos originales del SII sin procesar")
+    compressed_data = models.BinaryField(null=True, blank=True, help_text="Mismos datos como JSON comprimido con zlib")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'document_raw_data'
+        verbose_name = 'Document Raw Data'
+        verbose_name_plural = 'Document Raw Data'
+
+    def __str__(self):
+        return f"Raw data {self.document_id}"
+
+    @property
+    def payload(self):
+        """Datos originales, descomprimiendo si corresponde"""
+        if self.compressed_data is not None:
+            return json.loads(zlib.decompress(bytes(self.compressed_data)))
+        return self.data or {}
+
+    @staticmethod
+    def encode(payload, compress=None):
+        """
+        Valores de data / compressed_data para un payload.
+
+        Args:
+            payload: Datos originales del SII
+            compress: Forzar (o no) compresión; por defecto DOCUMENT_RAW_DATA_COMPRESSION
+        """
+        if compress is None:
+            compress = getattr(settings, 'DOCUMENT_RAW_DATA_COMPRESSION', False)
+        if compress:
+            raw = json.dumps(payload, default=str, separators=(',', ':')).encode('utf-8')
+            return {'data': None, 'compressed_data': zlib.compress(raw)}
+        return {'data': payload, 'compressed_data': None}
+
+    @classmethod
+    def store(cls, items, batch_size=500):
+        """
+        Crea o reemplaza los datos originales de varios documentos en un upsert.
+
+        Args:
+            items: Pares (document_id, payload); se omiten los payloads vacíos
+
+        Returns:
+            Cantidad de filas escritas
+        """
+        rows = [
+            cls(document_id=document_id, **cls.encode(payload))
+            for document_id, payload in items
+            if document_id and payload
+        ]
+        if rows:
+            cls.objects.bulk_create(
+                rows,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=['document'],
+                update_fields=['data', 'compressed_data', 'updated_at'],
+            )
+        return len(rows)
@@ -0,0 +1,96 @@
+"""
+Registro en memoria de tipos de documento (código SII -> DocumentType)
+
+Los tipos de documento casi nunca cambian, pero la ingesta los resuelve una
+vez por DTE. El registro los carga todos con una sola consulta y los reutiliza
+en el proceso hasta que vence su TTL o se invalida (al guardar o eliminar un
+DocumentType, o llamando a `invalidate()`).
+"""
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import DocumentType
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentTypeRegistry:
+    """
+    Caché por proceso de DocumentType indexado por código SII.
+
+    La invalidación por señales se aplica al hacer commit, para no recargar
+    tipos que un rollback todavía puede descartar.
+    """
+
+    def __init__(self, ttl: Optional[int] = None):
+        """
+        Args:
+            ttl: Segundos que se reutiliza la carga
+                 (por defecto settings.DOCUMENT_TYPE_REGISTRY_TTL)
+        """
+        self._ttl = ttl
+        self._types: Optional[Dict[int, DocumentType]] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self) -> int:
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'DOCUMENT_TYPE_REGISTRY_TTL', 300)
+
+    def _load(self) -> Dict[int, DocumentType]:
+        """Tipos registrados, recargándolos si no hay carga vigente"""
+        with self._lock:
+            if self._types is not None and self._expires_at > time.monotonic():
+                return self._types
+
+        types = {doc_type.code: doc_type for doc_type in DocumentType.objects.all()}
+        with self._lock:
+            self._types = types
+            self._expires_at = time.monotonic() + self.ttl
+        logger.debug(f"📄 Registro de tipos de documento cargado: {len(types)} tipos")
+        return types
+
+    def get(self, code: int) -> Optional[DocumentType]:
+        """
+        Tipo de documento por código, o None si no existe.
+        """
+        return self._load().get(code)
+
+    def get_or_create(self, code: int, defaults: Optional[Dict] = None) -> Tuple[DocumentType, bool]:
+        """
+        Igual que DocumentType.objects.get_or_create(code=...), pero solo consulta
+        la base de datos si el código no está registrado.
+
+        Returns:
+            (DocumentType, creado)
+        """
+        doc_type = self.get(code)
+        if doc_type is not None:
+            return doc_type, False
+
+        return DocumentType.objects.get_or_create(code=code, defaults=defaults or {})
+
+    def invalidate(self):
+        """Descarta la carga actual; la próxima consulta vuelve a leer la base de datos"""
+        with self._lock:
+            self._types = None
+            self._expires_at = 0.0
+
+
+document_type_registry = DocumentTypeRegistry()
+
+
+@receiver(post_save, sender=DocumentType)
+@receiver(post_delete, sender=DocumentType)
+def invalidate_document_type_registry(sender, **kwargs):
+    """Invalida el registro del proceso cuando cambia un tipo de documento"""
+    transaction.on_commit(document_type_registry.invalidate)
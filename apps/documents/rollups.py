@@ -0,0 +1,346 @@
+"""
+Mantenimiento y consulta de los totales mensuales de documentos (DocumentMonthlyRollup)
+
+Los documentos guardados o eliminados uno a uno (admin, vistas, borrados en
+cascada) recalculan su mes al confirmarse la transacción, vía post_save y
+post_delete. La ingesta masiva desactiva esas señales y recalcula sus meses
+una sola vez al final. Los UPDATE por conjunto (queryset.update) no emiten
+señales: quien los use debe llamar a refresh_rollups o rebuild_rollups.
+"""
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.db import transaction
+from django.db.models import Count, DateField, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from apps.companies.models import Company
+from .models import Document, DocumentMonthlyRollup
+
+logger = logging.getLogger(__name__)
+
+# Campos por los que se puede agrupar un resumen
+GROUP_FIELDS = ('company', 'month', 'direction', 'document_type', 'status')
+
+# Campos de Document que cambian su fila de rollup
+ROLLUP_FIELDS = frozenset({
+    'company', 'company_id', 'issue_date', 'direction', 'document_type', 'document_type_id',
+    'status', 'net_amount', 'tax_amount', 'exempt_amount', 'total_amount',
+})
+
+# Métricas de cada fila de resumen -> campo de monto en Document / DocumentMonthlyRollup
+AMOUNT_FIELDS = {
+    'net': 'net_amount',
+    'tax': 'tax_amount',
+    'exempt': 'exempt_amount',
+    'total': 'total_amount',
+}
+
+
+def month_start(value: date) -> date:
+    """Primer día del mes de una fecha"""
+    return value.replace(day=1)
+
+
+def next_month(value: date) -> date:
+    """Primer día del mes siguiente"""
+    if value.month == 12:
+        return date(value.year + 1, 1, 1)
+    return date(value.year, value.month + 1, 1)
+
+
+def document_bucket(document: Document) -> Optional[Tuple[int, date]]:
+    """Clave (empresa, mes) del rollup al que pertenece un documento"""
+    if not document.company_id or not document.issue_date:
+        return None
+    return document.company_id, month_start(document.issue_date)
+
+
+def _grouped(queryset, group_by: Sequence[str], count) -> List[Dict]:
+    """values().annotate() por las claves pedidas, o un aggregate() si no hay claves"""
+    metrics = {'count': count, **{metric: Sum(field) for metric, field in AMOUNT_FIELDS.items()}}
+    if not group_by:
+        return [queryset.aggregate(**metrics)]
+    return list(queryset.order_by().values(*group_by).annotate(**metrics))
+
+
+def _aggregate_documents(queryset, group_by: Sequence[str], **filters) -> List[Dict]:
+    """Agrupa documentos con las mismas claves y métricas que el rollup"""
+    queryset = queryset.annotate(
+        month=TruncMonth('issue_date', output_field=DateField()),
+    ).filter(**filters)
+    return _grouped(queryset, group_by, Count('id'))
+
+
+def refresh_rollups(buckets: Iterable[Tuple[int, date]]) -> int:
+    """
+    Recalcula los totales de los meses indicados desde la tabla de documentos.
+
+    Cada (empresa, mes) se recalcula completo, por lo que es idempotente y
+    sirve tanto para documentos nuevos como para actualizaciones que cambian
+    de mes, estado o montos.
+
+    Args:
+        buckets: Pares (company_id, primer día del mes)
+
+    Returns:
+        Cantidad de filas de rollup escritas
+    """
+    months_by_company: Dict[int, set] = defaultdict(set)
+    for company_id, month in buckets:
+        if company_id and month:
+            months_by_company[company_id].add(month_start(month))
+
+    written = 0
+    for company in Company.objects.filter(id__in=months_by_company.keys()):
+        months = sorted(months_by_company[company.id])
+
+        period_query = Q()
+        for month in months:
+            period_query |= Q(issue_date__gte=month, issue_date__lt=next_month(month))
+
+        with transaction.atomic():
+            # Serializa los recálculos concurrentes de una misma empresa
+            Company.objects.select_for_update().filter(id=company.id).first()
+
+            rows = _aggregate_documents(
+                Document.objects.filter(period_query, company=company),
+                ('month', 'direction', 'document_type', 'status')
+            )
+            rollups = [
+                DocumentMonthlyRollup(
+                    company=company,
+                    month=row['month'],
+                    direction=row['direction'],
+                    document_type_id=row['document_type'],
+                    status=row['status'],
+                    document_count=row['count'],
+                    **{field: row[metric] or 0 for metric, field in AMOUNT_FIELDS.items()}
+                )
+                for row in rows
+            ]
+
+            DocumentMonthlyRollup.objects.filter(company=company, month__in=months).delete()
+            DocumentMonthlyRollup.objects.bulk_create(rollups, batch_size=500)
+
+        written += len(rollups)
+        logger.debug(f"📊 Rollup {company.tax_id}: {len(months)} meses, {len(rollups)} filas")
+
+    return written
+
+
+def rebuild_rollups(company_ids: Optional[Iterable[int]] = None) -> Dict[str, int]:
+    """
+    Reconstruye desde cero los rollups de las empresas indicadas (o de todas).
+
+    Returns:
+        Dict con empresas procesadas y filas escritas
+    """
+    companies = Company.objects.all()
+    if company_ids:
+        companies = companies.filter(id__in=company_ids)
+
+    processed = 0
+    written = 0
+    for company in companies.iterator():
+        months = (
+            Document.objects.filter(company=company)
+            .order_by()
+            .annotate(month=TruncMonth('issue_date', output_field=DateField()))
+            .values_list('month', flat=True)
+            .distinct()
+        )
+        with transaction.atomic():
+            DocumentMonthlyRollup.objects.filter(company=company).delete()
+            written += refresh_rollups((company.id, month) for month in months)
+        processed += 1
+
+    logger.info(f"✅ Rollups reconstruidos: {processed} empresas, {written} filas")
+    return {'companies': processed, 'rows': written}
+
+
+_signal_state = threading.local()
+
+
+@contextmanager
+def suppress_rollup_signal():
+    """
+    Desactiva el recálculo de rollups por post_save/post_delete en el hilo actual.
+
+    Se usa en la ingesta masiva, que recalcula los meses del lote completo al final.
+    """
+    previous = getattr(_signal_state, 'suppressed', False)
+    _signal_state.suppressed = True
+    try:
+        yield
+    finally:
+        _signal_state.suppressed = previous
+
+
+def rollup_signal_suppressed() -> bool:
+    """True si el recálculo de rollups por señales está desactivado en el hilo actual"""
+    return getattr(_signal_state, 'suppressed', False)
+
+
+def schedule_rollup_refresh(buckets: Iterable[Optional[Tuple[int, date]]]):
+    """
+    Recalcula los meses indicados cuando se confirme la transacción en curso
+    (de inmediato fuera de una transacción).
+
+    Los meses pendientes del hilo se acumulan y el primer on_commit los
+    recalcula todos juntos, así que guardar muchos documentos de un mismo
+    mes lo recalcula una sola vez. Si la transacción se revierte, sus meses
+    se recalculan en el siguiente commit, lo que es inofensivo.
+    """
+    buckets = {bucket for bucket in buckets if bucket}
+    if not buckets:
+        return
+    pending = getattr(_signal_state, 'pending', None)
+    if pending is None:
+        pending = _signal_state.pending = set()
+    pending.update(buckets)
+    transaction.on_commit(_flush_pending_rollups)
+
+
+def _flush_pending_rollups():
+    pending = getattr(_signal_state, 'pending', None)
+    if not pending:
+        return
+    _signal_state.pending = set()
+    try:
+        refresh_rollups(pending)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudieron actualizar los rollups de documentos: {e}")
+
+
+@receiver(post_init, sender=Document)
+def remember_document_bucket(sender, instance, **kwargs):
+    """Guarda el (empresa, mes) con que se cargó el documento, para recalcularlo si cambia"""
+    # Solo con los campos cargados: no forzar consultas en instancias con campos diferidos
+    if 'company_id' in instance.__dict__ and 'issue_date' in instance.__dict__:
+        instance._rollup_bucket = document_bucket(instance)
+
+
+@receiver(post_save, sender=Document)
+def refresh_document_rollup(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Recalcula el mes del documento guardado (y el anterior si cambió de mes o empresa)"""
+    if raw or rollup_signal_suppressed():
+        return
+    if update_fields is not None and not ROLLUP_FIELDS.intersection(update_fields):
+        return
+    bucket = document_bucket(instance)
+    schedule_rollup_refresh((getattr(instance, '_rollup_bucket', None), bucket))
+    instance._rollup_bucket = bucket
+
+
+@receiver(post_delete, sender=Document)
+def refresh_deleted_document_rollup(sender, instance, **kwargs):
+    """Recalcula el mes del documento eliminado"""
+    if rollup_signal_suppressed():
+        return
+    schedule_rollup_refresh((getattr(instance, '_rollup_bucket', None) or document_bucket(instance),))
+
+
+def _full_month_window(start_date: Optional[date], end_date: Optional[date]):
+    """
+    Divide [start_date, end_date] en meses completos (servidos por el rollup)
+    y los tramos parciales de los extremos (calculados desde documentos).
+
+    Returns:
+        (desde_mes, hasta_mes_exclusivo, tramos_parciales). Los límites son None
+        cuando el rango es abierto; desde/hasta son None si no hay meses completos.
+    """
+    full_from = None
+    if start_date:
+        full_from = start_date if start_date.day == 1 else next_month(start_date)
+
+    full_until = None
+    if end_date:
+        full_until = next_month(end_date) if (end_date + timedelta(days=1)).day == 1 else month_start(end_date)
+
+    if full_from and full_until and full_from >= full_until:
+        return None, None, [(start_date, end_date)]
+
+    partial = []
+    if start_date and start_date < full_from:
+        partial.append((start_date, full_from - timedelta(days=1)))
+    if end_date and full_until <= end_date:
+        partial.append((full_until, end_date))
+    return full_from, full_until, partial
+
+
+def summarize(
+    companies: Sequence[Company],
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    group_by: Sequence[str] = (),
+    **filters
+) -> List[Dict]:
+    """
+    Totales de documentos de las empresas, agrupados por las claves pedidas.
+
+    Los meses completos del rango se leen del rollup; solo los días sueltos
+    de los extremos se agregan desde la tabla de documentos.
+
+    Args:
+        companies: Empresas propietarias de los documentos
+        start_date: Fecha de emisión desde (inclusive, opcional)
+        end_date: Fecha de emisión hasta (inclusive, opcional)
+        group_by: Subconjunto de GROUP_FIELDS
+        **filters: Filtros adicionales válidos en ambos modelos (p. ej. direction, status)
+
+    Returns:
+        Lista de dicts con las claves de group_by más count, net, tax, exempt y total
+    """
+    group_by = tuple(group_by)
+    invalid = set(group_by) - set(GROUP_FIELDS)
+    if invalid:
+        raise ValueError(f"Campos de agrupación no soportados: {', '.join(sorted(invalid))}")
+
+    companies = list(companies)
+    if not companies:
+        return []
+
+    full_from, full_until, partial = _full_month_window(start_date, end_date)
+    open_range = not start_date and not end_date
+    sources = []
+
+    if open_range or full_from or full_until:
+        rollups = DocumentMonthlyRollup.objects.filter(company__in=companies, **filters)
+        if full_from:
+            rollups = rollups.filter(month__gte=full_from)
+        if full_until:
+            rollups = rollups.filter(month__lt=full_until)
+        sources.append(_grouped(rollups, group_by, Sum('document_count')))
+
+    if partial:
+        period_query = Q()
+        for since, until in partial:
+            period_query |= Q(issue_date__gte=since, issue_date__lte=until)
+        sources.append(_aggregate_documents(
+            Document.objects.filter(period_query, company__in=companies),
+            group_by,
+            **filters
+        ))
+
+    merged: Dict[Tuple, Dict] = {}
+    for rows in sources:
+        for row in rows:
+            key = tuple(row[field] for field in group_by)
+            target = merged.setdefault(key, {
+                **{field: row[field] for field in group_by},
+                'count': 0,
+                **{metric: Decimal('0') for metric in AMOUNT_FIELDS},
+            })
+            target['count'] += row['count'] or 0
+            for metric in AMOUNT_FIELDS:
+                target[metric] += row[metric] or 0
+
+    return [row for row in merged.values() if row['count']]
@@ -0,0 +1,96 @@
+"""
+Búsqueda de documentos para el listado (type-ahead)
+
+Cada tipo de término usa un camino que PostgreSQL resuelve con índices:
+- RUT completo (12345678-9): igualdad sobre rut/dv del emisor o receptor
+- Numérico (folio o inicio de un RUT): igualdad de folio y prefijo de RUT
+  (índices varchar_pattern_ops)
+- Texto: ILIKE sobre razón social del emisor/receptor (índices GIN pg_trgm),
+  ordenable por similitud. Se usa NameContains y no icontains: icontains
+  compila a UPPER(col::text) LIKE UPPER(...), que esos índices no cubren
+"""
+import re
+from typing import Tuple
+
+from django.db import connection
+from django.db.models import F, Q, QuerySet
+from django.db.models.functions import Greatest
+from django.db.models.lookups import IContains, Lookup
+
+from .models import DocumentType
+
+FULL_RUT_RE = re.compile(r'^(\d{1,8})-([\dkK])$')
+NUMERIC_RE = re.compile(r'^\d+$')
+
+# Folio máximo que cabe en la columna entera
+MAX_FOLIO = 2 ** 31 - 1
+
+
+class NameContains(IContains):
+    """
+    icontains que en PostgreSQL compila a `columna ILIKE '%término%'` sobre la
+    columna sin transformar, para que lo resuelvan los índices GIN gin_trgm_ops.
+    En otros motores se comporta como icontains.
+    """
+
+    def as_postgresql(self, compiler, connection):
+        # Lookup.process_lhs evita el UPPER(...::text) que agrega icontains
+        lhs_sql, lhs_params = Lookup.process_lhs(self, compiler, connection)
+        rhs_sql, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs_sql} ILIKE {rhs_sql}', [*lhs_params, *rhs_params]
+
+
+def search_documents(queryset: QuerySet, term: str) -> Tuple[QuerySet, bool]:
+    """
+    Filtra documentos por un término de búsqueda libre.
+
+    Args:
+        queryset: Documentos a filtrar
+        term: Texto ingresado por el usuario
+
+    Returns:
+        (queryset filtrado, True si se anotó `search_rank` para ordenar por relevancia)
+    """
+    term = (term or '').strip()
+    if not term:
+        return queryset, False
+
+    compact = term.replace('.', '').replace(' ', '')
+
+    # RUT completo: igualdad exacta sobre emisor o receptor
+    match = FULL_RUT_RE.match(compact)
+    if match:
+        rut, dv = match.group(1), match.group(2).upper()
+        return queryset.filter(
+            Q(issuer_company_rut=rut, issuer_company_dv=dv) | Q(recipient_rut=rut, recipient_dv=dv)
+        ), False
+
+    # Numérico: folio exacto, código de tipo de documento o prefijo de RUT
+    if NUMERIC_RE.match(compact):
+        number = int(compact)
+        query = Q(recipient_rut__startswith=compact) | Q(issuer_company_rut__startswith=compact)
+        if number <= MAX_FOLIO:
+            query |= Q(folio=number)
+            type_ids = list(DocumentType.objects.filter(code=number).values_list('id', flat=True))
+            if type_ids:
+                query |= Q(document_type_id__in=type_ids)
+        return queryset.filter(query), False
+
+    # Texto: razón social de emisor/receptor o nombre del tipo de documento
+    type_ids = list(DocumentType.objects.filter(name__icontains=term).values_list('id', flat=True))
+    query = Q(NameContains(F('recipient_name'), term)) | Q(NameContains(F('issuer_name'), term))
+    if type_ids:
+        query |= Q(document_type_id__in=type_ids)
+    queryset = queryset.filter(query)
+
+    if connection.vendor != 'postgresql':
+        return queryset, False
+
+    from django.contrib.postgres.search import TrigramSimilarity
+
+    return queryset.annotate(
+        search_rank=Greatest(
+            TrigramSimilarity('recipient_name', term),
+            TrigramSimilarity('issuer_name', term)
+        )
+    ), True
@@ -2,16 +2,128 @@
 Tareas de Celery para la aplicación documents
 """
 import logging
-from typing import Dict, Any, Optional
+from datetime import date
+from typing import Dict, List, Optional
 from celery import shared_task
+from django.core.files import File
+from django.core.files.storage import default_storage
 from django.db import transaction
-from django.db.models import Q
+from django.db.models import Exists, IntegerField, Max, Min, OuterRef, Subquery
+from django.db.models.functions import Cast
 
+from .exports import book_queryset, export_book_to_tempfile, export_filename
 from .models import Document, DocumentType
 
 logger = logging.getLogger(__name__)
 
 
+# Documentos por rango de IDs en cada UPDATE del enlazador
+REFERENCE_CHUNK_SIZE = 5000
+
+# reference_folio numérico que cabe en la columna entera folio
+NUMERIC_FOLIO_REGEX = r'^[0-9]{1,9}$'
+
+
+def _reference_type_map(reference_types) -> Dict[str, int]:
+    """
+    Resuelve cada valor distinto de reference_folio_type a un DocumentType.id.
+
+    Los valores numéricos se interpretan como código SII y los demás como parte
+    del nombre del tipo (primer tipo por código cuyo nombre lo contiene).
+    Se consulta DocumentType una sola vez.
+
+    Args:
+        reference_types: Valores distintos de reference_folio_type
+
+    Returns:
+        Dict reference_folio_type -> DocumentType.id (solo los resueltos)
+    """
+    document_types = list(DocumentType.objects.order_by('code').values_list('id', 'code', 'name'))
+    ids_by_code = {code: type_id for type_id, code, _ in document_types}
+
+    type_map = {}
+    for value in reference_types:
+        if value.isdigit():
+            type_id = ids_by_code.get(int(value))
+        else:
+            needle = value.lower()
+            type_id = next((type_id for type_id, _, name in document_types if needle in name.lower()), None)
+
+        if type_id:
+            type_map[value] = type_id
+        else:
+            logger.debug(f"      DocumentType no encontrado para: {value}")
+    return type_map
+
+
+def link_document_references(company_id: Optional[int] = None, limit: Optional[int] = None,
+                             chunk_size: int = REFERENCE_CHUNK_SIZE) -> Dict[str, int]:
+    """
+    Enlaza por conjunto los documentos con reference_folio a su documento referenciado.
+
+    En vez de buscar y guardar documento por documento, ejecuta un UPDATE con
+    subconsulta correlacionada por tipo de referencia y rango de IDs, resuelta con
+    el índice único (issuer_company_rut, issuer_company_dv, document_type, folio).
+
+    Args:
+        company_id: ID de empresa específica para procesar (opcional)
+        limit: Límite de documentos pendientes a considerar (opcional)
+        chunk_size: Documentos por rango de IDs en cada UPDATE
+
+    Returns:
+        Dict con processed, references_created y unresolved
+    """
+    pending = Document.objects.filter(
+        reference_folio__isnull=False,
+        reference_document__isnull=True  # Solo documentos sin referencia ya asignada
+    ).exclude(reference_folio='')
+
+    # Filtrar por empresa si se especifica
+    if company_id:
+        pending = pending.filter(company_id=company_id)
+
+    # Aplicar límite si se especifica
+    if limit:
+        pending = Document.objects.filter(id__in=list(pending.order_by('id').values_list('id', flat=True)[:limit]))
+
+    processed = pending.count()
+    if processed == 0:
+        return {'processed': 0, 'references_created': 0, 'unresolved': 0}
+
+    reference_types = pending.exclude(reference_folio_type__isnull=True).exclude(
+        reference_folio_type=''
+    ).order_by().values_list('reference_folio_type', flat=True).distinct()
+    type_map = _reference_type_map(list(reference_types))
+
+    linkable = pending.filter(reference_folio__regex=NUMERIC_FOLIO_REGEX)
+    bounds = linkable.aggregate(first_id=Min('id'), last_id=Max('id'))
+
+    references_created = 0
+    if type_map and bounds['first_id'] is not None:
+        for chunk_start in range(bounds['first_id'], bounds['last_id'] + 1, chunk_size):
+            chunk = linkable.filter(id__gte=chunk_start, id__lt=chunk_start + chunk_size)
+
+            for reference_type, document_type_id in type_map.items():
+                referenced = Document.objects.filter(
+                    issuer_company_rut=OuterRef('issuer_company_rut'),
+                    issuer_company_dv=OuterRef('issuer_company_dv'),
+                    document_type_id=document_type_id,
+                    folio=Cast(OuterRef('reference_folio'), IntegerField())
+                ).values('id')[:1]
+
+                with transaction.atomic():
+                    references_created += chunk.filter(
+                        Exists(referenced),
+                        reference_folio_type=reference_type
+                    ).update(reference_document=Subquery(referenced))
+
+    return {
+        'processed': processed,
+        'references_created': references_created,
+        'unresolved': processed - references_created
+    }
+
+
 @shared_task(bind=True, queue='default', autoretry_for=(Exception,), retry_kwargs={'max_retries': 3, 'countdown': 60})
 def generate_document_references_task(self, company_id: Optional[int] = None, limit: Optional[int] = None):
     """
@@ -30,74 +142,26 @@ def generate_document_references_task(self, company_id: Optional[int] = None, li
     task_id = self.request.id
     logger.info(f"🔗 [Task {task_id}] Iniciando generación de referencias de documentos")
 
+    if company_id:
+        logger.info(f"   Filtrando por empresa ID: {company_id}")
+    if limit:
+        logger.info(f"   Limitando procesamiento a {limit} documentos")
+
     try:
-        # Construir queryset base
-        queryset = Document.objects.filter(
-            reference_folio__isnull=False,
-            reference_document__isnull=True  # Solo documentos sin referencia ya asignada
-        ).exclude(reference_folio='')
-
-        # Filtrar por empresa si se especifica
-        if company_id:
-            queryset = queryset.filter(company_id=company_id)
-            logger.info(f"   Filtrando por empresa ID: {company_id}")
-
-        # Aplicar límite si se especifica
-        if limit:
-            queryset = queryset[:limit]
-            logger.info(f"   Limitando procesamiento a {limit} documentos")
-
-        total_docs = queryset.count()
-        logger.info(f"   Total documentos a procesar: {total_docs}")
-
-        if total_docs == 0:
-            logger.info("   No hay documentos para procesar")
-            return {
-                'status': 'success',
-                'task_id': task_id,
-                'processed': 0,
-                'references_created': 0,
-                'errors': 0,
-                'message': 'No hay documentos para procesar'
-            }
-
-        processed = 0
-        references_created = 0
-        errors = 0
-
-        # Procesar documentos en lotes para optimizar memoria
-        batch_size = 100
-
-        for offset in range(0, total_docs, batch_size):
-            batch = queryset[offset:offset + batch_size]
-
-            logger.info(f"   Procesando lote {offset//batch_size + 1}: {len(batch)} documentos")
-
-            for document in batch:
-                try:
-                    with transaction.atomic():
-                        result = _process_document_reference(document)
-
-                        processed += 1
-                        if result['reference_created']:
-                            references_created += 1
-                            logger.info(f"      ✅ Referencia creada: Doc {document.id} -> {result['referenced_document_id']}")
-
-                except Exception as e:
-                    errors += 1
-                    logger.error(f"      ❌ Error procesando documento {document.id}: {str(e)}")
+        result = link_document_references(company_id, limit)
 
         logger.info(f"🎉 [Task {task_id}] Generación de referencias completada")
-        logger.info(f"   Procesados: {processed}")
-        logger.info(f"   Referencias creadas: {references_created}")
-        logger.info(f"   Errores: {errors}")
+        logger.info(f"   Procesados: {result['processed']}")
+        logger.info(f"   Referencias creadas: {result['references_created']}")
+        logger.info(f"   Sin referencia encontrada: {result['unresolved']}")
 
         return {
             'status': 'success',
             'task_id': task_id,
-            'processed': processed,
-            'references_created': references_created,
-            'errors': errors,
+            'processed': result['processed'],
+            'references_created': result['references_created'],
+            'unresolved': result['unresolved'],
+            'errors': 0,
             'company_id': company_id
         }
 
@@ -106,95 +170,6 @@ def generate_document_references_task(self, company_id: Optional[int] = None, li
         raise
 
 
-def _process_document_reference(document: Document) -> Dict[str, Any]:
-    """
-    Procesa un documento individual para encontrar su referencia.
-
-    Args:
-        document: Documento a procesar
-
-    Returns:
-        Dict con resultado del procesamiento
-    """
-    logger.debug(f"   🔍 Procesando documento ID {document.id} (Folio {document.folio})")
-
-    # Validar que tenga los campos necesarios
-    if not document.reference_folio:
-        return {
-            'reference_created': False,
-            'reason': 'reference_folio vacío'
-        }
-
-    if not document.reference_folio_type:
-        return {
-            'reference_created': False,
-            'reason': 'reference_folio_type vacío'
-        }
-
-    # Convertir reference_folio_type a código de DocumentType
-    try:
-        # Intentar convertir a entero (código directo)
-        if document.reference_folio_type.isdigit():
-            doc_type_code = int(document.reference_folio_type)
-        else:
-            # Si no es número, buscar por nombre
-            doc_type = DocumentType.objects.filter(name__icontains=document.reference_folio_type).first()
-            if not doc_type:
-                return {
-                    'reference_created': False,
-                    'reason': f'DocumentType no encontrado para: {document.reference_folio_type}'
-                }
-            doc_type_code = doc_type.code
-
-    except (ValueError, DocumentType.DoesNotExist):
-        return {
-            'reference_created': False,
-            'reason': f'Error convirtiendo reference_folio_type: {document.reference_folio_type}'
-        }
-
-    # Buscar documento referenciado
-    try:
-        # Buscar por RUT emisor, tipo documento y folio
-        referenced_doc = Document.objects.filter(
-            issuer_company_rut=document.issuer_company_rut,
-            issuer_company_dv=document.issuer_company_dv,
-            document_type__code=doc_type_code,
-            folio=int(document.reference_folio)
-        ).first()
-
-        if not referenced_doc:
-            logger.debug(f"      No se encontró documento referenciado: RUT {document.issuer_company_rut}-{document.issuer_company_dv}, Tipo {doc_type_code}, Folio {document.reference_folio}")
-            return {
-                'reference_created': False,
-                'reason': f'Documento referenciado no encontrado: RUT {document.issuer_company_rut}-{document.issuer_company_dv}, Tipo {doc_type_code}, Folio {document.reference_folio}'
-            }
-
-        # Crear la referencia
-        document.reference_document = referenced_doc
-        document.save(update_fields=['reference_document'])
-
-        logger.debug(f"      ✅ Referencia creada: {document.id} -> {referenced_doc.id}")
-
-        return {
-            'reference_created': True,
-            'referenced_document_id': referenced_doc.id,
-            'referenced_folio': referenced_doc.folio,
-            'referenced_type': referenced_doc.document_type.code
-        }
-
-    except ValueError:
-        return {
-            'reference_created': False,
-            'reason': f'reference_folio no es un número válido: {document.reference_folio}'
-        }
-    except Exception as e:
-        logger.error(f"      ❌ Error buscando documento referenciado: {str(e)}")
-        return {
-            'reference_created': False,
-            'reason': f'Error en búsqueda: {str(e)}'
-        }
-
-
 @shared_task(bind=True, queue='default')
 def generate_references_for_company_task(self, company_id: int, limit: Optional[int] = 500):
     """
@@ -224,4 +199,48 @@ def generate_references_batch_task(self, batch_size: int = 1000):
     return generate_document_references_task.apply_async(
         args=[None, batch_size],
         task_id=f"refs_batch_{batch_size}_{task_id}"
-    ).get()
\ No newline at end of file
+    ).get()
+
+@shared_task(bind=True, queue='default')
+def export_documents_book_task(
+    self,
+    company_ids: List[int],
+    book: str,
+    export_format: str = 'xlsx',
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+):
+    """
+    Exporta un libro de compras o ventas a un archivo en el storage por defecto.
+    Variante asíncrona del endpoint documents/export para rangos muy grandes.
+
+    Args:
+        company_ids: IDs de las empresas
+        book: sales | purchases
+        export_format: csv | xlsx
+        start_date: Fecha de emisión desde, ISO (opcional)
+        end_date: Fecha de emisión hasta, ISO (opcional)
+
+    Returns:
+        Dict con la ruta y URL del archivo y la cantidad de documentos exportados
+    """
+    task_id = self.request.id
+    start = date.fromisoformat(start_date) if start_date else None
+    end = date.fromisoformat(end_date) if end_date else None
+    logger.info(f"📤 [Task {task_id}] Exportando {book} ({export_format}) para empresas {company_ids}")
+
+    queryset = book_queryset(company_ids, book, start, end)
+    exported, rows = export_book_to_tempfile(queryset, book, export_format)
+    with exported:
+        filename = export_filename(book, export_format, start, end)
+        path = default_storage.save(f"documents/exports/{task_id or 'manual'}/{filename}", File(exported))
+
+    logger.info(f"✅ [Task {task_id}] Exportación completada: {rows} documentos en {path}")
+    return {
+        'status': 'success',
+        'task_id': task_id,
+        'company_ids': company_ids,
+        'rows': rows,
+        'path': path,
+        'url': default_storage.url(path),
+    }
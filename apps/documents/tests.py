@@ -0,0 +1,316 @@
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from apps.companies.models import Company
+from .exports import EXPORT_TASK_PREFIX, book_header, book_queryset, iter_book_rows, stream_csv
+from .models import Document, DocumentRawData, DocumentType, DocumentMonthlyRollup
+from .rollups import _full_month_window, rebuild_rollups, refresh_rollups, summarize
+from .search import search_documents
+from .tasks import link_document_references
+from .views import DocumentViewSet
+
+
+class DocumentFixturesMixin:
+    """
+    Empresa, tipo de documento y fábrica de documentos compartidos por los tests
+    """
+
+    def setUp(self):
+        self.company = Company.objects.create(
+            business_name='Test Company',
+            tax_id='76543210-K',
+            email='test@company.com'
+        )
+        self.document_type = DocumentType.objects.create(code=33, name='Factura Electrónica', category='invoice')
+
+    def create_document(self, folio, issue_date, issued=True, total=1000, status='accepted'):
+        own = ('76543210', 'K')
+        other = ('11111111', '1')
+        issuer, recipient = (own, other) if issued else (other, own)
+        return Document.objects.create(
+            company=self.company,
+            issuer_company_rut=issuer[0],
+            issuer_company_dv=issuer[1],
+            issuer_name='Emisor',
+            issuer_address='Dirección',
+            recipient_rut=recipient[0],
+            recipient_dv=recipient[1],
+            recipient_name='Receptor',
+            document_type=self.document_type,
+            folio=folio,
+            issue_date=issue_date,
+            status=status,
+            direction='issued' if issued else 'received',
+            total_amount=Decimal(total),
+            tax_amount=Decimal(total) * Decimal('0.19'),
+        )
+
+
+class DocumentMonthlyRollupTestCase(DocumentFixturesMixin, TestCase):
+    """
+    Tests del rollup mensual de documentos y de su lectura híbrida por rango de fechas
+    """
+
+    def test_full_month_window(self):
+        """Los meses completos van al rollup y los días sueltos a documentos"""
+        self.assertEqual(
+            _full_month_window(date(2024, 1, 5), date(2024, 3, 31)),
+            (date(2024, 2, 1), date(2024, 4, 1), [(date(2024, 1, 5), date(2024, 1, 31))])
+        )
+        self.assertEqual(
+            _full_month_window(date(2024, 1, 1), date(2024, 3, 15)),
+            (date(2024, 1, 1), date(2024, 3, 1), [(date(2024, 3, 1), date(2024, 3, 15))])
+        )
+        self.assertEqual(
+            _full_month_window(date(2024, 3, 5), date(2024, 3, 20)),
+            (None, None, [(date(2024, 3, 5), date(2024, 3, 20))])
+        )
+
+    def test_rebuild_groups_by_month_and_direction(self):
+        self.create_document(1, date(2024, 1, 5), issued=True, total=1000)
+        self.create_document(2, date(2024, 1, 20), issued=False, total=2000)
+        self.create_document(3, date(2024, 3, 2), issued=True, total=3000)
+
+        result = rebuild_rollups([self.company.id])
+
+        self.assertEqual(result, {'companies': 1, 'rows': 3})
+        january_sales = DocumentMonthlyRollup.objects.get(month=date(2024, 1, 1), direction='issued')
+        self.assertEqual(january_sales.document_count, 1)
+        self.assertEqual(january_sales.total_amount, Decimal('1000'))
+
+    def test_refresh_moves_document_between_months(self):
+        document = self.create_document(1, date(2024, 1, 5))
+        refresh_rollups([(self.company.id, date(2024, 1, 1))])
+
+        document.issue_date = date(2024, 2, 10)
+        document.save()
+        refresh_rollups([(self.company.id, date(2024, 1, 1)), (self.company.id, date(2024, 2, 1))])
+
+        self.assertEqual(
+            list(DocumentMonthlyRollup.objects.values_list('month', flat=True)),
+            [date(2024, 2, 1)]
+        )
+
+    def test_signals_refresh_months_on_commit(self):
+        """Guardar, mover de mes y eliminar un documento recalcula sus meses al confirmar"""
+        with self.captureOnCommitCallbacks(execute=True):
+            document = self.create_document(1, date(2024, 1, 5), total=1000)
+        self.assertEqual(DocumentMonthlyRollup.objects.get(month=date(2024, 1, 1)).document_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            document.issue_date = date(2024, 2, 10)
+            document.save()
+        self.assertEqual(
+            list(DocumentMonthlyRollup.objects.values_list('month', flat=True)),
+            [date(2024, 2, 1)]
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Document.objects.filter(id=document.id).delete()
+        self.assertFalse(DocumentMonthlyRollup.objects.exists())
+
+    def test_summarize_matches_documents_for_partial_months(self):
+        self.create_document(1, date(2024, 1, 5), issued=True, total=1000)
+        self.create_document(2, date(2024, 1, 20), issued=False, total=2000)
+        self.create_document(3, date(2024, 2, 15), issued=True, total=3000)
+        self.create_document(4, date(2024, 3, 2), issued=True, total=4000)
+        rebuild_rollups()
+
+        rows = {
+            row['direction']: row
+            for row in summarize([self.company], date(2024, 1, 10), date(2024, 2, 29), group_by=('direction',))
+        }
+
+        self.assertEqual(rows['issued']['count'], 1)
+        self.assertEqual(rows['issued']['total'], Decimal('3000'))
+        self.assertEqual(rows['received']['count'], 1)
+        self.assertEqual(rows['received']['total'], Decimal('2000'))
+
+
+class DocumentExportTestCase(DocumentFixturesMixin, TestCase):
+    """
+    Tests de la exportación de libros de compras y ventas y de su estado asíncrono
+    """
+
+    def test_book_export_rows(self):
+        """El libro de ventas solo incluye emitidos, en orden de fecha y con el RUT de la contraparte"""
+        self.create_document(2, date(2024, 1, 20), issued=True, total=2000)
+        self.create_document(1, date(2024, 1, 5), issued=True, total=1000)
+        self.create_document(3, date(2024, 1, 6), issued=False)
+
+        queryset = book_queryset([self.company.id], 'sales', date(2024, 1, 1), date(2024, 1, 31))
+        rows = list(iter_book_rows(queryset, 'sales', chunk_size=1))
+
+        self.assertEqual([row[1] for row in rows], [1, 2])
+        self.assertEqual(rows[0][3], '11111111-1')
+        lines = list(stream_csv(book_header('sales'), rows))
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith('\ufeffTipo Doc,Folio'))
+
+    def export_status(self, task_id, result=None):
+        """Llama a export-status con un AsyncResult falso"""
+        request = Request(APIRequestFactory().get('/', {'company_id': self.company.id, 'task_id': task_id}))
+        with mock.patch('celery.result.AsyncResult', return_value=result) as async_result:
+            response = DocumentViewSet().export_status(request)
+        return response, async_result
+
+    @staticmethod
+    def finished_task(result, failed=False):
+        return mock.Mock(
+            status='FAILURE' if failed else 'SUCCESS',
+            result=result,
+            successful=mock.Mock(return_value=not failed),
+            failed=mock.Mock(return_value=failed),
+        )
+
+    def test_export_status_returns_own_export(self):
+        task = self.finished_task({'company_ids': [self.company.id], 'path': 'documents/exports/x.csv', 'rows': 2})
+
+        response, _ = self.export_status(f'{EXPORT_TASK_PREFIX}1', task)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['path'], 'documents/exports/x.csv')
+
+    def test_export_status_rejects_foreign_export(self):
+        other = Company.objects.create(business_name='Other', tax_id='11111111-1', email='other@company.com')
+        task = self.finished_task({'company_ids': [other.id], 'path': 'documents/exports/y.csv'})
+
+        response, _ = self.export_status(f'{EXPORT_TASK_PREFIX}2', task)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('path', response.data)
+
+    def test_export_status_rejects_non_export_task(self):
+        task = self.finished_task({'status': 'success', 'processed': 10})
+
+        response, async_result = self.export_status('f3b6a5a4-sync-task', task)
+        self.assertEqual(response.status_code, 404)
+        async_result.assert_not_called()
+
+        # Con el prefijo, un resultado sin company_ids (o que no es dict) tampoco se entrega
+        for result in ({'status': 'success', 'processed': 10}, ['no', 'es', 'dict']):
+            response, _ = self.export_status(f'{EXPORT_TASK_PREFIX}3', self.finished_task(result))
+            self.assertEqual(response.status_code, 404)
+
+    def test_export_status_hides_failure_details(self):
+        task = self.finished_task(RuntimeError('password=secreto'), failed=True)
+
+        response, _ = self.export_status(f'{EXPORT_TASK_PREFIX}4', task)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'failure')
+        self.assertNotIn('secreto', response.data['error'])
+
+
+class DocumentSearchTestCase(DocumentFixturesMixin, TestCase):
+    """
+    Tests de la búsqueda de documentos (RUT, folio y texto)
+    """
+
+    def test_search_paths(self):
+        """RUT completo, número (folio / prefijo de RUT) y texto usan filtros distintos"""
+        self.create_document(1234, date(2024, 1, 5), issued=True)
+        self.create_document(77, date(2024, 1, 6), issued=False)
+        documents = Document.objects.all()
+
+        self.assertEqual(search_documents(documents, '11.111.111-1')[0].count(), 2)
+        self.assertEqual(list(search_documents(documents, '1234')[0].values_list('folio', flat=True)), [1234])
+        self.assertEqual(search_documents(documents, '7654')[0].count(), 2)
+        self.assertEqual(search_documents(documents, 'recept')[0].count(), 2)
+        self.assertEqual(search_documents(documents, 'no existe')[0].count(), 0)
+
+    def test_text_search_compiles_to_indexable_ilike_on_postgresql(self):
+        """
+        En PostgreSQL el texto se filtra con ILIKE sobre la columna sin transformar,
+        la expresión que cubren los índices GIN gin_trgm_ops (icontains compila a
+        UPPER("recipient_name"::text) LIKE ..., que obliga a un seq scan)
+        """
+        from django.db import connections
+        from django.db.backends.postgresql.base import DatabaseWrapper
+
+        postgresql = DatabaseWrapper(
+            {**connections['default'].settings_dict, 'ENGINE': 'django.db.backends.postgresql'},
+            alias='search-sql'
+        )
+        queryset, _ = search_documents(Document.objects.all(), 'comercial 50%')
+        sql, params = queryset.query.get_compiler(connection=postgresql).as_sql()
+
+        self.assertIn('"documents"."recipient_name" ILIKE %s', sql)
+        self.assertIn('"documents"."issuer_name" ILIKE %s', sql)
+        self.assertNotIn('UPPER', sql)
+        self.assertIn('%comercial 50\\%%', params)
+
+
+class DocumentListTestCase(DocumentFixturesMixin, TestCase):
+    """
+    Tests de la serialización de filas del listado de documentos
+    """
+
+    def test_unknown_direction_falls_back_to_raw_data(self):
+        """Sin dirección persistida, el tipo de operación sale de raw_data (también comprimido)"""
+        issued = self.create_document(1, date(2024, 1, 5), issued=True)
+        unknown_sale = self.create_document(2, date(2024, 1, 6), issued=False)
+        unknown_purchase = self.create_document(3, date(2024, 1, 7), issued=True)
+        Document.objects.filter(id__in=[unknown_sale.id, unknown_purchase.id]).update(direction='unknown')
+        DocumentRawData.objects.create(document=unknown_sale, **DocumentRawData.encode({'tipo_operacion': 'emitidos'}, compress=True))
+        DocumentRawData.objects.create(document=unknown_purchase, **DocumentRawData.encode({'tipo_operacion': 'recibidos'}))
+
+        rows = Document.objects.order_by('folio').values(*DocumentViewSet.LIST_FIELDS)
+        with self.assertNumQueries(2):
+            results = DocumentViewSet._serialize_list_rows(list(rows))
+
+        self.assertEqual([row['tipo_operacion'] for row in results], ['venta', 'venta', 'compra'])
+        self.assertEqual(results[0]['id'], issued.id)
+
+
+class DocumentReferenceTestCase(DocumentFixturesMixin, TestCase):
+    """
+    Tests del enlace por conjunto de notas de crédito/débito a su documento referenciado
+    """
+
+    def create_note(self, folio, reference_folio, reference_folio_type):
+        note = self.create_document(folio, date(2024, 2, 1))
+        Document.objects.filter(id=note.id).update(
+            document_type=self.credit_note_type,
+            reference_folio=reference_folio,
+            reference_folio_type=reference_folio_type
+        )
+        return note
+
+    def test_link_document_references(self):
+        self.credit_note_type = DocumentType.objects.create(code=61, name='Nota de Crédito Electrónica', category='credit_note')
+        invoice = self.create_document(100, date(2024, 1, 5))
+        other_invoice = self.create_document(101, date(2024, 1, 6))
+
+        by_code = self.create_note(1, '100', '33')
+        by_name = self.create_note(2, '101', 'Factura')
+        self.create_note(3, 'ABC-100', '33')  # folio no numérico: no se intenta enlazar
+        self.create_note(4, '999', '33')  # no existe el documento referenciado
+
+        result = link_document_references(chunk_size=2)
+
+        self.assertEqual(result, {'processed': 4, 'references_created': 2, 'unresolved': 2})
+        self.assertEqual(Document.objects.get(id=by_code.id).reference_document_id, invoice.id)
+        self.assertEqual(Document.objects.get(id=by_name.id).reference_document_id, other_invoice.id)
+        self.assertEqual(Document.objects.filter(reference_document__isnull=False).count(), 2)
+        # Una segunda pasada solo considera los pendientes
+        self.assertEqual(link_document_references(), {'processed': 2, 'references_created': 0, 'unresolved': 2})
+
+
+class DocumentCursorTestCase(SimpleTestCase):
+    """
+    Tests del cursor de paginación keyset del listado de documentos
+    """
+
+    def test_cursor_round_trip(self):
+        cursor = DocumentViewSet._encode_cursor({'issue_date': date(2024, 5, 31), 'folio': 1234, 'id': 99})
+        self.assertEqual(DocumentViewSet._decode_cursor(cursor), (date(2024, 5, 31), 1234, 99))
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            DocumentViewSet._decode_cursor('no-es-un-cursor')
@@ -2,12 +2,25 @@ from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from django.http import FileResponse, StreamingHttpResponse
 from django.utils import timezone
-from django.db.models import Q, Sum, Count, Case, When, DecimalField
+from django.db.models import Q, Sum, Count, Case, When, DecimalField, DateField
+from django.db.models.functions import Trunc
+from django.db import connection
 from datetime import datetime, timedelta
+import base64
+import binascii
+import json
 import logging
-
-from .models import Document, DocumentType
+import uuid
+
+from .exports import (
+    CONTENT_TYPES, EXPORT_FORMATS, EXPORT_TASK_PREFIX, book_header, book_queryset,
+    export_book_to_tempfile, export_filename, get_layout, iter_book_rows, stream_csv,
+)
+from .models import Document, DocumentRawData, DocumentType
+from .rollups import summarize
+from .search import search_documents
 from .serializers import DocumentSerializer
 from apps.core.permissions import IsCompanyMember
 from apps.companies.models import Company
@@ -84,14 +97,14 @@ def auth_debug(request):
                     'tax_id': company.tax_id
                 },
                 'ventas': {
-                    'total': float(ventas_stats['total'] or 0),
-                    'cantidad': ventas_stats['cantidad'],
-                    'iva': float(ventas_stats['iva'] or 0)
+                    'total': float(ventas_stats.get('total') or 0),
+                    'cantidad': ventas_stats.get('count', 0),
+                    'iva': float(ventas_stats.get('tax') or 0)
                 },
                 'compras': {
-                    'total': float(compras_stats['total'] or 0),
-                    'cantidad': compras_stats['cantidad'],
-                    'iva': float(compras_stats['iva'] or 0)
+                    'total': float(compras_stats.get('total') or 0),
+                    'cantidad': compras_stats.get('count', 0),
+                    'iva': float(compras_stats.get('tax') or 0)
                 },
                 'query_info': {
                     'total_docs_in_period': queryset.count(),
@@ -130,6 +143,15 @@ class DocumentViewSet(viewsets.ViewSet):
     serializer_class = DocumentSerializer
     permission_classes = [IsAuthenticated, IsCompanyMember]
     
+    # Columnas que usa el listado (evita cargar xml_data, sii_response, etc.)
+    LIST_FIELDS = (
+        'id', 'document_type__code', 'folio', 'issue_date', 'created_at',
+        'issuer_name', 'issuer_company_rut', 'issuer_company_dv',
+        'recipient_name', 'recipient_rut', 'recipient_dv',
+        'total_amount', 'net_amount', 'tax_amount', 'sii_track_id', 'status',
+        'direction',
+    )
+    
     def get_queryset(self):
         """Filtrar documentos por empresa del usuario"""
         return Document.objects.all().order_by('-issue_date', '-folio')
@@ -171,11 +193,119 @@ class DocumentViewSet(viewsets.ViewSet):
         except (ValueError, Company.DoesNotExist):
             raise ValueError(f"Empresa con ID {company_id} no encontrada")
     
+    @staticmethod
+    def _encode_cursor(row):
+        """Cursor opaco con la posición (issue_date, folio, id) de la última fila entregada"""
+        payload = json.dumps([row['issue_date'].isoformat(), row['folio'], row['id']])
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+    
+    @staticmethod
+    def _decode_cursor(cursor):
+        """Inverso de _encode_cursor. Lanza ValueError si el cursor es inválido"""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            issue_date, folio, document_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            return datetime.strptime(issue_date, '%Y-%m-%d').date(), int(folio), int(document_id)
+        except (TypeError, ValueError, binascii.Error):
+            raise ValueError('Cursor de paginación inválido')
+    
+    @staticmethod
+    def _keyset_filter(position, descending):
+        """Filtro de las filas posteriores a `position` en el orden (issue_date, folio, id)"""
+        issue_date, folio, document_id = position
+        op = 'lt' if descending else 'gt'
+        return (
+            Q(**{f'issue_date__{op}': issue_date})
+            | Q(issue_date=issue_date, **{f'folio__{op}': folio})
+            | Q(issue_date=issue_date, folio=folio, **{f'id__{op}': document_id})
+        )
+    
+    @staticmethod
+    def _count_documents(queryset, mode):
+        """
+        Total de documentos según el modo pedido:
+        exact = COUNT(*), approx = estimación del planner de PostgreSQL, none = no se calcula
+        """
+        if mode == 'none':
+            return None
+        if mode == 'approx' and connection.vendor == 'postgresql':
+            try:
+                plan = json.loads(queryset.order_by().explain(format='json'))
+                return int(plan[0]['Plan']['Plan Rows'])
+            except Exception as e:
+                logger.warning(f"No se pudo estimar el total de documentos: {e}")
+        return queryset.count()
+    
+    @classmethod
+    def _serialize_list_rows(cls, rows):
+        """
+        Serializa una página del listado. Para los documentos con dirección 'unknown'
+        lee el tipo_operacion de raw_data con una sola consulta adicional.
+        """
+        unknown_ids = [row['id'] for row in rows if row['direction'] == 'unknown']
+        raw_operations = {}
+        if unknown_ids:
+            # Se decodifica en Python: el payload puede estar comprimido
+            raw_operations = {
+                raw.document_id: raw.payload.get('tipo_operacion')
+                for raw in DocumentRawData.objects.filter(document_id__in=unknown_ids)
+            }
+        return [cls._serialize_list_row(row, raw_operations.get(row['id'])) for row in rows]
+    
+    @staticmethod
+    def _serialize_list_row(row, raw_tipo_operacion=None):
+        """Arma el dict del listado (formato del frontend) desde una fila de LIST_FIELDS"""
+        # Tipo de operación según la dirección persistida del documento
+        if row['direction'] != 'unknown':
+            is_issuer = row['direction'] == 'issued'
+        else:
+            # Fallback basado en raw_data
+            is_issuer = raw_tipo_operacion == 'emitidos'
+        
+        issuer_rut = f"{row['issuer_company_rut']}-{row['issuer_company_dv']}"
+        recipient_rut = f"{row['recipient_rut']}-{row['recipient_dv']}"
+        return {
+            'id': row['id'],
+            'document_type': str(row['document_type__code']),
+            'folio': str(row['folio']),
+            'issue_date': row['issue_date'].isoformat(),
+            'created_at': row['created_at'].isoformat(),
+            # Frontend expected fields
+            'receiver_name': row['recipient_name'],
+            'receiver_rut': recipient_rut,
+            'sender_name': row['issuer_name'],
+            'sender_rut': issuer_rut,
+            # Compatibility fields for ElectronicDocument interface
+            'razon_social_emisor': row['issuer_name'],
+            'rut_emisor': issuer_rut,
+            'total_amount': float(row['total_amount']),
+            'net_amount': float(row['net_amount']),
+            'tax_amount': float(row['tax_amount']),
+            'operation': 'issued' if is_issuer else 'received',
+            'track_id': row['sii_track_id'] or '',
+            'status': row['status'],
+            # Backward compatibility fields
+            'razon_social_receptor': row['recipient_name'],
+            'rut_receptor': recipient_rut,
+            'monto_total': float(row['total_amount']),
+            'monto_iva': float(row['tax_amount']),
+            'monto_neto': float(row['net_amount']),
+            'tipo_operacion': 'venta' if is_issuer else 'compra',
+        }
+    
     def list(self, request):
         """
         Endpoint para obtener lista de documentos con datos reales
         GET /api/v1/documents/?company_id=1&tipo_operacion=venta&fecha_desde=2024-01-01&fecha_hasta=2024-12-31
         GET /api/v1/documents/?company_ids=1,2,3&tipo_operacion=venta
+        GET /api/v1/documents/?company_id=1&pagination=cursor&page_size=50
+        GET /api/v1/documents/?company_id=1&cursor=<next_cursor>&count=approx
+
+        Paginación: por página (`page`, compatible con clientes antiguos) o por cursor
+        (`pagination=cursor` / `cursor`), que no se degrada en páginas profundas.
+        `count`: exact | approx | none (por defecto exact por página y none por cursor).
+        `search`: RUT, folio o texto (ver apps/documents/search.py); la búsqueda por texto
+        se ordena por relevancia salvo que se indique `ordering`.
         """
         try:
             companies = self.get_companies(request)
@@ -198,50 +328,11 @@ class DocumentViewSet(viewsets.ViewSet):
             # Construir query base - documentos de las empresas seleccionadas
             queryset = self.get_queryset().filter(company__in=companies)
 
-            # Filtrar por tipo de operación solo si se especifica
+            # Filtrar por tipo de operación solo si se especifica (dirección persistida e indexada)
             if tipo_operacion == 'venta':
-                # Documentos emitidos por cualquiera de las empresas
-                company_ruts = []
-                company_dvs = []
-                for company in companies:
-                    rut_parts = company.tax_id.split('-')
-                    if len(rut_parts) == 2:
-                        company_ruts.append(rut_parts[0])
-                        company_dvs.append(rut_parts[1].upper())
-
-                if company_ruts:
-                    # Crear queries OR para cada empresa
-                    issuer_queries = []
-                    for rut, dv in zip(company_ruts, company_dvs):
-                        issuer_queries.append(Q(issuer_company_rut=rut, issuer_company_dv=dv))
-
-                    if issuer_queries:
-                        combined_query = issuer_queries[0]
-                        for query in issuer_queries[1:]:
-                            combined_query |= query
-                        queryset = queryset.filter(combined_query)
-
+                queryset = queryset.filter(direction='issued')
             elif tipo_operacion == 'compra':
-                # Documentos recibidos por cualquiera de las empresas
-                company_ruts = []
-                company_dvs = []
-                for company in companies:
-                    rut_parts = company.tax_id.split('-')
-                    if len(rut_parts) == 2:
-                        company_ruts.append(rut_parts[0])
-                        company_dvs.append(rut_parts[1].upper())
-
-                if company_ruts:
-                    # Crear queries OR para cada empresa
-                    recipient_queries = []
-                    for rut, dv in zip(company_ruts, company_dvs):
-                        recipient_queries.append(Q(recipient_rut=rut, recipient_dv=dv))
-
-                    if recipient_queries:
-                        combined_query = recipient_queries[0]
-                        for query in recipient_queries[1:]:
-                            combined_query |= query
-                        queryset = queryset.filter(combined_query)
+                queryset = queryset.filter(direction='received')
             # Si no se especifica tipo_operacion, mostrar TODOS los documentos (ventas + compras)
             
             # Filtros de fecha
@@ -259,22 +350,11 @@ class DocumentViewSet(viewsets.ViewSet):
                 except ValueError:
                     pass
 
-            # Filtro de búsqueda de texto
+            # Filtro de búsqueda de texto (caminos indexados por tipo de término)
+            order_by_relevance = False
             if search:
-                search_query = Q(
-                    folio__icontains=search
-                ) | Q(
-                    recipient_name__icontains=search
-                ) | Q(
-                    recipient_rut__icontains=search
-                ) | Q(
-                    issuer_name__icontains=search
-                ) | Q(
-                    document_type__name__icontains=search
-                ) | Q(
-                    document_type__code__icontains=search
-                )
-                queryset = queryset.filter(search_query)
+                queryset, ranked = search_documents(queryset, search)
+                order_by_relevance = ranked and 'ordering' not in request.query_params
 
             # Filtro por tipo de documento
             if document_type:
@@ -320,8 +400,41 @@ class DocumentViewSet(viewsets.ViewSet):
                 except ValueError:
                     pass
 
+            cursor = request.query_params.get('cursor')
+            use_cursor = cursor is not None or request.query_params.get('pagination') == 'cursor'
+            # Modo de conteo: exact, approx (estimación del planner) o none.
+            # Por defecto exact en modo página (compatibilidad) y none en modo cursor
+            count_mode = request.query_params.get('count', 'none' if use_cursor else 'exact')
+
+            # Paginación por cursor (keyset) sobre (issue_date, folio, id): solo para
+            # ordenamiento por fecha; con otros ordenamientos se usa página/offset
+            if use_cursor and ordering.lstrip('-') == 'issue_date':
+                descending = ordering.startswith('-')
+                sort_fields = ['issue_date', 'folio', 'id']
+                queryset = queryset.order_by(*[f"-{field}" if descending else field for field in sort_fields])
+                total_count = self._count_documents(queryset, count_mode)
+                if cursor:
+                    queryset = queryset.filter(self._keyset_filter(self._decode_cursor(cursor), descending))
+
+                rows = list(queryset.values(*self.LIST_FIELDS)[:page_size + 1])
+                has_next = len(rows) > page_size
+                rows = rows[:page_size]
+                next_cursor = self._encode_cursor(rows[-1]) if has_next else None
+
+                return Response({
+                    'results': self._serialize_list_rows(rows),
+                    'count': total_count,
+                    'next': f'?cursor={next_cursor}' if next_cursor else None,
+                    'previous': None,
+                    'next_cursor': next_cursor,
+                    'page': None,
+                    'page_size': page_size
+                })
+
             # Aplicar ordenamiento
-            if ordering:
+            if order_by_relevance:
+                queryset = queryset.order_by('-search_rank', '-issue_date', '-folio')
+            elif ordering:
                 # Validar que el campo de ordering existe
                 valid_fields = ['issue_date', 'folio', 'total_amount', 'document_type', 'recipient_name', 'issuer_name']
                 order_field = ordering.lstrip('-')
@@ -329,75 +442,16 @@ class DocumentViewSet(viewsets.ViewSet):
                     queryset = queryset.order_by(ordering)
 
             # Aplicar paginación
-            total_count = queryset.count()
+            total_count = self._count_documents(queryset, count_mode)
             start_index = (page - 1) * page_size
             end_index = start_index + page_size
             
-            documents = queryset[start_index:end_index]
-            
-            # Serializar documentos para el frontend
-            results = []
-            for doc in documents:
-                # Determinar tipo de operación basado en las empresas seleccionadas
-                is_issuer = False
-                is_receiver = False
-
-                # Verificar si alguna de las empresas es emisor o receptor
-                for company in companies:
-                    company_rut = company.tax_id.split('-')[0]
-                    company_dv = company.tax_id.split('-')[1].upper()
-
-                    if (doc.issuer_company_rut == company_rut and
-                        doc.issuer_company_dv == company_dv):
-                        is_issuer = True
-                        break
-
-                    if (doc.recipient_rut == company_rut and
-                        doc.recipient_dv == company_dv):
-                        is_receiver = True
-                
-                if is_issuer:
-                    doc_operation = 'issued'
-                    doc_tipo_operacion = 'venta' 
-                elif is_receiver:
-                    doc_operation = 'received'
-                    doc_tipo_operacion = 'compra'
-                else:
-                    # Fallback basado en raw_data
-                    doc_operation = 'issued' if doc.raw_data.get('tipo_operacion') == 'emitidos' else 'received'
-                    doc_tipo_operacion = 'venta' if doc.raw_data.get('tipo_operacion') == 'emitidos' else 'compra'
-                
-                results.append({
-                    'id': doc.id,
-                    'document_type': str(doc.document_type.code),
-                    'folio': str(doc.folio),
-                    'issue_date': doc.issue_date.isoformat(),
-                    'created_at': doc.created_at.isoformat(),
-                    # Frontend expected fields
-                    'receiver_name': doc.recipient_name,
-                    'receiver_rut': doc.recipient_full_rut,
-                    'sender_name': doc.issuer_name,
-                    'sender_rut': f"{doc.issuer_company_rut}-{doc.issuer_company_dv}",
-                    # Compatibility fields for ElectronicDocument interface
-                    'razon_social_emisor': doc.issuer_name,
-                    'rut_emisor': f"{doc.issuer_company_rut}-{doc.issuer_company_dv}",
-                    'total_amount': float(doc.total_amount),
-                    'net_amount': float(doc.net_amount),
-                    'tax_amount': float(doc.tax_amount),
-                    'operation': doc_operation,
-                    'track_id': doc.sii_track_id or '',
-                    'status': doc.status,
-                    # Backward compatibility fields
-                    'razon_social_receptor': doc.recipient_name,
-                    'rut_receptor': doc.recipient_full_rut,
-                    'monto_total': float(doc.total_amount),
-                    'monto_iva': float(doc.tax_amount),
-                    'monto_neto': float(doc.net_amount),
-                    'tipo_operacion': doc_tipo_operacion,
-                })
+            # Proyección de solo las columnas que se devuelven, con el tipo de documento en el mismo JOIN
+            rows = list(queryset.values(*self.LIST_FIELDS)[start_index:end_index + 1])
+            results = self._serialize_list_rows(rows[:page_size])
             
             # Calcular next/previous
-            has_next = end_index < total_count
+            has_next = len(rows) > page_size
             has_previous = page > 1
             
             return Response({
@@ -445,70 +499,25 @@ class DocumentViewSet(viewsets.ViewSet):
                     'error': 'Formato de fecha inválido. Use YYYY-MM-DD'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # Query base: documentos de las empresas en el período
-            queryset = self.get_queryset().filter(
-                company__in=companies,
-                issue_date__gte=start_date_dt,
-                issue_date__lte=end_date_dt
-            )
-
-            # Recopilar RUTs de todas las empresas
-            company_ruts = []
-            company_dvs = []
-            for company in companies:
-                rut_parts = company.tax_id.split('-')
-                if len(rut_parts) == 2:
-                    company_ruts.append(rut_parts[0])
-                    company_dvs.append(rut_parts[1].upper())
-
-            # VENTAS: Documentos emitidos por cualquiera de las empresas
-            ventas_queries = []
-            for rut, dv in zip(company_ruts, company_dvs):
-                ventas_queries.append(Q(issuer_company_rut=rut, issuer_company_dv=dv))
-
-            if ventas_queries:
-                ventas_combined_query = ventas_queries[0]
-                for query in ventas_queries[1:]:
-                    ventas_combined_query |= query
-
-                ventas_queryset = queryset.filter(ventas_combined_query)
-                ventas_stats = ventas_queryset.aggregate(
-                    total=Sum('total_amount') or 0,
-                    cantidad=Count('id'),
-                    iva=Sum('tax_amount') or 0
-                )
-            else:
-                ventas_stats = {'total': 0, 'cantidad': 0, 'iva': 0}
-
-            # COMPRAS: Documentos recibidos por cualquiera de las empresas
-            compras_queries = []
-            for rut, dv in zip(company_ruts, company_dvs):
-                compras_queries.append(Q(recipient_rut=rut, recipient_dv=dv))
-
-            if compras_queries:
-                compras_combined_query = compras_queries[0]
-                for query in compras_queries[1:]:
-                    compras_combined_query |= query
-
-                compras_queryset = queryset.filter(compras_combined_query)
-                compras_stats = compras_queryset.aggregate(
-                    total=Sum('total_amount') or 0,
-                    cantidad=Count('id'),
-                    iva=Sum('tax_amount') or 0
-                )
-            else:
-                compras_stats = {'total': 0, 'cantidad': 0, 'iva': 0}
+            # Totales por dirección desde el rollup mensual (los días sueltos
+            # de los extremos del rango se agregan desde documentos)
+            totals = {
+                row['direction']: row
+                for row in summarize(companies, start_date_dt, end_date_dt, group_by=('direction',))
+            }
+            ventas_stats = totals.get('issued', {})
+            compras_stats = totals.get('received', {})
             
             return Response({
                 'ventas': {
-                    'total': float(ventas_stats['total'] or 0),
-                    'cantidad': ventas_stats['cantidad'],
-                    'iva': float(ventas_stats['iva'] or 0)
+                    'total': float(ventas_stats.get('total') or 0),
+                    'cantidad': ventas_stats.get('count', 0),
+                    'iva': float(ventas_stats.get('tax') or 0)
                 },
                 'compras': {
-                    'total': float(compras_stats['total'] or 0),
-                    'cantidad': compras_stats['cantidad'],
-                    'iva': float(compras_stats['iva'] or 0)
+                    'total': float(compras_stats.get('total') or 0),
+                    'cantidad': compras_stats.get('count', 0),
+                    'iva': float(compras_stats.get('tax') or 0)
                 },
                 'periodo': {
                     'inicio': start_date_dt.isoformat(),
@@ -560,81 +569,49 @@ class DocumentViewSet(viewsets.ViewSet):
                 issue_date__lte=end_date_dt
             )
 
-            # Recopilar RUTs de todas las empresas
-            company_ruts = []
-            company_dvs = []
-            for company in companies:
-                rut_parts = company.tax_id.split('-')
-                if len(rut_parts) == 2:
-                    company_ruts.append(rut_parts[0])
-                    company_dvs.append(rut_parts[1].upper())
-            
-            # Generar estadísticas por período
-            stats = []
-            current = start_date_dt.replace(day=1)  # Primer día del mes
-
-            while current <= end_date_dt:
-                # Calcular fin del período (mes)
-                if current.month == 12:
-                    next_month = current.replace(year=current.year + 1, month=1)
-                else:
-                    next_month = current.replace(month=current.month + 1)
-
-                period_end = next_month - timedelta(days=1)
-
-                # Filtrar documentos del período actual
-                period_docs = queryset.filter(
-                    issue_date__gte=current,
-                    issue_date__lte=period_end
+            kind = group_by if group_by in ('day', 'week') else 'month'
+            rows_by_period = {}
+            if kind == 'month':
+                # Agrupación mensual: se lee del rollup precalculado
+                for row in summarize(companies, start_date_dt, end_date_dt, group_by=('month', 'direction')):
+                    period = rows_by_period.setdefault(row['month'], {})
+                    if row['direction'] == 'issued':
+                        period.update(sales_count=row['count'], sales_amount=row['total'])
+                    elif row['direction'] == 'received':
+                        period.update(purchase_count=row['count'], purchase_amount=row['total'])
+            else:
+                # Una sola consulta agrupada por período con Sum/Count condicionales
+                ventas_query = Q(direction='issued')
+                compras_query = Q(direction='received')
+                rows = (
+                    queryset.filter(direction__in=('issued', 'received'))
+                    .order_by()
+                    .annotate(period=Trunc('issue_date', kind, output_field=DateField()))
+                    .values('period')
+                    .annotate(
+                        sales_count=Count('id', filter=ventas_query),
+                        sales_amount=Sum('total_amount', filter=ventas_query),
+                        purchase_count=Count('id', filter=compras_query),
+                        purchase_amount=Sum('total_amount', filter=compras_query),
+                    )
                 )
+                rows_by_period = {row['period']: row for row in rows}
 
-                # VENTAS: Documentos emitidos por cualquiera de las empresas
-                ventas_queries = []
-                for rut, dv in zip(company_ruts, company_dvs):
-                    ventas_queries.append(Q(issuer_company_rut=rut, issuer_company_dv=dv))
-
-                if ventas_queries:
-                    ventas_combined_query = ventas_queries[0]
-                    for query in ventas_queries[1:]:
-                        ventas_combined_query |= query
-
-                    ventas_queryset = period_docs.filter(ventas_combined_query)
-                    ventas_stats = ventas_queryset.aggregate(
-                        sales_count=Count('id'),
-                        sales_amount=Sum('total_amount') or 0
-                    )
-                else:
-                    ventas_stats = {'sales_count': 0, 'sales_amount': 0}
-
-                # COMPRAS: Documentos recibidos por cualquiera de las empresas
-                compras_queries = []
-                for rut, dv in zip(company_ruts, company_dvs):
-                    compras_queries.append(Q(recipient_rut=rut, recipient_dv=dv))
-
-                if compras_queries:
-                    compras_combined_query = compras_queries[0]
-                    for query in compras_queries[1:]:
-                        compras_combined_query |= query
-
-                    compras_queryset = period_docs.filter(compras_combined_query)
-                    compras_stats = compras_queryset.aggregate(
-                        purchase_count=Count('id'),
-                        purchase_amount=Sum('total_amount') or 0
-                    )
-                else:
-                    compras_stats = {'purchase_count': 0, 'purchase_amount': 0}
+            # Generar estadísticas por período, rellenando con ceros los períodos sin documentos
+            stats = []
+            for current in self._iter_periods(start_date_dt, end_date_dt, kind):
+                row = rows_by_period.get(current, {})
+                sales_count = row.get('sales_count', 0)
+                purchase_count = row.get('purchase_count', 0)
 
                 stats.append({
                     'period': current.isoformat(),
-                    'sales_amount': float(ventas_stats['sales_amount'] or 0),
-                    'purchase_amount': float(compras_stats['purchase_amount'] or 0),
-                    'document_count': ventas_stats['sales_count'] + compras_stats['purchase_count'],
-                    'sales_count': ventas_stats['sales_count'],
-                    'purchase_count': compras_stats['purchase_count']
+                    'sales_amount': float(row.get('sales_amount') or 0),
+                    'purchase_amount': float(row.get('purchase_amount') or 0),
+                    'document_count': sales_count + purchase_count,
+                    'sales_count': sales_count,
+                    'purchase_count': purchase_count
                 })
-
-                # Siguiente mes
-                current = next_month
             
             return Response(stats)
             
@@ -648,6 +625,28 @@ class DocumentViewSet(viewsets.ViewSet):
                 'error': 'Error interno del servidor'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+    @staticmethod
+    def _iter_periods(start_date, end_date, kind):
+        """
+        Genera el inicio de cada período (día, semana o mes) entre start_date y end_date,
+        alineado igual que Trunc en la base de datos.
+        """
+        if kind == 'day':
+            current, step = start_date, timedelta(days=1)
+        elif kind == 'week':
+            current, step = start_date - timedelta(days=start_date.weekday()), timedelta(days=7)
+        else:
+            current, step = start_date.replace(day=1), None
+
+        while current <= end_date:
+            yield current
+            if step:
+                current += step
+            elif current.month == 12:
+                current = current.replace(year=current.year + 1, month=1)
+            else:
+                current = current.replace(month=current.month + 1)
+
     @action(detail=False, methods=['get'])
     def sales_documents(self, request):
         """
@@ -668,4 +667,129 @@ class DocumentViewSet(viewsets.ViewSet):
         request._request.GET = mutable_params
         
         # Usar el método list que ya tiene datos reales
-        return self.list(request)
\ No newline at end of file
+        return self.list(request)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Exporta el libro de ventas o compras completo, sin paginar.
+        GET /api/v1/documents/export/?company_id=1&book=sales&format=csv&fecha_desde=2024-01-01&fecha_hasta=2024-12-31
+        GET /api/v1/documents/export/?company_ids=1,2&book=purchases&format=xlsx&async=true
+
+        `book`: sales | purchases (también acepta tipo_operacion=venta|compra)
+        `format`: csv (streaming) | xlsx (openpyxl write-only)
+        `async=true`: genera el archivo en Celery y retorna el task_id (ver export-status)
+        """
+        try:
+            companies = self.get_companies(request)
+
+            book = request.query_params.get('book')
+            if not book:
+                book = {'venta': 'sales', 'compra': 'purchases'}.get(request.query_params.get('tipo_operacion'), 'sales')
+            get_layout(book)
+
+            export_format = request.query_params.get('format', 'csv')
+            if export_format not in EXPORT_FORMATS:
+                raise ValueError(f"Formato no soportado: {export_format}. Opciones: {', '.join(EXPORT_FORMATS)}")
+
+            start_date = end_date = None
+            if request.query_params.get('fecha_desde'):
+                start_date = datetime.strptime(request.query_params['fecha_desde'], '%Y-%m-%d').date()
+            if request.query_params.get('fecha_hasta'):
+                end_date = datetime.strptime(request.query_params['fecha_hasta'], '%Y-%m-%d').date()
+
+            company_ids = [company.id for company in companies]
+
+            if request.query_params.get('async', '').lower() == 'true':
+                from .tasks import export_documents_book_task
+
+                task = export_documents_book_task.apply_async(
+                    args=[
+                        company_ids, book, export_format,
+                        start_date.isoformat() if start_date else None,
+                        end_date.isoformat() if end_date else None
+                    ],
+                    task_id=f"{EXPORT_TASK_PREFIX}{uuid.uuid4()}"
+                )
+                return Response({
+                    'task_id': task.id,
+                    'status': 'queued',
+                    'status_url': f'export-status/?company_ids={",".join(map(str, company_ids))}&task_id={task.id}'
+                }, status=status.HTTP_202_ACCEPTED)
+
+            queryset = book_queryset(company_ids, book, start_date, end_date)
+            filename = export_filename(book, export_format, start_date, end_date)
+
+            if export_format == 'csv':
+                response = StreamingHttpResponse(
+                    stream_csv(book_header(book), iter_book_rows(queryset, book)),
+                    content_type=CONTENT_TYPES['csv']
+                )
+                response['Content-Disposition'] = f'attachment; filename="{filename}"'
+                return response
+
+            exported, _ = export_book_to_tempfile(queryset, book, export_format)
+            return FileResponse(
+                exported,
+                as_attachment=True,
+                filename=filename,
+                content_type=CONTENT_TYPES[export_format]
+            )
+
+        except ValueError as e:
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error(f"Error en export documents: {str(e)}")
+            return Response({
+                'error': 'Error interno del servidor'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=False, methods=['get'], url_path='export-status')
+    def export_status(self, request):
+        """
+        Estado de una exportación asíncrona.
+        GET /api/v1/documents/export-status/?company_id=1&task_id=<task_id>
+
+        Solo acepta task_id emitidos por documents/export, y el archivo solo se
+        entrega si sus empresas están entre las del request.
+        """
+        from celery.result import AsyncResult
+
+        task_id = request.query_params.get('task_id')
+        if not task_id:
+            return Response({
+                'error': 'Se requiere el parámetro task_id'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            company_ids = {company.id for company in self.get_companies(request)}
+        except ValueError as e:
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        not_found = Response({
+            'error': 'Exportación no encontrada'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+        # Solo ids emitidos por documents/export: no se exponen resultados de otras tareas
+        if not task_id.startswith(EXPORT_TASK_PREFIX):
+            return not_found
+
+        result = AsyncResult(task_id)
+        data = {'task_id': task_id, 'status': result.status.lower()}
+        if result.successful():
+            exported = result.result
+            if (
+                not isinstance(exported, dict)
+                or not exported.get('company_ids')
+                or not set(exported['company_ids']) <= company_ids
+            ):
+                return not_found
+            data.update(exported)
+        elif result.failed():
+            logger.error(f"Exportación {task_id} falló: {result.result}")
+            data['error'] = 'La exportación falló, intenta nuevamente'
+        return Response(data)
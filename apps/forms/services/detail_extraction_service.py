@@ -2,7 +2,10 @@
 Servicio para extraer detalles completos de formularios F29 desde SII
 """
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Optional, List
+from django.conf import settings
+from django.db import connection
 from django.utils import timezone
 
 from ..models import TaxForm
@@ -17,6 +20,10 @@ class F29DetailExtractionService:
     Servicio para extraer detalles completos de formularios F29 usando obtener_formulario_f29
     """
 
+    EXTRACTION_METHOD = 'f29_rpa_service'
+    BULK_BATCH_SIZE = 100
+    PERSIST_EVERY = 20  # formularios extraídos por navegador entre cada guardado
+
     def __init__(self, tax_id: str = None, password: str = None):
         """
         Inicializar servicio con credenciales SII
@@ -80,23 +87,10 @@ class F29DetailExtractionService:
             )
 
             if resultado['status'] == 'success':
-                # Formatear campos extraídos
-                campos_formateados = self._format_extracted_fields(resultado.get('campos_extraidos', []))
-
                 # Guardar detalles en el formulario
                 tax_form.mark_details_extracted(
-                    method='f29_rpa_service',
-                    details_data={
-                        'extraction_timestamp': timezone.now().isoformat(),
-                        'folio': resultado['folio'],
-                        'periodo': resultado['periodo'],
-                        'total_campos': resultado['total_campos'],
-                        'campos_extraidos': campos_formateados,
-                        'campos_extraidos_raw': resultado.get('campos_extraidos', []),  # Mantener originales
-                        'subtablas': resultado.get('subtablas', []),
-                        'extraction_method': resultado.get('extraction_method', 'f29_rpa'),
-                        'original_response': resultado
-                    }
+                    method=self.EXTRACTION_METHOD,
+                    details_data=self._build_details_data(resultado)
                 )
 
                 logger.info(f"  ✅ Detalles extraídos exitosamente: {resultado['total_campos']} campos")
@@ -133,7 +127,8 @@ class F29DetailExtractionService:
         self,
         tax_forms: List[TaxForm],
         force_refresh: bool = False,
-        max_forms: int = 10
+        max_forms: int = 10,
+        batch: bool = True
     ) -> Dict[str, Any]:
         """
         Extrae detalles de múltiples formularios F29.
@@ -142,6 +137,8 @@ class F29DetailExtractionService:
             tax_forms: Lista de TaxForm instances
             force_refresh: Si True, fuerza nueva extracción aunque ya existan detalles
             max_forms: Máximo número de formularios a procesar
+            batch: Si True, usa extract_forms_details_batch (un login por navegador
+                   y guardado en bloque); si False, procesa formulario por formulario
 
         Returns:
             Dict con resumen de resultados
@@ -154,9 +151,12 @@ class F29DetailExtractionService:
         else:
             forms_to_process = tax_forms
 
-        # Limitar cantidad a procesar
+        # Limitar cantidad a procesar (los ya extraídos no consumen el límite)
         forms_to_process = forms_to_process[:max_forms]
 
+        if batch:
+            return self.extract_forms_details_batch(forms_to_process, force_refresh)
+
         logger.info(f"  📋 Procesando {len(forms_to_process)} formularios")
 
         # Contadores
@@ -198,6 +198,243 @@ class F29DetailExtractionService:
             'results': results
         }
 
+    def extract_forms_details_batch(
+        self,
+        tax_forms: List[TaxForm],
+        force_refresh: bool = False,
+        max_browsers: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Extrae detalles de muchos formularios F29 reutilizando navegadores autenticados.
+
+        Los formularios se agrupan por credenciales SII y se reparten entre a lo
+        más `max_browsers` navegadores en paralelo; cada uno se autentica una sola
+        vez y navega de un formulario al siguiente. Cada navegador guarda sus
+        resultados con bulk_update cada PERSIST_EVERY formularios, así una caída
+        del worker o un lote fallido no descarta lo ya extraído.
+
+        Args:
+            tax_forms: Lista de TaxForm instances
+            force_refresh: Si True, fuerza nueva extracción aunque ya existan detalles
+            max_browsers: Máximo de navegadores en paralelo (settings.SII_F29_BATCH_MAX_BROWSERS)
+
+        Returns:
+            Dict con resumen de resultados (mismo formato que extract_multiple_forms_details)
+        """
+        max_browsers = max_browsers or getattr(settings, 'SII_F29_BATCH_MAX_BROWSERS', 2)
+        forms_per_browser = getattr(settings, 'SII_F29_BATCH_MIN_FORMS_PER_BROWSER', 5)
+
+        results = []
+        already_extracted_count = 0
+        error_count = 0
+
+        # Agrupar por credenciales; descartar los que no se pueden procesar
+        groups: Dict[tuple, List[TaxForm]] = {}
+        for tax_form in tax_forms:
+            if tax_form.details_extracted and not force_refresh:
+                already_extracted_count += 1
+                results.append(self._form_result(tax_form, {
+                    'status': 'already_extracted',
+                    'message': 'Formulario ya tiene detalles extraídos',
+                    'extracted_at': tax_form.details_extracted_at.isoformat() if tax_form.details_extracted_at else None,
+                    'method': tax_form.details_extraction_method
+                }))
+                continue
+
+            if not tax_form.sii_folio:
+                error_count += 1
+                results.append(self._form_result(tax_form, {
+                    'status': 'error',
+                    'message': 'Formulario no tiene folio SII para extraer detalles'
+                }))
+                continue
+
+            if self.tax_id and self.password:
+                credentials = (self.tax_id, self.password)
+            else:
+                credentials = self._get_company_sii_credentials(tax_form.company)
+            if not credentials:
+                error_count += 1
+                results.append(self._form_result(tax_form, {
+                    'status': 'error',
+                    'message': 'No se encontraron credenciales SII para la company'
+                }))
+                continue
+
+            groups.setdefault(credentials, []).append(tax_form)
+
+        # Repartir cada grupo entre navegadores (sin abrir navegadores para lotes pequeños)
+        chunks = []
+        for (tax_id, password), forms in groups.items():
+            n_browsers = max(1, min(max_browsers, len(forms) // forms_per_browser))
+            for i in range(n_browsers):
+                chunk = forms[i::n_browsers]
+                if chunk:
+                    chunks.append((tax_id, password, chunk))
+
+        total_to_extract = sum(len(chunk) for _, _, chunk in chunks)
+        logger.info(f"🔄 Extrayendo detalles de {total_to_extract} formularios en {len(chunks)} navegadores")
+
+        if len(chunks) == 1:
+            chunk_results = [(chunks[0][2], self._extract_chunk(*chunks[0]))]
+        else:
+            chunk_results = []
+            with ThreadPoolExecutor(max_workers=min(max_browsers, len(chunks)) or 1) as executor:
+                futures = [
+                    (chunk, executor.submit(self._extract_chunk_in_thread, tax_id, password, chunk))
+                    for tax_id, password, chunk in chunks
+                ]
+                for chunk, future in futures:
+                    try:
+                        chunk_results.append((chunk, future.result()))
+                    except Exception as e:
+                        # Un navegador fallido no descarta los resultados de los demás
+                        logger.error(f"❌ Error en lote de {len(chunk)} F29: {str(e)}")
+                        chunk_results.append((chunk, [self._chunk_error(e)] * len(chunk)))
+
+        success_count = 0
+        for chunk, resultados in chunk_results:
+            for tax_form, resultado in zip(chunk, resultados):
+                if resultado['status'] == 'success':
+                    success_count += 1
+                else:
+                    error_count += 1
+                results.append(self._form_result(tax_form, resultado))
+
+        logger.info(f"✅ Extracción en lote completada:")
+        logger.info(f"  - Exitosos: {success_count}")
+        logger.info(f"  - Ya extraídos: {already_extracted_count}")
+        logger.info(f"  - Errores: {error_count}")
+
+        return {
+            'status': 'completed',
+            'total_processed': len(tax_forms),
+            'success_count': success_count,
+            'error_count': error_count,
+            'already_extracted_count': already_extracted_count,
+            'results': results
+        }
+
+    def _extract_chunk(self, tax_id: str, password: str, tax_forms: List[TaxForm]) -> List[Dict[str, Any]]:
+        """
+        Extrae un grupo de formularios con un solo navegador autenticado.
+
+        Los extraídos se guardan cada PERSIST_EVERY formularios y al terminar,
+        incluso si el navegador falla a mitad del grupo; los formularios sin
+        resultado quedan como error.
+
+        Returns:
+            Resultado por formulario (formato de extract_form_details), en el mismo orden
+        """
+        results: Dict[int, Dict[str, Any]] = {}
+        pending: List[int] = []
+
+        def flush():
+            if not pending:
+                return
+            try:
+                self._save_extracted([tax_forms[i] for i in pending])
+            except Exception as e:
+                logger.error(f"❌ Error guardando detalles de {len(pending)} F29: {str(e)}")
+                for i in pending:
+                    results[i] = {'status': 'error', 'message': f'Error guardando detalles: {str(e)}'}
+            pending.clear()
+
+        def on_result(index: int, resultado: Dict[str, Any]):
+            results[index] = self._apply_result(tax_forms[index], resultado)
+            if results[index]['status'] == 'success':
+                pending.append(index)
+                if len(pending) >= self.PERSIST_EVERY:
+                    flush()
+
+        f29_service = None
+        try:
+            f29_service = F29Service(tax_id, password, headless=True)
+            f29_service.obtener_formularios_f29(
+                [(tax_form.sii_folio, tax_form.tax_period) for tax_form in tax_forms],
+                on_result=on_result
+            )
+        except Exception as e:
+            logger.error(f"❌ Error en lote de {len(tax_forms)} F29: {str(e)}")
+            for i in range(len(tax_forms)):
+                results.setdefault(i, self._chunk_error(e))
+        finally:
+            flush()
+            if f29_service is not None:
+                try:
+                    f29_service.close()
+                except Exception:
+                    pass
+
+        return [
+            results.get(i, {'status': 'error', 'message': 'Error extrayendo detalles: sin resultado'})
+            for i in range(len(tax_forms))
+        ]
+
+    def _extract_chunk_in_thread(self, tax_id: str, password: str, tax_forms: List[TaxForm]) -> List[Dict[str, Any]]:
+        """Ejecuta _extract_chunk en un hilo, liberando su conexión a la BD al terminar"""
+        try:
+            return self._extract_chunk(tax_id, password, tax_forms)
+        finally:
+            connection.close()
+
+    def _apply_result(self, tax_form: TaxForm, resultado: Dict[str, Any]) -> Dict[str, Any]:
+        """Asigna (sin guardar) los detalles obtenidos al formulario y arma su resultado"""
+        if resultado['status'] != 'success':
+            error_msg = resultado.get('message', 'Error desconocido')
+            return {'status': 'error', 'message': f'Error extrayendo detalles: {error_msg}'}
+
+        now = timezone.now()
+        tax_form.details_extracted = True
+        tax_form.details_extracted_at = now
+        tax_form.details_extraction_method = self.EXTRACTION_METHOD
+        tax_form.details_data = self._build_details_data(resultado)
+        tax_form.updated_at = now  # bulk_update no aplica auto_now
+        return {
+            'status': 'success',
+            'message': f'Detalles extraídos exitosamente: {resultado["total_campos"]} campos',
+            'folio': resultado['folio'],
+            'total_campos': resultado['total_campos'],
+            'extracted_at': now.isoformat()
+        }
+
+    def _save_extracted(self, tax_forms: List[TaxForm]) -> None:
+        TaxForm.objects.bulk_update(
+            tax_forms,
+            ['details_extracted', 'details_extracted_at', 'details_extraction_method',
+             'details_data', 'updated_at'],
+            batch_size=self.BULK_BATCH_SIZE
+        )
+
+    @staticmethod
+    def _chunk_error(error: Exception) -> Dict[str, Any]:
+        return {'status': 'error', 'message': f'Excepción extrayendo detalles: {str(error)}'}
+
+    def _form_result(self, tax_form: TaxForm, resultado: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'form_id': tax_form.id,
+            'folio': tax_form.sii_folio,
+            'period': tax_form.tax_period,
+            'result': resultado
+        }
+
+    def _build_details_data(self, resultado: Dict[str, Any]) -> Dict[str, Any]:
+        """Arma el contenido de TaxForm.details_data desde el resultado del F29Service"""
+        # Formatear campos extraídos
+        campos_formateados = self._format_extracted_fields(resultado.get('campos_extraidos', []))
+
+        return {
+            'extraction_timestamp': timezone.now().isoformat(),
+            'folio': resultado['folio'],
+            'periodo': resultado['periodo'],
+            'total_campos': resultado['total_campos'],
+            'campos_extraidos': campos_formateados,
+            'campos_extraidos_raw': resultado.get('campos_extraidos', []),  # Mantener originales
+            'subtablas': resultado.get('subtablas', []),
+            'extraction_method': resultado.get('extraction_method', 'f29_rpa'),
+            'original_response': resultado
+        }
+
     def get_forms_needing_details(self, company: Company = None, limit: int = 50) -> List[TaxForm]:
         """
         Obtiene formularios que necesitan extracción de detalles.
@@ -209,7 +446,7 @@ class F29DetailExtractionService:
         Returns:
             Lista de TaxForm que necesitan extracción
         """
-        queryset = TaxForm.objects.filter(
+        queryset = TaxForm.objects.select_related('company').filter(
             details_extracted=False,
             sii_folio__isnull=False,
             sii_folio__gt=''
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import SIISession, SIISyncLog
+from .models import SIISession, SIISyncLog, SIIPeriodSyncState
 
 
 @admin.register(SIISession)
@@ -57,3 +57,11 @@ class SIISyncLogAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         })
     )
+
+
+@admin.register(SIIPeriodSyncState)
+class SIIPeriodSyncStateAdmin(admin.ModelAdmin):
+    list_display = ('company', 'periodo', 'operacion', 'document_count', 'last_synced_at')
+    list_filter = ('operacion', 'last_synced_at')
+    search_fields = ('company__tax_id', 'company__business_name', 'periodo', 'task_id')
+    readonly_fields = ('created_at', 'updated_at')
@@ -8,7 +8,12 @@ import logging
 import time
 from typing import Dict, Any, List, Optional
 from functools import wraps
-from django.utils import timezone
+from django.conf import settings
+
+from apps.core.http import get_shared_session
+from ..utils.exceptions import SIIAuthenticationError
+from ..utils.rate_limit import get_sii_rate_limiter
+from ..utils.session_broker import session_broker
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +21,7 @@ logger = logging.getLogger(__name__)
 def retry_on_sii_unavailable(max_retries: int = 3, base_delay: int = 30):
     """
     Decorador para reintentar automáticamente cuando el SII no está disponible.
+    Los errores de autenticación no se reintentan (requieren cookies nuevas).
     
     Args:
         max_retries: Número máximo de reintentos
@@ -29,6 +35,8 @@ def retry_on_sii_unavailable(max_retries: int = 3, base_delay: int = 30):
             for attempt in range(max_retries + 1):
                 try:
                     return func(*args, **kwargs)
+                except SIIAuthenticationError:
+                    raise
                 except Exception as e:
                     last_exception = e
                     
@@ -59,6 +67,12 @@ class SIIServiceV2:
     MISIIR_URL = "https://misiir.sii.cl/cgi_misii/CViewCarta.cgi"
     BOLETAS_URL = "https://www4.sii.cl/complementoscvui/services/data/facadeServiceBoletasDiarias"
     
+    # Ruta a la que el SII redirige cuando la sesión no es válida
+    LOGIN_PATH_MARKER = "AUT2000"
+    
+    # Timeout de conexión (el de lectura se configura con SII_TIMEOUT)
+    CONNECT_TIMEOUT = 10
+    
     # Tipos de documentos disponibles
     TIPOS_DOCUMENTO = {
         "33": "Factura Electrónica",
@@ -146,7 +160,7 @@ class SIIServiceV2:
     
     def _load_stored_cookies(self, tax_id: str) -> Optional[List[Dict[str, Any]]]:
         """
-        Carga cookies almacenadas desde la base de datos si existen y son válidas.
+        Carga cookies de la sesión activa entregada por el broker de sesiones.
         
         Args:
             tax_id: RUT de la empresa
@@ -155,30 +169,11 @@ class SIIServiceV2:
             Lista de cookies si se encuentran válidas, None en caso contrario
         """
         try:
-            # Importar aquí para evitar dependencias circulares
-            from ..models import SIISession
+            active_session = session_broker.get_session(tax_id)
             
-            # Extraer RUT y DV del tax_id
-            rut_parts = tax_id.split('-')
-            company_rut = rut_parts[0]
-            company_dv = rut_parts[1].upper() if len(rut_parts) > 1 else 'K'
-            
-            # Buscar sesión activa y no expirada
-            active_session = SIISession.objects.filter(
-                company_rut=company_rut,
-                company_dv=company_dv,
-                is_active=True,
-                expires_at__gt=timezone.now()
-            ).order_by('-created_at').first()
-            
-            if active_session and active_session.cookies_data:
-                logger.info(f"🍪 Encontrada sesión almacenada para {tax_id} (ID: {active_session.session_id})")
-                
-                # Actualizar última actividad
-                active_session.last_activity = timezone.now()
-                active_session.save(update_fields=['last_activity'])
-                
-                return active_session.cookies_data
+            if active_session:
+                logger.info(f"🍪 Encontrada sesión almacenada para {tax_id} (ID: {active_session['session_id']})")
+                return active_session['cookies']
             else:
                 logger.info(f"🔍 No se encontró sesión válida almacenada para {tax_id}")
                 return None
@@ -245,6 +240,46 @@ class SIIServiceV2:
         cookie_parts = [f"{c['name']}={c['value']}" for c in self.cookies]
         return "; ".join(cookie_parts)
     
+    @staticmethod
+    def _get_http_session() -> requests.Session:
+        """
+        Sesión HTTP compartida por el proceso para todas las consultas al SII.
+        Las cookies de cada empresa se envían por header, por lo que la sesión
+        no persiste cookies propias.
+        """
+        return get_shared_session(
+            'sii',
+            pool_connections=4,
+            pool_maxsize=max(10, getattr(settings, 'SII_SYNC_MAX_WORKERS', 4) * 2),
+            retries=2,
+            backoff_factor=1,
+            allowed_methods=('GET', 'POST'),  # Las consultas POST del SII son idempotentes
+        )
+    
+    def _post(self, url: str, **kwargs) -> requests.Response:
+        """
+        Envía un POST al SII respetando el límite de tasa por host, usando
+        la sesión HTTP compartida (keep-alive).
+        
+        Args:
+            url: URL de destino
+            **kwargs: Argumentos para Session.post
+            
+        Raises:
+            SIIAuthenticationError: Si el SII rechaza la sesión (401/403 o
+                redirección a la página de login)
+        """
+        kwargs.setdefault('timeout', (self.CONNECT_TIMEOUT, getattr(settings, 'SII_TIMEOUT', 30)))
+        get_sii_rate_limiter().wait(url)
+        response = self._get_http_session().post(url, **kwargs)
+        
+        if response.status_code in (401, 403) or self.LOGIN_PATH_MARKER in response.url:
+            raise SIIAuthenticationError(
+                f"Sesión SII no autorizada para {self.tax_id} (HTTP {response.status_code})",
+                error_code='SESSION_EXPIRED'
+            )
+        return response
+    
     def _generate_metadata(self, namespace: str = None) -> Dict[str, Any]:
         """Genera los metadatos requeridos para las peticiones al SII."""
         token_cookie = next((cookie for cookie in self.cookies if cookie['name'] == 'TOKEN'), None)
@@ -342,7 +377,7 @@ class SIIServiceV2:
             }
         }
         
-        response = requests.post(url, json=payload, headers=self.headers, timeout=30)
+        response = self._post(url, json=payload, headers=self.headers)
         response.raise_for_status()
         
         result = response.json()
@@ -394,7 +429,7 @@ class SIIServiceV2:
             }
         }
         
-        response = requests.post(url, json=payload, headers=self.headers, timeout=30)
+        response = self._post(url, json=payload, headers=self.headers)
         response.raise_for_status()
         
         return response.json()
@@ -467,7 +502,7 @@ class SIIServiceV2:
             }
         }
         
-        response = requests.post(url, json=payload, headers=self.headers, timeout=30)
+        response = self._post(url, json=payload, headers=self.headers)
         response.raise_for_status()
         
         return response.json()
@@ -482,7 +517,7 @@ class SIIServiceV2:
         headers_post = self.headers.copy()
         headers_post['Content-Type'] = 'application/x-www-form-urlencoded'
         
-        response = requests.post(self.MISIIR_URL, data=payload, headers=headers_post, timeout=30)
+        response = self._post(self.MISIIR_URL, data=payload, headers=headers_post)
         response.raise_for_status()
         
         datos_contribuyente = response.json()
@@ -570,43 +605,14 @@ class SIIServiceV2:
         }
 
     def _guardar_cookies_frescas(self):
-        """Guarda las cookies frescas en SIISession para persistencia"""
+        """Publica las cookies frescas como sesión activa a través del broker"""
         try:
             if not self.cookies:
                 logger.warning(f"⚠️ No hay cookies para guardar para {self.tax_id}")
                 return
-                
-            # Importar aquí para evitar dependencias circulares
-            from ..models import SIISession
-            from django.utils import timezone
-            import uuid
-            from datetime import timedelta
-            
-            # Extraer RUT y DV del tax_id
-            rut_parts = self.tax_id.split('-')
-            company_rut = rut_parts[0]
-            company_dv = rut_parts[1].upper() if len(rut_parts) > 1 else 'K'
-            
-            # Invalidar sesiones activas existentes para esta empresa
-            SIISession.objects.filter(
-                company_rut=company_rut,
-                company_dv=company_dv,
-                is_active=True
-            ).update(is_active=False)
-            
-            # Crear nueva sesión con cookies frescas
-            session_id = str(uuid.uuid4())
-            session = SIISession.objects.create(
-                company_rut=company_rut,
-                company_dv=company_dv,
-                username=self.tax_id,  # Usar tax_id como username
-                session_id=session_id,
-                cookies_data=self.cookies,
-                is_active=True,
-                expires_at=timezone.now() + timedelta(hours=8)  # SII sessions ~8 horas
-            )
             
-            logger.info(f"💾 Guardadas cookies frescas en nueva sesión {session_id} para {self.tax_id}")
+            session = session_broker.store_cookies(self.tax_id, self.cookies)
+            logger.info(f"💾 Guardadas cookies frescas en sesión {session['session_id']} para {self.tax_id}")
             
         except Exception as e:
             logger.error(f"❌ Error guardando cookies frescas para {self.tax_id}: {str(e)}")
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.11 on 2026-10-16 19:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0002_backgroundtasktracker'),
+        ('sii', '0002_siisynclog_progress_percentage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SIIPeriodSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('periodo', models.CharField(help_text='Período tributario YYYYMM', max_length=6)),
+                ('operacion', models.CharField(choices=[('COMPRA', 'Compras'), ('VENTA', 'Ventas')], max_length=10)),
+                ('last_synced_at', models.DateTimeField()),
+                ('document_count', models.IntegerField(default=0)),
+                ('summary_hash', models.CharField(blank=True, help_text='Hash del resumen SII del período', max_length=64)),
+                ('task_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sii_period_sync_states', to='companies.company')),
+            ],
+            options={
+                'verbose_name': 'SII Period Sync State',
+                'verbose_name_plural': 'SII Period Sync States',
+                'db_table': 'sii_period_sync_states',
+                'ordering': ['company', '-periodo', 'operacion'],
+                'unique_together': {('company', 'periodo', 'operacion')},
+            },
+        ),
+    ]
@@ -119,3 +119,39 @@ class SIISyncLog(TimeStampedModel):
         if self.records_processed == 0:
             return 0
         return ((self.records_created + self.records_updated) / self.records_processed) * 100
+
+
+class SIIPeriodSyncState(TimeStampedModel):
+    """
+    Estado de sincronización de documentos por empresa, período y operación.
+    
+    Guarda un hash del resumen SII del período para omitir en las siguientes
+    sincronizaciones los períodos cerrados que no cambiaron, y el task_id que
+    lo completó para que un reintento de la misma tarea reanude donde quedó.
+    """
+    OPERATION_CHOICES = [
+        ('COMPRA', 'Compras'),
+        ('VENTA', 'Ventas'),
+    ]
+    
+    company = models.ForeignKey(
+        'companies.Company',
+        on_delete=models.CASCADE,
+        related_name='sii_period_sync_states'
+    )
+    periodo = models.CharField(max_length=6, help_text="Período tributario YYYYMM")
+    operacion = models.CharField(max_length=10, choices=OPERATION_CHOICES)
+    last_synced_at = models.DateTimeField()
+    document_count = models.IntegerField(default=0)
+    summary_hash = models.CharField(max_length=64, blank=True, help_text="Hash del resumen SII del período")
+    task_id = models.CharField(max_length=255, blank=True, null=True)
+    
+    class Meta:
+        db_table = 'sii_period_sync_states'
+        verbose_name = 'SII Period Sync State'
+        verbose_name_plural = 'SII Period Sync States'
+        unique_together = ['company', 'periodo', 'operacion']
+        ordering = ['company', '-periodo', 'operacion']
+    
+    def __str__(self):
+        return f"{self.company_id} - {self.periodo} {self.operacion} ({self.document_count} docs)"
@@ -2,6 +2,7 @@
 Integración del SIIServiceV2 (API) con el sistema RPA para obtención optimizada de DTEs
 """
 import logging
+import threading
 from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime, date
 
@@ -12,6 +13,7 @@ from ..utils.exceptions import (
     SIIAuthenticationError,
     SIIValidationError
 )
+from ..utils.cookie_cache import cookie_validity_cache
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +31,9 @@ class SIIIntegratedService:
     
     Importante: Solo usa RPA si las cookies están expiradas. Si las cookies son válidas
     pero la API falla, no intenta con RPA automáticamente.
+    
+    Es seguro usarlo desde varios hilos: la inicialización de la sesión y la
+    renovación de cookies vía RPA se serializan con un lock.
     """
     
     def __init__(self, tax_id: str, password: str, headless: bool = True):
@@ -40,15 +45,20 @@ class SIIIntegratedService:
         self.api_service = None
         self.rpa_service = None
         self._session_initialized = False
+        self._lock = threading.RLock()
         
         logger.info(f"🔧 SIIIntegratedService initialized for {tax_id}")
     
     def _initialize_session(self):
         """Inicializa la sesión API una sola vez"""
-        if not self._session_initialized:
-            logger.info("🔐 Inicializando sesión API por primera vez")
-            self.api_service = self._get_api_service(force_new_cookies=False)
-            self._session_initialized = True
+        if self._session_initialized:
+            return
+        
+        with self._lock:
+            if not self._session_initialized:
+                logger.info("🔐 Inicializando sesión API por primera vez")
+                self.api_service = self._get_api_service(force_new_cookies=False)
+                self._session_initialized = True
     
     def _get_api_service(self, force_new_cookies: bool = False, fresh_cookies: List[Dict] = None) -> SIIServiceV2:
         """Obtiene o crea el servicio API reutilizando la instancia"""
@@ -77,6 +87,8 @@ class SIIIntegratedService:
                     validar_cookies=True,
                     auto_relogin=True
                 )
+                # El constructor ya validó las cookies (o lanzó excepción)
+                cookie_validity_cache.mark_valid(self.tax_id, self.api_service.cookies)
             self._session_initialized = True
         
         return self.api_service
@@ -182,26 +194,34 @@ class SIIIntegratedService:
         """
         Método interno para obtener documentos con estrategia híbrida mejorada.
         Solo usa RPA si las cookies almacenadas están expiradas.
+        
+        La validación de cookies se cachea por tax_id (SII_COOKIE_VALIDATION_TTL),
+        de modo que no se valida antes de cada consulta. Si una consulta devuelve
+        error de autenticación, la entrada se invalida y se renuevan las cookies.
         """
         logger.info(f"📄 Obteniendo documentos {operacion} período {periodo_tributario}")
         
         # PASO 1: Verificar si tenemos cookies válidas almacenadas
         api_service = self._get_api_service(force_new_cookies=False)
-        cookies_validas = False
+        cookies_validas = cookie_validity_cache.is_valid(self.tax_id, api_service.cookies)
         
-        try:
-            logger.info("🔍 Verificando validez de cookies almacenadas")
-            validacion = api_service.validar_cookies()
-            cookies_validas = validacion.get('valid', False)
-            
-            if cookies_validas:
-                logger.info("✅ Cookies válidas encontradas")
-            else:
-                logger.info(f"⚠️ Cookies inválidas: {validacion.get('message', 'Sin mensaje')}")
+        if cookies_validas:
+            logger.debug("✅ Cookies validadas recientemente (caché)")
+        else:
+            try:
+                logger.info("🔍 Verificando validez de cookies almacenadas")
+                validacion = api_service.validar_cookies()
+                cookies_validas = validacion.get('valid', False)
                 
-        except Exception as e:
-            logger.warning(f"⚠️ Error validando cookies: {str(e)}")
-            cookies_validas = False
+                if cookies_validas:
+                    logger.info("✅ Cookies válidas encontradas")
+                    cookie_validity_cache.mark_valid(self.tax_id, api_service.cookies)
+                else:
+                    logger.info(f"⚠️ Cookies inválidas: {validacion.get('message', 'Sin mensaje')}")
+                    
+            except Exception as e:
+                logger.warning(f"⚠️ Error validando cookies: {str(e)}")
+                cookies_validas = False
         
         # PASO 2: Si las cookies son válidas, intentar solo con API
         if cookies_validas:
@@ -228,6 +248,12 @@ class SIIIntegratedService:
                         'message': 'Sin documentos en el período',
                         'timestamp': datetime.now().isoformat()
                     }
+            
+            except SIIAuthenticationError as e:
+                # La sesión expiró desde la última validación: renovar cookies
+                logger.warning(f"⚠️ Sesión SII rechazada: {str(e)}")
+                cookie_validity_cache.invalidate(self.tax_id, api_service.cookies)
+                cookies_validas = False
                     
             except Exception as e:
                 logger.error(f"❌ Error con API usando cookies válidas: {str(e)}")
@@ -254,6 +280,34 @@ class SIIIntegratedService:
         
         logger.info("🤖 Cookies inválidas - Renovando con RPA")
         
+        # Solo un hilo renueva cookies / usa el navegador a la vez
+        with self._lock:
+            # Otro hilo pudo haber renovado las cookies mientras esperábamos
+            if self.api_service is not api_service:
+                try:
+                    logger.info("🔄 Cookies renovadas por otro hilo, reintentando API")
+                    if operacion == "COMPRA":
+                        result = self.api_service.get_documentos_compra(periodo_tributario, cod_tipo_doc)
+                    else:
+                        result = self.api_service.get_documentos_venta(periodo_tributario, cod_tipo_doc)
+                    
+                    if self._is_valid_result(result):
+                        return self._enrich_result(result, "rpa_cookies_api")
+                except Exception as e:
+                    logger.warning(f"⚠️ API con cookies renovadas falló: {str(e)}")
+            
+            return self._obtener_documentos_rpa(operacion, periodo_tributario, cod_tipo_doc)
+    
+    def _obtener_documentos_rpa(
+        self,
+        operacion: str,
+        periodo_tributario: str,
+        cod_tipo_doc: str = "33"
+    ) -> Dict[str, Any]:
+        """
+        Obtiene documentos renovando cookies con RPA y, como último recurso,
+        extrayéndolos completamente vía RPA. Debe llamarse con el lock tomado.
+        """
         # ESTRATEGIA RPA 1: Renovar cookies vía RPA + API
         try:
             logger.info("🔄 Renovando cookies con RPA y reintentando API")
@@ -273,6 +327,7 @@ class SIIIntegratedService:
                     result = api_service_fresh.get_documentos_venta(periodo_tributario, cod_tipo_doc)
                 
                 if self._is_valid_result(result):
+                    cookie_validity_cache.mark_valid(self.tax_id, fresh_cookies)
                     logger.info(f"✅ RPA + API exitoso: {len(result.get('data', []))} documentos")
                     return self._enrich_result(result, "rpa_cookies_api")
                 else:
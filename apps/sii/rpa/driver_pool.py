@@ -0,0 +1,281 @@
+"""
+Pool de navegadores Chrome precalentados por proceso worker
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from .selenium_driver import SeleniumDriver
+
+logger = logging.getLogger(__name__)
+
+
+class _Lease:
+    """Préstamo activo de un navegador"""
+
+    def __init__(self, driver: SeleniumDriver):
+        self.driver = driver
+        self.thread = threading.current_thread()
+        self.acquired_at = time.monotonic()
+        self.finalizer: Optional[weakref.finalize] = None
+        self.reported = False
+
+
+class DriverPool:
+    """
+    Mantiene navegadores ya iniciados para reutilizarlos entre tareas.
+
+    - Limita la cantidad de Chrome simultáneos del proceso (`max_size`)
+    - Verifica que el navegador responda antes de entregarlo
+    - Limpia cookies y almacenamiento al devolverlo, para no mezclar empresas
+    - Recicla cada navegador tras `max_uses` préstamos o `idle_timeout`
+      segundos sin uso, acotando la memoria que acumula Chrome
+    - Recupera los préstamos abandonados (nunca devueltos): los de un `owner`
+      que ya no existe y los de un hilo terminado. Así un servicio que no se
+      cerró no bloquea el cupo hasta que venza `acquire_timeout` en los demás.
+      Un navegador en manos de un hilo vivo nunca se cierra: con `max_lease`
+      los préstamos largos solo se reportan en el log.
+    """
+
+    RECLAIM_INTERVAL = 5  # segundos entre revisiones de préstamos abandonados mientras se espera cupo
+
+    def __init__(
+        self,
+        max_size: Optional[int] = None,
+        max_uses: Optional[int] = None,
+        idle_timeout: Optional[int] = None,
+        acquire_timeout: Optional[int] = None,
+        max_lease: Optional[int] = None
+    ):
+        """
+        Args:
+            max_size: Máximo de navegadores vivos (settings.SII_BROWSER_POOL_SIZE)
+            max_uses: Préstamos antes de reciclar un navegador (settings.SII_BROWSER_MAX_USES)
+            idle_timeout: Segundos ocioso antes de descartarlo (settings.SII_BROWSER_IDLE_TIMEOUT)
+            acquire_timeout: Segundos esperando un cupo libre (settings.SII_BROWSER_ACQUIRE_TIMEOUT)
+            max_lease: Segundos tras los cuales se advierte de un préstamo largo;
+                       0 desactiva el aviso (settings.SII_BROWSER_MAX_LEASE)
+        """
+        self.max_size = max_size or getattr(settings, 'SII_BROWSER_POOL_SIZE', 2)
+        self.max_uses = max_uses or getattr(settings, 'SII_BROWSER_MAX_USES', 20)
+        self.idle_timeout = idle_timeout or getattr(settings, 'SII_BROWSER_IDLE_TIMEOUT', 600)
+        self.acquire_timeout = acquire_timeout or getattr(settings, 'SII_BROWSER_ACQUIRE_TIMEOUT', 120)
+        self.max_lease = max_lease if max_lease is not None else getattr(settings, 'SII_BROWSER_MAX_LEASE', 0)
+
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._lock = threading.Lock()
+        # headless -> [(driver, idle_since)]
+        self._idle: Dict[bool, List[Tuple[SeleniumDriver, float]]] = {True: [], False: []}
+        self._uses: Dict[int, int] = {}
+        # id(driver) -> préstamo activo
+        self._leases: Dict[int, _Lease] = {}
+
+    def _discard(self, driver: SeleniumDriver):
+        self._uses.pop(id(driver), None)
+        driver.quit()
+
+    def _pop_idle(self, headless: bool) -> Optional[SeleniumDriver]:
+        """Saca un navegador ocioso saludable, descartando los vencidos"""
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                if not self._idle[headless]:
+                    return None
+                driver, idle_since = self._idle[headless].pop()
+
+            if now - idle_since > self.idle_timeout or not driver.is_alive():
+                logger.info("♻️ Descartando navegador ocioso vencido o sin respuesta")
+                self._discard(driver)
+                continue
+            return driver
+
+    def acquire(self, headless: bool = True, owner: Any = None) -> SeleniumDriver:
+        """
+        Presta un navegador iniciado; inicia uno nuevo si no hay ociosos.
+
+        Args:
+            headless: Modo del navegador
+            owner: Objeto dueño del préstamo (p. ej. el servicio que usa el
+                   navegador). Si se recolecta sin devolverlo, el navegador
+                   se descarta y su cupo se libera.
+
+        Raises:
+            TimeoutError: Si no se libera un cupo dentro de `acquire_timeout`
+        """
+        if not self._acquire_slot():
+            raise TimeoutError(
+                f"No hay navegadores disponibles (máximo {self.max_size} por proceso)"
+            )
+
+        try:
+            driver = self._pop_idle(headless)
+            if driver is None:
+                driver = SeleniumDriver(headless=headless)
+                driver.start()
+                self._uses[id(driver)] = 0
+            else:
+                logger.info("🔥 Reutilizando navegador precalentado")
+            self._uses[id(driver)] = self._uses.get(id(driver), 0) + 1
+        except Exception:
+            self._slots.release()
+            raise
+
+        lease = _Lease(driver)
+        if owner is not None:
+            lease.finalizer = weakref.finalize(owner, self._reclaim, id(driver), 'su dueño fue recolectado')
+        with self._lock:
+            self._leases[id(driver)] = lease
+        return driver
+
+    def _acquire_slot(self) -> bool:
+        """Espera un cupo libre, recuperando en el camino los préstamos abandonados"""
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            self._reclaim_dead_leases()
+            remaining = deadline - time.monotonic()
+            if self._slots.acquire(timeout=max(0, min(self.RECLAIM_INTERVAL, remaining))):
+                return True
+            if remaining <= self.RECLAIM_INTERVAL:
+                return False
+
+    def _reclaim_dead_leases(self) -> int:
+        """
+        Libera los préstamos de hilos terminados. Los que superan `max_lease`
+        con su hilo vivo siguen en uso: solo se advierten una vez.
+
+        Returns:
+            Cantidad de préstamos recuperados
+        """
+        now = time.monotonic()
+        with self._lock:
+            dead = [key for key, lease in self._leases.items() if not lease.thread.is_alive()]
+            long_leases = [
+                lease for lease in self._leases.values()
+                if self.max_lease and not lease.reported and lease.thread.is_alive()
+                and now - lease.acquired_at > self.max_lease
+            ]
+            for lease in long_leases:
+                lease.reported = True
+
+        for lease in long_leases:
+            logger.warning(
+                f"⚠️ Navegador prestado hace más de {self.max_lease}s al hilo {lease.thread.name}; "
+                f"sigue en uso y no se recupera"
+            )
+        return sum(1 for key in dead if self._reclaim(key, 'su hilo terminó'))
+
+    def _reclaim(self, key: int, reason: str) -> bool:
+        """Descarta el navegador de un préstamo abandonado y libera su cupo"""
+        lease = self._end_lease(key)
+        if lease is None:
+            return False
+        logger.warning(f"♻️ Recuperando navegador prestado y nunca devuelto ({reason})")
+        self._return(lease.driver, discard=True)
+        return True
+
+    def _end_lease(self, key: int) -> Optional[_Lease]:
+        """Cierra el préstamo; None si ya se había devuelto o recuperado"""
+        with self._lock:
+            lease = self._leases.pop(key, None)
+        if lease is not None and lease.finalizer is not None:
+            lease.finalizer.detach()
+        return lease
+
+    def release(self, driver: SeleniumDriver, discard: bool = False):
+        """
+        Devuelve un navegador al pool. Devolver dos veces (o un navegador ya
+        recuperado por abandono) no tiene efecto.
+
+        Args:
+            driver: Navegador obtenido con acquire()
+            discard: Si True, se cierra en vez de volver al pool (p. ej. tras un error)
+        """
+        if self._end_lease(id(driver)) is None:
+            logger.debug("Navegador ya devuelto al pool, se ignora")
+            return
+        self._return(driver, discard)
+
+    def _return(self, driver: SeleniumDriver, discard: bool = False):
+        """Deja el navegador ocioso (o lo cierra) y libera su cupo"""
+        try:
+            if discard or self._uses.get(id(driver), 0) >= self.max_uses or not driver.is_alive():
+                self._discard(driver)
+                return
+
+            try:
+                driver.reset()
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo limpiar el navegador, se descarta: {e}")
+                self._discard(driver)
+                return
+
+            with self._lock:
+                self._idle[driver.headless].append((driver, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def lease(self, headless: bool = True):
+        """Context manager que presta un navegador y lo devuelve al salir"""
+        driver = self.acquire(headless)
+        failed = False
+        try:
+            yield driver
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.release(driver, discard=failed)
+
+    def prewarm(self, count: int, headless: bool = True):
+        """Inicia `count` navegadores por adelantado (sin superar max_size)"""
+        drivers = []
+        try:
+            for _ in range(min(count, self.max_size)):
+                drivers.append(self.acquire(headless))
+        except Exception as e:
+            logger.warning(f"⚠️ Error precalentando navegadores: {e}")
+        finally:
+            for driver in drivers:
+                self.release(driver)
+        logger.info(f"🔥 {len(drivers)} navegadores precalentados")
+
+    def close_all(self):
+        """Cierra todos los navegadores ociosos"""
+        with self._lock:
+            idle = [driver for drivers in self._idle.values() for driver, _ in drivers]
+            self._idle = {True: [], False: []}
+        for driver in idle:
+            self._discard(driver)
+
+
+_pools: Dict[int, DriverPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_driver_pool() -> DriverPool:
+    """
+    Retorna el pool del proceso actual.
+    Se indexa por PID porque los workers prefork de Celery no pueden compartir navegadores.
+    """
+    pid = os.getpid()
+    with _pools_lock:
+        pool = _pools.get(pid)
+        if pool is None:
+            pool = DriverPool()
+            _pools[pid] = pool
+        return pool
+
+
+@atexit.register
+def _close_pools():
+    pool = _pools.get(os.getpid())
+    if pool:
+        pool.close_all()
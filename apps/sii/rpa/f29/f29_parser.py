@@ -0,0 +1,215 @@
+"""
+Parser offline del formulario F29
+
+Construye las mismas estructuras que F29RpaService a partir de una sola
+captura de page_source, en vez de consultar cada celda al navegador.
+"""
+import logging
+from typing import Dict, List, Optional
+
+from bs4 import BeautifulSoup
+from lxml import html as lxml_html
+
+from .f29_types import SubtablaF29, CampoF29
+
+logger = logging.getLogger(__name__)
+
+TABLA_F29_CLASS = "borde_tabla_f29"
+
+# Sincroniza el valor actual de los inputs con su atributo, para que
+# page_source refleje lo que el usuario ve (los valores los carga el JS del SII)
+SYNC_INPUT_VALUES_JS = """
+document.querySelectorAll('input').forEach(function (input) {
+    input.setAttribute('value', input.value);
+});
+"""
+
+
+def _cell_text(element) -> str:
+    """Texto visible de una celda con los espacios normalizados (equivalente a WebElement.text)"""
+    return " ".join(element.get_text(" ").split())
+
+
+def _cell_classes(element) -> str:
+    return " ".join(element.get("class") or [])
+
+
+def _process_subtable(title: str, subtitles: List[str],
+                      columns: Optional[Dict], rows: List[Dict]) -> SubtablaF29:
+    """Arma una subtabla individual del F29"""
+    return {
+        "main_title": title,
+        "subtitles": subtitles.copy(),
+        "columns": columns or {"title": "", "columns": []},
+        "rows": rows.copy()
+    }
+
+
+def parse_formulario_f29(page_source: str) -> List[SubtablaF29]:
+    """
+    Obtiene la estructura del formulario F29 desde el HTML de la página.
+
+    Args:
+        page_source: HTML capturado del formulario F29
+
+    Returns:
+        Lista de subtablas del formulario
+
+    Raises:
+        ValueError: Si el HTML no contiene la tabla del F29
+    """
+    soup = BeautifulSoup(page_source, "html.parser")
+    for tag in soup(["script", "style"]):
+        tag.decompose()
+
+    tabla_f29 = soup.find(class_=TABLA_F29_CLASS)
+    if tabla_f29 is None:
+        raise ValueError("No se encontró la tabla del formulario F29")
+
+    filas = tabla_f29.find_all("tr")
+    logger.info(f"📋 {len(filas)} filas encontradas en F29")
+
+    # Variables para procesar la estructura
+    main_title = None
+    subtitles = []
+    column_names = None
+    rows_data = []
+    processed_subtables = []
+
+    for i, fila in enumerate(filas):
+        try:
+            all_cells = [(celda, _cell_classes(celda), _cell_text(celda)) for celda in fila.find_all("td")]
+            if not all_cells:
+                continue
+
+            # Identificar tipo de fila
+            left_header_text = None
+            header_text = None
+            column_text = None
+            line_text = None
+
+            for _, classes, texto in all_cells:
+                if "f29_celda_cabecera_izq" in classes and texto and left_header_text is None:
+                    left_header_text = texto
+                elif "f29_celda_cabecera" in classes and texto and header_text is None:
+                    header_text = texto
+                elif "f29_celda_columna_cabecera" in classes and texto and column_text is None:
+                    column_text = texto
+                elif "celda-linea" in classes and texto and line_text is None:
+                    line_text = texto
+
+            # Procesar según tipo de fila
+            if left_header_text:
+                # Subtítulo
+                subtitles.append(left_header_text)
+
+            elif header_text:
+                # Título principal - procesar sección anterior si existe
+                if main_title is None or header_text != main_title:
+                    if main_title and rows_data:
+                        processed_subtables.append(
+                            _process_subtable(main_title, subtitles, column_names, rows_data)
+                        )
+                        logger.info(f"✅ Subtabla '{main_title}': {len(rows_data)} filas")
+
+                    # Nueva sección
+                    main_title = header_text
+                    subtitles = []
+                    column_names = None
+                    rows_data = []
+
+            elif column_text:
+                # Encabezados de columnas
+                column_names = {
+                    "title": column_text,
+                    "columns": [
+                        texto for _, classes, texto in all_cells
+                        if "f29_celda_columna_cabecera_b" in classes and texto
+                    ]
+                }
+
+            elif line_text:
+                # Fila de datos
+                description = ""
+                values = []
+
+                # Buscar descripción y valores
+                for _, classes, texto in all_cells:
+                    if "f29_celda_descripcion" in classes:
+                        description = texto
+                    elif "f29_celda_valor" in classes and texto:
+                        # Incluye f29_celda_valor_calculado
+                        values.append({
+                            "code": line_text,
+                            "value": texto
+                        })
+
+                if description:
+                    rows_data.append({
+                        "line": line_text,
+                        "description": description,
+                        "values": values
+                    })
+
+        except Exception as e:
+            logger.warning(f"⚠️ Error procesando fila {i}: {str(e)}")
+            continue
+
+    # Procesar última sección
+    if main_title and rows_data:
+        processed_subtables.append(_process_subtable(main_title, subtitles, column_names, rows_data))
+        logger.info(f"✅ Subtabla final '{main_title}': {len(rows_data)} filas")
+
+    logger.info(f"🎯 F29 procesado: {len(processed_subtables)} subtablas")
+    return processed_subtables
+
+
+def extraer_valores_por_xpath(page_source: str, campos: Dict[str, CampoF29]) -> List[Dict[str, str]]:
+    """
+    Evalúa los XPaths de los códigos F29 sobre el HTML de la página.
+
+    Args:
+        page_source: HTML capturado del formulario (con los inputs sincronizados
+                     mediante SYNC_INPUT_VALUES_JS)
+        campos: Códigos F29 indexados por código, con su XPath
+
+    Returns:
+        Lista de valores encontrados con code, value, name y subject
+    """
+    documento = lxml_html.fromstring(page_source)
+
+    resultados = []
+    for code, campo in campos.items():
+        xpath = (campo.get('xpath') or '').strip()
+        if not xpath:
+            continue
+
+        try:
+            elementos = documento.xpath(xpath)
+        except Exception as e:
+            logger.debug(f"⚠️ XPath inválido para {code}: {str(e)}")
+            continue
+
+        if not elementos:
+            continue
+
+        element = elementos[0]
+        # Obtener valor según tipo de elemento
+        if getattr(element, 'tag', None) == 'input':
+            valor = (element.get('value') or '').strip()
+        elif hasattr(element, 'text_content'):
+            valor = " ".join(element.text_content().split())
+        else:
+            valor = str(element).strip()
+
+        if valor:
+            resultados.append({
+                "code": code,
+                "value": valor,
+                "name": campo['name'],
+                "subject": campo['subject']
+            })
+            logger.debug(f"✅ {code}: {valor}")
+
+    logger.info(f"🎯 Extraídos {len(resultados)} valores por XPath")
+    return resultados
@@ -6,7 +6,7 @@ import os
 import csv
 import logging
 import time
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Any, Tuple
 from selenium.webdriver.common.by import By
 from selenium.common.exceptions import NoSuchElementException, TimeoutException
 
@@ -15,6 +15,8 @@ from .f29_types import (
     SubtablaF29, FilaDatos, ValorFila, ColumnasSubtabla,
     CampoF29, DetalleF29, ResumenF29, EventoHistorialF29, FormularioF29
 )
+from .f29_parser import SYNC_INPUT_VALUES_JS, parse_formulario_f29
+from .f29_parser import extraer_valores_por_xpath as extraer_valores_desde_html
 from ...utils.exceptions import SIIValidationError
 
 logger = logging.getLogger(__name__)
@@ -43,13 +45,33 @@ class F29Service:
             )
         return self._rpa_service
 
-    def _get_f29_rpa(self, folio: str) -> 'F29RpaService':
-        """Obtiene o crea la instancia del servicio F29 RPA"""
-        if not self._f29_rpa:
+    def _get_f29_rpa(self, folio: str, periodo: str = None) -> 'F29RpaService':
+        """Obtiene el servicio F29 RPA para el folio, reutilizando la sesión RPA base"""
+        if not self._f29_rpa or self._f29_rpa.folio != folio:
             rpa_service = self._get_rpa_service()
-            self._f29_rpa = F29RpaService(rpa_service, folio)
+            self._f29_rpa = F29RpaService(rpa_service, folio, periodo)
         return self._f29_rpa
 
+    def _extraer_formulario(self, folio: str, periodo: str = None) -> Dict[str, Any]:
+        """Navega al formulario en el navegador ya autenticado y extrae sus campos"""
+        f29_rpa = self._get_f29_rpa(folio, periodo)
+
+        # Navegar al formulario
+        f29_rpa.navegar_a_formulario()
+
+        # Obtener datos del formulario
+        campos_extraidos = f29_rpa.extraer_valores_por_xpath()
+
+        return {
+            'status': 'success',
+            'folio': folio,
+            'periodo': periodo,
+            'campos_extraidos': campos_extraidos,
+            'total_campos': len(campos_extraidos),
+            'extraction_method': 'f29_rpa',
+            'timestamp': time.time()
+        }
+
     def obtener_formulario_f29(self, folio: str, periodo: str = None) -> Dict[str, Any]:
         """
         Obtiene los datos completos de un formulario F29.
@@ -69,24 +91,7 @@ class F29Service:
             if not rpa_service.authenticate(force_auth=True):
                 raise SIIValidationError("Error en autenticación con SII")
 
-            # Crear servicio F29 específico
-            f29_rpa = F29RpaService(rpa_service, folio, periodo)
-
-            # Navegar al formulario
-            f29_rpa.navegar_a_formulario()
-
-            # Obtener datos del formulario
-            campos_extraidos = f29_rpa.extraer_valores_por_xpath()
-
-            return {
-                'status': 'success',
-                'folio': folio,
-                'periodo': periodo,
-                'campos_extraidos': campos_extraidos,
-                'total_campos': len(campos_extraidos),
-                'extraction_method': 'f29_rpa',
-                'timestamp': time.time()
-            }
+            return self._extraer_formulario(folio, periodo)
 
         except Exception as e:
             logger.error(f"❌ Error obteniendo F29 {folio}: {str(e)}")
@@ -98,6 +103,82 @@ class F29Service:
                 'timestamp': time.time()
             }
 
+    def obtener_formularios_f29(
+        self,
+        formularios: List[Tuple[str, Optional[str]]],
+        on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Obtiene varios formularios F29 autenticando una sola vez y navegando de
+        un formulario al siguiente en el mismo navegador.
+
+        Args:
+            formularios: Lista de tuplas (folio, periodo)
+            on_result: Función (índice, resultado) llamada apenas se obtiene cada
+                       formulario, para guardar el avance sin esperar al lote completo
+
+        Returns:
+            Lista de resultados en el mismo orden y formato que obtener_formulario_f29
+        """
+        logger.info(f"📚 Obteniendo {len(formularios)} F29 en lote para {self.tax_id}")
+
+        resultados = []
+
+        def agregar(resultado: Dict[str, Any]):
+            resultados.append(resultado)
+            if on_result:
+                on_result(len(resultados) - 1, resultado)
+
+        rpa_service = self._get_rpa_service()
+        try:
+            if not rpa_service.authenticate(force_auth=True):
+                raise SIIValidationError("Error en autenticación con SII")
+        except Exception as e:
+            logger.error(f"❌ Error autenticando lote F29: {str(e)}")
+            for folio, _ in formularios:
+                agregar({
+                    'status': 'error',
+                    'folio': folio,
+                    'message': str(e),
+                    'extraction_method': 'f29_rpa_failed',
+                    'timestamp': time.time()
+                })
+            return resultados
+
+        for i, (folio, periodo) in enumerate(formularios, 1):
+            logger.info(f"  📝 F29 {i}/{len(formularios)}: {folio}")
+            try:
+                try:
+                    resultado = self._extraer_formulario(folio, periodo)
+                except Exception:
+                    if not self._sesion_perdida():
+                        raise
+                    # La sesión expiró a mitad del lote: re-autenticar una vez y reintentar
+                    logger.warning(f"🔄 Sesión SII perdida en folio {folio}, re-autenticando")
+                    rpa_service.authenticate(force_auth=True)
+                    resultado = self._extraer_formulario(folio, periodo)
+
+            except Exception as e:
+                logger.error(f"❌ Error obteniendo F29 {folio}: {str(e)}")
+                resultado = {
+                    'status': 'error',
+                    'folio': folio,
+                    'message': str(e),
+                    'extraction_method': 'f29_rpa_failed',
+                    'timestamp': time.time()
+                }
+            agregar(resultado)
+
+        return resultados
+
+    def _sesion_perdida(self) -> bool:
+        """Indica si el navegador fue redirigido al login del SII"""
+        try:
+            driver = self._get_rpa_service().driver
+            return bool(driver) and "AUT2000" in driver.get_current_url()
+        except Exception:
+            return False
+
     def obtener_formularios_periodo(self, periodo: str) -> List[Dict[str, Any]]:
         """
         Obtiene todos los formularios F29 de un período específico.
@@ -131,11 +212,13 @@ class F29RpaService:
     Migrado desde legacy RectificacionF29.
     """
 
+    # Códigos F29 del CSV, compartidos por todas las instancias del proceso
+    _codigos_cache: Optional[Dict[str, CampoF29]] = None
+
     def __init__(self, rpa_service: RealSIIService, folio: str, periodo: str = None):
         self.rpa_service = rpa_service
         self.folio = folio
         self.periodo = periodo
-        self._codigos_f29 = None
 
     @classmethod
     def buscar_formularios(
@@ -382,8 +465,8 @@ class F29RpaService:
         Carga los códigos F29 desde el archivo CSV.
         Migrado desde legacy.
         """
-        if self._codigos_f29 is not None:
-            return self._codigos_f29
+        if F29RpaService._codigos_cache is not None:
+            return F29RpaService._codigos_cache
 
         try:
             csv_path = os.path.join(os.path.dirname(__file__), '..', 'codigos_f29.csv')
@@ -410,150 +493,39 @@ class F29RpaService:
                         }
 
             logger.info(f"✅ Cargados {len(codigos)} códigos F29")
-            self._codigos_f29 = codigos
+            F29RpaService._codigos_cache = codigos
             return codigos
 
         except Exception as e:
             logger.error(f"❌ Error cargando códigos F29: {str(e)}")
             return {}
 
+    def _capturar_page_source(self) -> str:
+        """
+        Captura el HTML actual del formulario en una sola llamada al navegador,
+        sincronizando antes el valor de los inputs con sus atributos.
+        """
+        driver = self.rpa_service.driver
+        driver.execute_script(SYNC_INPUT_VALUES_JS)
+        return driver.get_page_source()
+
     def obtener_formulario_actual(self) -> List[SubtablaF29]:
         """
         Obtiene la estructura actual del formulario F29.
-        Migrado desde legacy.
+        Se parsea una captura de page_source en vez de consultar cada celda al navegador.
         """
         try:
             logger.info("=== PROCESANDO FORMULARIO F29 ===")
-
-            # Buscar tabla principal del F29
-            tabla_f29 = self.rpa_service.driver.driver.find_element(By.CLASS_NAME, "borde_tabla_f29")
-            filas = tabla_f29.find_elements(By.TAG_NAME, "tr")
-
-            logger.info(f"📋 {len(filas)} filas encontradas en F29")
-
-            # Variables para procesar la estructura
-            main_title = None
-            subtitles = []
-            column_names = None
-            rows_data = []
-            processed_subtables = []
-
-            for i, fila in enumerate(filas):
-                try:
-                    all_cells = fila.find_elements(By.TAG_NAME, "td")
-                    if not all_cells:
-                        continue
-
-                    # Identificar tipo de fila
-                    left_header_cell = None
-                    header_cell = None
-                    column_cell = None
-                    line_cell = None
-
-                    for celda in all_cells:
-                        classes = celda.get_attribute("class") or ""
-                        texto = celda.text.strip()
-
-                        if "f29_celda_cabecera_izq" in classes and texto and not left_header_cell:
-                            left_header_cell = celda
-                        elif "f29_celda_cabecera" in classes and texto and not header_cell:
-                            header_cell = celda
-                        elif "f29_celda_columna_cabecera" in classes and texto and not column_cell:
-                            column_cell = celda
-                        elif "celda-linea" in classes and texto and not line_cell:
-                            line_cell = celda
-
-                    # Procesar según tipo de fila
-                    if left_header_cell:
-                        # Subtítulo
-                        subtitles.append(left_header_cell.text)
-
-                    elif header_cell:
-                        # Título principal - procesar sección anterior si existe
-                        new_title = header_cell.text.strip()
-
-                        if new_title and (main_title is None or new_title != main_title):
-                            if main_title and rows_data:
-                                subtabla = self._process_subtable(main_title, subtitles, column_names, rows_data)
-                                processed_subtables.append(subtabla)
-                                logger.info(f"✅ Subtabla '{main_title}': {len(rows_data)} filas")
-
-                            # Nueva sección
-                            main_title = new_title
-                            subtitles = []
-                            column_names = None
-                            rows_data = []
-
-                    elif column_cell:
-                        # Encabezados de columnas
-                        columns_b = [celda for celda in all_cells
-                                   if "f29_celda_columna_cabecera_b" in (celda.get_attribute("class") or "")
-                                   and celda.text.strip()]
-
-                        column_names = {
-                            "title": column_cell.text,
-                            "columns": [col.text for col in columns_b]
-                        }
-
-                    elif line_cell:
-                        # Fila de datos
-                        line_number = line_cell.text
-                        description = ""
-                        values = []
-
-                        # Buscar descripción y valores
-                        for celda in all_cells:
-                            classes = celda.get_attribute("class") or ""
-
-                            if "f29_celda_descripcion" in classes:
-                                description = celda.text.strip()
-                            elif ("f29_celda_valor" in classes or
-                                  "f29_celda_valor_calculado" in classes):
-                                valor = celda.text.strip()
-                                if valor:
-                                    values.append({
-                                        "code": line_number,
-                                        "value": valor
-                                    })
-
-                        if line_number and description:
-                            rows_data.append({
-                                "line": line_number,
-                                "description": description,
-                                "values": values
-                            })
-
-                except Exception as e:
-                    logger.warning(f"⚠️ Error procesando fila {i}: {str(e)}")
-                    continue
-
-            # Procesar última sección
-            if main_title and rows_data:
-                subtabla = self._process_subtable(main_title, subtitles, column_names, rows_data)
-                processed_subtables.append(subtabla)
-                logger.info(f"✅ Subtabla final '{main_title}': {len(rows_data)} filas")
-
-            logger.info(f"🎯 F29 procesado: {len(processed_subtables)} subtablas")
-            return processed_subtables
+            return parse_formulario_f29(self._capturar_page_source())
 
         except Exception as e:
             logger.error(f"❌ Error procesando F29: {str(e)}")
             raise
 
-    def _process_subtable(self, title: str, subtitles: List[str],
-                         columns: Optional[Dict], rows: List[Dict]) -> SubtablaF29:
-        """Procesa una subtabla individual del F29"""
-        return {
-            "main_title": title,
-            "subtitles": subtitles.copy(),
-            "columns": columns or {"title": "", "columns": []},
-            "rows": rows.copy()
-        }
-
     def extraer_valores_por_xpath(self) -> List[ValorFila]:
         """
         Extrae valores específicos usando XPaths del CSV.
-        Migrado desde legacy.
+        Los XPaths se evalúan sobre una captura de page_source.
         """
         try:
             logger.info("=== EXTRAYENDO VALORES POR XPATH ===")
@@ -571,33 +543,7 @@ class F29RpaService:
 
             logger.info(f"🎯 Extrayendo {len(campos_con_xpath)} campos con XPath")
 
-            resultados = []
-            for code, campo in campos_con_xpath.items():
-                try:
-                    xpath = campo['xpath']
-                    element = self.rpa_service.driver.driver.find_element(By.XPATH, xpath)
-
-                    # Obtener valor según tipo de elemento
-                    if element.tag_name == 'input':
-                        valor = element.get_attribute('value') or ''
-                    else:
-                        valor = element.text.strip()
-
-                    if valor:
-                        resultados.append({
-                            "code": code,
-                            "value": valor,
-                            "name": campo['name'],
-                            "subject": campo['subject']
-                        })
-                        logger.debug(f"✅ {code}: {valor}")
-
-                except Exception as e:
-                    logger.debug(f"⚠️ Error extrayendo {code}: {str(e)}")
-                    continue
-
-            logger.info(f"🎯 Extraídos {len(resultados)} valores por XPath")
-            return resultados
+            return extraer_valores_desde_html(self._capturar_page_source(), campos_con_xpath)
 
         except Exception as e:
             logger.error(f"❌ Error en extracción por XPath: {str(e)}")
@@ -11,12 +11,50 @@ from selenium.common.exceptions import TimeoutException
 from webdriver_manager.chrome import ChromeDriverManager
 import logging
 import os
+from functools import lru_cache
 from typing import Optional, Any
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=None)
+def _resolve_chromedriver_path(is_docker: bool) -> str:
+    """
+    Resuelve la ruta de ChromeDriver una sola vez por proceso.
+    webdriver-manager consulta la red en cada install(), por lo que se cachea.
+    """
+    # Buscar ChromeDriver del sistema primero
+    driver_path = getattr(settings, 'CHROME_DRIVER_PATH', None) or os.getenv('CHROME_DRIVER_PATH')
+    
+    if driver_path and os.path.exists(driver_path):
+        logger.info(f"Using ChromeDriver from config: {driver_path}")
+        return driver_path
+    
+    if is_docker:
+        # En Docker, buscar en rutas estándar
+        docker_driver_paths = [
+            "/usr/bin/chromedriver",
+            "/usr/lib/chromium-browser/chromedriver",
+            "/usr/lib/chromium/chromedriver",
+        ]
+        
+        for path in docker_driver_paths:
+            if os.path.exists(path) and os.access(path, os.X_OK):
+                logger.info(f"Found ChromeDriver in Docker: {path}")
+                return path
+    
+    # Fallback a webdriver-manager si no se encontró del sistema
+    try:
+        logger.info("Using webdriver-manager for ChromeDriver")
+        chromedriver_path = ChromeDriverManager().install()
+        logger.info(f"webdriver-manager provided: {chromedriver_path}")
+        return chromedriver_path
+    except Exception as e:
+        logger.error(f"webdriver-manager failed: {e}")
+        raise Exception("No valid ChromeDriver found")
+
+
 class TimeoutError(Exception):
     """Error personalizado para timeouts"""
     pass
@@ -116,38 +154,7 @@ class SeleniumDriver:
                 os.getenv('DOCKER_CONTAINER') is not None
             )
             
-            service = None
-            
-            # Buscar ChromeDriver del sistema primero
-            driver_path = getattr(settings, 'CHROME_DRIVER_PATH', None) or os.getenv('CHROME_DRIVER_PATH')
-            
-            if driver_path and os.path.exists(driver_path):
-                service = Service(driver_path)
-                logger.info(f"Using ChromeDriver from config: {driver_path}")
-            elif is_docker:
-                # En Docker, buscar en rutas estándar
-                docker_driver_paths = [
-                    "/usr/bin/chromedriver",
-                    "/usr/lib/chromium-browser/chromedriver",
-                    "/usr/lib/chromium/chromedriver",
-                ]
-                
-                for path in docker_driver_paths:
-                    if os.path.exists(path) and os.access(path, os.X_OK):
-                        service = Service(path)
-                        logger.info(f"Found ChromeDriver in Docker: {path}")
-                        break
-            
-            # Fallback a webdriver-manager si no se encontró del sistema
-            if service is None:
-                try:
-                    logger.info("Using webdriver-manager for ChromeDriver")
-                    chromedriver_path = ChromeDriverManager().install()
-                    service = Service(chromedriver_path)
-                    logger.info(f"webdriver-manager provided: {chromedriver_path}")
-                except Exception as e:
-                    logger.error(f"webdriver-manager failed: {e}")
-                    raise Exception("No valid ChromeDriver found")
+            service = Service(_resolve_chromedriver_path(is_docker))
             
             # Inicializar driver
             self.driver = webdriver.Chrome(service=service, options=options)
@@ -183,6 +190,36 @@ class SeleniumDriver:
                 self.driver = None
                 self.wait = None
 
+    def is_alive(self) -> bool:
+        """Verifica que el navegador siga respondiendo"""
+        if not self.driver:
+            return False
+        try:
+            self.driver.execute_script("return 1")
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ Driver no responde: {e}")
+            return False
+
+    def reset(self) -> None:
+        """
+        Limpia cookies y almacenamiento del navegador para reutilizarlo con
+        otra empresa sin arrastrar la sesión anterior.
+        """
+        if not self.driver:
+            raise Exception("Driver no está iniciado")
+        try:
+            self.driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+            self.driver.execute_cdp_cmd('Storage.clearDataForOrigin', {
+                'origin': '*',
+                'storageTypes': 'all',
+            })
+        except Exception:
+            # Sin CDP solo se pueden borrar las cookies del dominio actual
+            self.driver.delete_all_cookies()
+        self.driver.get('about:blank')
+        self._last_error = None
+
     def wait_for_element(self, by: str, value: str, timeout: Optional[int] = None) -> Any:
         """Espera a que un elemento esté presente"""
         if not self.driver:
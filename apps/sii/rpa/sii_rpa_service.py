@@ -4,16 +4,16 @@ Based on fizko-backend SII RPA implementation
 """
 import time
 import logging
-import uuid
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Dict, Any, List, Optional
 from selenium.webdriver.common.by import By
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
-from django.utils import timezone
+from django.conf import settings
 
 from .selenium_driver import SeleniumDriver
+from .driver_pool import get_driver_pool
 from ..utils.exceptions import SIIConnectionError, SIIAuthenticationError, SIIValidationError
-from ..models import SIISession
+from ..utils.session_broker import session_broker
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +31,7 @@ class RealSIIService:
         self.password = password
         self.headless = headless
         self.driver = None
+        self._driver_pooled = False
         self.authenticated = False
         self.cookies = []
         self.session_id = None
@@ -46,25 +47,15 @@ class RealSIIService:
         self._load_stored_cookies()
 
     def _load_stored_cookies(self):
-        """Carga cookies almacenadas de una sesión activa"""
+        """Carga cookies de la sesión activa entregada por el broker de sesiones"""
         try:
-            # Buscar sesión activa para esta empresa
-            active_session = SIISession.objects.filter(
-                company_rut=self.company_rut,
-                company_dv=self.company_dv.upper(),
-                is_active=True,
-                expires_at__gt=timezone.now()
-            ).first()
-            
-            if active_session and active_session.cookies_data:
-                self.cookies = active_session.cookies_data
-                self.session_id = active_session.session_id
+            active_session = session_broker.get_session(self.tax_id)
+            
+            if active_session:
+                self.cookies = active_session['cookies']
+                self.session_id = active_session['session_id']
                 self.authenticated = True  # Asumimos que está autenticado si hay cookies válidas
                 logger.info(f"🍪 Loaded {len(self.cookies)} stored cookies for {self.tax_id}")
-                
-                # Actualizar última actividad
-                active_session.last_activity = timezone.now()
-                active_session.save(update_fields=['last_activity'])
             else:
                 logger.info(f"🔍 No valid stored session found for {self.tax_id}")
                 
@@ -72,32 +63,14 @@ class RealSIIService:
             logger.warning(f"⚠️ Error loading stored cookies for {self.tax_id}: {str(e)}")
 
     def _save_cookies_to_session(self):
-        """Guarda las cookies actuales en SIISession - SIEMPRE crea nueva sesión"""
+        """Publica las cookies actuales como sesión activa a través del broker"""
         try:
             if not self.cookies:
                 logger.warning(f"⚠️ No cookies to save for {self.tax_id}")
                 return
-                
-            # Invalidar sesiones anteriores para este contribuyente
-            SIISession.objects.filter(
-                company_rut=self.company_rut,
-                company_dv=self.company_dv.upper(),
-                is_active=True
-            ).update(is_active=False)
-            logger.info(f"🗑️ Invalidated previous sessions for {self.tax_id}")
-            
-            # SIEMPRE crear nueva sesión con cookies frescas
-            self.session_id = str(uuid.uuid4())
-            session = SIISession.objects.create(
-                company_rut=self.company_rut,
-                company_dv=self.company_dv.upper(),
-                username=self.tax_id,  # Usar tax_id como username
-                session_id=self.session_id,
-                cookies_data=self.cookies,
-                is_active=True,
-                expires_at=timezone.now() + timedelta(hours=8)
-            )
-            logger.info(f"💾 Created NEW session {self.session_id} for {self.tax_id} with {len(self.cookies)} cookies")
+            
+            session = session_broker.store_cookies(self.tax_id, self.cookies)
+            self.session_id = session['session_id']
                 
         except Exception as e:
             logger.error(f"❌ Error saving cookies to session for {self.tax_id}: {str(e)}")
@@ -130,23 +103,36 @@ class RealSIIService:
             return False
 
     def _start_driver(self):
-        """Inicia el driver Selenium"""
+        """Obtiene un driver Selenium, precalentado desde el pool si está habilitado"""
         if self.driver is None:
-            self.driver = SeleniumDriver(headless=self.headless)
-            self.driver.start()
+            if getattr(settings, 'SII_BROWSER_POOL_ENABLED', True):
+                self.driver = get_driver_pool().acquire(headless=self.headless, owner=self)
+                self._driver_pooled = True
+            else:
+                self.driver = SeleniumDriver(headless=self.headless)
+                self.driver.start()
+                self._driver_pooled = False
 
     def _close_driver(self):
-        """Cierra el driver Selenium"""
+        """Devuelve el driver al pool (limpiando la sesión) o lo cierra"""
         if self.driver:
-            self.driver.quit()
+            if self._driver_pooled:
+                get_driver_pool().release(self.driver)
+            else:
+                self.driver.quit()
             self.driver = None
 
     def authenticate(self, force_auth: bool = False) -> bool:
         """
-        Autentica con el SII usando Selenium - verifica cookies existentes primero
+        Autentica con el SII usando Selenium - verifica cookies existentes primero.
+        
+        El login en navegador pasa por el broker de sesiones: si otro worker ya
+        está autenticando la misma empresa se espera su resultado en vez de abrir
+        un segundo Chrome.
 
         Args:
             force_auth: Si es True, fuerza nueva autenticación sin revisar cookies
+                        (necesario cuando se requiere el navegador autenticado)
         """
         try:
             logger.info(f"🔐 Starting SII authentication for {self.tax_id}")
@@ -159,61 +145,19 @@ class RealSIIService:
             
             logger.info(f"🔄 No valid cookies found, proceeding with browser authentication")
             
-            # Iniciar driver
-            self._start_driver()
-            
-            # Ir a página de login
-            self.driver.driver.get(self.LOGIN_URL)
-            logger.info(f"📄 Loaded login page: {self.LOGIN_URL}")
-            
-            # Llenar formulario de login - asegurar formato correcto del RUT
-            normalized_rut = self.tax_id.upper()  # Asegurar que el DV esté en mayúscula
-            rut_input = self.driver.wait_for_element(By.ID, "rutcntr", timeout=15)
-            rut_input.clear()
-            rut_input.send_keys(normalized_rut)
-            logger.info(f"✏️ Entered RUT: {normalized_rut}")
-            
-            clave_input = self.driver.wait_for_element(By.ID, "clave", timeout=15)
-            clave_input.clear()
-            clave_input.send_keys(self.password)
-            logger.info(f"✏️ Entered password")
-            
-            # Click botón de login
-            login_button = self.driver.wait_for_clickable(By.ID, "bt_ingresar", timeout=15)
-            login_button.click()
-            logger.info(f"🖱️ Clicked login button")
+            session = session_broker.login(
+                self.tax_id,
+                self._browser_login,
+                stale_cookies=self.cookies or None,
+                force=force_auth
+            )
             
-            # Esperar y verificar resultado
-            time.sleep(3)
+            self.authenticated = True
+            self.cookies = session['cookies']
+            self.session_id = session['session_id']
+            logger.info(f"✅ Authentication successful for {self.tax_id}")
             
-            # Verificar login exitoso
-            login_result = self._verificar_login_exitoso()
-            
-            if login_result['status'] == 'success':
-                self.authenticated = True
-                self.cookies = login_result['cookies']
-                logger.info(f"✅ Authentication successful for {self.tax_id}")
-                
-                # Guardar cookies en SIISession para persistencia
-                self._save_cookies_to_session()
-                
-                return True
-            elif login_result['status'] == 'sii_unavailable':
-                raise SIIConnectionError(
-                    message=login_result['message'],
-                    retry_after=login_result.get('retry_after'),
-                    error_type=login_result.get('error_type')
-                )
-            elif login_result['status'] == 'sii_error':
-                raise SIIConnectionError(
-                    message=login_result['message'],
-                    retry_after=login_result.get('retry_after'),
-                    error_type=login_result.get('error_type')
-                )
-            else:
-                # Invalidar sesión almacenada si las credenciales fallan
-                self._invalidate_stored_session()
-                raise SIIAuthenticationError(login_result['message'])
+            return True
             
         except (SIIConnectionError, SIIAuthenticationError):
             # Invalidar sesión en caso de error de autenticación
@@ -224,7 +168,53 @@ class RealSIIService:
             # Invalidar sesión en caso de error general
             self._invalidate_stored_session()
             raise SIIValidationError(f"Error durante autenticación: {str(e)}")
+
+    def _browser_login(self) -> List[Dict]:
+        """
+        Hace el login en el navegador y retorna las cookies obtenidas.
+        Lo invoca el broker de sesiones mientras tiene el lock de login.
+        """
+        # Iniciar driver
+        self._start_driver()
         
+        # Ir a página de login
+        self.driver.driver.get(self.LOGIN_URL)
+        logger.info(f"📄 Loaded login page: {self.LOGIN_URL}")
+        
+        # Llenar formulario de login - asegurar formato correcto del RUT
+        normalized_rut = self.tax_id.upper()  # Asegurar que el DV esté en mayúscula
+        rut_input = self.driver.wait_for_element(By.ID, "rutcntr", timeout=15)
+        rut_input.clear()
+        rut_input.send_keys(normalized_rut)
+        logger.info(f"✏️ Entered RUT: {normalized_rut}")
+        
+        clave_input = self.driver.wait_for_element(By.ID, "clave", timeout=15)
+        clave_input.clear()
+        clave_input.send_keys(self.password)
+        logger.info(f"✏️ Entered password")
+        
+        # Click botón de login
+        login_button = self.driver.wait_for_clickable(By.ID, "bt_ingresar", timeout=15)
+        login_button.click()
+        logger.info(f"🖱️ Clicked login button")
+        
+        # Esperar y verificar resultado
+        time.sleep(3)
+        
+        # Verificar login exitoso
+        login_result = self._verificar_login_exitoso()
+        
+        if login_result['status'] == 'success':
+            return login_result['cookies']
+        elif login_result['status'] in ('sii_unavailable', 'sii_error'):
+            raise SIIConnectionError(
+                message=login_result['message'],
+                retry_after=login_result.get('retry_after'),
+                error_type=login_result.get('error_type')
+            )
+        else:
+            raise SIIAuthenticationError(login_result['message'])
+
     def _verificar_login_exitoso(self) -> Dict[str, Any]:
         """Verifica si el login fue exitoso"""
         try:
@@ -666,18 +656,10 @@ class RealSIIService:
     def _invalidate_stored_session(self):
         """Invalida la sesión almacenada en caso de error de autenticación"""
         try:
+            session_broker.invalidate(self.tax_id, session_id=self.session_id)
             if self.session_id:
-                session = SIISession.objects.get(session_id=self.session_id)
-                session.is_active = False
-                session.save(update_fields=['is_active'])
                 logger.info(f"🗑️ Invalidated stored session {self.session_id} for {self.tax_id}")
             else:
-                # Invalidar todas las sesiones activas para esta empresa
-                SIISession.objects.filter(
-                    company_rut=self.company_rut,
-                    company_dv=self.company_dv.upper(),
-                    is_active=True
-                ).update(is_active=False)
                 logger.info(f"🗑️ Invalidated all active sessions for {self.tax_id}")
         except Exception as e:
             logger.warning(f"⚠️ Error invalidating session for {self.tax_id}: {str(e)}")
@@ -1,17 +1,23 @@
 """
 Servicio para sincronización de documentos SII
 """
+import hashlib
+import json
 import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, date, timedelta
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Set, Tuple
 
-from django.db import transaction
+from django.conf import settings
+from django.db import connection, transaction
 from django.utils import timezone
 
 from apps.companies.models import Company
 from apps.taxpayers.models import TaxpayerSiiCredentials
 from ..rpa.api_integration import SIIIntegratedService
-from ..models import SIISyncLog
+from ..models import SIISyncLog, SIIPeriodSyncState
 
 logger = logging.getLogger(__name__)
 
@@ -22,19 +28,35 @@ class DocumentSyncService:
     Encapsula toda la lógica de negocio para la sincronización.
     """
     
-    def __init__(self, company_rut: str, company_dv: str):
+    # Tipos consultados cuando el resumen no informa tipos con datos
+    TIPOS_COMUNES_COMPRA = ['33', '34', '46', '56', '61']  # Facturas, NC, ND, Factura Compra
+    TIPOS_COMUNES_VENTA = ['33', '34', '39', '41', '52', '56', '61']  # Facturas, Boletas, GD, NC, ND
+    
+    def __init__(
+        self,
+        company_rut: str,
+        company_dv: str,
+        max_workers: Optional[int] = None,
+        chunk_size: Optional[int] = None
+    ):
         """
         Inicializa el servicio de sincronización.
         
         Args:
             company_rut: RUT de la empresa sin dígito verificador
             company_dv: Dígito verificador de la empresa
+            max_workers: Máximo de consultas concurrentes al SII
+                         (por defecto settings.SII_SYNC_MAX_WORKERS)
+            chunk_size: Documentos por lote enviado al procesador
+                        (por defecto settings.SII_SYNC_CHUNK_SIZE)
         """
         self.company_rut = company_rut
         self.company_dv = company_dv
         self.full_rut = f"{company_rut}-{company_dv}"
         self.company = None
         self.credentials = None
+        self.max_workers = max(1, max_workers or getattr(settings, 'SII_SYNC_MAX_WORKERS', 4))
+        self.chunk_size = max(1, chunk_size or getattr(settings, 'SII_SYNC_CHUNK_SIZE', 1000))
         
         # Inicializar empresa y credenciales
         self._initialize()
@@ -79,7 +101,8 @@ class DocumentSyncService:
         fecha_desde: str, 
         fecha_hasta: str,
         sync_log: SIISyncLog,
-        task_id: Optional[str] = None
+        task_id: Optional[str] = None,
+        incremental: bool = True
     ) -> Dict[str, Any]:
         """
         Sincroniza documentos para un período específico.
@@ -89,6 +112,8 @@ class DocumentSyncService:
             fecha_hasta: Fecha fin en formato YYYY-MM-DD
             sync_log: Log de sincronización para actualizar
             task_id: ID de la tarea de Celery (opcional)
+            incremental: Si True, omite los períodos cerrados cuyo resumen SII
+                         no cambió desde la última sincronización
             
         Returns:
             Dict con los resultados de la sincronización
@@ -106,9 +131,11 @@ class DocumentSyncService:
         periodos = self._get_periodos_from_dates(fecha_desde, fecha_hasta)
         logger.info(f"📅 Períodos a procesar: {periodos}")
         
-        all_dtes = []
         sii_password = self.credentials.get_password()
         
+        from .dte_processor import DTEProcessor
+        processor = DTEProcessor(self.company)
+        
         # Usar servicio integrado SII
         with SIIIntegratedService(
             tax_id=self.full_rut, 
@@ -117,24 +144,13 @@ class DocumentSyncService:
         ) as sii_service:
             logger.info(f"✅ Servicio SII integrado creado para {self.full_rut}")
             
-            # Procesar cada período
-            for periodo in periodos:
-                logger.info(f"📅 Procesando período {periodo}")
-                
-                # Extraer documentos del período
-                dtes_periodo = self._extract_periodo_documents(
-                    sii_service, 
-                    periodo, 
-                    task_id
-                )
-                all_dtes.extend(dtes_periodo)
-        
-        logger.info(f"🎯 Extracción completada: {len(all_dtes)} documentos totales")
-        
-        # Procesar y almacenar DTEs
-        from .dte_processor import DTEProcessor
-        processor = DTEProcessor(self.company)
-        results = processor.process_batch(all_dtes, sync_log)
+            # Extraer y procesar por lotes a medida que llegan los documentos
+            results, _ = self._process_document_stream(
+                self._iter_periodos_documents(sii_service, periodos, task_id, incremental),
+                processor,
+                sync_log,
+                task_id
+            )
         
         logger.info(f"✅ Procesamiento completado: {results['created']} creados, {results['updated']} actualizados")
         
@@ -143,14 +159,20 @@ class DocumentSyncService:
     def sync_full_history(
         self,
         sync_log: SIISyncLog,
-        task_id: Optional[str] = None
+        task_id: Optional[str] = None,
+        incremental: bool = True
     ) -> Dict[str, Any]:
         """
         Sincroniza todo el historial de documentos desde el inicio de actividades.
         
+        Con incremental=True se omiten los períodos cerrados cuyo resumen SII no
+        cambió, y si la tarea se reintenta (mismo task_id) se reanuda desde los
+        períodos que no alcanzaron a completarse.
+        
         Args:
             sync_log: Log de sincronización para actualizar
             task_id: ID de la tarea de Celery (opcional)
+            incremental: Si False, vuelve a descargar todos los períodos
             
         Returns:
             Dict con los resultados de la sincronización
@@ -171,64 +193,32 @@ class DocumentSyncService:
         total_periodos = len(periodos)
         logger.info(f"📅 Períodos a procesar: {total_periodos} ({periodos[0]} - {periodos[-1]})")
         
-        all_dtes = []
-        processed_periodos = 0
         sii_password = self.credentials.get_password()
         
         # Procesar y almacenar resultados parciales
         from .dte_processor import DTEProcessor
         processor = DTEProcessor(self.company)
         
-        total_results = {
-            'processed': 0,
-            'created': 0,
-            'updated': 0,
-            'errors': 0,
-            'error_details': []
-        }
+        def on_period_extracted(periodo: str, processed_periodos: int):
+            logger.info(f"📅 Período {periodo} extraído ({processed_periodos}/{total_periodos})")
+            # Actualizar progreso cada 10 períodos
+            if processed_periodos % 10 == 0:
+                self._update_sync_progress(sync_log, processed_periodos, total_periodos)
         
         with SIIIntegratedService(
             tax_id=self.full_rut,
             password=sii_password,
             headless=True
         ) as sii_service:
-            logger.info(f"✅ Servicio SII integrado creado")
+            logger.info(f"✅ Servicio SII integrado creado (concurrencia: {self.max_workers})")
             
-            for i, periodo in enumerate(periodos, 1):
-                logger.info(f"📅 Procesando período {periodo} ({i}/{total_periodos})")
-                
-                # Actualizar progreso cada 10 períodos
-                if i % 10 == 0:
-                    self._update_sync_progress(sync_log, i, total_periodos)
-                
-                # Extraer documentos del período
-                dtes_periodo = self._extract_periodo_documents(
-                    sii_service,
-                    periodo,
-                    task_id
-                )
-                all_dtes.extend(dtes_periodo)
-                processed_periodos += 1
-                
-                # Procesar en lotes para evitar consumir mucha memoria
-                if len(all_dtes) >= 1000:
-                    logger.info(f"📊 Procesando lote de {len(all_dtes)} documentos...")
-                    batch_results = processor.process_batch(all_dtes, sync_log)
-                    
-                    # Acumular resultados
-                    self._accumulate_results(total_results, batch_results)
-                    
-                    # Actualizar log con resultados parciales
-                    self._update_sync_log_results(sync_log, total_results)
-                    
-                    logger.info(f"✅ Lote procesado: {batch_results['created']} creados, {batch_results['updated']} actualizados")
-                    all_dtes = []  # Limpiar lista para siguiente lote
-        
-        # Procesar DTEs finales si quedan
-        if all_dtes:
-            logger.info(f"📊 Procesando último lote de {len(all_dtes)} documentos...")
-            final_results = processor.process_batch(all_dtes, sync_log)
-            self._accumulate_results(total_results, final_results)
+            total_results, processed_periodos = self._process_document_stream(
+                self._iter_periodos_documents(sii_service, periodos, task_id, incremental),
+                processor,
+                sync_log,
+                task_id,
+                on_period_extracted=on_period_extracted
+            )
         
         logger.info(f"🎉 Sincronización COMPLETA exitosa")
         logger.info(f"   Períodos procesados: {processed_periodos}")
@@ -242,115 +232,522 @@ class DocumentSyncService:
             **total_results
         }
     
-    def _extract_periodo_documents(
-        self, 
-        sii_service: SIIIntegratedService,
-        periodo: str,
-        task_id: Optional[str] = None
-    ) -> List[Dict]:
+    def _process_document_stream(
+        self,
+        events,
+        processor,
+        sync_log: SIISyncLog,
+        task_id: Optional[str] = None,
+        on_period_extracted=None
+    ) -> Tuple[Dict[str, Any], int]:
         """
-        Extrae documentos de un período específico.
+        Consume los documentos que entrega _iter_periodos_documents en lotes de
+        tamaño fijo (self.chunk_size).
+        
+        Solo se retiene en memoria el lote en curso: cada lote se procesa apenas
+        se completa y, mientras tanto, el extractor no encola más consultas al
+        SII. Un período se marca como sincronizado (checkpoint) solo cuando
+        todos sus documentos ya se procesaron y ninguno falló; si alguno falló
+        el período queda sin checkpoint y la próxima sincronización lo reintenta.
         
         Args:
-            sii_service: Servicio SII integrado
-            periodo: Período tributario (YYYYMM)
+            events: Tuplas (período, documentos, checkpoints) del extractor
+            processor: DTEProcessor de la empresa
+            sync_log: Log de sincronización
             task_id: ID de la tarea (opcional)
+            on_period_extracted: Callback (período, períodos extraídos) al completar cada período
             
         Returns:
-            Lista de DTEs extraídos
+            Tupla (resultados acumulados, períodos extraídos)
+        """
+        total_results = {
+            'processed': 0,
+            'created': 0,
+            'updated': 0,
+            'errors': 0,
+            'error_details': []
+        }
+        buffer: List[Dict] = []
+        # Período de cada documento del buffer (misma posición)
+        buffer_periods: List[str] = []
+        # Períodos con documentos que no se pudieron guardar
+        failed_periods: Set[str] = set()
+        received = 0
+        flushed = 0
+        processed_periodos = 0
+        # Documentos por operación de los períodos aún incompletos
+        period_counts: Dict[str, Dict[str, int]] = {}
+        # (documentos recibidos al completar el período, checkpoints del período)
+        pending_checkpoints: List[Tuple[int, List[Dict[str, Any]]]] = []
+        
+        def flush(chunk: List[Dict], chunk_periods: List[str]):
+            nonlocal flushed
+            logger.info(f"📊 Procesando lote de {len(chunk)} documentos...")
+            batch_results = processor.process_batch(chunk, sync_log)
+            failed_periods.update(self._failed_periods(chunk, chunk_periods, batch_results))
+            self._accumulate_results(total_results, batch_results)
+            self._update_sync_log_results(sync_log, total_results)
+            flushed += len(chunk)
+            logger.info(f"✅ Lote procesado: {batch_results['created']} creados, {batch_results['updated']} actualizados")
+        
+        def save_ready_checkpoints():
+            nonlocal pending_checkpoints
+            ready = [checkpoints for watermark, checkpoints in pending_checkpoints if watermark <= flushed]
+            pending_checkpoints = [item for item in pending_checkpoints if item[0] > flushed]
+            for checkpoints in ready:
+                periodo = checkpoints[0]['periodo'] if checkpoints else None
+                if periodo in failed_periods:
+                    logger.warning(f"⚠️ Período {periodo} con documentos fallidos: sin checkpoint, se reintentará")
+                    continue
+                self._save_checkpoints(checkpoints, task_id)
+        
+        for periodo, dtes, checkpoints in events:
+            if dtes:
+                counts = period_counts.setdefault(periodo, {'COMPRA': 0, 'VENTA': 0})
+                for dte in dtes:
+                    counts['COMPRA' if dte.get('tipo_operacion') == 'recibidos' else 'VENTA'] += 1
+                
+                buffer.extend(dtes)
+                buffer_periods.extend([periodo] * len(dtes))
+                received += len(dtes)
+                del dtes
+                
+                while len(buffer) >= self.chunk_size:
+                    chunk = buffer[:self.chunk_size]
+                    chunk_periods = buffer_periods[:self.chunk_size]
+                    del buffer[:self.chunk_size]
+                    del buffer_periods[:self.chunk_size]
+                    flush(chunk, chunk_periods)
+                    del chunk
+                    save_ready_checkpoints()
+            
+            if checkpoints is not None:
+                # Período completo: su checkpoint espera a que se procesen sus documentos
+                pending_checkpoints.append((
+                    received,
+                    self._build_checkpoints(periodo, period_counts.pop(periodo, {}), checkpoints)
+                ))
+                processed_periodos += 1
+                if on_period_extracted:
+                    on_period_extracted(periodo, processed_periodos)
+                save_ready_checkpoints()
+        
+        # Procesar DTEs finales si quedan
+        if buffer:
+            flush(buffer, buffer_periods)
+            buffer = []
+        save_ready_checkpoints()
+        
+        logger.info(f"🎯 Extracción completada: {received} documentos totales")
+        return total_results, processed_periodos
+    
+    def _iter_periodos_documents(
+        self,
+        sii_service: SIIIntegratedService,
+        periodos: List[str],
+        task_id: Optional[str] = None,
+        incremental: bool = False
+    ):
         """
-        dtes = []
+        Extrae los documentos de varios períodos con concurrencia acotada,
+        entregándolos por (período, operación, tipo) a medida que llegan.
         
-        # Extraer documentos de compra
-        dtes.extend(self._extract_compras(sii_service, periodo, task_id))
+        1. Obtiene en paralelo el resumen de cada período y arma los trabajos
+           de extracción (período, operación, tipo de documento)
+        2. Ejecuta los trabajos en un pool de max_workers hilos; el límite de
+           tasa por host lo aplica SIIServiceV2
         
-        # Extraer documentos de venta
-        dtes.extend(self._extract_ventas(sii_service, periodo, task_id))
+        Como máximo hay max_workers trabajos encolados o en curso, y solo se
+        encolan nuevos cuando el consumidor pide el siguiente resultado: si el
+        procesamiento en BD (hilo principal) es más lento que el SII, la
+        extracción espera en vez de acumular documentos en memoria.
         
-        return dtes
+        Args:
+            sii_service: Servicio SII integrado
+            periodos: Períodos tributarios (YYYYMM)
+            task_id: ID de la tarea (opcional)
+            incremental: Si True, omite períodos sin cambios según SIIPeriodSyncState
+            
+        Yields:
+            Tuplas (período, lista de DTEs, None) por cada trabajo extraído y
+            (período, [], checkpoints {operación: hash del resumen}) cuando todos
+            los trabajos del período terminaron, con las operaciones extraídas
+            completas en esta ejecución
+        """
+        states = self._load_sync_states() if incremental else {}
+        pending_jobs: Dict[str, int] = {}
+        period_checkpoints: Dict[str, Dict[str, str]] = {}
+        queued_jobs = deque()
+        
+        # Reanudar: períodos ya completados por esta misma tarea (reintento de Celery)
+        if incremental and task_id:
+            remaining = []
+            for periodo in periodos:
+                if all(
+                    states.get((periodo, operacion)) and states[(periodo, operacion)].task_id == task_id
+                    for operacion in ('COMPRA', 'VENTA')
+                ):
+                    logger.info(f"⏭️ Período {periodo} ya completado por la tarea {task_id}, omitiendo")
+                    yield periodo, [], {}
+                else:
+                    remaining.append(periodo)
+            periodos = remaining
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='sii-sync') as executor:
+            # PASO 1: resúmenes de todos los períodos (respuestas pequeñas)
+            in_flight = {
+                executor.submit(self._run_in_thread, self._plan_periodo, sii_service, periodo, task_id, states): (periodo, None)
+                for periodo in periodos
+            }
+            running_jobs = 0
+            
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                events = deque()
+                
+                for future in done:
+                    periodo, operacion = in_flight.pop(future)
+                    
+                    if operacion is None:
+                        jobs, synthetic_docs, checkpoints = future.result()
+                        period_checkpoints[periodo] = checkpoints
+                        pending_jobs[periodo] = len(jobs)
+                        if synthetic_docs:
+                            events.append((periodo, synthetic_docs, None))
+                        # PASO 2: extracción por (período, operación, tipo), encolada
+                        queued_jobs.extend((periodo, operacion, cod_tipo) for operacion, cod_tipo in jobs)
+                    else:
+                        running_jobs -= 1
+                        docs = future.result()
+                        pending_jobs[periodo] -= 1
+                        if docs is None:
+                            # La extracción falló: no marcar la operación como sincronizada
+                            period_checkpoints[periodo].pop(operacion, None)
+                        elif docs:
+                            events.append((periodo, docs, None))
+                    
+                    if pending_jobs[periodo] == 0:
+                        pending_jobs.pop(periodo)
+                        events.append((periodo, [], period_checkpoints.pop(periodo)))
+                
+                # Mantener ocupados los hilos mientras el consumidor procesa
+                while queued_jobs and running_jobs < self.max_workers:
+                    periodo, operacion, cod_tipo = queued_jobs.popleft()
+                    future_job = executor.submit(
+                        self._run_in_thread, self._fetch_documentos,
+                        sii_service, periodo, operacion, cod_tipo, task_id
+                    )
+                    in_flight[future_job] = (periodo, operacion)
+                    running_jobs += 1
+                
+                # Entregar soltando cada lista apenas se consume
+                while events:
+                    yield events.popleft()
     
-    def _extract_compras(
+    def _run_in_thread(self, func, *args):
+        """
+        Ejecuta una función en un hilo del pool cerrando al final su conexión
+        a la base de datos (Django abre una conexión por hilo).
+        """
+        try:
+            return func(*args)
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connection.close()
+    
+    def _plan_periodo(
         self,
-        sii_service: SIIIntegratedService, 
+        sii_service: SIIIntegratedService,
         periodo: str,
-        task_id: Optional[str]
-    ) -> List[Dict]:
+        task_id: Optional[str],
+        states: Optional[Dict[Tuple[str, str], SIIPeriodSyncState]] = None
+    ) -> Tuple[List[Tuple[str, Optional[str]]], List[Dict], Dict[str, str]]:
         """
-        Extrae documentos de compra (recibidos) de un período.
-        Primero obtiene el resumen para identificar tipos de documentos disponibles.
+        Obtiene el resumen de compras y ventas de un período e identifica los
+        tipos de documentos a extraer.
+        
+        Los tipos 39 y 48 de ventas no se extraen individualmente: se generan
+        documentos sintéticos a partir del resumen.
+        
+        Si se entregan estados de sincronización, las operaciones de períodos
+        cerrados cuyo resumen tiene el mismo hash que el último sincronizado
+        se omiten.
         
         Args:
             sii_service: Servicio SII integrado
             periodo: Período tributario (YYYYMM)
             task_id: ID de la tarea (opcional)
+            states: Estados de sincronización por (período, operación)
             
         Returns:
-            Lista de documentos de compra
+            Tupla (trabajos [(operación, tipo)], documentos sintéticos,
+            checkpoints {operación: hash del resumen}).
+            Un tipo None indica consultar el tipo por defecto del servicio.
         """
+        jobs: List[Tuple[str, Optional[str]]] = []
+        synthetic_docs: List[Dict] = []
+        checkpoints: Dict[str, str] = {}
+        states = states or {}
+        
         try:
-            logger.info(f"📥 Extrayendo documentos de compra período {periodo}")
-            
-            # Primero obtener resumen para identificar tipos de documentos
-            logger.info(f"📊 Obteniendo resumen de compras para identificar tipos de documentos...")
+            logger.info(f"📊 Obteniendo resumen de compras/ventas período {periodo} para identificar tipos de documentos...")
             resumen = sii_service.get_resumen_compras_ventas(periodo)
+        except Exception as e:
+            logger.error(f"❌ Error obteniendo resumen período {periodo}: {str(e)}")
+            resumen = {}
+        
+        # Compras (documentos recibidos)
+        if resumen.get('status') == 'success' and resumen.get('compras'):
+            summary_hash = self._summary_hash(resumen['compras'])
             
-            all_docs = []
-            
-            if resumen.get('status') == 'success' and resumen.get('compras'):
-                compras_data = resumen['compras'].get('data', [])
+            if self._is_unchanged(periodo, 'COMPRA', summary_hash, states):
+                logger.info(f"⏭️ [{periodo}] Compras sin cambios desde la última sincronización, omitiendo")
+            else:
+                checkpoints['COMPRA'] = summary_hash
+                tipos_con_datos, _ = self._tipos_con_datos(resumen['compras'].get('data', []))
                 
-                # Identificar tipos de documentos con datos
-                tipos_con_datos = []
-                if isinstance(compras_data, list):
-                    for item in compras_data:
-                        if isinstance(item, dict):
-                            tipo_codigo = str(item.get('rsmnTipoDocInteger', ''))
-                            cantidad = item.get('rsmnTotDoc', 0)
-                            nombre = item.get('dcvNombreTipoDoc', f'Tipo {tipo_codigo}')
-                            if tipo_codigo and cantidad > 0:
-                                tipos_con_datos.append(tipo_codigo)
-                                logger.info(f"   Tipo {tipo_codigo} ({nombre}): {cantidad} documentos")
+                # Si no hay tipos identificados, intentar con los comunes
+                if not tipos_con_datos:
+                    logger.info(f"   [{periodo}] No se encontraron tipos de compra en resumen, intentando con tipos comunes...")
+                    tipos_con_datos = list(self.TIPOS_COMUNES_COMPRA)
+                
+                jobs.extend(('COMPRA', cod_tipo) for cod_tipo in tipos_con_datos)
+        else:
+            # Si falla el resumen, intentar con tipo 33 por defecto
+            logger.warning(f"⚠️ [{periodo}] No se pudo obtener resumen de compras, extrayendo tipo 33 por defecto")
+            checkpoints['COMPRA'] = ''
+            jobs.append(('COMPRA', None))
+        
+        # Ventas (documentos emitidos)
+        if resumen.get('status') == 'success' and resumen.get('ventas'):
+            summary_hash = self._summary_hash(resumen['ventas'])
+            
+            if self._is_unchanged(periodo, 'VENTA', summary_hash, states):
+                logger.info(f"⏭️ [{periodo}] Ventas sin cambios desde la última sincronización, omitiendo")
+            else:
+                checkpoints['VENTA'] = summary_hash
+                tipos_con_datos, resumen_items = self._tipos_con_datos(resumen['ventas'].get('data', []))
                 
                 # Si no hay tipos identificados, intentar con los comunes
                 if not tipos_con_datos:
-                    logger.info("   No se encontraron tipos en resumen, intentando con tipos comunes...")
-                    tipos_con_datos = ['33', '34', '46', '56', '61']  # Facturas, NC, ND, Factura Compra
+                    logger.info(f"   [{periodo}] No se encontraron tipos de venta en resumen, intentando con tipos comunes...")
+                    tipos_con_datos = list(self.TIPOS_COMUNES_VENTA)
+                    # Para tipos especiales sin resumen, no podemos crear documentos sintéticos
+                    resumen_items = {}
                 
-                # Extraer documentos para cada tipo
                 for cod_tipo in tipos_con_datos:
-                    logger.info(f"   📄 Extrayendo documentos tipo {cod_tipo}...")
-                    result = sii_service.get_documentos_compra(periodo, cod_tipo_doc=cod_tipo)
-                    
-                    if result.get('status') == 'success':
-                        docs = result.get('data', [])
-                        if docs:
-                            logger.info(f"      ✅ {len(docs)} documentos tipo {cod_tipo} extraídos")
-                            # Agregar metadatos
-                            for doc in docs:
-                                doc['tipo_operacion'] = 'recibidos'
-                                doc['company_rut'] = self.full_rut
-                                doc['extraction_task_id'] = task_id
-                                doc['periodo_tributario'] = periodo
-                            all_docs.extend(docs)
-            else:
-                # Si falla el resumen, intentar con tipo 33 por defecto
-                logger.warning(f"⚠️ No se pudo obtener resumen, extrayendo tipo 33 por defecto")
-                result = sii_service.get_documentos_compra(periodo)
-                if result.get('status') == 'success':
-                    docs = result.get('data', [])
-                    for doc in docs:
-                        doc['tipo_operacion'] = 'recibidos'
-                        doc['company_rut'] = self.full_rut
-                        doc['extraction_task_id'] = task_id
-                        doc['periodo_tributario'] = periodo
-                    all_docs.extend(docs)
+                    if cod_tipo == '48':
+                        # Manejo especial para tipo 48 (Comprobante de pago electrónico)
+                        if cod_tipo in resumen_items:
+                            synthetic_docs.append(
+                                self._create_synthetic_document_type_48(resumen_items[cod_tipo], periodo, task_id)
+                            )
+                        else:
+                            logger.warning(f"      ⚠️ No se encontró item en resumen para tipo 48 - no se puede crear documento sintético")
+                    elif cod_tipo == '39':
+                        # Manejo especial para tipo 39 (Boleta Electrónica)
+                        if cod_tipo in resumen_items:
+                            synthetic_docs.append(
+                                self._create_synthetic_document_type_39(resumen_items[cod_tipo], periodo, task_id)
+                            )
+                        else:
+                            logger.warning(f"      ⚠️ No se encontró item en resumen para tipo 39 - no se puede crear documento sintético")
+                    else:
+                        jobs.append(('VENTA', cod_tipo))
+        else:
+            # Si falla el resumen, intentar con tipo 33 por defecto
+            logger.warning(f"⚠️ [{periodo}] No se pudo obtener resumen de ventas, extrayendo tipo 33 por defecto")
+            checkpoints['VENTA'] = ''
+            jobs.append(('VENTA', None))
+        
+        return jobs, synthetic_docs, checkpoints
+    
+    def _summary_hash(self, resumen_operacion: Any) -> str:
+        """
+        Calcula un hash estable de los datos del resumen SII de una operación.
+        Solo considera 'data' (los metadatos cambian en cada petición).
+        """
+        data = resumen_operacion.get('data') if isinstance(resumen_operacion, dict) else resumen_operacion
+        payload = json.dumps(data, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def _is_unchanged(
+        self,
+        periodo: str,
+        operacion: str,
+        summary_hash: str,
+        states: Dict[Tuple[str, str], SIIPeriodSyncState]
+    ) -> bool:
+        """
+        Indica si una operación de un período puede omitirse: el período está
+        cerrado y su resumen coincide con el de la última sincronización.
+        """
+        state = states.get((periodo, operacion))
+        return (
+            state is not None
+            and bool(state.summary_hash)
+            and state.summary_hash == summary_hash
+            and self._is_closed_period(periodo)
+        )
+    
+    def _is_closed_period(self, periodo: str) -> bool:
+        """Un período está cerrado si es anterior al mes en curso"""
+        return periodo < date.today().strftime('%Y%m')
+    
+    def _load_sync_states(self) -> Dict[Tuple[str, str], SIIPeriodSyncState]:
+        """
+        Carga en una consulta los estados de sincronización de la empresa.
+        
+        Returns:
+            Dict (período, operación) -> SIIPeriodSyncState
+        """
+        return {
+            (state.periodo, state.operacion): state
+            for state in SIIPeriodSyncState.objects.filter(company=self.company)
+        }
+    
+    @staticmethod
+    def _failed_periods(chunk: List[Dict], chunk_periods: List[str], batch_results: Dict) -> Set[str]:
+        """
+        Períodos de los documentos de un lote que process_batch no pudo guardar.
+        Si hay errores que no se pueden atribuir a un documento, se marcan todos
+        los períodos del lote.
+        """
+        failed_dtes = batch_results.get('failed_dtes', [])
+        if batch_results.get('errors', 0) > len(failed_dtes):
+            return set(chunk_periods)
+        failed_ids = {id(dte) for dte in failed_dtes}
+        return {periodo for dte, periodo in zip(chunk, chunk_periods) if id(dte) in failed_ids}
+    
+    def _build_checkpoints(
+        self,
+        periodo: str,
+        counts: Dict[str, int],
+        period_checkpoints: Dict[str, str]
+    ) -> List[Dict[str, Any]]:
+        """
+        Arma los checkpoints de un período extraído con su cantidad de documentos.
+        
+        Args:
+            periodo: Período tributario (YYYYMM)
+            counts: Documentos extraídos del período por operación
+            period_checkpoints: {operación: hash del resumen}
             
-            logger.info(f"✅ Total documentos de compra extraídos: {len(all_docs)}")
-            return all_docs
-                
+        Returns:
+            Lista de checkpoints pendientes de guardar
+        """
+        return [
+            {
+                'periodo': periodo,
+                'operacion': operacion,
+                'summary_hash': summary_hash,
+                'document_count': counts.get(operacion, 0),
+            }
+            for operacion, summary_hash in period_checkpoints.items()
+        ]
+    
+    def _save_checkpoints(self, checkpoints: List[Dict[str, Any]], task_id: Optional[str]):
+        """
+        Guarda los checkpoints de los períodos cuyos documentos ya se procesaron.
+        
+        Args:
+            checkpoints: Checkpoints armados por _build_checkpoints
+            task_id: ID de la tarea que completó los períodos
+        """
+        now = timezone.now()
+        for checkpoint in checkpoints:
+            try:
+                SIIPeriodSyncState.objects.update_or_create(
+                    company=self.company,
+                    periodo=checkpoint['periodo'],
+                    operacion=checkpoint['operacion'],
+                    defaults={
+                        'summary_hash': checkpoint['summary_hash'],
+                        'document_count': checkpoint['document_count'],
+                        'last_synced_at': now,
+                        'task_id': task_id,
+                    }
+                )
+            except Exception as e:
+                logger.warning(f"⚠️ Error guardando estado de sincronización {checkpoint['periodo']} {checkpoint['operacion']}: {e}")
+    
+    def _tipos_con_datos(self, resumen_data: Any) -> Tuple[List[str], Dict[str, Dict]]:
+        """
+        Identifica los tipos de documentos con datos en un resumen del SII.
+        
+        Args:
+            resumen_data: Lista de items del resumen
+            
+        Returns:
+            Tupla (códigos de tipo con documentos, items del resumen por tipo)
+        """
+        tipos_con_datos = []
+        resumen_items = {}
+        
+        if isinstance(resumen_data, list):
+            for item in resumen_data:
+                if isinstance(item, dict):
+                    tipo_codigo = str(item.get('rsmnTipoDocInteger', ''))
+                    cantidad = item.get('rsmnTotDoc', 0)
+                    nombre = item.get('dcvNombreTipoDoc', f'Tipo {tipo_codigo}')
+                    if tipo_codigo and cantidad > 0:
+                        tipos_con_datos.append(tipo_codigo)
+                        resumen_items[tipo_codigo] = item
+                        logger.info(f"   Tipo {tipo_codigo} ({nombre}): {cantidad} documentos")
+        
+        return tipos_con_datos, resumen_items
+    
+    def _fetch_documentos(
+        self,
+        sii_service: SIIIntegratedService,
+        periodo: str,
+        operacion: str,
+        cod_tipo: Optional[str],
+        task_id: Optional[str]
+    ) -> List[Dict]:
+        """
+        Extrae los documentos de un (período, operación, tipo) y agrega metadatos.
+        
+        Args:
+            sii_service: Servicio SII integrado
+            periodo: Período tributario (YYYYMM)
+            operacion: 'COMPRA' o 'VENTA'
+            cod_tipo: Código de tipo de documento (None = tipo por defecto)
+            task_id: ID de la tarea (opcional)
+            
+        Returns:
+            Lista de documentos extraídos, o None si la extracción falló
+        """
+        tipo_operacion = 'recibidos' if operacion == 'COMPRA' else 'emitidos'
+        get_documentos = (
+            sii_service.get_documentos_compra if operacion == 'COMPRA'
+            else sii_service.get_documentos_venta
+        )
+        
+        try:
+            logger.info(f"   📄 [{periodo}] Extrayendo documentos {operacion} tipo {cod_tipo or 'por defecto'}...")
+            if cod_tipo:
+                result = get_documentos(periodo, cod_tipo_doc=cod_tipo)
+            else:
+                result = get_documentos(periodo)
         except Exception as e:
-            logger.error(f"❌ Error extrayendo documentos de compra período {periodo}: {str(e)}")
-            return []
+            logger.error(f"❌ Error extrayendo documentos {operacion} tipo {cod_tipo} período {periodo}: {str(e)}")
+            return None
+        
+        if result.get('status') != 'success':
+            logger.warning(f"      ⚠️ [{periodo}] No se pudieron extraer documentos {operacion} tipo {cod_tipo}")
+            return None
+        
+        docs = result.get('data', [])
+        for doc in docs:
+            doc['tipo_operacion'] = tipo_operacion
+            doc['company_rut'] = self.full_rut
+            doc['extraction_task_id'] = task_id
+            doc['periodo_tributario'] = periodo
+        
+        if docs:
+            logger.info(f"      ✅ [{periodo}] {len(docs)} documentos {operacion} tipo {cod_tipo} extraídos")
+        return docs
     
     def _create_synthetic_document_type_48(
         self,
@@ -501,128 +898,6 @@ class DocumentSyncService:
 
         return doc_sintetico
 
-    def _extract_ventas(
-        self,
-        sii_service: SIIIntegratedService,
-        periodo: str,
-        task_id: Optional[str]
-    ) -> List[Dict]:
-        """
-        Extrae documentos de venta (emitidos) de un período.
-        Primero obtiene el resumen para identificar tipos de documentos disponibles.
-        
-        Args:
-            sii_service: Servicio SII integrado
-            periodo: Período tributario (YYYYMM)
-            task_id: ID de la tarea (opcional)
-            
-        Returns:
-            Lista de documentos de venta
-        """
-        try:
-            logger.info(f"📤 Extrayendo documentos de venta período {periodo}")
-            
-            # Primero obtener resumen para identificar tipos de documentos
-            logger.info(f"📊 Obteniendo resumen de ventas para identificar tipos de documentos...")
-            resumen = sii_service.get_resumen_compras_ventas(periodo)
-            
-            all_docs = []
-            
-            if resumen.get('status') == 'success' and resumen.get('ventas'):
-                ventas_data = resumen['ventas'].get('data', [])
-                
-                # Identificar tipos de documentos con datos
-                tipos_con_datos = []
-                resumen_items = {}  # Para almacenar items del resumen por tipo
-                if isinstance(ventas_data, list):
-                    for item in ventas_data:
-                        if isinstance(item, dict):
-                            tipo_codigo = str(item.get('rsmnTipoDocInteger', ''))
-                            cantidad = item.get('rsmnTotDoc', 0)
-                            nombre = item.get('dcvNombreTipoDoc', f'Tipo {tipo_codigo}')
-                            if tipo_codigo and cantidad > 0:
-                                tipos_con_datos.append(tipo_codigo)
-                                resumen_items[tipo_codigo] = item  # Almacenar item completo
-                                logger.info(f"   Tipo {tipo_codigo} ({nombre}): {cantidad} documentos")
-                
-                # Si no hay tipos identificados, intentar con los comunes
-                if not tipos_con_datos:
-                    logger.info("   No se encontraron tipos en resumen, intentando con tipos comunes...")
-                    tipos_con_datos = ['33', '34', '39', '41', '52', '56', '61']  # Facturas, Boletas, GD, NC, ND
-                    # Para tipos especiales sin resumen, no podemos crear documentos sintéticos
-                    resumen_items = {}
-                
-                # Extraer documentos para cada tipo
-                for cod_tipo in tipos_con_datos:
-                    if cod_tipo == '48':
-                        # Manejo especial para tipo 48 (Comprobante de pago electrónico)
-                        logger.info(f"   📄 Procesando tipo 48 (Comprobante de pago electrónico) - usando resumen")
-                        logger.info(f"      🔍 Verificando resumen_items para tipo 48...")
-                        logger.info(f"      📊 Claves disponibles en resumen: {list(resumen_items.keys())}")
-
-                        if cod_tipo in resumen_items:
-                            logger.info(f"      ✅ Encontrado item en resumen para tipo 48")
-                            doc_sintetico = self._create_synthetic_document_type_48(
-                                resumen_items[cod_tipo],
-                                periodo,
-                                task_id
-                            )
-                            all_docs.append(doc_sintetico)
-                            logger.info(f"      ✅ Documento sintético tipo 48 agregado a all_docs (total: {len(all_docs)})")
-                        else:
-                            logger.warning(f"      ⚠️ No se encontró item en resumen para tipo 48 - no se puede crear documento sintético")
-                            logger.warning(f"      📊 Tipos disponibles en resumen: {list(resumen_items.keys())}")
-                    elif cod_tipo == '39':
-                        # Manejo especial para tipo 39 (Boleta Electrónica)
-                        logger.info(f"   📄 Procesando tipo 39 (Boleta Electrónica) - usando resumen")
-                        if cod_tipo in resumen_items:
-                            doc_sintetico = self._create_synthetic_document_type_39(
-                                resumen_items[cod_tipo],
-                                periodo,
-                                task_id
-                            )
-                            all_docs.append(doc_sintetico)
-                            logger.info(f"      ✅ Documento sintético tipo 39 creado")
-                        else:
-                            logger.warning(f"      ⚠️ No se encontró item en resumen para tipo 39 - no se puede crear documento sintético")
-                    else:
-                        # Proceso normal para otros tipos
-                        logger.info(f"   📄 Extrayendo documentos tipo {cod_tipo}...")
-                        result = sii_service.get_documentos_venta(periodo, cod_tipo_doc=cod_tipo)
-
-                        if result.get('status') == 'success':
-                            docs = result.get('data', [])
-                            if docs:
-                                logger.info(f"      ✅ {len(docs)} documentos tipo {cod_tipo} extraídos")
-                                # Agregar metadatos
-                                for doc in docs:
-                                    doc['tipo_operacion'] = 'emitidos'
-                                    doc['company_rut'] = self.full_rut
-                                    doc['extraction_task_id'] = task_id
-                                    doc['periodo_tributario'] = periodo
-                                all_docs.extend(docs)
-                        else:
-                            logger.warning(f"      ⚠️ No se pudieron extraer documentos tipo {cod_tipo}")
-            else:
-                # Si falla el resumen, intentar con tipo 33 por defecto
-                logger.warning(f"⚠️ No se pudo obtener resumen, extrayendo tipo 33 por defecto")
-                result = sii_service.get_documentos_venta(periodo)
-                if result.get('status') == 'success':
-                    docs = result.get('data', [])
-                    for doc in docs:
-                        doc['tipo_operacion'] = 'emitidos'
-                        doc['company_rut'] = self.full_rut
-                        doc['extraction_task_id'] = task_id
-                        doc['periodo_tributario'] = periodo
-                    all_docs.extend(docs)
-            
-            logger.info(f"✅ Total documentos de venta extraídos: {len(all_docs)}")
-            return all_docs
-                
-        except Exception as e:
-            logger.error(f"❌ Error extrayendo documentos de venta período {periodo}: {str(e)}")
-            return []
-    
     def _validate_dates(self, fecha_desde: str, fecha_hasta: str):
         """
         Valida que las fechas sean correctas.
@@ -4,10 +4,11 @@ Mapeador de DTEs a modelos de Django
 import logging
 import re
 from datetime import datetime, date
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
 
 from apps.companies.models import Company
-from apps.documents.models import DocumentType
+from apps.documents.models import Document, DocumentType
+from apps.documents.registry import document_type_registry
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +38,37 @@ class DTEMapper:
         'liquidacion factura': 43,
     }
     
+    # Nombres descriptivos de los tipos que se crean al mapear
+    DOCUMENT_TYPE_NAMES = {
+        33: 'Factura Electrónica',
+        34: 'Factura Exenta Electrónica',
+        35: 'Boleta Electrónica',
+        38: 'Boleta Exenta Electrónica',
+        39: 'Boleta Electrónica',
+        40: 'Liquidación Factura Electrónica',
+        43: 'Liquidación Factura Electrónica',
+        45: 'Factura de Compra Electrónica',
+        46: 'Factura de Compra',
+        48: 'Comprobante de Pago Electrónico',
+        52: 'Guía de Despacho',
+        56: 'Nota de Débito Electrónica',
+        60: 'Nota de Crédito',
+        61: 'Nota de Crédito Electrónica',
+        110: 'Factura de Exportación Electrónica',
+        111: 'Nota de Débito de Exportación Electrónica',
+        112: 'Nota de Crédito de Exportación Electrónica',
+    }
+    
+    # Formatos comunes de fecha del SII, en orden de prueba:
+    # (formato strptime equivalente, regex precompilada con grupos día/mes/año)
+    DATE_FORMATS = (
+        ('%d/%m/%Y', re.compile(r'^(?P<d>\d{1,2})/(?P<m>\d{1,2})/(?P<y>\d{4})$')),
+        ('%d-%m-%Y', re.compile(r'^(?P<d>\d{1,2})-(?P<m>\d{1,2})-(?P<y>\d{4})$')),
+        ('%Y-%m-%d', re.compile(r'^(?P<y>\d{4})-(?P<m>\d{1,2})-(?P<d>\d{1,2})$')),
+        ('%d/%m/%y', re.compile(r'^(?P<d>\d{1,2})/(?P<m>\d{1,2})/(?P<y>\d{2})$')),
+        ('%d-%m-%y', re.compile(r'^(?P<d>\d{1,2})-(?P<m>\d{1,2})-(?P<y>\d{2})$')),
+    )
+    
     def __init__(self, company: Company):
         """
         Inicializa el mapeador.
@@ -46,6 +78,8 @@ class DTEMapper:
         """
         self.company = company
         self.company_rut_parts = self._parse_company_rut()
+        # Tipo de documento (string del SII) -> código, ya resuelto
+        self._type_codes: Dict[Any, int] = {}
     
     def _parse_company_rut(self) -> Dict[str, str]:
         """
@@ -67,6 +101,19 @@ class DTEMapper:
                 'dv': self.company.tax_id[-1].upper() if self.company.tax_id else '0'
             }
     
+    def _get_direction(self, rut_emisor: Any, dv_emisor: Any, rut_receptor: Any, dv_receptor: Any) -> str:
+        """
+        Dirección del documento respecto de la empresa ('issued', 'received' o 'unknown').
+        
+        Returns:
+            Valor para Document.direction
+        """
+        return Document.compute_direction(
+            f"{self.company_rut_parts['rut']}-{self.company_rut_parts['dv']}",
+            str(rut_emisor)[:12], str(dv_emisor)[:1],
+            str(rut_receptor)[:12], str(dv_receptor)[:1]
+        )
+    
     def map_to_document(self, dte_data: Dict) -> Dict[str, Any]:
         """
         Mapea un DTE a los campos del modelo Document.
@@ -78,27 +125,86 @@ class DTEMapper:
             Dict con los campos mapeados para Document
         """
         # Detectar formato del DTE
-        is_api_format = 'detNroDoc' in dte_data
+        is_api_format = self._is_api_format(dte_data)
         
         if is_api_format:
             return self._map_api_format(dte_data)
         else:
             return self._map_rpa_format(dte_data)
     
-    def _map_api_format(self, dte_data: Dict) -> Dict[str, Any]:
+    def map_many(
+        self,
+        dtes: Iterable[Dict],
+        on_error: Optional[Callable[[Dict, Exception], None]] = None
+    ) -> List[Tuple[Dict, Dict[str, Any]]]:
+        """
+        Mapea un lote de DTEs del mismo origen.
+        
+        El formato (API o RPA) y el formato de fecha se detectan una vez con el
+        primer DTE y el resto se mapea con un parser de fecha precompilado. Los
+        DTEs que no calzan con lo detectado se mapean igual que en map_to_document.
+        
+        Args:
+            dtes: DTEs a mapear
+            on_error: Callback (dte_data, error) para los DTEs que no se pudieron
+                      mapear. Si no se entrega, el error se propaga.
+            
+        Returns:
+            Lista de (dte_data, campos mapeados) en el orden de entrada
+        """
+        dtes = list(dtes)
+        if not dtes:
+            return []
+        
+        is_api_format = self._is_api_format(dtes[0])
+        date_key = 'detFchDoc' if is_api_format else 'fecha_emision'
+        sample_date = next((dte.get(date_key) for dte in dtes if dte.get(date_key)), None)
+        parse_date = self._date_parser_for(sample_date)
+        
+        mapped = []
+        for dte_data in dtes:
+            try:
+                if self._is_api_format(dte_data) != is_api_format:
+                    fields = self.map_to_document(dte_data)
+                elif is_api_format:
+                    fields = self._map_api_format(dte_data, parse_date)
+                else:
+                    fields = self._map_rpa_format(dte_data, parse_date)
+            except Exception as e:
+                if on_error is None:
+                    raise
+                on_error(dte_data, e)
+                continue
+            mapped.append((dte_data, fields))
+        
+        return mapped
+    
+    @staticmethod
+    def _is_api_format(dte_data: Dict) -> bool:
+        """True si el DTE viene en formato API del SII (si no, formato RPA)"""
+        return 'detNroDoc' in dte_data
+    
+    def _map_api_format(
+        self,
+        dte_data: Dict,
+        parse_date: Optional[Callable[[Any], date]] = None
+    ) -> Dict[str, Any]:
         """
         Mapea un DTE en formato API del SII.
         
         Args:
             dte_data: DTE en formato API
+            parse_date: Parser de fecha del lote (por defecto _parse_date)
             
         Returns:
             Dict con campos para Document
         """
+        parse_date = parse_date or self._parse_date
+        
         # Extraer información básica
         folio = dte_data.get('detNroDoc')
         tipo_documento_raw = dte_data.get('detTipoDoc') or dte_data.get('codTDoc', 33)
-        fecha_emision = self._parse_date(dte_data.get('detFchDoc'))
+        fecha_emision = parse_date(dte_data.get('detFchDoc'))
 
         reference_folio = dte_data.get('detFolioDocRef', None)
         reference_folio_type = dte_data.get('detTipoDocRef', None)
@@ -160,23 +266,31 @@ class DTEMapper:
             'tax_amount': tax_amount,
             'total_amount': total_amount,
             'status': 'accepted',  # Asumimos aceptado por defecto
+            'direction': self._get_direction(rut_emisor, dv_emisor, rut_receptor, dv_receptor),
             'sii_track_id': track_id,
             'xml_data': dte_data.get('xml_data', ''),
-            'raw_data': dte_data,
+            'raw_data': dte_data,  # DTEProcessor lo guarda en DocumentRawData
             'reference_folio': reference_folio,
             'reference_folio_type': reference_folio_type,
         }
     
-    def _map_rpa_format(self, dte_data: Dict) -> Dict[str, Any]:
+    def _map_rpa_format(
+        self,
+        dte_data: Dict,
+        parse_date: Optional[Callable[[Any], date]] = None
+    ) -> Dict[str, Any]:
         """
         Mapea un DTE en formato RPA (procesado).
 
         Args:
             dte_data: DTE en formato RPA
+            parse_date: Parser de fecha del lote (por defecto _parse_date)
 
         Returns:
             Dict con campos para Document
         """
+        parse_date = parse_date or self._parse_date
+
         # Log específico para documentos sintéticos tipo 48
         if dte_data.get('tipo_documento') == '48' and dte_data.get('is_synthetic'):
             logger.info(f"🔄 Mapeando documento sintético tipo 48 - Folio: {dte_data.get('folio')}")
@@ -184,7 +298,7 @@ class DTEMapper:
         # Extraer información básica
         folio = dte_data.get('folio')
         tipo_documento_raw = dte_data.get('tipo_documento')
-        fecha_emision = self._parse_date(dte_data.get('fecha_emision'))
+        fecha_emision = parse_date(dte_data.get('fecha_emision'))
         
         # Parsear RUT emisor
         rut_emisor_full = dte_data.get('rut_emisor', self.company.tax_id)
@@ -251,9 +365,10 @@ class DTEMapper:
             'tax_amount': tax_amount,
             'total_amount': total_amount,
             'status': 'accepted',
+            'direction': self._get_direction(rut_emisor, dv_emisor, rut_receptor, dv_receptor),
             'sii_track_id': track_id,
             'xml_data': dte_data.get('xml_data', ''),
-            'raw_data': dte_data
+            'raw_data': dte_data  # DTEProcessor lo guarda en DocumentRawData
         }
 
         # Log específico para documentos sintéticos tipo 48
@@ -270,37 +385,23 @@ class DTEMapper:
         """
         Obtiene o crea un tipo de documento.
         
+        Los tipos existentes se resuelven desde el registro en memoria del
+        proceso; solo los códigos nuevos consultan la base de datos.
+        
         Args:
             tipo_codigo: Código numérico del tipo de documento
             
         Returns:
             DocumentType instance
         """
-        # Mapeo de códigos a nombres descriptivos
-        type_names = {
-            33: 'Factura Electrónica',
-            34: 'Factura Exenta Electrónica',
-            35: 'Boleta Electrónica',
-            38: 'Boleta Exenta Electrónica',
-            39: 'Boleta Electrónica',
-            40: 'Liquidación Factura Electrónica',
-            43: 'Liquidación Factura Electrónica',
-            45: 'Factura de Compra Electrónica',
-            46: 'Factura de Compra',
-            48: 'Comprobante de Pago Electrónico',
-            52: 'Guía de Despacho',
-            56: 'Nota de Débito Electrónica',
-            60: 'Nota de Crédito',
-            61: 'Nota de Crédito Electrónica',
-            110: 'Factura de Exportación Electrónica',
-            111: 'Nota de Débito de Exportación Electrónica',
-            112: 'Nota de Crédito de Exportación Electrónica',
-        }
+        doc_type = document_type_registry.get(tipo_codigo)
+        if doc_type is not None:
+            return doc_type
         
-        doc_type, created = DocumentType.objects.get_or_create(
-            code=tipo_codigo,
+        doc_type, created = document_type_registry.get_or_create(
+            tipo_codigo,
             defaults={
-                'name': type_names.get(tipo_codigo, f'DTE Tipo {tipo_codigo}'),
+                'name': self.DOCUMENT_TYPE_NAMES.get(tipo_codigo, f'DTE Tipo {tipo_codigo}'),
                 'is_electronic': True,
                 'is_dte': True,
                 'category': self._get_document_category(tipo_codigo)
@@ -352,7 +453,14 @@ class DTEMapper:
         if isinstance(tipo_str, int):
             return tipo_str
         
-        # Si es string, procesarlo
+        # Los lotes repiten los mismos tipos: resolver cada string una sola vez
+        code = self._type_codes.get(tipo_str)
+        if code is None:
+            code = self._type_codes[tipo_str] = self._resolve_document_type(tipo_str)
+        return code
+    
+    def _resolve_document_type(self, tipo_str: Any) -> int:
+        """Código numérico de un tipo de documento en texto"""
         tipo_lower = str(tipo_str).lower()
         
         # Buscar en mapeo
@@ -380,32 +488,75 @@ class DTEMapper:
         if not date_str:
             return date.today()
         
-        if isinstance(date_str, date):
-            return date_str
-        
         if isinstance(date_str, datetime):
             return date_str.date()
         
-        # Formatos comunes de fecha del SII
-        date_formats = [
-            '%d/%m/%Y',
-            '%d-%m-%Y', 
-            '%Y-%m-%d',
-            '%d/%m/%y',
-            '%d-%m-%y'
-        ]
+        if isinstance(date_str, date):
+            return date_str
         
         date_str = str(date_str).strip()
         
-        for fmt in date_formats:
-            try:
-                return datetime.strptime(date_str, fmt).date()
-            except ValueError:
-                continue
+        for _, pattern in self.DATE_FORMATS:
+            parsed = self._match_date(pattern, date_str)
+            if parsed:
+                return parsed
         
         logger.warning(f"No se pudo parsear fecha: {date_str}, usando fecha actual")
         return date.today()
     
+    @staticmethod
+    def _match_date(pattern, date_str: str) -> Optional[date]:
+        """
+        Fecha según una regex de DATE_FORMATS, o None si no calza o no es válida.
+        Los años de dos dígitos siguen la regla de strptime (%y): 69-99 -> 19xx.
+        """
+        match = pattern.match(date_str)
+        if not match:
+            return None
+        year = int(match.group('y'))
+        if len(match.group('y')) == 2:
+            year += 1900 if year >= 69 else 2000
+        try:
+            return date(year, int(match.group('m')), int(match.group('d')))
+        except ValueError:
+            return None
+    
+    def _date_parser_for(self, sample: Any) -> Callable[[Any], date]:
+        """
+        Parser de fecha para un lote, según el formato de una fecha de muestra.
+        
+        Prueba primero el formato detectado y, si una fecha no calza, cae a
+        _parse_date con todos los formatos.
+        
+        Args:
+            sample: Fecha de muestra del lote
+            
+        Returns:
+            Función fecha -> date
+        """
+        if not isinstance(sample, str):
+            return self._parse_date
+        
+        sample = sample.strip()
+        pattern = next(
+            (pattern for _, pattern in self.DATE_FORMATS if self._match_date(pattern, sample)),
+            None
+        )
+        if pattern is None:
+            return self._parse_date
+        
+        match_date = self._match_date
+        parse_date = self._parse_date
+        
+        def parse(value: Any) -> date:
+            if isinstance(value, str):
+                parsed = match_date(pattern, value.strip())
+                if parsed:
+                    return parsed
+            return parse_date(value)
+        
+        return parse
+    
     def _parse_amount(self, amount_str: Any) -> float:
         """
         Convierte string de monto a float.
@@ -3,12 +3,17 @@ Procesador de DTEs (Documentos Tributarios Electrónicos)
 """
 import logging
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 
 from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_save
+from django.utils import timezone
 
 from apps.companies.models import Company
-from apps.documents.models import Document, DocumentType
+from apps.contacts.services import counterparties_from_documents, suppress_contact_signal, upsert_contacts
+from apps.documents.models import Document, DocumentRawData, DocumentType
+from apps.documents.rollups import document_bucket, refresh_rollups, suppress_rollup_signal
 from ..models import SIISyncLog
 
 logger = logging.getLogger(__name__)
@@ -19,6 +24,12 @@ class DTEProcessor:
     Procesador especializado para DTEs.
     Maneja la lógica de procesamiento, validación y almacenamiento.
     """
+
+    # Tamaño de lote para bulk_create / bulk_update
+    BULK_BATCH_SIZE = 500
+
+    # Campos que nunca se sobrescriben al actualizar un documento existente
+    FIELDS_TO_SKIP = ('id', 'created_at', 'updated_at', 'sync_log')
     
     def __init__(self, company: Company):
         """
@@ -30,6 +41,8 @@ class DTEProcessor:
         self.company = company
         self.validator = None
         self.mapper = None
+        self._rollup_buckets = set()
+        self._written_documents: List[Document] = []
         
         # Inicializar validador y mapper
         self._initialize_dependencies()
@@ -45,7 +58,8 @@ class DTEProcessor:
     def process_batch(
         self,
         dtes: List[Dict], 
-        sync_log: Optional[SIISyncLog] = None
+        sync_log: Optional[SIISyncLog] = None,
+        bulk: bool = True
     ) -> Dict[str, Any]:
         """
         Procesa un lote de DTEs.
@@ -53,6 +67,8 @@ class DTEProcessor:
         Args:
             dtes: Lista de DTEs a procesar
             sync_log: Log de sincronización (opcional)
+            bulk: Si True, usa el modo por lotes (bulk_create/bulk_update).
+                  Si False, procesa cada DTE con su propia transacción.
             
         Returns:
             Dict con estadísticas del procesamiento
@@ -62,7 +78,9 @@ class DTEProcessor:
             'created': 0,
             'updated': 0,
             'errors': 0,
-            'error_details': []
+            'error_details': [],
+            # DTEs (los mismos dicts recibidos) que no se pudieron guardar
+            'failed_dtes': []
         }
         
         if not dtes:
@@ -71,40 +89,293 @@ class DTEProcessor:
         
         logger.info(f"📊 Procesando lote de {len(dtes)} DTEs para empresa {self.company.tax_id}")
         
-        # Procesar cada DTE individualmente para evitar que un error rompa todo
+        # Meses (empresa, mes) tocados por el lote, para recalcular sus rollups
+        self._rollup_buckets = set()
+        # Documentos escritos por el lote, para derivar sus contactos al final
+        self._written_documents = []
+        
+        # Los contactos y rollups se calculan una vez por lote, no en el post_save de cada documento
+        with suppress_contact_signal(), suppress_rollup_signal():
+            if bulk:
+                self._process_batch_bulk(dtes, results)
+            else:
+                # Procesar cada DTE individualmente para evitar que un error rompa todo
+                for dte_data in dtes:
+                    try:
+                        self._process_single_dte(dte_data, results)
+                    except Exception as e:
+                        self._register_error(results, dte_data, e)
+        
+        self._refresh_rollups()
+        self._derive_contacts()
+        
+        logger.info(f"✅ Procesamiento completado: {results['created']} creados, {results['updated']} actualizados, {results['errors']} errores")
+        
+        return results
+    
+    def _process_batch_bulk(self, dtes: List[Dict], results: Dict):
+        """
+        Procesa un lote de DTEs con operaciones por conjunto.
+        
+        1. Valida cada DTE y mapea los válidos con DTEMapper.map_many (errores reportados por fila)
+        2. Busca en una sola consulta los documentos existentes del lote
+        3. Inserta los nuevos con bulk_create y actualiza los existentes con bulk_update
+        
+        Si una escritura por lotes falla, ese lote se reprocesa fila a fila para
+        mantener el reporte de errores por documento.
+        
+        Args:
+            dtes: Lista de DTEs a procesar
+            results: Dict para acumular resultados
+        """
+        # PASO 1: Validar y mapear. Si un documento viene repetido en el lote,
+        # prevalece la última versión (igual que en el procesamiento secuencial).
+        mapped: Dict[Tuple, Dict] = {}
+        sources: Dict[Tuple, Dict] = {}
+        raw_payloads: Dict[Tuple, Dict] = {}
+        occurrences: Dict[Tuple, int] = {}
+        
+        valid_dtes = []
         for dte_data in dtes:
             try:
-                self._process_single_dte(dte_data, results)
+                self._validate(dte_data)
             except Exception as e:
-                results['errors'] += 1
-                error_msg = f"Error procesando DTE: {str(e)}"
-                results['error_details'].append(error_msg)
-                logger.error(error_msg)
-                
-                # Log información del DTE problemático para debugging
-                if dte_data and isinstance(dte_data, dict):
-                    folio = dte_data.get('detNroDoc') or dte_data.get('folio', 'N/A')
-                    tipo = dte_data.get('detTipoDoc') or dte_data.get('tipo_documento', 'N/A')
-                    logger.error(f"   DTE problemático - Folio: {folio}, Tipo: {tipo}")
+                self._register_error(results, dte_data, e)
+                continue
+            valid_dtes.append(dte_data)
         
-        logger.info(f"✅ Procesamiento completado: {results['created']} creados, {results['updated']} actualizados, {results['errors']} errores")
+        mapped_dtes = self.mapper.map_many(
+            valid_dtes,
+            on_error=lambda dte_data, e: self._register_error(results, dte_data, e)
+        )
         
-        return results
+        for dte_data, dte_fields in mapped_dtes:
+            try:
+                key = self._document_key(dte_fields)
+            except Exception as e:
+                self._register_error(results, dte_data, e)
+                continue
+            
+            # Los datos originales se guardan aparte, en DocumentRawData
+            raw_payloads[key] = dte_fields.pop('raw_data', None)
+            mapped[key] = dte_fields
+            sources[key] = dte_data
+            occurrences[key] = occurrences.get(key, 0) + 1
+        
+        if not mapped:
+            return
+        
+        # PASO 2: Prefetch de documentos existentes en una sola consulta
+        existing = self._find_existing_documents(list(mapped.keys()))
+        
+        to_create: List[Document] = []
+        to_update: List[Document] = []
+        update_fields = set()
+        now = timezone.now()
+        
+        for key, dte_fields in mapped.items():
+            document = existing.get(key)
+            if document:
+                self._track_rollup_bucket(document)
+                update_fields.update(self._apply_fields(document, dte_fields))
+                document.updated_at = now
+                to_update.append(document)
+            else:
+                document = Document(**dte_fields)
+                to_create.append(document)
+            self._track_rollup_bucket(document)
+        
+        # PASO 3: Escrituras por lotes
+        for chunk in self._chunks(to_create):
+            self._bulk_create_chunk(chunk, mapped, sources, raw_payloads, occurrences, results)
+        
+        if to_update:
+            fields = sorted(update_fields | {'updated_at'})
+            for chunk in self._chunks(to_update):
+                self._bulk_update_chunk(chunk, fields, mapped, sources, raw_payloads, occurrences, results)
     
-    def _process_single_dte(
+    def _bulk_create_chunk(
         self,
-        dte_data: Dict,
+        chunk: List[Document],
+        mapped: Dict[Tuple, Dict],
+        sources: Dict[Tuple, Dict],
+        raw_payloads: Dict[Tuple, Dict],
+        occurrences: Dict[Tuple, int],
         results: Dict
     ):
         """
-        Procesa un DTE individual.
-
+        Inserta un lote de documentos nuevos, con fallback fila a fila.
+        """
+        try:
+            with transaction.atomic():
+                created = Document.objects.bulk_create(chunk, batch_size=self.BULK_BATCH_SIZE)
+                self._store_raw_data(created, raw_payloads)
+                self._send_post_save(created, created=True)
+        except Exception as e:
+            logger.warning(f"⚠️ bulk_create falló para lote de {len(chunk)} documentos, reprocesando fila a fila: {e}")
+            self._fallback_single(chunk, sources, results)
+            return
+        
+        self._written_documents.extend(created)
+        for document in created:
+            key = self._document_key_from_instance(document)
+            count = occurrences.get(key, 1)
+            results['processed'] += count
+            results['created'] += 1
+            results['updated'] += count - 1
+            self._log_saved(sources.get(key, {}), mapped.get(key, {}), created=True)
+    
+    def _bulk_update_chunk(
+        self,
+        chunk: List[Document],
+        fields: List[str],
+        mapped: Dict[Tuple, Dict],
+        sources: Dict[Tuple, Dict],
+        raw_payloads: Dict[Tuple, Dict],
+        occurrences: Dict[Tuple, int],
+        results: Dict
+    ):
+        """
+        Actualiza un lote de documentos existentes, con fallback fila a fila.
+        """
+        try:
+            with transaction.atomic():
+                Document.objects.bulk_update(chunk, fields, batch_size=self.BULK_BATCH_SIZE)
+                self._store_raw_data(chunk, raw_payloads)
+                self._send_post_save(chunk, created=False)
+        except Exception as e:
+            logger.warning(f"⚠️ bulk_update falló para lote de {len(chunk)} documentos, reprocesando fila a fila: {e}")
+            self._fallback_single(chunk, sources, results)
+            return
+        
+        self._written_documents.extend(chunk)
+        for document in chunk:
+            key = self._document_key_from_instance(document)
+            count = occurrences.get(key, 1)
+            results['processed'] += count
+            results['updated'] += count
+            self._log_saved(sources.get(key, {}), mapped.get(key, {}), created=False)
+    
+    def _fallback_single(self, chunk: List[Document], sources: Dict[Tuple, Dict], results: Dict):
+        """
+        Reprocesa fila a fila los DTEs de un lote cuya escritura masiva falló.
+        """
+        for document in chunk:
+            dte_data = sources.get(self._document_key_from_instance(document), {})
+            try:
+                self._process_single_dte(dte_data, results)
+            except Exception as e:
+                self._register_error(results, dte_data, e)
+    
+    def _store_raw_data(self, documents: List[Document], raw_payloads: Dict[Tuple, Dict]):
+        """Guarda en DocumentRawData los datos originales de los documentos escritos por lotes"""
+        DocumentRawData.store(
+            (document.id, raw_payloads.get(self._document_key_from_instance(document)))
+            for document in documents
+        )
+    
+    def _track_rollup_bucket(self, document: Document):
+        """Registra el (empresa, mes) del documento para recalcular su rollup"""
+        bucket = document_bucket(document)
+        if bucket:
+            self._rollup_buckets.add(bucket)
+    
+    def _refresh_rollups(self):
+        """
+        Recalcula los totales mensuales de los meses tocados por el lote.
+        Un error aquí no invalida los documentos ya guardados: el rollup
+        se puede reconstruir con `manage.py rebuild_document_rollups`.
+        """
+        if not self._rollup_buckets:
+            return
+        
+        try:
+            rows = refresh_rollups(self._rollup_buckets)
+            logger.info(f"📊 Rollups actualizados: {len(self._rollup_buckets)} meses, {rows} filas")
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudieron actualizar los rollups de documentos: {e}")
+        finally:
+            self._rollup_buckets = set()
+    
+    def _derive_contacts(self):
+        """
+        Crea o actualiza en un solo upsert los contactos de las contrapartes del lote.
+        Un error aquí no invalida los documentos ya guardados: los contactos
+        se pueden regenerar con `manage.py sync_contacts`.
+        """
+        if not self._written_documents:
+            return
+        
+        try:
+            upsert_contacts(self.company, counterparties_from_documents(self._written_documents))
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudieron actualizar los contactos del lote: {e}")
+        finally:
+            self._written_documents = []
+    
+    def _send_post_save(self, documents: List[Document], created: bool):
+        """
+        Emite post_save para los documentos escritos por lotes.
+        
+        bulk_create/bulk_update no disparan señales; se emiten manualmente
+        para que los receptores existentes sigan funcionando (los contactos
+        se derivan aparte, por lote, en `_derive_contacts`).
+        """
+        for document in documents:
+            post_save.send(
+                sender=Document,
+                instance=document,
+                created=created,
+                update_fields=None,
+                raw=False,
+                using=document._state.db or 'default'
+            )
+    
+    def _register_error(self, results: Dict, dte_data: Any, error: Exception):
+        """
+        Registra un error de procesamiento para un DTE.
+        
         Args:
-            dte_data: Datos del DTE
             results: Dict para acumular resultados
-
+            dte_data: Datos del DTE problemático
+            error: Excepción producida
+        """
+        results['errors'] += 1
+        error_msg = f"Error procesando DTE: {str(error)}"
+        results['error_details'].append(error_msg)
+        results['failed_dtes'].append(dte_data)
+        logger.error(error_msg)
+        
+        # Log información del DTE problemático para debugging
+        if dte_data and isinstance(dte_data, dict):
+            folio = dte_data.get('detNroDoc') or dte_data.get('folio', 'N/A')
+            tipo = dte_data.get('detTipoDoc') or dte_data.get('tipo_documento', 'N/A')
+            logger.error(f"   DTE problemático - Folio: {folio}, Tipo: {tipo}")
+    
+    def _validate_and_map(self, dte_data: Dict) -> Dict[str, Any]:
+        """
+        Valida un DTE y lo mapea a campos de Document.
+        
+        Args:
+            dte_data: Datos del DTE
+            
+        Returns:
+            Dict con los campos mapeados
+            
         Raises:
-            Exception: Si hay error en el procesamiento
+            ValueError: Si el DTE es inválido
+        """
+        self._validate(dte_data)
+        
+        # Mapear datos del DTE
+        return self.mapper.map_to_document(dte_data)
+    
+    def _validate(self, dte_data: Dict):
+        """
+        Valida un DTE.
+        
+        Raises:
+            ValueError: Si el DTE es inválido
         """
         # Log específico para documentos sintéticos tipo 48
         if dte_data.get('tipo_documento') == '48' and dte_data.get('is_synthetic'):
@@ -115,9 +386,119 @@ class DTEProcessor:
             if dte_data.get('tipo_documento') == '48':
                 logger.error(f"❌ Documento sintético tipo 48 falló validación: {self.validator.get_last_error()}")
             raise ValueError(f"DTE inválido: {self.validator.get_last_error()}")
+    
+    def _log_saved(self, dte_data: Dict, dte_fields: Dict, created: bool):
+        """Log de un documento guardado"""
+        is_synthetic_48 = dte_data.get('tipo_documento') == '48' and dte_data.get('is_synthetic')
+        if created:
+            if is_synthetic_48:
+                logger.info(f"🆕 Documento sintético tipo 48 CREADO: Folio {dte_fields.get('folio')}")
+            else:
+                logger.debug(f"🆕 DTE creado: Folio {dte_fields.get('folio')}, Tipo {dte_fields.get('document_type')}")
+        else:
+            if is_synthetic_48:
+                logger.info(f"📝 Documento sintético tipo 48 ACTUALIZADO: Folio {dte_fields.get('folio')}")
+            else:
+                logger.debug(f"📝 DTE actualizado: Folio {dte_fields.get('folio')}, Tipo {dte_fields.get('document_type')}")
+    
+    @staticmethod
+    def _document_key(dte_fields: Dict) -> Tuple:
+        """
+        Clave única del documento según la constraint unique_together:
+        issuer_company_rut, issuer_company_dv, document_type, folio
+        """
+        document_type = dte_fields['document_type']
+        return (
+            str(dte_fields['issuer_company_rut']),
+            str(dte_fields['issuer_company_dv']),
+            getattr(document_type, 'pk', document_type),
+            int(dte_fields['folio']),
+        )
+    
+    @staticmethod
+    def _document_key_from_instance(document: Document) -> Tuple:
+        """Clave única de una instancia de Document"""
+        return (
+            str(document.issuer_company_rut),
+            str(document.issuer_company_dv),
+            document.document_type_id,
+            int(document.folio),
+        )
+    
+    def _find_existing_documents(self, keys: List[Tuple]) -> Dict[Tuple, Document]:
+        """
+        Busca en una sola consulta todos los documentos existentes del lote.
         
-        # Mapear datos del DTE
-        dte_fields = self.mapper.map_to_document(dte_data)
+        Agrupa las claves por (rut, dv, tipo) y consulta los folios de cada grupo
+        con __in, combinando los grupos con OR.
+        
+        Args:
+            keys: Claves únicas de los documentos del lote
+            
+        Returns:
+            Dict clave -> Document existente
+        """
+        folios_by_group: Dict[Tuple, set] = {}
+        for rut, dv, document_type_id, folio in keys:
+            folios_by_group.setdefault((rut, dv, document_type_id), set()).add(folio)
+        
+        query = Q()
+        for (rut, dv, document_type_id), folios in folios_by_group.items():
+            query |= Q(
+                issuer_company_rut=rut,
+                issuer_company_dv=dv,
+                document_type_id=document_type_id,
+                folio__in=folios
+            )
+        
+        return {
+            self._document_key_from_instance(document): document
+            for document in Document.objects.filter(query)
+        }
+    
+    def _apply_fields(self, document: Document, dte_fields: Dict) -> List[str]:
+        """
+        Aplica los campos mapeados sobre un documento existente sin guardarlo.
+        
+        Args:
+            document: Documento a actualizar
+            dte_fields: Nuevos campos del documento
+            
+        Returns:
+            Lista de nombres de campos asignados
+        """
+        assigned = []
+        for field, value in dte_fields.items():
+            if field not in self.FIELDS_TO_SKIP and hasattr(document, field):
+                setattr(document, field, value)
+                assigned.append(field)
+        return assigned
+    
+    def _chunks(self, items: List) -> List[List]:
+        """Divide una lista en lotes de BULK_BATCH_SIZE"""
+        return [
+            items[i:i + self.BULK_BATCH_SIZE]
+            for i in range(0, len(items), self.BULK_BATCH_SIZE)
+        ]
+    
+    def _process_single_dte(
+        self,
+        dte_data: Dict,
+        results: Dict
+    ):
+        """
+        Procesa un DTE individual.
+
+        Args:
+            dte_data: Datos del DTE
+            results: Dict para acumular resultados
+
+        Raises:
+            Exception: Si hay error en el procesamiento
+        """
+        # Validar y mapear datos del DTE
+        dte_fields = self._validate_and_map(dte_data)
+        raw_data = dte_fields.pop('raw_data', None)
         
         # Guardar en base de datos con transacción atómica
         with transaction.atomic():
@@ -127,19 +508,16 @@ class DTEProcessor:
             if existing:
                 # Actualizar documento existente
                 self._update_document(existing, dte_fields)
+                document = existing
                 results['updated'] += 1
-                if dte_data.get('tipo_documento') == '48' and dte_data.get('is_synthetic'):
-                    logger.info(f"📝 Documento sintético tipo 48 ACTUALIZADO: Folio {dte_fields.get('folio')}")
-                else:
-                    logger.debug(f"📝 DTE actualizado: Folio {dte_fields.get('folio')}, Tipo {dte_fields.get('document_type')}")
+                self._log_saved(dte_data, dte_fields, created=False)
             else:
                 # Crear nuevo documento
-                self._create_document(dte_fields)
+                document = self._create_document(dte_fields)
                 results['created'] += 1
-                if dte_data.get('tipo_documento') == '48' and dte_data.get('is_synthetic'):
-                    logger.info(f"🆕 Documento sintético tipo 48 CREADO: Folio {dte_fields.get('folio')}")
-                else:
-                    logger.debug(f"🆕 DTE creado: Folio {dte_fields.get('folio')}, Tipo {dte_fields.get('document_type')}")
+                self._log_saved(dte_data, dte_fields, created=True)
+            
+            DocumentRawData.store([(document.id, raw_data)])
         
         results['processed'] += 1
     
@@ -174,15 +552,16 @@ class DTEProcessor:
             document: Documento a actualizar
             dte_fields: Nuevos campos del documento
         """
-        # Actualizar todos los campos excepto los de auditoría
-        fields_to_skip = ['id', 'created_at', 'updated_at', 'sync_log']
+        # El mes anterior también se recalcula por si cambió la fecha o la empresa
+        self._track_rollup_bucket(document)
         
-        for field, value in dte_fields.items():
-            if field not in fields_to_skip and hasattr(document, field):
-                setattr(document, field, value)
+        # Actualizar todos los campos excepto los de auditoría
+        self._apply_fields(document, dte_fields)
         
         # Guardar cambios
         document.save()
+        self._track_rollup_bucket(document)
+        self._written_documents.append(document)
     
     def _create_document(self, dte_fields: Dict) -> Document:
         """
@@ -194,4 +573,7 @@ class DTEProcessor:
         Returns:
             Document creado
         """
-        return Document.objects.create(**dte_fields)
\ No newline at end of file
+        document = Document.objects.create(**dte_fields)
+        self._track_rollup_bucket(document)
+        self._written_documents.append(document)
+        return document
\ No newline at end of file
@@ -4,6 +4,7 @@ Tareas de Celery para sincronización SII
 
 from .documents import sync_sii_documents_task, sync_sii_documents_full_history_task
 from .company import sync_company_data_task
+from .sessions import refresh_expiring_sii_sessions_task
 from .forms import (
     sync_tax_forms_task,
     sync_all_historical_forms_task,
@@ -15,6 +16,7 @@ __all__ = [
     'sync_sii_documents_task',
     'sync_sii_documents_full_history_task',
     'sync_company_data_task',
+    'refresh_expiring_sii_sessions_task',
     'sync_tax_forms_task',
     'sync_all_historical_forms_task',
     'extract_form_details_task',
@@ -128,7 +128,13 @@ def sync_sii_documents_task(
 
 
 @shared_task(bind=True, queue='sii', autoretry_for=(Exception,), retry_kwargs={'max_retries': 2, 'countdown': 300})
-def sync_sii_documents_full_history_task(self, company_rut: str, company_dv: str, user_email: str = None):
+def sync_sii_documents_full_history_task(
+    self,
+    company_rut: str,
+    company_dv: str,
+    user_email: str = None,
+    incremental: bool = True
+):
     """
     Tarea de Celery para sincronizar todos los documentos electrónicos desde el inicio de actividades.
     Esta tarea orquesta múltiples llamadas a sync_sii_documents_task para cada período mensual.
@@ -137,6 +143,8 @@ def sync_sii_documents_full_history_task(self, company_rut: str, company_dv: str
         company_rut: RUT de la empresa sin dígito verificador
         company_dv: Dígito verificador de la empresa
         user_email: Email del usuario que solicita la sincronización
+        incremental: Si True, omite períodos cerrados sin cambios y reanuda los reintentos
+                     desde el último período completado
     """
     
     task_id = self.request.id
@@ -165,7 +173,7 @@ def sync_sii_documents_full_history_task(self, company_rut: str, company_dv: str
         service = DocumentSyncService(company_rut, company_dv)
         
         # El servicio se encarga de todo: obtener fecha de inicio, procesar períodos, etc.
-        results = service.sync_full_history(sync_log=sync_log, task_id=task_id)
+        results = service.sync_full_history(sync_log=sync_log, task_id=task_id, incremental=incremental)
         
         # Actualizar log de sincronización con resultados exitosos
         sync_log.status = 'completed'
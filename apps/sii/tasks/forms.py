@@ -179,7 +179,8 @@ def sync_all_historical_forms_task(
     company_rut: str,
     company_dv: str,
     user_email: str = None,
-    form_type: str = 'f29'
+    form_type: str = 'f29',
+    extract_details: bool = False
 ):
     """
     Tarea para sincronizar TODOS los formularios históricos desde el inicio de actividades.
@@ -190,6 +191,8 @@ def sync_all_historical_forms_task(
         company_dv: Dígito verificador de la empresa
         user_email: Email del usuario que solicita la sincronización
         form_type: Tipo de formulario ('f29', 'f3323', etc.)
+        extract_details: Si True, al terminar envía una sola tarea de extracción
+                         de detalles en lote para todos los formularios sincronizados
     """
     task_id = self.request.id
     full_rut = f"{company_rut}-{company_dv}"
@@ -289,6 +292,7 @@ def sync_all_historical_forms_task(
         total_actualizados = 0
         total_errores = 0
         total_extraction_tasks = 0
+        form_ids_to_extract = []
         resultados_por_anio = {}
 
         # Procesar año por año
@@ -321,6 +325,7 @@ def sync_all_historical_forms_task(
 
                     # Combinar IDs de formularios creados y actualizados
                     all_form_ids = created_form_ids + updated_form_ids
+                    form_ids_to_extract.extend(all_form_ids)
 
                     # Enviar tarea de extracción de detalles para cada formulario
                     # for form_id in all_form_ids:
@@ -355,6 +360,19 @@ def sync_all_historical_forms_task(
                     'error': str(e)
                 }
 
+        # Extracción de detalles en lote: un solo login por navegador para todo el historial
+        if extract_details and form_ids_to_extract:
+            try:
+                extract_multiple_forms_details_task.delay(
+                    form_ids=form_ids_to_extract,
+                    max_forms=len(form_ids_to_extract),
+                    force_refresh=False
+                )
+                total_extraction_tasks += 1
+                logger.info(f"🔍 [Task {task_id}] Extracción en lote enviada para {len(form_ids_to_extract)} formularios")
+            except Exception as e:
+                logger.error(f"❌ [Task {task_id}] Error enviando extracción en lote: {str(e)}")
+
         # Actualizar log con resultados finales
         sync_log.status = 'completed'
         sync_log.completed_at = timezone.now()
@@ -461,7 +479,9 @@ def extract_multiple_forms_details_task(
     self,
     company_id: int = None,
     force_refresh: bool = False,
-    max_forms: int = 10
+    max_forms: int = 10,
+    form_ids: list = None,
+    batch: bool = True
 ):
     """
     Tarea para extraer detalles de múltiples formularios F29.
@@ -470,6 +490,8 @@ def extract_multiple_forms_details_task(
         company_id: ID de Company específica (opcional)
         force_refresh: Si True, fuerza nueva extracción aunque ya existan detalles
         max_forms: Máximo número de formularios a procesar
+        form_ids: IDs de TaxForm específicos a procesar (opcional, en vez de buscar pendientes)
+        batch: Si True, extrae en lote reutilizando navegadores autenticados
     """
     task_id = self.request.id
 
@@ -493,7 +515,13 @@ def extract_multiple_forms_details_task(
         extraction_service = F29DetailExtractionService()
 
         # Obtener formularios que necesitan extracción
-        forms_to_process = extraction_service.get_forms_needing_details(company, max_forms)
+        if form_ids:
+            from apps.forms.models import TaxForm
+            forms_to_process = list(
+                TaxForm.objects.select_related("company").filter(id__in=form_ids)[:max_forms]
+            )
+        else:
+            forms_to_process = extraction_service.get_forms_needing_details(company, max_forms)
 
         if not forms_to_process:
             logger.info(f"  ℹ️ No hay formularios que necesiten extracción de detalles")
@@ -509,7 +537,8 @@ def extract_multiple_forms_details_task(
         resultado = extraction_service.extract_multiple_forms_details(
             forms_to_process,
             force_refresh,
-            max_forms
+            max_forms,
+            batch=batch
         )
 
         logger.info(f"✅ [Task {task_id}] Extracción múltiple completada:")
@@ -0,0 +1,57 @@
+"""
+Tareas de Celery para mantener vigentes las sesiones SII compartidas
+"""
+import logging
+
+from celery import shared_task
+
+from apps.taxpayers.models import TaxpayerSiiCredentials
+from ..rpa.sii_rpa_service import RealSIIService
+from ..utils.session_broker import session_broker
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, queue='sii')
+def refresh_expiring_sii_sessions_task(self, max_sessions: int = 20):
+    """
+    Renueva las sesiones SII en uso que están por expirar, antes de que un
+    worker de sincronización tenga que hacer el login en medio de su trabajo.
+
+    Args:
+        max_sessions: Máximo de sesiones a renovar por ejecución
+    """
+    task_id = self.request.id
+    sessions = list(session_broker.sessions_to_refresh()[:max_sessions])
+
+    if not sessions:
+        return {'status': 'success', 'task_id': task_id, 'refreshed': 0, 'failed': 0}
+
+    logger.info(f"🔄 [Task {task_id}] Renovando {len(sessions)} sesiones SII próximas a expirar")
+
+    refreshed = 0
+    failed = 0
+    for session in sessions:
+        tax_id = f"{session.company_rut}-{session.company_dv}"
+        credentials = TaxpayerSiiCredentials.objects.filter(
+            tax_id__iexact=tax_id,
+            is_active=True
+        ).first()
+
+        if not credentials:
+            logger.info(f"🔍 [Task {task_id}] Sin credenciales activas para {tax_id}, se deja expirar")
+            continue
+
+        try:
+            # La sesión ya está en la ventana de refresco, por lo que el servicio
+            # no la carga y authenticate() pasa por el login serializado del broker
+            with RealSIIService(tax_id=tax_id, password=credentials.get_password(), headless=True) as rpa_service:
+                rpa_service.authenticate()
+            refreshed += 1
+        except Exception as e:
+            failed += 1
+            logger.warning(f"⚠️ [Task {task_id}] No se pudo renovar la sesión de {tax_id}: {str(e)}")
+
+    logger.info(f"✅ [Task {task_id}] Sesiones renovadas: {refreshed}, fallidas: {failed}")
+
+    return {'status': 'success', 'task_id': task_id, 'refreshed': refreshed, 'failed': failed}
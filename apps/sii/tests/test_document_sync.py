@@ -0,0 +1,125 @@
+"""
+Tests del consumo por lotes de la extracción de documentos (DocumentSyncService)
+"""
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from apps.sii.services.document_sync import DocumentSyncService
+
+
+def dte(folio, tipo_operacion='emitidos'):
+    return {'folio': folio, 'tipo_operacion': tipo_operacion}
+
+
+class FakeProcessor:
+    """Registra los lotes que recibiría DTEProcessor.process_batch"""
+
+    def __init__(self, failing=()):
+        self.batches = []
+        self.failing = set(failing)
+
+    @property
+    def persisted(self):
+        return {doc['folio'] for batch in self.batches for doc in batch}
+
+    def process_batch(self, dtes, sync_log):
+        self.batches.append(list(dtes))
+        failed = [doc for doc in dtes if doc['folio'] in self.failing]
+        ok = len(dtes) - len(failed)
+        return {
+            'processed': ok, 'created': ok, 'updated': 0, 'errors': len(failed),
+            'error_details': [f"Error procesando DTE {doc['folio']}" for doc in failed],
+            'failed_dtes': failed
+        }
+
+
+class DocumentStreamTestCase(SimpleTestCase):
+
+    def setUp(self):
+        # Sin _initialize: el stream no necesita empresa ni credenciales
+        self.service = DocumentSyncService.__new__(DocumentSyncService)
+        self.service.chunk_size = 3
+        self.processor = FakeProcessor()
+        self.saved = []
+
+        def save_checkpoints(checkpoints, task_id):
+            self.saved.append((checkpoints, set(self.processor.persisted)))
+
+        patcher = mock.patch.multiple(
+            self.service,
+            _save_checkpoints=mock.Mock(side_effect=save_checkpoints),
+            _update_sync_log_results=mock.Mock()
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_checkpoints_wait_for_earlier_documents_and_last_chunk_is_flushed(self):
+        # 202402 termina antes que 202401, con documentos aún en el lote en curso
+        events = [
+            ('202401', [dte('a1'), dte('a2')], None),
+            ('202402', [dte('b1', 'recibidos'), dte('b2', 'recibidos')], None),
+            ('202402', [], {'COMPRA': 'hash-b'}),
+            ('202401', [dte('a3'), dte('a4')], None),
+            ('202401', [dte('a5')], {'VENTA': 'hash-a'}),
+        ]
+        extracted = []
+
+        results, periods = self.service._process_document_stream(
+            iter(events), self.processor, sync_log=None,
+            on_period_extracted=lambda periodo, count: extracted.append(periodo)
+        )
+
+        self.assertEqual(
+            [[doc['folio'] for doc in batch] for batch in self.processor.batches],
+            [['a1', 'a2', 'b1'], ['b2', 'a3', 'a4'], ['a5']]
+        )
+        self.assertEqual(results['processed'], 7)
+        self.assertEqual(periods, 2)
+        self.assertEqual(extracted, ['202402', '202401'])
+
+        (feb, feb_persisted), (jan, jan_persisted) = self.saved
+        self.assertEqual(feb, [{'periodo': '202402', 'operacion': 'COMPRA', 'summary_hash': 'hash-b', 'document_count': 2}])
+        # Todo lo recibido antes de completar 202402 ya estaba guardado
+        self.assertTrue({'a1', 'a2', 'b1', 'b2'} <= feb_persisted)
+        self.assertEqual(jan, [{'periodo': '202401', 'operacion': 'VENTA', 'summary_hash': 'hash-a', 'document_count': 5}])
+        self.assertEqual(jan_persisted, {'a1', 'a2', 'a3', 'a4', 'a5', 'b1', 'b2'})
+
+    def test_period_without_documents_is_checkpointed_after_pending_chunk(self):
+        events = [
+            ('202401', [dte('a1')], None),
+            ('202402', [], {'VENTA': 'hash-vacio'}),
+        ]
+
+        self.service._process_document_stream(iter(events), self.processor, sync_log=None)
+
+        # El período vacío se completó con a1 sin guardar: espera al lote final
+        self.assertEqual(len(self.saved), 1)
+        self.assertEqual(self.saved[0][1], {'a1'})
+
+    def test_period_with_failed_documents_is_not_checkpointed(self):
+        self.processor.failing = {'a2'}
+        events = [
+            ('202401', [dte('a1'), dte('a2')], None),
+            ('202402', [dte('b1')], {'VENTA': 'hash-b'}),
+            ('202401', [], {'VENTA': 'hash-a'}),
+        ]
+
+        results, periods = self.service._process_document_stream(iter(events), self.processor, sync_log=None)
+
+        self.assertEqual(results['errors'], 1)
+        self.assertEqual(periods, 2)
+        # 202401 queda sin checkpoint para que la próxima sincronización lo reintente
+        self.assertEqual([checkpoints[0]['periodo'] for checkpoints, _ in self.saved], ['202402'])
+
+    def test_unattributed_errors_mark_every_period_of_the_chunk(self):
+        chunk = [dte('a1'), dte('b1')]
+
+        self.assertEqual(
+            DocumentSyncService._failed_periods(chunk, ['202401', '202402'], {'errors': 1}),
+            {'202401', '202402'}
+        )
+        self.assertEqual(
+            DocumentSyncService._failed_periods(chunk, ['202401', '202402'], {'errors': 1, 'failed_dtes': [chunk[1]]}),
+            {'202402'}
+        )
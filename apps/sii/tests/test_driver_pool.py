@@ -0,0 +1,93 @@
+"""
+Tests del pool de navegadores: recuperación de préstamos abandonados
+"""
+import gc
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from apps.sii.rpa.driver_pool import DriverPool
+
+
+class FakeSeleniumDriver:
+    """Navegador falso: no abre Chrome"""
+
+    def __init__(self, headless=True):
+        self.headless = headless
+        self.quit_called = False
+
+    def start(self):
+        pass
+
+    def is_alive(self):
+        return not self.quit_called
+
+    def reset(self):
+        pass
+
+    def quit(self):
+        self.quit_called = True
+
+
+class Owner:
+    pass
+
+
+@mock.patch('apps.sii.rpa.driver_pool.SeleniumDriver', FakeSeleniumDriver)
+class DriverPoolLeaseTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.pool = DriverPool(max_size=1, acquire_timeout=1)
+
+    def test_released_driver_is_reused_and_double_release_is_ignored(self):
+        driver = self.pool.acquire()
+        self.pool.release(driver)
+        self.pool.release(driver)
+
+        self.assertIs(self.pool.acquire(), driver)
+        with self.assertRaises(TimeoutError):
+            self.pool.acquire()
+
+    def test_lease_of_collected_owner_is_reclaimed(self):
+        owner = Owner()
+        driver = self.pool.acquire(owner=owner)
+        del owner
+        gc.collect()
+
+        self.assertTrue(driver.quit_called)
+        self.assertIsNot(self.pool.acquire(), driver)
+
+    def test_lease_of_finished_thread_is_reclaimed(self):
+        leaked = []
+        worker = threading.Thread(target=lambda: leaked.append(self.pool.acquire()))
+        worker.start()
+        worker.join()
+
+        self.assertIsNot(self.pool.acquire(), leaked[0])
+        self.assertTrue(leaked[0].quit_called)
+
+    def test_long_lease_of_live_thread_survives_concurrent_acquire(self):
+        self.pool.max_lease = 60
+        acquired, done = threading.Event(), threading.Event()
+        leased = []
+
+        def hold_browser():
+            leased.append(self.pool.acquire())
+            acquired.set()
+            done.wait()
+            self.pool.release(leased[0])
+
+        worker = threading.Thread(target=hold_browser)
+        worker.start()
+        acquired.wait()
+        self.pool._leases[id(leased[0])].acquired_at -= 61
+
+        with self.assertLogs('apps.sii.rpa.driver_pool', level='WARNING'):
+            with self.assertRaises(TimeoutError):
+                self.pool.acquire()
+        self.assertFalse(leased[0].quit_called)
+
+        done.set()
+        worker.join()
+        self.assertIs(self.pool.acquire(), leased[0])
@@ -0,0 +1,69 @@
+"""
+Tests del mapeo por lotes de DTEs (DTEMapper.map_many)
+"""
+from datetime import date
+
+from django.test import TestCase
+
+from apps.companies.models import Company
+from apps.documents.models import DocumentType
+from apps.documents.registry import document_type_registry
+from apps.sii.services.dte_mapper import DTEMapper
+
+
+def api_dte(folio, fecha='05/02/2024', tipo=39):
+    return {
+        'detNroDoc': folio,
+        'detTipoDoc': tipo,
+        'detFchDoc': fecha,
+        'detRutDoc': 76123456,
+        'detDvDoc': '7',
+        'detRznSoc': 'Proveedor',
+        'detMntTotal': 1190,
+        'tipo_operacion': 'recibidos',
+    }
+
+
+class DTEMapperBatchTestCase(TestCase):
+
+    def setUp(self):
+        document_type_registry.invalidate()
+        self.company = Company.objects.create(
+            business_name='Test Company',
+            tax_id='76543210-K',
+            email='test@company.com'
+        )
+        self.boleta = DocumentType.objects.create(code=39, name='Boleta Electrónica', category='receipt')
+        self.mapper = DTEMapper(self.company)
+
+    def tearDown(self):
+        document_type_registry.invalidate()
+
+    def test_map_many_resolves_types_once(self):
+        dtes = [api_dte(folio) for folio in range(1, 201)]
+
+        with self.assertNumQueries(1):
+            mapped = self.mapper.map_many(dtes)
+
+        self.assertEqual(len(mapped), 200)
+        self.assertTrue(all(fields['document_type'] == self.boleta for _, fields in mapped))
+        self.assertEqual(mapped[0][1]['issue_date'], date(2024, 2, 5))
+
+    def test_map_many_mixed_dates_formats_and_errors(self):
+        rpa = {
+            'folio': 7,
+            'tipo_documento': 'Boleta Electrónica',
+            'fecha_emision': '2024-03-01',
+            'rut_emisor': '76123456-7',
+        }
+        errors = []
+        mapped = self.mapper.map_many(
+            [api_dte(1), api_dte(2, fecha='2024-01-31'), rpa, api_dte(3, tipo='no es código')],
+            on_error=lambda dte_data, e: errors.append(dte_data['detNroDoc'])
+        )
+
+        self.assertEqual([fields['folio'] for _, fields in mapped], [1, 2, 7])
+        self.assertEqual(mapped[1][1]['issue_date'], date(2024, 1, 31))
+        self.assertEqual(mapped[2][1]['issue_date'], date(2024, 3, 1))
+        self.assertEqual(mapped[2][1]['document_type'], self.boleta)
+        self.assertEqual(errors, [3])
@@ -0,0 +1,125 @@
+"""
+Tests del parser offline del formulario F29 usando HTML guardado del SII
+"""
+import os
+
+from django.test import SimpleTestCase
+
+from apps.sii.rpa.f29.f29_parser import parse_formulario_f29, extraer_valores_por_xpath
+from apps.sii.rpa.f29.f29_service import F29RpaService
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+class FakeDriver:
+    """Driver mínimo que cuenta las llamadas al navegador"""
+
+    def __init__(self, page_source):
+        self.page_source = page_source
+        self.calls = 0
+
+    def execute_script(self, script, *args):
+        self.calls += 1
+
+    def get_page_source(self):
+        self.calls += 1
+        return self.page_source
+
+
+class FakeRpaService:
+    def __init__(self, driver):
+        self.driver = driver
+
+
+class ParseFormularioF29TestCase(SimpleTestCase):
+    """Estructura de subtablas construida desde page_source"""
+
+    def setUp(self):
+        self.subtablas = parse_formulario_f29(load_fixture('f29_formulario.html'))
+
+    def test_subtables_split_by_main_title(self):
+        self.assertEqual(
+            [s['main_title'] for s in self.subtablas],
+            ['DÉBITOS Y VENTAS', 'CRÉDITOS Y COMPRAS']
+        )
+
+    def test_subtitles_and_columns(self):
+        debitos = self.subtablas[0]
+        self.assertEqual(debitos['subtitles'], ['IVA Débito Fiscal'])
+        self.assertEqual(debitos['columns'], {
+            'title': 'Detalle',
+            'columns': ['Código', 'Cantidad de Documentos', 'Código', 'Monto Neto'],
+        })
+        self.assertEqual(self.subtablas[1]['subtitles'], [])
+
+    def test_rows_with_normalized_text_and_values(self):
+        rows = self.subtablas[0]['rows']
+        self.assertEqual([r['line'] for r in rows], ['1', '2', '3'])
+        self.assertEqual(rows[1]['description'], 'Ventas y/o Servicios prestados Exentos o No Gravados del giro')
+        # Los inputs no aportan texto a la celda, igual que WebElement.text
+        self.assertEqual(rows[0]['values'], [])
+        self.assertEqual(rows[1]['values'], [{'code': '2', 'value': '0'}])
+        self.assertEqual(rows[2]['values'], [
+            {'code': '3', 'value': '42'},
+            {'code': '3', 'value': '1.900.000'},
+        ])
+
+    def test_rows_without_line_number_are_ignored(self):
+        rows = self.subtablas[1]['rows']
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['description'], 'Facturas recibidas del giro')
+
+    def test_missing_table_raises(self):
+        with self.assertRaises(ValueError):
+            parse_formulario_f29('<html><body><table></table></body></html>')
+
+
+class ExtraerValoresPorXpathTestCase(SimpleTestCase):
+    """Evaluación de los XPaths de codigos_f29.csv sobre page_source"""
+
+    def campo(self, code, xpath):
+        return {
+            'name': f'Campo {code}', 'type': 'Valor', 'task': 'Automático',
+            'subject': 'Debito Fiscal', 'code': code, 'xpath': xpath,
+        }
+
+    def test_extracts_input_values_and_cell_text(self):
+        campos = {
+            '20': self.campo('20', '//*[@id="fila-20"]/td[6]/input'),
+            '585': self.campo('585', '//*[@id="fila-20"]/td[4]/input'),
+            '142': self.campo('142', '//*[@id="fila-142"]/td[6]'),
+        }
+        valores = extraer_valores_por_xpath(load_fixture('f29_formulario.html'), campos)
+        self.assertEqual(
+            {v['code']: v['value'] for v in valores},
+            {'20': '1.250.000', '585': '3', '142': '0'}
+        )
+        self.assertEqual(valores[0]['name'], 'Campo 20')
+        self.assertEqual(valores[0]['subject'], 'Debito Fiscal')
+
+    def test_missing_empty_and_invalid_xpaths_are_skipped(self):
+        campos = {
+            '1': self.campo('1', '//*[@id="no-existe"]/input'),
+            '2': self.campo('2', '//*[@id="fila-142"]/td[4]'),
+            '3': self.campo('3', '//*[@id='),
+            '4': self.campo('4', ''),
+        }
+        self.assertEqual(extraer_valores_por_xpath(load_fixture('f29_formulario.html'), campos), [])
+
+
+class F29RpaServiceSnapshotTestCase(SimpleTestCase):
+    """El servicio RPA consulta el navegador una sola vez por formulario"""
+
+    def test_obtener_formulario_actual_uses_single_snapshot(self):
+        driver = FakeDriver(load_fixture('f29_formulario.html'))
+        service = F29RpaService(FakeRpaService(driver), folio='123456789')
+
+        subtablas = service.obtener_formulario_actual()
+
+        self.assertEqual(len(subtablas), 2)
+        self.assertEqual(driver.calls, 2)  # sincronizar inputs + page_source
@@ -0,0 +1,102 @@
+"""
+Caché con TTL de la validez de las cookies SII por empresa
+"""
+import hashlib
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class CookieValidityCache:
+    """
+    Recuerda por un tiempo corto que un set de cookies fue validado contra el SII.
+    
+    Usa dos niveles: un diccionario en memoria del proceso y el caché de Django
+    (Redis) para compartir el resultado entre workers. La clave incluye una
+    huella del cookie TOKEN, de modo que al renovar cookies la entrada anterior
+    deja de aplicar.
+    """
+    
+    CACHE_PREFIX = 'sii:cookies_valid'
+    
+    def __init__(self, ttl: Optional[int] = None):
+        """
+        Args:
+            ttl: Segundos que se considera válida una validación
+                 (por defecto settings.SII_COOKIE_VALIDATION_TTL)
+        """
+        self._ttl = ttl
+        self._local: Dict[str, float] = {}
+        self._lock = threading.Lock()
+    
+    @property
+    def ttl(self) -> int:
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'SII_COOKIE_VALIDATION_TTL', 300)
+    
+    def _key(self, tax_id: str, cookies: Optional[List[Dict[str, Any]]]) -> Optional[str]:
+        """Clave de caché para (tax_id, cookie TOKEN)"""
+        token = next((c.get('value') for c in cookies or [] if c.get('name') == 'TOKEN'), None)
+        if not token:
+            return None
+        fingerprint = hashlib.sha256(str(token).encode('utf-8')).hexdigest()[:16]
+        return f"{self.CACHE_PREFIX}:{tax_id}:{fingerprint}"
+    
+    def is_valid(self, tax_id: str, cookies: Optional[List[Dict[str, Any]]]) -> bool:
+        """
+        Indica si las cookies fueron validadas hace menos de `ttl` segundos.
+        """
+        key = self._key(tax_id, cookies)
+        if not key or self.ttl <= 0:
+            return False
+        
+        with self._lock:
+            expires_at = self._local.get(key)
+        if expires_at and expires_at > time.monotonic():
+            return True
+        
+        try:
+            if cache.get(key):
+                with self._lock:
+                    self._local[key] = time.monotonic() + self.ttl
+                return True
+        except Exception as e:
+            logger.debug(f"Caché de validez de cookies no disponible: {e}")
+        
+        return False
+    
+    def mark_valid(self, tax_id: str, cookies: Optional[List[Dict[str, Any]]]):
+        """Registra que las cookies se validaron correctamente"""
+        key = self._key(tax_id, cookies)
+        if not key or self.ttl <= 0:
+            return
+        
+        with self._lock:
+            self._local[key] = time.monotonic() + self.ttl
+        try:
+            cache.set(key, True, timeout=self.ttl)
+        except Exception as e:
+            logger.debug(f"Caché de validez de cookies no disponible: {e}")
+    
+    def invalidate(self, tax_id: str, cookies: Optional[List[Dict[str, Any]]]):
+        """Olvida la validación de las cookies (p. ej. tras un error de autenticación)"""
+        key = self._key(tax_id, cookies)
+        if not key:
+            return
+        
+        with self._lock:
+            self._local.pop(key, None)
+        try:
+            cache.delete(key)
+        except Exception as e:
+            logger.debug(f"Caché de validez de cookies no disponible: {e}")
+
+
+cookie_validity_cache = CookieValidityCache()
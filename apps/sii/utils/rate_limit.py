@@ -0,0 +1,67 @@
+"""
+Limitador de tasa por host para las peticiones HTTP al SII
+"""
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+
+class HostRateLimiter:
+    """
+    Limitador de tasa thread-safe por host.
+    
+    Reserva para cada petición un "slot" separado al menos `1 / requests_per_second`
+    segundos del anterior hacia el mismo host, de modo que varios hilos
+    compartiendo el limitador no excedan la tasa configurada.
+    """
+    
+    def __init__(self, requests_per_second: float):
+        """
+        Args:
+            requests_per_second: Peticiones máximas por segundo y por host (0 = sin límite)
+        """
+        self.min_interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot: Dict[str, float] = {}
+    
+    def wait(self, url: str):
+        """
+        Bloquea hasta que se pueda enviar una petición a la URL.
+        
+        Args:
+            url: URL de destino (se limita por su host)
+        """
+        if not self.min_interval:
+            return
+        
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, 0.0))
+            self._next_slot[host] = slot + self.min_interval
+        
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+_sii_rate_limiter: Optional[HostRateLimiter] = None
+_sii_rate_limiter_lock = threading.Lock()
+
+
+def get_sii_rate_limiter() -> HostRateLimiter:
+    """
+    Retorna el limitador compartido por el proceso para los hosts del SII.
+    La tasa se configura con SII_RATE_LIMIT_PER_SECOND.
+    """
+    global _sii_rate_limiter
+    
+    if _sii_rate_limiter is None:
+        with _sii_rate_limiter_lock:
+            if _sii_rate_limiter is None:
+                from django.conf import settings
+                _sii_rate_limiter = HostRateLimiter(
+                    getattr(settings, 'SII_RATE_LIMIT_PER_SECOND', 5)
+                )
+    return _sii_rate_limiter
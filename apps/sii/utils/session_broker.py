@@ -0,0 +1,368 @@
+"""
+Broker de sesiones SII compartido entre workers
+
+Entrega el set de cookies más reciente por tax_id (caché de Django/Redis con
+respaldo en SIISession) y serializa los re-logins con un lock distribuido, de
+modo que un solo worker abre Chrome mientras los demás esperan su resultado.
+"""
+import logging
+import time
+import uuid
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .exceptions import SIIAuthenticationError
+
+logger = logging.getLogger(__name__)
+
+
+class SIISessionBroker:
+    """
+    Punto único de lectura/escritura de sesiones SII.
+
+    Las sesiones viven en SIISession (fuente de verdad) y se replican en el
+    caché de Django para que los workers no consulten la BD en cada carga.
+    Una sesión que expira dentro de `refresh_margin` ya no se entrega: el
+    siguiente worker que la necesite (o la tarea periódica de refresco) la
+    renueva antes de que el SII la corte a mitad de una sincronización.
+    """
+
+    SESSION_CACHE_PREFIX = 'sii:session'
+    LOCK_PREFIX = 'sii:login_lock'
+    FAILURE_PREFIX = 'sii:login_failed'
+    POLL_INTERVAL = 2  # segundos entre consultas mientras se espera el lock
+    FAILURE_TTL = 60  # segundos que se recuerda un login fallido por credenciales
+    CACHE_TIMEOUT = 900  # fuerza una lectura de BD periódica que registra last_activity
+
+    @property
+    def session_ttl(self) -> int:
+        return getattr(settings, 'SII_SESSION_TTL', 8 * 3600)
+
+    @property
+    def refresh_margin(self) -> int:
+        return getattr(settings, 'SII_SESSION_REFRESH_MARGIN', 1800)
+
+    @property
+    def activity_window(self) -> int:
+        return getattr(settings, 'SII_SESSION_ACTIVITY_WINDOW', 3600)
+
+    @property
+    def lock_timeout(self) -> int:
+        return getattr(settings, 'SII_LOGIN_LOCK_TIMEOUT', 180)
+
+    @property
+    def wait_timeout(self) -> int:
+        return getattr(settings, 'SII_LOGIN_WAIT_TIMEOUT', 150)
+
+    @staticmethod
+    def split_tax_id(tax_id: str):
+        """Separa '12345678-9' en ('12345678', '9') con el DV en mayúscula"""
+        rut_parts = tax_id.split('-')
+        company_rut = rut_parts[0]
+        company_dv = rut_parts[1].upper() if len(rut_parts) > 1 else 'K'
+        return company_rut, company_dv
+
+    def _normalize(self, tax_id: str) -> str:
+        company_rut, company_dv = self.split_tax_id(tax_id)
+        return f"{company_rut}-{company_dv}"
+
+    def _session_key(self, tax_id: str) -> str:
+        return f"{self.SESSION_CACHE_PREFIX}:{self._normalize(tax_id)}"
+
+    def _lock_key(self, tax_id: str) -> str:
+        return f"{self.LOCK_PREFIX}:{self._normalize(tax_id)}"
+
+    def _failure_key(self, tax_id: str) -> str:
+        return f"{self.FAILURE_PREFIX}:{self._normalize(tax_id)}"
+
+    # ------------------------------------------------------------------
+    # Lectura / escritura de sesiones
+    # ------------------------------------------------------------------
+
+    def _is_usable(self, session: Optional[Dict[str, Any]]) -> bool:
+        """La sesión existe, tiene cookies y no entra en la ventana de refresco"""
+        if not session or not session.get('cookies'):
+            return False
+        expires_at = session.get('expires_at')
+        if expires_at is None:
+            return True
+        return expires_at > timezone.now() + timedelta(seconds=self.refresh_margin)
+
+    def _cache_session(self, tax_id: str, session: Dict[str, Any]):
+        expires_at = session.get('expires_at')
+        timeout = self.CACHE_TIMEOUT
+        if expires_at is not None:
+            timeout = max(min(int((expires_at - timezone.now()).total_seconds()), timeout), 1)
+        try:
+            cache.set(self._session_key(tax_id), {
+                'session_id': session['session_id'],
+                'cookies': session['cookies'],
+                'expires_at': expires_at.isoformat() if expires_at else None,
+            }, timeout=timeout)
+        except Exception as e:
+            logger.debug(f"Caché de sesiones SII no disponible: {e}")
+
+    def _cached_session(self, tax_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            data = cache.get(self._session_key(tax_id))
+        except Exception as e:
+            logger.debug(f"Caché de sesiones SII no disponible: {e}")
+            return None
+        if not data:
+            return None
+        return {
+            'session_id': data['session_id'],
+            'cookies': data['cookies'],
+            'expires_at': parse_datetime(data['expires_at']) if data.get('expires_at') else None,
+        }
+
+    def _db_session(self, tax_id: str) -> Optional[Dict[str, Any]]:
+        from ..models import SIISession
+
+        company_rut, company_dv = self.split_tax_id(tax_id)
+        active_session = SIISession.objects.filter(
+            company_rut=company_rut,
+            company_dv=company_dv,
+            is_active=True,
+            expires_at__gt=timezone.now()
+        ).order_by('-created_at').first()
+
+        if not active_session or not active_session.cookies_data:
+            return None
+
+        SIISession.objects.filter(pk=active_session.pk).update(last_activity=timezone.now())
+        return {
+            'session_id': active_session.session_id,
+            'cookies': active_session.cookies_data,
+            'expires_at': active_session.expires_at,
+        }
+
+    def get_session(self, tax_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Retorna la sesión vigente más reciente para la empresa.
+
+        Args:
+            tax_id: RUT de la empresa (ej: "12345678-9")
+
+        Returns:
+            Dict con session_id, cookies y expires_at, o None si no hay sesión
+            utilizable (inexistente o próxima a expirar)
+        """
+        session = self._cached_session(tax_id)
+        if not self._is_usable(session):
+            session = self._db_session(tax_id)
+            if session:
+                self._cache_session(tax_id, session)
+
+        return session if self._is_usable(session) else None
+
+    def get_cookies(self, tax_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Atajo de get_session que retorna solo las cookies"""
+        session = self.get_session(tax_id)
+        return session['cookies'] if session else None
+
+    def store_cookies(self, tax_id: str, cookies: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Publica un set de cookies frescas como la sesión activa de la empresa.
+
+        Invalida las sesiones anteriores y crea una nueva en una sola
+        transacción. Si la sesión activa ya tiene exactamente esas cookies no
+        crea otra fila.
+
+        Args:
+            tax_id: RUT de la empresa
+            cookies: Cookies obtenidas del login
+
+        Returns:
+            Dict con session_id, cookies y expires_at de la sesión publicada
+        """
+        from ..models import SIISession
+
+        company_rut, company_dv = self.split_tax_id(tax_id)
+
+        with transaction.atomic():
+            active = SIISession.objects.select_for_update().filter(
+                company_rut=company_rut,
+                company_dv=company_dv,
+                is_active=True
+            )
+            current = active.filter(expires_at__gt=timezone.now()).order_by('-created_at').first()
+
+            if current and current.cookies_data == cookies:
+                session = {
+                    'session_id': current.session_id,
+                    'cookies': current.cookies_data,
+                    'expires_at': current.expires_at,
+                }
+            else:
+                active.update(is_active=False)
+                new_session = SIISession.objects.create(
+                    company_rut=company_rut,
+                    company_dv=company_dv,
+                    username=self._normalize(tax_id),
+                    session_id=str(uuid.uuid4()),
+                    cookies_data=cookies,
+                    is_active=True,
+                    expires_at=timezone.now() + timedelta(seconds=self.session_ttl)
+                )
+                session = {
+                    'session_id': new_session.session_id,
+                    'cookies': new_session.cookies_data,
+                    'expires_at': new_session.expires_at,
+                }
+                logger.info(f"💾 Created NEW session {new_session.session_id} for {tax_id} with {len(cookies)} cookies")
+
+        self._cache_session(tax_id, session)
+        return session
+
+    def invalidate(self, tax_id: str, session_id: Optional[str] = None):
+        """
+        Invalida la sesión indicada o, si no se indica, todas las activas de la empresa.
+        """
+        from ..models import SIISession
+
+        company_rut, company_dv = self.split_tax_id(tax_id)
+        sessions = SIISession.objects.filter(
+            company_rut=company_rut,
+            company_dv=company_dv,
+            is_active=True
+        )
+        if session_id:
+            sessions = sessions.filter(session_id=session_id)
+        sessions.update(is_active=False)
+
+        try:
+            cached = cache.get(self._session_key(tax_id))
+            if not session_id or (cached and cached.get('session_id') == session_id):
+                cache.delete(self._session_key(tax_id))
+        except Exception as e:
+            logger.debug(f"Caché de sesiones SII no disponible: {e}")
+
+    def sessions_to_refresh(self):
+        """
+        Sesiones activas que entran en la ventana de refresco y se usaron
+        dentro de `activity_window` (vale la pena renovarlas antes de que
+        expiren). last_activity se registra al menos cada CACHE_TIMEOUT
+        mientras la sesión está en uso, así que la ventana debe ser mayor.
+        """
+        from ..models import SIISession
+
+        now = timezone.now()
+        return SIISession.objects.filter(
+            is_active=True,
+            expires_at__gt=now,
+            expires_at__lte=now + timedelta(seconds=self.refresh_margin),
+            last_activity__gte=now - timedelta(seconds=self.activity_window)
+        ).order_by('expires_at')
+
+    # ------------------------------------------------------------------
+    # Login serializado
+    # ------------------------------------------------------------------
+
+    def _acquire_lock(self, tax_id: str) -> Optional[str]:
+        token = str(uuid.uuid4())
+        try:
+            if cache.add(self._lock_key(tax_id), token, timeout=self.lock_timeout):
+                return token
+            return None
+        except Exception as e:
+            # Sin caché compartido no hay coordinación posible: seguir sin lock
+            logger.warning(f"⚠️ Lock de login SII no disponible, continuando sin lock: {e}")
+            return token
+
+    def _release_lock(self, tax_id: str, token: str):
+        try:
+            if cache.get(self._lock_key(tax_id)) == token:
+                cache.delete(self._lock_key(tax_id))
+        except Exception as e:
+            logger.debug(f"Caché de sesiones SII no disponible: {e}")
+
+    def _recent_failure(self, tax_id: str) -> Optional[str]:
+        try:
+            return cache.get(self._failure_key(tax_id))
+        except Exception:
+            return None
+
+    def _fresh_session(self, tax_id: str, stale_cookies) -> Optional[Dict[str, Any]]:
+        """Sesión utilizable distinta de la que el llamador ya sabe que está vencida"""
+        session = self.get_session(tax_id)
+        if session and session['cookies'] != stale_cookies:
+            return session
+        return None
+
+    def login(
+        self,
+        tax_id: str,
+        login_func: Callable[[], List[Dict[str, Any]]],
+        stale_cookies: Optional[List[Dict[str, Any]]] = None,
+        force: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Obtiene una sesión fresca ejecutando a lo más un login por empresa a la vez.
+
+        Args:
+            tax_id: RUT de la empresa
+            login_func: Función que hace el login en el SII y retorna las cookies
+            stale_cookies: Cookies que el llamador ya sabe inválidas; cualquier
+                           otra sesión vigente se considera fresca
+            force: Si True, siempre ejecuta login_func (el llamador necesita su
+                   propio navegador autenticado), aunque igual espera el lock
+
+        Returns:
+            Dict con session_id, cookies y expires_at de la sesión resultante
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        token = self._acquire_lock(tax_id)
+
+        while token is None:
+            if not force:
+                session = self._fresh_session(tax_id, stale_cookies)
+                if session:
+                    logger.info(f"🔁 Reusing session {session['session_id']} refreshed by another worker for {tax_id}")
+                    return session
+
+            failure = self._recent_failure(tax_id)
+            if failure:
+                raise SIIAuthenticationError(failure)
+
+            if time.monotonic() >= deadline:
+                logger.warning(f"⏱️ Timeout waiting for SII login lock for {tax_id}, logging in without lock")
+                break
+
+            time.sleep(self.POLL_INTERVAL)
+            token = self._acquire_lock(tax_id)
+
+        try:
+            if not force:
+                # Otro worker pudo completar el login justo antes de liberar el lock
+                session = self._fresh_session(tax_id, stale_cookies)
+                if session:
+                    logger.info(f"🔁 Reusing session {session['session_id']} refreshed by another worker for {tax_id}")
+                    return session
+
+            try:
+                cookies = login_func()
+            except SIIAuthenticationError as e:
+                try:
+                    cache.set(self._failure_key(tax_id), str(e), timeout=self.FAILURE_TTL)
+                except Exception:
+                    pass
+                raise
+
+            try:
+                cache.delete(self._failure_key(tax_id))
+            except Exception:
+                pass
+            return self.store_cookies(tax_id, cookies)
+        finally:
+            if token is not None:
+                self._release_lock(tax_id, token)
+
+
+session_broker = SIISessionBroker()
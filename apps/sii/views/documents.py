@@ -8,7 +8,9 @@ from datetime import datetime, timedelta
 import logging
 
 from ..models import SIISyncLog
+from apps.companies.models import Company
 from apps.documents.models import Document
+from apps.documents.rollups import summarize
 
 logger = logging.getLogger(__name__)
 
@@ -182,18 +184,18 @@ def get_dtes_summary(request):
         fecha_desde = request.query_params.get('fecha_desde')
         fecha_hasta = request.query_params.get('fecha_hasta')
         
-        # Construir queryset
-        queryset = Document.objects.all()
-        
+        # Empresas a resumir: con company_rut, solo los documentos que emitió esa empresa
+        companies = Company.objects.all()
+        filters = {}
         if company_rut:
             # Extraer solo el número del RUT (sin DV)
             rut_number = company_rut.split('-')[0] if '-' in company_rut else company_rut
-            queryset = queryset.filter(issuer_company_rut=rut_number)
+            companies = companies.filter(tax_id__startswith=f"{rut_number}-")
+            filters['direction'] = 'issued'
         
         if fecha_desde:
             try:
                 fecha_desde = datetime.strptime(fecha_desde, '%Y-%m-%d').date()
-                queryset = queryset.filter(issue_date__gte=fecha_desde)
             except ValueError:
                 return Response({
                     'error': 'Formato de fecha_desde inválido. Use YYYY-MM-DD'
@@ -202,73 +204,42 @@ def get_dtes_summary(request):
         if fecha_hasta:
             try:
                 fecha_hasta = datetime.strptime(fecha_hasta, '%Y-%m-%d').date()
-                queryset = queryset.filter(issue_date__lte=fecha_hasta)
             except ValueError:
                 return Response({
                     'error': 'Formato de fecha_hasta inválido. Use YYYY-MM-DD'
                 }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Calcular estadísticas
-        total_count = queryset.count()
-        
-        # Importar models para aggregates
-        from django.db import models
-        
-        # Verificar si Document tiene los campos necesarios
-        try:
-            # Totales por monto
-            totals = queryset.aggregate(
-                total_net=models.Sum('net_amount'),
-                total_tax=models.Sum('tax_amount'),
-                total_amount=models.Sum('total_amount')
-            )
-            
-            # Por tipo de documento
-            by_type = queryset.values(
-                'document_type'
-            ).annotate(
-                count=models.Count('id'),
-                total_amount=models.Sum('total_amount')
-            ).order_by('-count')
-            
-            # Por estado
-            by_status = queryset.values(
-                'status'
-            ).annotate(
-                count=models.Count('id'),
-                total_amount=models.Sum('total_amount')
-            ).order_by('-count')
-            
-        except Exception as field_error:
-            # Si hay problemas con los campos, devolver estadísticas básicas
-            logger.warning(f"Error accessing document fields: {field_error}")
-            return Response({
-                'period': {
-                    'fecha_desde': fecha_desde.isoformat() if fecha_desde else None,
-                    'fecha_hasta': fecha_hasta.isoformat() if fecha_hasta else None,
-                },
-                'totals': {
-                    'total_documents': total_count,
-                    'total_net_amount': 0,
-                    'total_tax_amount': 0,
-                    'total_amount': 0,
-                },
-                'by_document_type': [],
-                'by_status': [],
-                'by_month': []
-            })
+        # Una sola lectura del rollup mensual, agrupada por mes, tipo y estado;
+        # los totales, tipos, estados y meses se pliegan en memoria
+        rows = summarize(
+            companies,
+            fecha_desde or None,
+            fecha_hasta or None,
+            group_by=('month', 'document_type', 'status'),
+            **filters
+        )
         
+        totals = {'count': 0, 'net': 0, 'tax': 0, 'total': 0}
+        by_type = {}
+        by_status = {}
+        by_month = {}
+        for row in rows:
+            for metric in totals:
+                totals[metric] += row[metric]
+            for groups, key, value in (
+                (by_type, 'document_type', row['document_type']),
+                (by_status, 'status', row['status']),
+                (by_month, 'month', row['month']),
+            ):
+                group = groups.setdefault(value, {key: value, 'count': 0, 'total_amount': 0})
+                group['count'] += row['count']
+                group['total_amount'] += row['total']
+        
+        total_count = totals['count']
+        by_type = sorted(by_type.values(), key=lambda group: -group['count'])
+        by_status = sorted(by_status.values(), key=lambda group: -group['count'])
         # Estadísticas por mes (últimos 12 meses)
-        try:
-            from django.db.models.functions import TruncMonth
-            by_month = queryset.annotate(
-                month=TruncMonth('issue_date')
-            ).values('month').annotate(
-                count=models.Count('id'),
-                total_amount=models.Sum('total_amount')
-            ).order_by('-month')[:12]
-        except:
-            by_month = []
+        by_month = sorted(by_month.values(), key=lambda group: group['month'], reverse=True)[:12]
         
         return Response({
             'period': {
@@ -277,13 +248,13 @@ def get_dtes_summary(request):
             },
             'totals': {
                 'total_documents': total_count,
-                'total_net_amount': float(totals['total_net'] or 0),
-                'total_tax_amount': float(totals['total_tax'] or 0),
-                'total_amount': float(totals['total_amount'] or 0),
+                'total_net_amount': float(totals['net']),
+                'total_tax_amount': float(totals['tax']),
+                'total_amount': float(totals['total']),
             },
-            'by_document_type': list(by_type),
-            'by_status': list(by_status),
-            'by_month': list(by_month)
+            'by_document_type': by_type,
+            'by_status': by_status,
+            'by_month': by_month
         })
         
     except Exception as e:
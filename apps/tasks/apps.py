@@ -3,3 +3,9 @@ from django.apps import AppConfig
 class UtasksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.tasks'
+
+    def ready(self):
+        """
+        Importar signals cuando la app esté lista
+        """
+        import apps.tasks.signals  # noqa
@@ -1,6 +1,55 @@
 from django.db import models
+from django.utils import timezone
 from apps.core.models import TimeStampedModel
 
+
+class OverdueQuerySet(models.QuerySet):
+    """
+    Vencimientos calculados en SQL para modelos con due_date y status
+    (equivalente a la propiedad is_overdue de Task y Process)
+    """
+
+    # Estados que nunca cuentan como vencidos
+    CLOSED_STATUSES = ['completed', 'cancelled']
+
+    @classmethod
+    def overdue_q(cls, now=None) -> models.Q:
+        """Condición de vencido: abierto y con due_date anterior a `now`"""
+        return (
+            models.Q(due_date__isnull=False, due_date__lt=now or timezone.now())
+            & ~models.Q(status__in=cls.CLOSED_STATUSES)
+        )
+
+    def overdue(self, now=None):
+        """Registros vencidos"""
+        return self.filter(self.overdue_q(now))
+
+    def grouped_counts(self, *fields, now=None) -> dict:
+        """
+        Contadores para dashboards en una sola consulta agrupada por `fields`.
+
+        Args:
+            fields: Campos por los que desglosar (p. ej. 'status', 'priority')
+            now: Momento de referencia para los vencidos (por defecto ahora)
+
+        Returns:
+            Dict con 'total', 'overdue' y, por cada campo, un dict valor -> cantidad
+        """
+        rows = self.order_by().values(*fields).annotate(
+            count=models.Count('id'),
+            overdue_count=models.Count('id', filter=self.overdue_q(now)),
+        )
+
+        counts = {'total': 0, 'overdue': 0}
+        counts.update({field: {} for field in fields})
+        for row in rows:
+            counts['total'] += row['count']
+            counts['overdue'] += row['overdue_count']
+            for field in fields:
+                counts[field][row[field]] = counts[field].get(row[field], 0) + row['count']
+        return counts
+
+
 class TaskCategory(TimeStampedModel):
     """
     Categorías de tareas
@@ -83,6 +132,8 @@ class Task(TimeStampedModel):
     recurrence_pattern = models.JSONField(default=dict, help_text="Patrón de recurrencia")
     next_run = models.DateTimeField(null=True, blank=True)
     
+    objects = OverdueQuerySet.as_manager()
+    
     class Meta:
         db_table = 'tasks'
         verbose_name = 'Task'
@@ -101,7 +152,7 @@ class Task(TimeStampedModel):
     
     @property
     def is_overdue(self):
-        """Verifica si la tarea está vencida"""
+        """Verifica si la tarea está vencida (en SQL: Task.objects.overdue())"""
         if self.status in ['completed', 'cancelled'] or not self.due_date:
             return False
         from django.utils import timezone
@@ -220,6 +271,40 @@ class TaskAttachment(TimeStampedModel):
         return f"{size:.1f} TB"
 
 
+class ProcessQuerySet(OverdueQuerySet):
+    """
+    QuerySet de procesos con los cálculos de listados hechos en SQL
+    """
+
+    # Estados de tarea que cuentan como paso actual de un proceso
+    CURRENT_STEP_STATUSES = ['pending', 'in_progress']
+
+    def with_progress(self):
+        """
+        Anota conteo de tareas y paso actual de cada proceso:
+        - task_total: tareas del proceso
+        - task_completed: tareas completadas
+        - current_step_id: ProcessTask pendiente o en progreso con menor execution_order
+
+        Process.progress_percentage, Process.current_step y los serializers
+        usan estas anotaciones cuando están presentes en vez de consultar por proceso.
+        """
+        current_step = ProcessTask.objects.filter(
+            process=models.OuterRef('pk'),
+            task__status__in=self.CURRENT_STEP_STATUSES
+        ).order_by('execution_order', 'id').values('id')[:1]
+
+        return self.annotate(
+            task_total=models.Count('process_tasks', distinct=True),
+            task_completed=models.Count(
+                'process_tasks',
+                filter=models.Q(process_tasks__task__status='completed'),
+                distinct=True
+            ),
+            current_step_id=models.Subquery(current_step),
+        )
+
+
 class Process(TimeStampedModel):
     """
     Proceso completo que agrupa múltiples tareas relacionadas
@@ -309,6 +394,8 @@ class Process(TimeStampedModel):
         help_text="Proceso padre del cual se generó este por recurrencia"
     )
 
+    objects = ProcessQuerySet.as_manager()
+
     class Meta:
         db_table = 'processes'
         verbose_name = 'Process'
@@ -323,25 +410,45 @@ class Process(TimeStampedModel):
     def __str__(self):
         return f"{self.name} ({self.get_status_display()})"
 
+    @property
+    def task_count(self):
+        """Cantidad de tareas del proceso (anotación task_total si existe)"""
+        if hasattr(self, 'task_total'):
+            return self.task_total
+        return self.process_tasks.count()
+
     @property
     def progress_percentage(self):
         """Calcula progreso basado en tareas completadas"""
-        tasks = self.process_tasks.all()
-        if not tasks.exists():
+        if hasattr(self, 'task_total'):
+            total, completed = self.task_total, self.task_completed
+        else:
+            tasks = self.process_tasks.all()
+            total = tasks.count()
+            completed = tasks.filter(task__status='completed').count() if total else 0
+        if not total:
             return 0
-        completed = tasks.filter(task__status='completed').count()
-        return int((completed / tasks.count()) * 100)
+        return int((completed / total) * 100)
 
     @property
     def current_step(self):
         """Obtiene el paso actual del proceso"""
-        return self.process_tasks.filter(
-            task__status__in=['pending', 'in_progress']
-        ).order_by('execution_order').first()
+        if not hasattr(self, 'current_step_id'):
+            return self.process_tasks.filter(
+                task__status__in=ProcessQuerySet.CURRENT_STEP_STATUSES
+            ).select_related('task').order_by('execution_order', 'id').first()
+
+        if self.current_step_id is None:
+            return None
+        # Con process_tasks precargado el paso actual sale del caché, sin consulta
+        prefetched = getattr(self, '_prefetched_objects_cache', {}).get('process_tasks')
+        if prefetched is not None:
+            return next((step for step in prefetched if step.id == self.current_step_id), None)
+        return ProcessTask.objects.select_related('task').filter(id=self.current_step_id).first()
 
     @property
     def is_overdue(self):
-        """Verifica si el proceso está vencido"""
+        """Verifica si el proceso está vencido (en SQL: Process.objects.overdue())"""
         if self.status in ['completed', 'cancelled'] or not self.due_date:
             return False
         from django.utils import timezone
@@ -440,14 +547,29 @@ class Process(TimeStampedModel):
 
     def generate_next_occurrence(self):
         """Genera el siguiente proceso en la serie recurrente"""
+        from .services.process_builder import ProcessBuilder
+
+        builder = ProcessBuilder()
+        next_process = self.build_next_occurrence(builder)
+        builder.save()
+        return next_process
+
+    def build_next_occurrence(self, builder):
+        """
+        Arma en memoria el siguiente proceso de la serie y lo agrega a `builder`
+        (ProcessBuilder) sin guardarlo, para generar muchas series en lote.
+
+        Returns:
+            El proceso armado (sin pk hasta builder.save()) o None si no es recurrente
+        """
         if not self.is_recurring:
             return None
 
         # Calcular datos del siguiente período
         next_period_data = self._calculate_next_period_data()
 
-        # Crear el nuevo proceso
-        next_process = Process.objects.create(
+        # Armar el nuevo proceso
+        next_process = Process(
             name=next_period_data['name'],
             description=next_period_data['description'],
             process_type=self.process_type,
@@ -465,9 +587,7 @@ class Process(TimeStampedModel):
         )
 
         # Copiar las tareas del proceso original
-        self._copy_tasks_to_next_process(next_process, next_period_data)
-
-        return next_process
+        return builder.add(next_process, self._copy_tasks_to_next_process(next_process, next_period_data))
 
     def _calculate_next_period_data(self):
         """Calcula los datos específicos del siguiente período"""
@@ -508,12 +628,21 @@ class Process(TimeStampedModel):
         return {}
 
     def _copy_tasks_to_next_process(self, next_process, period_data):
-        """Copia las tareas del proceso actual al siguiente"""
-        from datetime import timedelta
-
-        for process_task in self.process_tasks.all():
-            # Crear nueva tarea basada en la original
-            new_task = Task.objects.create(
+        """
+        Arma (sin guardar) las tareas del siguiente proceso a partir de las actuales
+
+        Returns:
+            Lista de (tarea, vínculo ProcessTask) para ProcessBuilder
+        """
+        # Con process_tasks precargado (generación en lote) no hay consultas
+        process_tasks = getattr(self, '_prefetched_objects_cache', {}).get('process_tasks')
+        if process_tasks is None:
+            process_tasks = self.process_tasks.select_related('task')
+
+        steps = []
+        for process_task in process_tasks:
+            # Nueva tarea basada en la original
+            new_task = Task(
                 title=self._update_task_title_for_period(process_task.task.title, period_data),
                 description=process_task.task.description,
                 task_type=process_task.task.task_type,
@@ -525,19 +654,13 @@ class Process(TimeStampedModel):
                 task_data={
                     **process_task.task.task_data,
                     **period_data['config_data']
-                }
+                },
+                # Calcular fecha límite para esta tarea
+                due_date=self._calculate_task_due_date(process_task, next_process, steps)
             )
 
-            # Calcular fecha límite para esta tarea
-            task_due_date = self._calculate_task_due_date(process_task, next_process)
-            if task_due_date:
-                new_task.due_date = task_due_date
-                new_task.save()
-
-            # Crear la relación ProcessTask
-            ProcessTask.objects.create(
-                process=next_process,
-                task=new_task,
+            # Relación ProcessTask (process y task se asignan al guardar)
+            steps.append((new_task, ProcessTask(
                 execution_order=process_task.execution_order,
                 execution_conditions=process_task.execution_conditions,
                 is_optional=process_task.is_optional,
@@ -546,7 +669,9 @@ class Process(TimeStampedModel):
                 due_date_offset_days=process_task.due_date_offset_days,
                 due_date_from_previous=process_task.due_date_from_previous,
                 absolute_due_date=process_task.absolute_due_date
-            )
+            )))
+
+        return steps
 
     def _update_task_title_for_period(self, original_title, period_data):
         """Actualiza el título de la tarea para el nuevo período"""
@@ -559,8 +684,15 @@ class Process(TimeStampedModel):
 
         return f"{original_title} - {period}" if period else original_title
 
-    def _calculate_task_due_date(self, process_task, next_process):
-        """Calcula la fecha límite para una tarea específica"""
+    def _calculate_task_due_date(self, process_task, next_process, previous_steps=()):
+        """
+        Calcula la fecha límite para una tarea específica
+
+        Args:
+            process_task: Paso del proceso actual que se copia
+            next_process: Proceso siguiente
+            previous_steps: (tarea, vínculo) ya armados para el proceso siguiente
+        """
         from datetime import timedelta
 
         # Si tiene fecha absoluta, usarla
@@ -573,12 +705,14 @@ class Process(TimeStampedModel):
 
         # Si depende de la tarea anterior
         if process_task.due_date_from_previous:
-            previous_task = next_process.process_tasks.filter(
-                execution_order__lt=process_task.execution_order
-            ).order_by('-execution_order').first()
-
-            if previous_task and previous_task.task.due_date:
-                return previous_task.task.due_date + timedelta(days=process_task.due_date_from_previous)
+            previous = [
+                (link.execution_order, task) for task, link in previous_steps
+                if link.execution_order < process_task.execution_order
+            ]
+            if previous:
+                previous_task = max(previous, key=lambda item: item[0])[1]
+                if previous_task.due_date:
+                    return previous_task.due_date + timedelta(days=process_task.due_date_from_previous)
 
         # Por defecto, usar la fecha límite del proceso
         return next_process.due_date
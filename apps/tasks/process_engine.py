@@ -1,18 +1,138 @@
 """
 Motor de ejecución de procesos
 Este módulo maneja la lógica de ejecución automática y seguimiento de procesos
+
+Los pasos de un proceso se arman una vez por evento como un grafo en memoria
+(ProcessGraph) a partir de execution_order, can_run_parallel y TaskDependency.
+Cada cambio de estado de una tarea avanza las ejecuciones en curso: se inician
+todos los pasos cuyas dependencias están cumplidas y los automáticos se
+despachan juntos en un group de Celery.
 """
 
 import logging
-from typing import Optional, Dict, Any, List
+from collections import defaultdict
+from typing import Optional, Dict, Any, List, Set, Tuple
 from django.utils import timezone
 from django.db import transaction
-from celery import shared_task
+from django.db.models import F
+from celery import group, shared_task
 
-from .models import Process, ProcessExecution, ProcessTask, Task, TaskLog
+from .models import Process, ProcessExecution, ProcessTask, Task, TaskDependency, TaskLog
 
 logger = logging.getLogger(__name__)
 
+# Estados con los que una tarea opcional deja de bloquear a sus sucesores
+OPTIONAL_SETTLED_STATUSES = ('completed', 'failed', 'cancelled')
+
+
+class ProcessGraph:
+    """
+    Grafo (DAG) en memoria de los pasos (ProcessTask) de un proceso.
+
+    Aristas:
+    - Por orden: los pasos se agrupan en etapas y cada etapa depende de la
+      anterior. Una etapa es el primer paso de un execution_order más los pasos
+      siguientes del mismo orden con can_run_parallel; un paso del mismo orden
+      sin can_run_parallel abre una etapa nueva.
+    - Por TaskDependency entre tareas del proceso: finish_to_start exige que el
+      predecesor haya terminado y start_to_start que haya iniciado. Los tipos
+      *_to_finish restringen el término, no el inicio, y no afectan el despacho.
+    """
+
+    def __init__(self, steps: List[ProcessTask], dependencies: List[TaskDependency]):
+        """
+        Args:
+            steps: Pasos del proceso con su tarea cargada, en orden de ejecución
+            dependencies: Dependencias entre tareas del proceso
+        """
+        self.steps: Dict[int, ProcessTask] = {step.id: step for step in steps}
+        # paso -> {predecesor: True si exige término, False si solo inicio}
+        self.predecessors: Dict[int, Dict[int, bool]] = defaultdict(dict)
+        self.successors: Dict[int, Set[int]] = defaultdict(set)
+
+        self._add_order_edges(steps)
+
+        step_by_task = {step.task_id: step.id for step in steps}
+        for dependency in dependencies:
+            if dependency.dependency_type not in ('finish_to_start', 'start_to_start'):
+                continue
+            self._add_edge(
+                step_by_task[dependency.predecessor_id],
+                step_by_task[dependency.successor_id],
+                requires_finish=dependency.dependency_type == 'finish_to_start'
+            )
+
+    @classmethod
+    def load(cls, process: Process) -> 'ProcessGraph':
+        """Arma el grafo de un proceso con dos consultas (pasos y dependencias)"""
+        steps = list(process.process_tasks.select_related('task').order_by('execution_order', 'id'))
+        task_ids = [step.task_id for step in steps]
+        dependencies = list(TaskDependency.objects.filter(
+            predecessor_id__in=task_ids,
+            successor_id__in=task_ids
+        ))
+        return cls(steps, dependencies)
+
+    def _add_edge(self, predecessor_id: int, successor_id: int, requires_finish: bool = True):
+        if predecessor_id == successor_id:
+            return
+        # Si hay dos aristas entre los mismos pasos, prevalece la más estricta
+        current = self.predecessors[successor_id].get(predecessor_id, False)
+        self.predecessors[successor_id][predecessor_id] = current or requires_finish
+        self.successors[predecessor_id].add(successor_id)
+
+    def _add_order_edges(self, steps: List[ProcessTask]):
+        stages: List[List[ProcessTask]] = []
+        for step in steps:
+            stage = stages[-1] if stages else None
+            if stage and stage[0].execution_order == step.execution_order and step.can_run_parallel:
+                stage.append(step)
+            else:
+                stages.append([step])
+
+        for previous, stage in zip(stages, stages[1:]):
+            for step in stage:
+                for predecessor in previous:
+                    self._add_edge(predecessor.id, step.id)
+
+    @staticmethod
+    def is_settled(step: ProcessTask) -> bool:
+        """El paso ya no bloquea a sus sucesores"""
+        if step.is_optional:
+            return step.task.status in OPTIONAL_SETTLED_STATUSES
+        return step.task.status == 'completed'
+
+    def is_ready(self, step_id: int) -> bool:
+        """El paso está pendiente y todas sus dependencias están cumplidas"""
+        if self.steps[step_id].task.status != 'pending':
+            return False
+        for predecessor_id, requires_finish in self.predecessors[step_id].items():
+            predecessor = self.steps[predecessor_id]
+            if requires_finish and not self.is_settled(predecessor):
+                return False
+            if not requires_finish and predecessor.task.status == 'pending':
+                return False
+        return True
+
+    def ready_steps(self, candidates: Optional[Set[int]] = None) -> List[ProcessTask]:
+        """Pasos listos para iniciar, entre `candidates` o en todo el grafo"""
+        step_ids = self.steps if candidates is None else candidates
+        return sorted(
+            (self.steps[step_id] for step_id in step_ids if self.is_ready(step_id)),
+            key=lambda step: (step.execution_order, step.id)
+        )
+
+    def steps_with_status(self, *statuses: str) -> List[ProcessTask]:
+        return [step for step in self.steps.values() if step.task.status in statuses]
+
+    def failed_required_steps(self) -> List[ProcessTask]:
+        """Pasos obligatorios fallidos o cancelados (bloquean el proceso)"""
+        return [step for step in self.steps_with_status('failed', 'cancelled') if not step.is_optional]
+
+    def earlier_steps(self, step: ProcessTask) -> List[ProcessTask]:
+        """Pasos con execution_order menor que el del paso dado"""
+        return [other for other in self.steps.values() if other.execution_order < step.execution_order]
+
 
 class ProcessEngine:
     """
@@ -45,8 +165,8 @@ class ProcessEngine:
 
             self.logger.info(f"Iniciando proceso {process.name} con ejecución {execution.id}")
 
-            # Ejecutar primer paso
-            self._execute_next_steps(execution)
+            # Ejecutar primeros pasos
+            self.advance(execution)
 
             return execution
 
@@ -54,88 +174,166 @@ class ProcessEngine:
             self.logger.error(f"Error al iniciar proceso {process_id}: {str(e)}")
             raise
 
-    def _execute_next_steps(self, execution: ProcessExecution) -> None:
+    def handle_task_event(self, task_id: int) -> None:
         """
-        Ejecuta los siguientes pasos disponibles del proceso
+        Reacciona al cambio de estado de una tarea (inicio, término o falla)
+        avanzando las ejecuciones en curso de los procesos que la contienen.
         """
-        process = execution.process
+        executions = ProcessExecution.objects.filter(
+            status='running',
+            process__process_tasks__task_id=task_id
+        ).distinct()
 
-        # Obtener tareas pendientes en orden de ejecución
-        pending_tasks = process.process_tasks.filter(
-            task__status='pending'
-        ).order_by('execution_order')
+        for execution in executions:
+            self.advance(execution)
 
-        if not pending_tasks.exists():
-            self._complete_process_execution(execution)
-            return
+    def advance(self, execution: ProcessExecution) -> List[ProcessTask]:
+        """
+        Avanza una ejecución en curso.
+
+        Con la ejecución bloqueada (select_for_update) arma el grafo del proceso,
+        inicia todos los pasos listos, despacha los automáticos en un solo group
+        de Celery al hacer commit y cierra la ejecución si ya no quedan pasos
+        por correr.
 
-        # Ejecutar tareas que pueden correr en paralelo o la primera tarea secuencial
-        tasks_to_execute = []
-        current_order = None
-
-        for process_task in pending_tasks:
-            # Si es la primera tarea o puede ejecutarse en paralelo
-            if current_order is None:
-                current_order = process_task.execution_order
-                tasks_to_execute.append(process_task)
-            elif (process_task.execution_order == current_order and
-                  process_task.can_run_parallel):
-                tasks_to_execute.append(process_task)
+        Args:
+            execution: Ejecución a avanzar
+
+        Returns:
+            Pasos iniciados
+        """
+        with transaction.atomic():
+            execution = ProcessExecution.objects.select_for_update().select_related('process').get(id=execution.id)
+            if execution.status != 'running':
+                return []
+
+            graph = ProcessGraph.load(execution.process)
+            started = self._start_ready_steps(graph, execution)
+            if started is None:
+                return []
+
+            execution.total_steps = len(graph.steps)
+            execution.completed_steps = len(graph.steps_with_status('completed'))
+            execution.failed_steps = len(graph.steps_with_status('failed'))
+            active = graph.steps_with_status('in_progress')
+            execution.current_step = min((step.execution_order for step in active), default=0)
+
+            if active:
+                execution.save()
             else:
-                break
-
-        # Ejecutar tareas seleccionadas
-        for process_task in tasks_to_execute:
-            if self._check_execution_conditions(process_task, execution):
-                self._execute_task(process_task, execution)
-            elif not process_task.is_optional:
-                # Si una tarea obligatoria no puede ejecutarse, fallar el proceso
-                self._fail_process_execution(
-                    execution,
-                    f"No se pueden cumplir las condiciones para la tarea: {process_task.task.title}"
+                self._close_execution(graph, execution)
+
+        return started
+
+    def _start_ready_steps(self, graph: ProcessGraph, execution: ProcessExecution) -> Optional[List[ProcessTask]]:
+        """
+        Inicia los pasos listos del grafo y los que estos liberan.
+
+        Un paso opcional cuyas condiciones no se cumplen se omite (tarea
+        cancelada) y libera a sus sucesores. Si un paso obligatorio no cumple
+        sus condiciones la ejecución falla.
+
+        Returns:
+            Pasos iniciados, o None si la ejecución falló
+        """
+        now = timezone.now()
+        started: List[ProcessTask] = []
+        skipped: List[ProcessTask] = []
+
+        ready = graph.ready_steps()
+        while ready:
+            released: Set[int] = set()
+            for step in ready:
+                task = step.task
+                if self._check_execution_conditions(step, execution, graph):
+                    if step.context_data:
+                        task.task_data.update(step.context_data)
+                    task.status = 'in_progress'
+                    task.started_at = now
+                    started.append(step)
+                elif step.is_optional:
+                    task.status = 'cancelled'
+                    task.completed_at = now
+                    skipped.append(step)
+                else:
+                    # Si una tarea obligatoria no puede ejecutarse, fallar el proceso
+                    self._fail_process_execution(
+                        execution,
+                        f"No se pueden cumplir las condiciones para la tarea: {task.title}"
+                    )
+                    return None
+                task.updated_at = now
+                released.update(graph.successors[step.id])
+            ready = graph.ready_steps(released)
+
+        if not started and not skipped:
+            return started
+
+        Task.objects.bulk_update(
+            [step.task for step in started + skipped],
+            ['status', 'started_at', 'completed_at', 'task_data', 'updated_at']
+        )
+        TaskLog.objects.bulk_create(
+            [
+                TaskLog(
+                    task=step.task,
+                    level='info',
+                    message=f"Tarea iniciada por proceso {execution.process.name}",
+                    details={'execution_id': execution.id, 'process_task_id': step.id}
                 )
-                return
+                for step in started
+            ] + [
+                TaskLog(
+                    task=step.task,
+                    level='info',
+                    message=f"Tarea opcional omitida por proceso {execution.process.name}: condiciones no cumplidas",
+                    details={'execution_id': execution.id, 'process_task_id': step.id}
+                )
+                for step in skipped
+            ]
+        )
 
-    def _execute_task(self, process_task: ProcessTask, execution: ProcessExecution) -> None:
+        for step in started:
+            self.logger.info(f"Ejecutando tarea {step.task.title} del proceso {execution.process.name}")
+            if step.task.task_type == 'scheduled':
+                self._schedule_task(step.task, execution)
+
+        automatic_ids = [step.task_id for step in started if step.task.task_type == 'automatic']
+        if automatic_ids:
+            signatures = group(_execute_automatic_task.s(task_id, execution.id) for task_id in automatic_ids)
+            transaction.on_commit(signatures.apply_async)
+
+        return started
+
+    def _close_execution(self, graph: ProcessGraph, execution: ProcessExecution) -> None:
         """
-        Ejecuta una tarea específica del proceso
+        Cierra una ejecución sin pasos activos: la completa si todos los pasos
+        quedaron resueltos o la falla si un paso obligatorio falló o quedó bloqueado.
         """
-        task = process_task.task
+        failed = graph.failed_required_steps()
+        if failed:
+            self._fail_process_execution(
+                execution,
+                f"Falló la tarea obligatoria: {failed[0].task.title}"
+            )
+            return
 
-        try:
-            self.logger.info(f"Ejecutando tarea {task.title} del proceso {execution.process.name}")
-
-            # Actualizar contexto de la tarea
-            if process_task.context_data:
-                task.task_data.update(process_task.context_data)
-                task.save()
-
-            # Iniciar tarea
-            task.start_task()
-
-            # Si es tarea automática, ejecutarla
-            if task.task_type == 'automatic':
-                self._execute_automatic_task.delay(task.id, execution.id)
-            elif task.task_type == 'scheduled':
-                self._schedule_task(task, execution)
-
-            # Log de la ejecución
-            TaskLog.objects.create(
-                task=task,
-                level='info',
-                message=f"Tarea iniciada por proceso {execution.process.name}",
-                details={'execution_id': execution.id, 'process_task_id': process_task.id}
+        blocked = graph.steps_with_status('pending')
+        if blocked:
+            self._fail_process_execution(
+                execution,
+                f"Tareas bloqueadas por dependencias no cumplidas: {', '.join(step.task.title for step in blocked[:5])}"
             )
+            return
 
-        except Exception as e:
-            self.logger.error(f"Error ejecutando tarea {task.id}: {str(e)}")
-            task.fail_task(str(e))
-            execution.failed_steps += 1
-            execution.error_count += 1
-            execution.last_error = str(e)
-            execution.save()
+        self._complete_process_execution(execution)
 
-    def _check_execution_conditions(self, process_task: ProcessTask, execution: ProcessExecution) -> bool:
+    def _check_execution_conditions(
+        self,
+        process_task: ProcessTask,
+        execution: ProcessExecution,
+        graph: ProcessGraph
+    ) -> bool:
         """
         Verifica si se cumplen las condiciones para ejecutar una tarea
         """
@@ -150,7 +348,7 @@ class ProcessEngine:
         for condition_key, condition_value in conditions.items():
             if condition_key == 'previous_task_status':
                 # Verificar estado de tareas anteriores
-                if not self._check_previous_tasks_status(process_task, condition_value):
+                if not self._check_previous_tasks_status(process_task, condition_value, graph):
                     return False
 
             elif condition_key == 'context_variable':
@@ -167,15 +365,11 @@ class ProcessEngine:
 
         return True
 
-    def _check_previous_tasks_status(self, process_task: ProcessTask, required_status: str) -> bool:
+    def _check_previous_tasks_status(self, process_task: ProcessTask, required_status: str, graph: ProcessGraph) -> bool:
         """
         Verifica que las tareas anteriores tengan el estado requerido
         """
-        previous_tasks = process_task.process.process_tasks.filter(
-            execution_order__lt=process_task.execution_order
-        )
-
-        for prev_task in previous_tasks:
+        for prev_task in graph.earlier_steps(process_task):
             if not prev_task.is_optional and prev_task.task.status != required_status:
                 return False
 
@@ -262,7 +456,7 @@ class ProcessEngine:
             for execution in paused_executions:
                 execution.status = 'running'
                 execution.save()
-                self._execute_next_steps(execution)
+                self.advance(execution)
 
             self.logger.info(f"Proceso {process.name} reanudado")
 
@@ -275,7 +469,7 @@ class ProcessEngine:
         Obtiene el estado actual de un proceso
         """
         try:
-            process = Process.objects.get(id=process_id)
+            process = Process.objects.with_progress().get(id=process_id)
             active_execution = process.executions.filter(status='running').first()
 
             status = {
@@ -313,6 +507,20 @@ class ProcessEngine:
             raise ValueError(f"Proceso {process_id} no encontrado")
 
 
+def notify_task_status_changed(task_id: int) -> None:
+    """
+    Evento de cambio de estado de una tarea (inicio, término o falla).
+    Lo emite la señal post_save de Task (apps.tasks.signals) al confirmar.
+
+    Avanza los procesos que contienen la tarea. Los errores se registran sin
+    propagarse: el cambio de estado de la tarea ya quedó guardado.
+    """
+    try:
+        ProcessEngine().handle_task_event(task_id)
+    except Exception as e:
+        logger.error(f"Error avanzando procesos de la tarea {task_id}: {str(e)}")
+
+
 # Tareas Celery para ejecución asíncrona
 
 @shared_task
@@ -322,7 +530,6 @@ def _execute_automatic_task(task_id: int, execution_id: int):
     """
     try:
         task = Task.objects.get(id=task_id)
-        execution = ProcessExecution.objects.get(id=execution_id)
 
         logger.info(f"Ejecutando tarea automática {task.title}")
 
@@ -334,30 +541,27 @@ def _execute_automatic_task(task_id: int, execution_id: int):
 
             if success:
                 task.complete_task({'executed_by': 'process_engine', 'execution_id': execution_id})
-                execution.completed_steps += 1
             else:
                 task.fail_task("Error en ejecución automática")
-                execution.failed_steps += 1
-                execution.error_count += 1
-
-            execution.save()
-
-            # Continuar con el siguiente paso
-            engine = ProcessEngine()
-            engine._execute_next_steps(execution)
+                _register_execution_error(execution_id, "Error en ejecución automática")
 
     except Exception as e:
         logger.error(f"Error en tarea automática {task_id}: {str(e)}")
         try:
             task = Task.objects.get(id=task_id)
             task.fail_task(str(e))
-            execution = ProcessExecution.objects.get(id=execution_id)
-            execution.failed_steps += 1
-            execution.error_count += 1
-            execution.last_error = str(e)
-            execution.save()
+            _register_execution_error(execution_id, str(e))
         except:
             pass
+    # complete_task / fail_task avanzan el proceso (señal post_save de Task)
+
+
+def _register_execution_error(execution_id: int, error_message: str) -> None:
+    """Registra un error en la ejecución sin pisar actualizaciones concurrentes"""
+    ProcessExecution.objects.filter(id=execution_id).update(
+        error_count=F('error_count') + 1,
+        last_error=error_message
+    )
 
 
 def _execute_task_logic(task: Task) -> bool:
@@ -420,6 +624,22 @@ class ProcessTemplateFactory:
         """
         Crea un proceso para declaración F29 mensual con recurrencia automática
         """
+        company = ProcessTemplateFactory._get_company(company_rut, company_dv)
+        process, steps = ProcessTemplateFactory.build_monthly_f29_process(
+            company, company_rut, company_dv, period, assigned_to, is_recurring=is_recurring
+        )
+        return ProcessTemplateFactory._save(process, steps)
+
+    @staticmethod
+    def build_monthly_f29_process(company, company_rut: str, company_dv: str, period: str,
+                                  assigned_to: str, is_recurring: bool = True) -> Tuple[Process, List[Tuple[Task, ProcessTask]]]:
+        """
+        Arma en memoria, sin guardar, el proceso F29 mensual y sus pasos.
+        Se persiste con ProcessBuilder, solo o junto a los de otras empresas.
+
+        Returns:
+            (proceso, [(tarea, vínculo), ...])
+        """
         # Parsear período (formato: "YYYY-MM")
         year, month = period.split('-')
         year = int(year)
@@ -429,7 +649,6 @@ class ProcessTemplateFactory:
 
         # Calcular fecha de vencimiento (F29 vence el día 12 del mes siguiente)
         from datetime import datetime
-        from django.utils import timezone
 
         due_month = month + 1
         due_year = year
@@ -439,15 +658,7 @@ class ProcessTemplateFactory:
 
         due_date = timezone.make_aware(datetime(due_year, due_month, 12, 23, 59, 59))
 
-        # Buscar la empresa por RUT
-        from apps.companies.models import Company
-        company_tax_id = f"{company_rut}-{company_dv}"
-        try:
-            company = Company.objects.get(tax_id=company_tax_id)
-        except Company.DoesNotExist:
-            raise ValueError(f"No se encontró empresa con tax_id: {company_tax_id}")
-
-        process = Process.objects.create(
+        process = Process(
             name=process_name,
             description=f"Declaración F29 para el período {month:02d}/{year}",
             process_type='tax_monthly',
@@ -524,62 +735,12 @@ class ProcessTemplateFactory:
             }
         ]
 
-        for task_config in tasks_config:
-            # Crear tarea
-            task = Task.objects.create(
-                title=task_config['title'],
-                description=task_config.get('description', ''),
-                task_type=task_config['task_type'],
-                company_rut=company_rut,
-                company_dv=company_dv,
-                assigned_to=assigned_to,
-                created_by=assigned_to,
-                task_data={
-                    'period': period,
-                    'period_month': month,
-                    'period_year': year,
-                    'form_type': 'f29'
-                }
-            )
-
-            # Calcular fecha límite para esta tarea
-            task_due_date = None
-            if task_config.get('due_date_offset_days') is not None:
-                from datetime import timedelta
-                offset_days = task_config['due_date_offset_days']
-
-                if offset_days > 0:
-                    # Offset positivo: calcular desde ahora (inicio del proceso)
-                    task_due_date = timezone.now() + timedelta(days=offset_days)
-                else:
-                    # Offset negativo: calcular desde la fecha de vencimiento del proceso
-                    task_due_date = due_date + timedelta(days=offset_days)
-            elif task_config.get('due_date_from_previous') and task_config['order'] > 1:
-                # Para tareas que dependen de la anterior, usar fecha del proceso por ahora
-                # En un futuro se puede implementar cálculo dinámico
-                task_due_date = due_date
-            else:
-                # Por defecto, usar la fecha de vencimiento del proceso
-                task_due_date = due_date
-
-            # Asignar fecha límite a la tarea
-            if task_due_date:
-                task.due_date = task_due_date
-                task.save()
-
-            # Asociar tarea al proceso con fechas límite
-            ProcessTask.objects.create(
-                process=process,
-                task=task,
-                execution_order=task_config['order'],
-                is_optional=task_config['optional'],
-                can_run_parallel=task_config['parallel'],
-                execution_conditions=task_config.get('conditions', {}),
-                due_date_offset_days=task_config.get('due_date_offset_days'),
-                due_date_from_previous=task_config.get('due_date_from_previous')
-            )
-
-        return process
+        return process, ProcessTemplateFactory._build_steps(process, tasks_config, task_data={
+            'period': period,
+            'period_month': month,
+            'period_year': year,
+            'form_type': 'f29'
+        })
 
     @staticmethod
     def create_annual_declaration_process(company_rut: str, company_dv: str,
@@ -587,23 +748,29 @@ class ProcessTemplateFactory:
         """
         Crea un proceso para declaración anual F22 con todas sus tareas
         """
+        company = ProcessTemplateFactory._get_company(company_rut, company_dv)
+        process, steps = ProcessTemplateFactory.build_annual_declaration_process(
+            company, company_rut, company_dv, year, assigned_to
+        )
+        return ProcessTemplateFactory._save(process, steps)
+
+    @staticmethod
+    def build_annual_declaration_process(company, company_rut: str, company_dv: str,
+                                         year: str, assigned_to: str) -> Tuple[Process, List[Tuple[Task, ProcessTask]]]:
+        """
+        Arma en memoria, sin guardar, el proceso F22 anual y sus pasos.
+
+        Returns:
+            (proceso, [(tarea, vínculo), ...])
+        """
         process_name = f"F22 {year} - {company_rut}-{company_dv}"
 
         # Calcular fecha de vencimiento del F22 (30 de abril del año siguiente)
         from datetime import datetime
-        from django.utils import timezone
 
         due_date = timezone.make_aware(datetime(int(year) + 1, 4, 30, 23, 59, 59))
 
-        # Buscar la empresa por RUT
-        from apps.companies.models import Company
-        company_tax_id = f"{company_rut}-{company_dv}"
-        try:
-            company = Company.objects.get(tax_id=company_tax_id)
-        except Company.DoesNotExist:
-            raise ValueError(f"No se encontró empresa con tax_id: {company_tax_id}")
-
-        process = Process.objects.create(
+        process = Process(
             name=process_name,
             description=f"Declaración anual de renta F22 para el año {year}",
             process_type='tax_annual',
@@ -683,52 +850,75 @@ class ProcessTemplateFactory:
             }
         ]
 
+        return process, ProcessTemplateFactory._build_steps(process, tasks_config, task_data={
+            'year': year,
+            'form_type': 'f22'
+        })
+
+    @staticmethod
+    def _get_company(company_rut: str, company_dv: str):
+        """Busca la empresa por RUT"""
+        from apps.companies.models import Company
+        company_tax_id = f"{company_rut}-{company_dv}"
+        try:
+            return Company.objects.get(tax_id=company_tax_id)
+        except Company.DoesNotExist:
+            raise ValueError(f"No se encontró empresa con tax_id: {company_tax_id}")
+
+    @staticmethod
+    def _build_steps(process: Process, tasks_config: List[Dict[str, Any]],
+                     task_data: Dict[str, Any]) -> List[Tuple[Task, ProcessTask]]:
+        """
+        Arma las tareas y vínculos (sin guardar) de un proceso con sus fechas límite
+        """
+        from datetime import timedelta
+
+        now = timezone.now()
+        steps = []
         for task_config in tasks_config:
-            # Crear tarea
-            task = Task.objects.create(
+            # Calcular fecha límite para esta tarea
+            offset_days = task_config.get('due_date_offset_days')
+            if offset_days is not None and offset_days > 0:
+                # Offset positivo: calcular desde ahora (inicio del proceso)
+                task_due_date = now + timedelta(days=offset_days)
+            elif offset_days is not None:
+                # Offset negativo: calcular desde la fecha de vencimiento del proceso
+                task_due_date = process.due_date + timedelta(days=offset_days)
+            else:
+                # Tareas que dependen de la anterior y por defecto: fecha de vencimiento del proceso
+                task_due_date = process.due_date
+
+            task = Task(
                 title=task_config['title'],
                 description=task_config.get('description', ''),
                 task_type=task_config['task_type'],
-                company_rut=company_rut,
-                company_dv=company_dv,
-                assigned_to=assigned_to,
-                created_by=assigned_to,
-                task_data={
-                    'year': year,
-                    'form_type': 'f22'
-                }
+                company_rut=process.company_rut,
+                company_dv=process.company_dv,
+                assigned_to=process.assigned_to,
+                created_by=process.created_by,
+                due_date=task_due_date,
+                task_data=dict(task_data)
             )
 
-            # Calcular fecha límite para esta tarea
-            task_due_date = None
-            if task_config.get('due_date_offset_days') is not None:
-                from datetime import timedelta
-                offset_days = task_config['due_date_offset_days']
-
-                if offset_days > 0:
-                    # Offset positivo: calcular desde ahora (inicio del proceso)
-                    task_due_date = timezone.now() + timedelta(days=offset_days)
-                else:
-                    # Offset negativo: calcular desde la fecha de vencimiento del proceso
-                    task_due_date = due_date + timedelta(days=offset_days)
-            else:
-                # Por defecto, usar la fecha de vencimiento del proceso
-                task_due_date = due_date
-
-            # Asignar fecha límite a la tarea
-            if task_due_date:
-                task.due_date = task_due_date
-                task.save()
-
             # Asociar tarea al proceso con fechas límite
-            ProcessTask.objects.create(
-                process=process,
-                task=task,
+            link = ProcessTask(
                 execution_order=task_config['order'],
                 is_optional=task_config['optional'],
                 can_run_parallel=task_config['parallel'],
                 execution_conditions=task_config.get('conditions', {}),
                 due_date_offset_days=task_config.get('due_date_offset_days'),
+                due_date_from_previous=task_config.get('due_date_from_previous')
             )
+            steps.append((task, link))
 
-        return process
\ No newline at end of file
+        return steps
+
+    @staticmethod
+    def _save(process: Process, steps: List[Tuple[Task, ProcessTask]]) -> Process:
+        """Persiste un proceso armado con sus pasos (tres inserciones)"""
+        from .services.process_builder import ProcessBuilder
+
+        builder = ProcessBuilder()
+        builder.add(process, steps)
+        builder.save()
+        return process
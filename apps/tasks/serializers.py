@@ -280,5 +280,5 @@ class ProcessSummarySerializer(serializers.ModelSerializer):
         ]
 
     def get_task_count(self, obj):
-        """Cuenta de tareas en el proceso"""
-        return obj.process_tasks.count()
\ No newline at end of file
+        """Cuenta de tareas en el proceso (anotación de with_progress() si existe)"""
+        return obj.task_count
\ No newline at end of file
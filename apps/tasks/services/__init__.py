@@ -2,6 +2,7 @@
 Servicios de lógica de negocio para el módulo de tareas
 """
 from .process_assignment import ProcessAssignmentService
+from .process_builder import ProcessBuilder
 from .template_factory import ProcessTemplateFactory
 
-__all__ = ['ProcessAssignmentService', 'ProcessTemplateFactory']
+__all__ = ['ProcessAssignmentService', 'ProcessBuilder', 'ProcessTemplateFactory']
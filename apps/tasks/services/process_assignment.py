@@ -14,6 +14,7 @@ from apps.tasks.models import (
 )
 from apps.companies.models import Company
 from apps.taxpayers.models import TaxPayer
+from .process_builder import ProcessBuilder, ProcessStep
 
 logger = logging.getLogger(__name__)
 
@@ -254,8 +255,8 @@ class ProcessAssignmentService:
             is_recurring = template.default_recurrence_type is not None
             recurrence_config = template.default_recurrence_config if is_recurring else {}
 
-            # Crear el proceso
-            process = Process.objects.create(
+            # Armar el proceso
+            process = Process(
                 name=f"{template.name} - {company.business_name}",
                 description=template.description,
                 process_type=template.process_type,
@@ -271,8 +272,10 @@ class ProcessAssignmentService:
                 recurrence_config=recurrence_config
             )
 
-            # Crear tareas del proceso desde la plantilla
-            ProcessAssignmentService._create_tasks_from_template(process, template)
+            # Armar tareas del proceso desde la plantilla y guardar todo en lote
+            builder = ProcessBuilder()
+            builder.add(process, ProcessAssignmentService._build_tasks_from_template(process, template))
+            builder.save()
 
             # Incrementar contador de uso de la plantilla
             template.increment_usage()
@@ -285,21 +288,25 @@ class ProcessAssignmentService:
             return None
 
     @staticmethod
-    def _create_tasks_from_template(process: Process, template: ProcessTemplateConfig):
+    def _build_tasks_from_template(process: Process, template: ProcessTemplateConfig) -> List[ProcessStep]:
         """
-        Crea las tareas de un proceso basándose en las tareas de la plantilla
+        Arma (sin guardar) las tareas de un proceso basándose en las tareas de la plantilla
 
         Args:
-            process: Proceso recién creado
+            process: Proceso a crear
             template: Plantilla con las definiciones de tareas
+
+        Returns:
+            Lista de (tarea, vínculo ProcessTask) para ProcessBuilder
         """
         from apps.tasks.models import Task, ProcessTask
 
         template_tasks = template.template_tasks.all().order_by('execution_order')
 
+        steps = []
         for template_task in template_tasks:
-            # Crear la tarea
-            task = Task.objects.create(
+            # Armar la tarea
+            task = Task(
                 title=template_task.task_title,
                 description=template_task.task_description,
                 task_type=template_task.task_type,
@@ -313,18 +320,17 @@ class ProcessAssignmentService:
             )
 
             # Vincular tarea con el proceso
-            ProcessTask.objects.create(
-                process=process,
-                task=task,
+            steps.append((task, ProcessTask(
                 execution_order=template_task.execution_order,
                 is_optional=template_task.is_optional,
                 can_run_parallel=template_task.can_run_parallel,
                 due_date_offset_days=template_task.due_date_offset_days,
                 due_date_from_previous=template_task.due_date_from_previous,
                 context_data={'template_task_id': template_task.id}
-            )
+            )))
 
-            logger.debug(f"Tarea '{task.title}' creada para proceso '{process.name}'")
+        logger.debug(f"{len(steps)} tareas armadas para proceso '{process.name}'")
+        return steps
 
     @staticmethod
     def get_applicable_templates(company: Company) -> List[ProcessTemplateConfig]:
@@ -0,0 +1,154 @@
+"""
+Instanciación de procesos en lote
+
+Arma en memoria procesos completos (Process, sus Task y los ProcessTask que
+los vinculan) y los persiste con bulk_create: una inserción por modelo y por
+lote de `batch_size` filas, sin importar cuántos procesos o empresas incluya.
+"""
+import logging
+from typing import Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+
+from apps.tasks.models import Process, ProcessTask, Task
+from apps.tasks.process_engine import ProcessGraph
+
+logger = logging.getLogger(__name__)
+
+# Paso de un proceso sin guardar: la tarea y su vínculo (sin process ni task)
+ProcessStep = Tuple[Task, ProcessTask]
+
+
+class ProcessBuilder:
+    """
+    Acumula procesos con sus pasos y los guarda juntos.
+
+    Uso:
+        builder = ProcessBuilder()
+        builder.add(Process(...), [(Task(...), ProcessTask(...)), ...])
+        for process, graph in builder.save():
+            ...
+
+    Los Process pueden venir ya guardados (con pk); en ese caso solo se
+    insertan sus tareas y vínculos. bulk_create no llama a save() ni emite
+    señales, por lo que los valores calculados (p. ej. due_date) deben venir
+    asignados en las instancias.
+    """
+
+    def __init__(self, batch_size: Optional[int] = None):
+        """
+        Args:
+            batch_size: Filas por INSERT (por defecto settings.PROCESS_BULK_BATCH_SIZE)
+        """
+        self.batch_size = batch_size or getattr(settings, 'PROCESS_BULK_BATCH_SIZE', 500)
+        # (proceso, pasos, True si el proceso se agregó sin guardar)
+        self._pending: List[Tuple[Process, List[ProcessStep], bool]] = []
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, process: Process, steps: Iterable[ProcessStep]) -> Process:
+        """
+        Agrega un proceso y sus pasos, en orden de ejecución.
+
+        Returns:
+            El mismo proceso (sin pk hasta llamar a save())
+        """
+        self._pending.append((process, list(steps), process.pk is None))
+        return process
+
+    def save(self) -> List[Tuple[Process, ProcessGraph]]:
+        """
+        Persiste los procesos acumulados en una transacción y vacía el builder.
+
+        Returns:
+            Lista de (proceso, grafo de sus pasos) en el orden en que se agregaron
+        """
+        pending, self._pending = self._pending, []
+        if not pending:
+            return []
+
+        with transaction.atomic():
+            self._insert(pending)
+
+        return self._graphs(pending)
+
+    def save_isolated(self) -> Tuple[List[Tuple[Process, ProcessGraph]], List[Tuple[Process, Exception]]]:
+        """
+        Como save(), pero si el lote falla reintenta proceso por proceso, para
+        que una fila inválida no descarte a todos los demás del lote.
+
+        Returns:
+            (guardados como en save(), [(proceso, error), ...] de los que fallaron)
+        """
+        pending, self._pending = self._pending, []
+        if not pending:
+            return [], []
+
+        try:
+            with transaction.atomic():
+                self._insert(pending)
+            return self._graphs(pending), []
+        except Exception as e:
+            if len(pending) == 1:
+                self._reset(pending[0])
+                return [], [(pending[0][0], e)]
+            logger.warning(f"⚠️ Falló el lote de {len(pending)} procesos, reintentando uno por uno: {str(e)}")
+
+        saved, failed = [], []
+        for entry in pending:
+            # El lote se revirtió: las instancias no deben conservar los pk asignados
+            self._reset(entry)
+            try:
+                with transaction.atomic():
+                    self._insert([entry])
+            except Exception as e:
+                self._reset(entry)
+                failed.append((entry[0], e))
+                continue
+            saved.append(entry)
+
+        return self._graphs(saved), failed
+
+    def _insert(self, pending: List[Tuple[Process, List[ProcessStep], bool]]) -> None:
+        """Inserta procesos, tareas y vínculos con un bulk_create por modelo"""
+        Process.objects.bulk_create(
+            [process for process, _, is_new in pending if is_new],
+            batch_size=self.batch_size
+        )
+        Task.objects.bulk_create(
+            [task for _, steps, _ in pending for task, _ in steps],
+            batch_size=self.batch_size
+        )
+
+        links = []
+        for process, steps, _ in pending:
+            for task, link in steps:
+                link.process = process
+                link.task = task
+                links.append(link)
+        ProcessTask.objects.bulk_create(links, batch_size=self.batch_size)
+
+        logger.info(f"🧩 Procesos instanciados en lote: {len(pending)} procesos, {len(links)} tareas")
+
+    @staticmethod
+    def _reset(entry: Tuple[Process, List[ProcessStep], bool]) -> None:
+        """Devuelve a 'sin guardar' las instancias de un proceso tras un rollback"""
+        process, steps, is_new = entry
+        instances = [obj for step in steps for obj in step]
+        if is_new:
+            instances.append(process)
+        for obj in instances:
+            obj.pk = None
+            obj._state.adding = True
+
+    @staticmethod
+    def _graphs(pending: List[Tuple[Process, List[ProcessStep], bool]]) -> List[Tuple[Process, ProcessGraph]]:
+        return [
+            (process, ProcessGraph(
+                sorted((link for _, link in steps), key=lambda link: (link.execution_order, link.id)),
+                []
+            ))
+            for process, steps, _ in pending
+        ]
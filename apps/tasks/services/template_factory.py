@@ -3,7 +3,7 @@ Factory para crear procesos desde plantillas configurables
 """
 import logging
 from datetime import date, timedelta
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from django.utils import timezone
 
 from apps.tasks.models import (
@@ -14,6 +14,7 @@ from apps.tasks.models import (
     ProcessTask
 )
 from apps.companies.models import Company
+from .process_builder import ProcessBuilder, ProcessStep
 
 logger = logging.getLogger(__name__)
 
@@ -72,8 +73,8 @@ class ProcessTemplateFactory:
             if config_overrides:
                 config_data.update(config_overrides)
 
-            # Crear proceso
-            process = Process.objects.create(
+            # Armar proceso
+            process = Process(
                 name=template.name,
                 description=template.description,
                 process_type=template.process_type,
@@ -90,12 +91,14 @@ class ProcessTemplateFactory:
                 recurrence_config=template.default_recurrence_config or {}
             )
 
-            # Crear tareas del proceso
-            ProcessTemplateFactory._create_tasks_from_template(
+            # Armar tareas del proceso y guardar todo en lote
+            builder = ProcessBuilder()
+            builder.add(process, ProcessTemplateFactory._build_tasks_from_template(
                 process=process,
                 template=template,
                 start_date=start_date
-            )
+            ))
+            builder.save()
 
             # Incrementar contador de uso
             template.increment_usage()
@@ -108,21 +111,25 @@ class ProcessTemplateFactory:
             return None
 
     @staticmethod
-    def _create_tasks_from_template(
+    def _build_tasks_from_template(
         process: Process,
         template: ProcessTemplateConfig,
         start_date: date
-    ):
+    ) -> List[ProcessStep]:
         """
-        Crea tareas desde ProcessTemplateTask
+        Arma (sin guardar) las tareas desde ProcessTemplateTask
 
         Args:
             process: Proceso padre
             template: Template con las tareas
             start_date: Fecha de inicio del proceso
+
+        Returns:
+            Lista de (tarea, vínculo ProcessTask) para ProcessBuilder
         """
         template_tasks = template.template_tasks.all().order_by('execution_order')
 
+        steps = []
         for template_task in template_tasks:
             # Calcular fecha límite
             due_date = ProcessTemplateFactory._calculate_task_due_date(
@@ -130,8 +137,8 @@ class ProcessTemplateFactory:
                 offset_days=template_task.due_date_offset_days
             )
 
-            # Crear tarea
-            task = Task.objects.create(
+            # Armar tarea
+            task = Task(
                 title=template_task.task_title,
                 description=template_task.task_description,
                 task_type=template_task.task_type,
@@ -147,9 +154,7 @@ class ProcessTemplateFactory:
             )
 
             # Vincular tarea con proceso
-            ProcessTask.objects.create(
-                process=process,
-                task=task,
+            steps.append((task, ProcessTask(
                 execution_order=template_task.execution_order,
                 is_optional=template_task.is_optional,
                 can_run_parallel=template_task.can_run_parallel,
@@ -159,7 +164,9 @@ class ProcessTemplateFactory:
                     'template_task_id': template_task.id,
                     'template_id': template.id
                 }
-            )
+            )))
+
+        return steps
 
     @staticmethod
     def _calculate_task_due_date(start_date: date, offset_days: int = None) -> Optional[date]:
@@ -0,0 +1,36 @@
+from django.db import transaction
+from django.db.models.signals import post_init, post_save
+from django.dispatch import receiver
+
+from .models import Task
+from .process_engine import notify_task_status_changed
+
+
+@receiver(post_init, sender=Task)
+def remember_task_status(sender, instance, **kwargs):
+    """Guarda el estado con que se cargó la tarea, para detectar cambios al guardar"""
+    # Solo con el campo cargado: no forzar consultas en instancias con campos diferidos
+    if 'status' in instance.__dict__:
+        instance._loaded_status = instance.status
+
+
+@receiver(post_save, sender=Task)
+def advance_processes_on_status_change(sender, instance, created, raw=False, **kwargs):
+    """
+    Signal que se ejecuta cuando se guarda una tarea.
+    Si cambió su estado (start_task, complete_task, fail_task, admin, API...)
+    avanza los procesos que la contienen al confirmar la transacción.
+
+    Las escrituras en lote del motor (bulk_update) no emiten esta señal, así
+    que avanzar un proceso no vuelve a dispararlo.
+    """
+    if raw:
+        return
+
+    previous = None if created else getattr(instance, '_loaded_status', None)
+    instance._loaded_status = instance.status
+    if instance.status == previous or (created and instance.status == 'pending'):
+        return
+
+    task_id = instance.id
+    transaction.on_commit(lambda: notify_task_status_changed(task_id))
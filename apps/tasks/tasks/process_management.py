@@ -12,6 +12,7 @@ from apps.taxpayers.models import TaxPayer
 from apps.companies.models import Company
 from apps.tasks.models import Process, ProcessTemplate, Task
 from apps.tasks.process_engine import ProcessTemplateFactory
+from apps.tasks.services.process_builder import ProcessBuilder
 
 logger = logging.getLogger(__name__)
 
@@ -266,8 +267,6 @@ def ensure_company_processes(self, company_rut, company_dv, assigned_to=None, fo
         dict: Resultado con procesos creados y errores
     """
     try:
-        from .process_engine import ProcessTemplateFactory
-        from .models import ProcessTemplate
         from datetime import datetime
         from dateutil.relativedelta import relativedelta
 
@@ -506,7 +505,8 @@ def ensure_all_companies_have_processes(dry_run=False):
                             'rut': rut_parts[0],
                             'dv': rut_parts[1],
                             'name': company.business_name or company.display_name,
-                            'assigned_to': company.email or 'system@fizko.cl'
+                            'assigned_to': company.email or 'system@fizko.cl',
+                            'company': company
                         })
 
             logger.info(f"📊 Encontradas {len(companies)} empresas activas en la base de datos")
@@ -541,6 +541,9 @@ def ensure_all_companies_have_processes(dry_run=False):
             'timestamp': timezone.now().isoformat()
         }
 
+        # F29 del mes actual de todas las empresas que no tienen uno activo, en lote
+        bulk_f29 = {} if dry_run else _create_missing_f29_processes(companies_data)
+
         for company_data in companies_data:
             try:
                 company_rut = company_data['rut']
@@ -599,15 +602,17 @@ def ensure_all_companies_have_processes(dry_run=False):
                         force_create=False
                     )
 
-                    if result['created_count'] > 0:
+                    created = bulk_f29.get((company_rut, company_dv), []) + result.get('created_processes', [])
+
+                    if created:
                         results['companies_with_new_processes'] += 1
-                        results['total_processes_created'] += result['created_count']
+                        results['total_processes_created'] += len(created)
 
                     results['companies_details'].append({
                         'company': f"{company_rut}-{company_dv}",
                         'name': company_data.get('name', 'Unknown'),
-                        'created': result.get('created_processes', []),
-                        'count': result['created_count'],
+                        'created': created,
+                        'count': len(created),
                         'errors': result.get('errors', [])
                     })
 
@@ -645,4 +650,71 @@ def ensure_all_companies_have_processes(dry_run=False):
             'success': False,
             'error': str(e),
             'timestamp': timezone.now().isoformat()
-        }
\ No newline at end of file
+        }
+
+
+def _create_missing_f29_processes(companies_data):
+    """
+    Crea en lote el F29 recurrente del mes actual para las empresas sin un F29
+    activo. Los procesos se arman en memoria y se guardan con ProcessBuilder;
+    ensure_company_processes ya no los crea para esas empresas.
+
+    Args:
+        companies_data: Empresas de ensure_all_companies_have_processes
+
+    Returns:
+        dict: (rut, dv) -> procesos creados, con el formato de ensure_company_processes
+    """
+    from .notifications import send_process_created_notification
+
+    # Sin el modelo Company cada empresa sigue el camino individual
+    companies_data = [data for data in companies_data if data.get('company')]
+    if not companies_data:
+        return {}
+
+    # Sin plantilla activa, ensure_company_processes reporta el error por empresa
+    if not ProcessTemplate.objects.filter(process_type='tax_monthly', is_active=True).exists():
+        return {}
+
+    now = timezone.now()
+    f29_period = f"{now.year}-{now.month:02d}"
+
+    with_active_f29 = set(Process.objects.filter(
+        company_rut__in={data['rut'] for data in companies_data},
+        process_type='tax_monthly',
+        status__in=['active', 'paused']
+    ).values_list('company_rut', 'company_dv'))
+    missing = [data for data in companies_data if (data['rut'], data['dv']) not in with_active_f29]
+
+    created = {}
+    builder = ProcessBuilder()
+    for start in range(0, len(missing), builder.batch_size):
+        for data in missing[start:start + builder.batch_size]:
+            builder.add(*ProcessTemplateFactory.build_monthly_f29_process(
+                data['company'],
+                data['rut'],
+                data['dv'],
+                f29_period,
+                data.get('assigned_to', 'system@fizko.cl'),
+                is_recurring=True
+            ))
+
+        # Si el lote falla se reintenta por proceso; las empresas que fallan
+        # quedan para el camino individual
+        saved, failed = builder.save_isolated()
+        for process, e in failed:
+            logger.error(f"Error creando proceso F29 {f29_period} para {process.company_full_rut}: {str(e)}")
+
+        for process, _ in saved:
+            created[(process.company_rut, process.company_dv)] = [{
+                'type': 'F29',
+                'period': f29_period,
+                'process_id': process.id,
+                'name': process.name
+            }]
+            send_process_created_notification.delay(process.id)
+
+    if created:
+        logger.info(f"✅ Creados en lote {len(created)} procesos F29 recurrentes para período {f29_period}")
+
+    return created
@@ -7,8 +7,10 @@ from datetime import datetime, timedelta
 from celery import shared_task
 from django.utils import timezone
 from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 
-from apps.tasks.models import Process, ProcessExecution, Task
+from apps.tasks.models import Process, ProcessExecution, ProcessTask, Task
+from apps.tasks.services.process_builder import ProcessBuilder
 
 logger = logging.getLogger(__name__)
 
@@ -84,6 +86,9 @@ def generate_monthly_processes_batch():
     """
     Genera procesos mensuales en lote para todas las empresas que los requieran
     Esta tarea se puede ejecutar mensualmente para asegurar que todos los procesos se generen
+
+    Los procesos se arman en memoria y se guardan con ProcessBuilder por lotes
+    de PROCESS_BULK_BATCH_SIZE, en vez de insertar cada tarea por separado
     """
     try:
         # Buscar todos los procesos F29 recurrentes completados
@@ -94,35 +99,53 @@ def generate_monthly_processes_batch():
             status='completed'
         )
 
+        # Siguiente período de cada serie (una sola vez por empresa y período)
+        candidates = {}
+        for process in monthly_processes:
+            next_period_data = process._calculate_next_period_data()
+            if not next_period_data:
+                continue
+            period = next_period_data['config_data'].get('period')
+            candidates.setdefault((process.company_rut, process.company_dv, period), process)
+
+        # Verificar en una sola consulta qué períodos ya se generaron
+        existing = set(Process.objects.filter(
+            process_type='tax_monthly',
+            config_data__period__in={period for _, _, period in candidates}
+        ).values_list('company_rut', 'company_dv', 'config_data__period'))
+        pending = [process for key, process in candidates.items() if key not in existing]
+
         generated_count = 0
         errors = []
-
-        for process in monthly_processes:
-            try:
-                # Verificar si ya se generó el proceso del siguiente mes
-                next_period_data = process._calculate_next_period_data()
-                if not next_period_data:
-                    continue
-
-                existing = Process.objects.filter(
-                    company_rut=process.company_rut,
-                    company_dv=process.company_dv,
-                    process_type=process.process_type,
-                    config_data__period=next_period_data['config_data'].get('period')
-                ).exists()
-
-                if not existing:
-                    # Generar proceso del siguiente mes
-                    next_process = process.generate_next_occurrence()
-                    if next_process:
-                        generated_count += 1
-                        logger.info(f"✅ Generado proceso mensual: {next_process.name}")
-
-            except Exception as e:
-                error_msg = f"Error generando proceso para {process.company_full_rut}: {str(e)}"
+        builder = ProcessBuilder()
+
+        for start in range(0, len(pending), builder.batch_size):
+            chunk = pending[start:start + builder.batch_size]
+            prefetch_related_objects(
+                chunk,
+                Prefetch('process_tasks', queryset=ProcessTask.objects.select_related('task'))
+            )
+
+            for process in chunk:
+                try:
+                    # Armar proceso del siguiente mes
+                    process.build_next_occurrence(builder)
+                except Exception as e:
+                    error_msg = f"Error generando proceso para {process.company_full_rut}: {str(e)}"
+                    errors.append(error_msg)
+                    logger.error(error_msg)
+
+            # Si el lote falla se reintenta por proceso: cada empresa falla por separado
+            created, failed = builder.save_isolated()
+            for next_process, e in failed:
+                error_msg = f"Error guardando proceso para {next_process.company_full_rut}: {str(e)}"
                 errors.append(error_msg)
                 logger.error(error_msg)
 
+            generated_count += len(created)
+            for next_process, _ in created:
+                logger.info(f"✅ Generado proceso mensual: {next_process.name}")
+
         logger.info(f"🗓️ Generación mensual en lote completada: {generated_count} procesos generados")
 
         return {
@@ -0,0 +1,270 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from .models import Process, ProcessTask, Task, TaskDependency
+from .process_engine import ProcessEngine, ProcessGraph
+from .services.process_builder import ProcessBuilder
+
+
+class ProcessFixturesMixin:
+    """
+    Fábrica de procesos con pasos manuales (sin despacho a Celery)
+    """
+
+    def create_process(self, steps, dependencies=()):
+        """
+        Args:
+            steps: (título, execution_order, can_run_parallel, is_optional, execution_conditions)
+            dependencies: (título predecesor, título sucesor, dependency_type)
+
+        Returns:
+            (proceso, {título: tarea})
+        """
+        process = Process.objects.create(
+            name='Proceso de prueba',
+            process_type='custom',
+            company_rut='76543210',
+            company_dv='K',
+            created_by='test@company.com',
+            status='draft'
+        )
+        tasks = {}
+        for title, order, parallel, optional, conditions in steps:
+            tasks[title] = Task.objects.create(title=title, task_type='manual', created_by='test@company.com')
+            ProcessTask.objects.create(
+                process=process,
+                task=tasks[title],
+                execution_order=order,
+                can_run_parallel=parallel,
+                is_optional=optional,
+                execution_conditions=conditions
+            )
+        for predecessor, successor, dependency_type in dependencies:
+            TaskDependency.objects.create(
+                predecessor=tasks[predecessor],
+                successor=tasks[successor],
+                dependency_type=dependency_type
+            )
+        return process, tasks
+
+    def statuses(self, tasks):
+        return {title: Task.objects.get(id=task.id).status for title, task in tasks.items()}
+
+
+class ProcessGraphTestCase(ProcessFixturesMixin, TestCase):
+    """
+    Tests del grafo de pasos de un proceso
+    """
+
+    def predecessor_titles(self, process):
+        graph = ProcessGraph.load(process)
+        return {
+            graph.steps[step_id].task.title: sorted(graph.steps[other].task.title for other in predecessors)
+            for step_id, predecessors in graph.predecessors.items()
+        }
+
+    def test_stages_follow_execution_order(self):
+        """Los pasos paralelos del mismo orden forman una etapa; uno no paralelo abre otra"""
+        process, _ = self.create_process([
+            ('A', 1, False, False, {}),
+            ('B', 2, False, False, {}),
+            ('C', 2, True, False, {}),
+            ('D', 2, False, False, {}),
+            ('E', 3, False, False, {}),
+        ])
+
+        self.assertEqual(self.predecessor_titles(process), {
+            'B': ['A'],
+            'C': ['A'],
+            'D': ['B', 'C'],
+            'E': ['D'],
+        })
+
+    def test_dependencies_add_edges_inside_a_stage(self):
+        process, _ = self.create_process(
+            [('X', 1, False, False, {}), ('Y', 1, True, False, {}), ('Z', 1, True, False, {})],
+            [('X', 'Y', 'finish_to_start'), ('X', 'Z', 'start_to_start'), ('Y', 'Z', 'finish_to_finish')]
+        )
+        graph = ProcessGraph.load(process)
+        step_ids = {step.task.title: step.id for step in graph.steps.values()}
+
+        self.assertEqual(graph.predecessors[step_ids['Y']], {step_ids['X']: True})
+        # start_to_start solo exige inicio; *_to_finish no afecta el despacho
+        self.assertEqual(graph.predecessors[step_ids['Z']], {step_ids['X']: False})
+
+
+class ProcessEngineTestCase(ProcessFixturesMixin, TestCase):
+    """
+    Tests del avance de ejecuciones de procesos por eventos de tareas
+    """
+
+    def start(self, process):
+        with self.captureOnCommitCallbacks(execute=True):
+            return ProcessEngine().start_process(process.id)
+
+    def complete(self, task):
+        """Completa la tarea; la señal post_save avanza el proceso al confirmar"""
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.objects.get(id=task.id).complete_task()
+
+    def test_stages_start_in_order(self):
+        process, tasks = self.create_process([
+            ('A', 1, False, False, {}),
+            ('B', 2, False, False, {}),
+            ('C', 2, True, False, {}),
+            ('D', 3, False, False, {}),
+        ])
+
+        self.start(process)
+        self.assertEqual(self.statuses(tasks), {'A': 'in_progress', 'B': 'pending', 'C': 'pending', 'D': 'pending'})
+
+        self.complete(tasks['A'])
+        self.assertEqual(self.statuses(tasks), {'A': 'completed', 'B': 'in_progress', 'C': 'in_progress', 'D': 'pending'})
+
+        # D espera a toda la etapa anterior
+        self.complete(tasks['B'])
+        self.assertEqual(self.statuses(tasks)['D'], 'pending')
+        self.complete(tasks['C'])
+        self.assertEqual(self.statuses(tasks)['D'], 'in_progress')
+
+    def test_finish_to_start_waits_and_start_to_start_does_not(self):
+        process, tasks = self.create_process(
+            [('X', 1, False, False, {}), ('Y', 1, True, False, {}), ('Z', 1, True, False, {})],
+            [('X', 'Y', 'finish_to_start'), ('X', 'Z', 'start_to_start')]
+        )
+
+        self.start(process)
+        self.assertEqual(self.statuses(tasks), {'X': 'in_progress', 'Y': 'pending', 'Z': 'in_progress'})
+
+        self.complete(tasks['X'])
+        self.assertEqual(self.statuses(tasks)['Y'], 'in_progress')
+
+    def test_optional_step_with_unmet_conditions_is_skipped(self):
+        process, tasks = self.create_process([
+            ('A', 1, False, False, {}),
+            ('Opcional', 2, False, True, {'context_variable': {'name': 'con_iva', 'value': True}}),
+            ('B', 3, False, False, {}),
+        ])
+
+        execution = self.start(process)
+        self.complete(tasks['A'])
+
+        self.assertEqual(self.statuses(tasks), {'A': 'completed', 'Opcional': 'cancelled', 'B': 'in_progress'})
+        execution.refresh_from_db()
+        self.assertEqual(execution.status, 'running')
+
+    def test_execution_completes_when_all_steps_are_settled(self):
+        process, tasks = self.create_process([
+            ('A', 1, False, False, {}),
+            ('Opcional', 2, False, True, {'context_variable': {'name': 'con_iva', 'value': True}}),
+        ])
+
+        execution = self.start(process)
+        self.complete(tasks['A'])
+
+        execution.refresh_from_db()
+        process.refresh_from_db()
+        self.assertEqual(execution.status, 'completed')
+        self.assertEqual(execution.completed_steps, 2)
+        self.assertEqual(process.status, 'completed')
+
+    def test_execution_fails_when_required_step_fails(self):
+        process, tasks = self.create_process([('A', 1, False, False, {}), ('B', 2, False, False, {})])
+
+        execution = self.start(process)
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.objects.get(id=tasks['A'].id).fail_task('Error de prueba')
+
+        execution.refresh_from_db()
+        process.refresh_from_db()
+        self.assertEqual(execution.status, 'failed')
+        self.assertIn('A', execution.last_error)
+        self.assertEqual(process.status, 'failed')
+        self.assertEqual(self.statuses(tasks)['B'], 'pending')
+
+    def test_execution_fails_when_required_step_conditions_are_unmet(self):
+        process, tasks = self.create_process([
+            ('A', 1, False, False, {'context_variable': {'name': 'con_iva', 'value': True}}),
+        ])
+
+        execution = self.start(process)
+
+        execution.refresh_from_db()
+        self.assertEqual(execution.status, 'failed')
+        self.assertEqual(self.statuses(tasks)['A'], 'pending')
+
+    def test_only_status_changes_notify_the_engine(self):
+        task = Task.objects.create(title='Suelta', task_type='manual', created_by='test@company.com')
+
+        with mock.patch('apps.tasks.signals.notify_task_status_changed') as notify:
+            with self.captureOnCommitCallbacks(execute=True):
+                task.description = 'Sin cambio de estado'
+                task.save()
+            notify.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                task.start_task()
+            notify.assert_called_once_with(task.id)
+
+
+class ProcessBuilderTestCase(TestCase):
+    """
+    Tests de la instanciación de procesos en lote
+    """
+
+    def build(self, name, titles, created_by='test@company.com'):
+        process = Process(name=name, process_type='custom', company_rut='76543210', company_dv='K', created_by='test@company.com')
+        steps = [
+            (Task(title=title, task_type='manual', created_by=created_by), ProcessTask(execution_order=order))
+            for order, title in enumerate(titles, start=1)
+        ]
+        return process, steps
+
+    def test_save_inserts_processes_tasks_and_links(self):
+        builder = ProcessBuilder(batch_size=2)
+        builder.add(*self.build('Uno', ['A', 'B', 'C']))
+        existing = Process.objects.create(name='Existente', process_type='custom', created_by='test@company.com')
+        builder.add(existing, self.build('Existente', ['D'])[1])
+
+        saved = builder.save()
+
+        self.assertEqual(len(builder), 0)
+        self.assertEqual([process.name for process, _ in saved], ['Uno', 'Existente'])
+        self.assertEqual(Process.objects.count(), 2)
+        self.assertEqual(
+            list(ProcessTask.objects.filter(process=saved[0][0]).order_by('execution_order').values_list('task__title', flat=True)),
+            ['A', 'B', 'C']
+        )
+        self.assertEqual(existing.process_tasks.get().task.title, 'D')
+        # El grafo devuelto encadena los pasos por execution_order
+        graph = saved[0][1]
+        self.assertEqual([step.task.title for step in graph.ready_steps()], ['A'])
+
+    def test_save_is_atomic(self):
+        builder = ProcessBuilder()
+        builder.add(*self.build('Uno', ['A']))
+        builder.add(*self.build('Inválido', ['B'], created_by=None))
+
+        with self.assertRaises(Exception):
+            builder.save()
+
+        self.assertFalse(Process.objects.exists())
+        self.assertFalse(Task.objects.exists())
+
+    def test_save_isolated_retries_each_process_when_the_batch_fails(self):
+        builder = ProcessBuilder()
+        builder.add(*self.build('Uno', ['A', 'B']))
+        invalid, invalid_steps = self.build('Inválido', ['C'], created_by=None)
+        builder.add(invalid, invalid_steps)
+        builder.add(*self.build('Tres', ['D']))
+
+        saved, failed = builder.save_isolated()
+
+        self.assertEqual([process.name for process, _ in saved], ['Uno', 'Tres'])
+        self.assertEqual([process.name for process, _ in failed], ['Inválido'])
+        self.assertIsNone(invalid.pk)
+        self.assertIsNone(invalid_steps[0][0].pk)
+        self.assertEqual(sorted(Process.objects.values_list('name', flat=True)), ['Tres', 'Uno'])
+        self.assertEqual(sorted(Task.objects.values_list('title', flat=True)), ['A', 'B', 'D'])
+        self.assertEqual(ProcessTask.objects.count(), 3)
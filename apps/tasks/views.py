@@ -4,7 +4,7 @@ from rest_framework.decorators import action
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
 from django.utils import timezone
-from django.db.models import Q, Count
+from django.db.models import Q
 from django.contrib.auth import get_user_model
 
 from .models import (
@@ -21,6 +21,13 @@ from apps.core.permissions import IsCompanyMember
 
 User = get_user_model()
 
+# Relaciones que TaskSerializer anida, para serializar listados sin N+1
+TASK_SERIALIZER_PREFETCH = (
+    'comments', 'attachments', 'logs',
+    'predecessor_dependencies__predecessor', 'predecessor_dependencies__successor',
+    'successor_dependencies__predecessor', 'successor_dependencies__successor',
+)
+
 
 class TaskCategoryViewSet(viewsets.ModelViewSet):
     """ViewSet para categorías de tareas"""
@@ -132,18 +139,21 @@ class TaskViewSet(viewsets.ModelViewSet):
         user_email = request.user.email
         tasks = Task.objects.filter(assigned_to=user_email)
         
-        # Estadísticas
+        # Estadísticas (una sola consulta agrupada)
+        counts = tasks.grouped_counts('status')
         stats = {
-            'total': tasks.count(),
-            'pending': tasks.filter(status='pending').count(),
-            'in_progress': tasks.filter(status='in_progress').count(),
-            'completed': tasks.filter(status='completed').count(),
-            'failed': tasks.filter(status='failed').count(),
-            'overdue': sum(1 for task in tasks if task.is_overdue),
+            'total': counts['total'],
+            'pending': counts['status'].get('pending', 0),
+            'in_progress': counts['status'].get('in_progress', 0),
+            'completed': counts['status'].get('completed', 0),
+            'failed': counts['status'].get('failed', 0),
+            'overdue': counts['overdue'],
         }
         
         # Tareas recientes (últimas 10)
-        recent_tasks = tasks.order_by('-created_at')[:10]
+        recent_tasks = tasks.select_related('category').prefetch_related(
+            *TASK_SERIALIZER_PREFETCH
+        ).order_by('-created_at')[:10]
         
         return Response({
             'stats': stats,
@@ -158,18 +168,13 @@ class TaskViewSet(viewsets.ModelViewSet):
             Q(assigned_to=user_email) | Q(created_by=user_email)
         )
         
-        # Estadísticas por estado
-        stats_by_status = dict(
-            all_tasks.values('status').annotate(count=Count('id')).values_list('status', 'count')
-        )
-        
-        # Estadísticas por prioridad
-        stats_by_priority = dict(
-            all_tasks.values('priority').annotate(count=Count('id')).values_list('priority', 'count')
-        )
+        # Totales, vencidas y estadísticas por estado y prioridad en una sola consulta
+        counts = all_tasks.grouped_counts('status', 'priority')
         
         # Tareas vencidas
-        overdue_tasks = [task for task in all_tasks if task.is_overdue]
+        overdue_tasks = all_tasks.overdue().select_related('category').prefetch_related(
+            *TASK_SERIALIZER_PREFETCH
+        )[:5]
         
         # Próximas tareas (próximas 7 días)
         from datetime import timedelta
@@ -178,14 +183,16 @@ class TaskViewSet(viewsets.ModelViewSet):
             due_date__isnull=False,
             due_date__lte=next_week,
             status__in=['pending', 'in_progress']
+        ).select_related('category').prefetch_related(
+            *TASK_SERIALIZER_PREFETCH
         ).order_by('due_date')[:5]
         
         return Response({
-            'total_tasks': all_tasks.count(),
-            'stats_by_status': stats_by_status,
-            'stats_by_priority': stats_by_priority,
-            'overdue_count': len(overdue_tasks),
-            'overdue_tasks': TaskSerializer(overdue_tasks[:5], many=True).data,
+            'total_tasks': counts['total'],
+            'stats_by_status': counts['status'],
+            'stats_by_priority': counts['priority'],
+            'overdue_count': counts['overdue'],
+            'overdue_tasks': TaskSerializer(overdue_tasks, many=True).data,
             'upcoming_tasks': TaskSerializer(upcoming_tasks, many=True).data,
         })
 
@@ -280,7 +287,10 @@ class ProcessViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         """Filtrar procesos por usuario y empresa(s)"""
-        queryset = Process.objects.all()
+        # Progreso, cantidad de tareas y paso actual se calculan en la misma consulta
+        queryset = Process.objects.with_progress()
+        if self.action != 'list':
+            queryset = queryset.prefetch_related('process_tasks__task', 'executions')
 
         # Filtrar por company_ids (múltiples) o company_id (único)
         company_ids_param = self.request.query_params.get('company_ids')
@@ -474,34 +484,27 @@ class ProcessViewSet(viewsets.ModelViewSet):
             Q(assigned_to=user_email) | Q(created_by=user_email)
         )
 
-        # Estadísticas por estado
-        stats_by_status = dict(
-            all_processes.values('status').annotate(count=Count('id')).values_list('status', 'count')
-        )
-
-        # Estadísticas por tipo
-        stats_by_type = dict(
-            all_processes.values('process_type').annotate(count=Count('id')).values_list('process_type', 'count')
-        )
+        # Totales, vencidos y estadísticas por estado y tipo en una sola consulta
+        counts = all_processes.grouped_counts('status', 'process_type')
 
         # Procesos vencidos
-        overdue_processes = [p for p in all_processes if p.is_overdue]
+        overdue_processes = all_processes.overdue().with_progress()[:5]
 
         # Próximos procesos (próximos 7 días)
         from datetime import timedelta
         next_week = timezone.now() + timedelta(days=7)
-        upcoming_processes = all_processes.filter(
+        upcoming_processes = all_processes.with_progress().filter(
             due_date__isnull=False,
             due_date__lte=next_week,
             status__in=['draft', 'active', 'paused']
         ).order_by('due_date')[:5]
 
         return Response({
-            'total_processes': all_processes.count(),
-            'stats_by_status': stats_by_status,
-            'stats_by_type': stats_by_type,
-            'overdue_count': len(overdue_processes),
-            'overdue_processes': ProcessSummarySerializer(overdue_processes[:5], many=True).data,
+            'total_processes': counts['total'],
+            'stats_by_status': counts['status'],
+            'stats_by_type': counts['process_type'],
+            'overdue_count': counts['overdue'],
+            'overdue_processes': ProcessSummarySerializer(overdue_processes, many=True).data,
             'upcoming_processes': ProcessSummarySerializer(upcoming_processes, many=True).data,
         })
 
@@ -4,6 +4,7 @@ Celery configuration for Fizko Django backend.
 import os
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_process_init
 from django.conf import settings
 
 # Set Django settings module for Celery
@@ -75,6 +76,13 @@ app.conf.beat_schedule = {
         'options': {'queue': 'sii'},
     },
     
+    # Refresh shared SII sessions before they expire every 10 minutes
+    'refresh-sii-sessions': {
+        'task': 'apps.sii.tasks.sessions.refresh_expiring_sii_sessions_task',
+        'schedule': crontab(minute='*/10'),
+        'options': {'queue': 'sii'},
+    },
+    
     # Process pending documents every 30 minutes
     'process-pending-documents': {
         'task': 'apps.documents.tasks.process_pending_documents',
@@ -127,6 +135,15 @@ def debug_task(self):
 
 
 # Signal handlers
+@worker_process_init.connect
+def prewarm_sii_browsers(**kwargs):
+    """Start headless browsers for SII RPA as soon as each worker process boots"""
+    count = getattr(settings, 'SII_BROWSER_PREWARM', 0)
+    if count and getattr(settings, 'SII_BROWSER_POOL_ENABLED', True):
+        from apps.sii.rpa.driver_pool import get_driver_pool
+        get_driver_pool().prewarm(count)
+
+
 @app.task(bind=True)
 def test_celery_connection(self):
     """Test task to verify Celery is working"""
@@ -37,6 +37,7 @@ DJANGO_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 ]
 
 THIRD_PARTY_APPS = [
@@ -398,6 +399,35 @@ SII_LOGIN_URL = config(
 SII_TIMEOUT = config('SII_TIMEOUT', default=30, cast=int)
 SII_USE_REAL_SERVICE = config('SII_USE_REAL_SERVICE', default=IS_RAILWAY, cast=bool)
 
+# Concurrencia de la sincronización de documentos SII
+SII_SYNC_MAX_WORKERS = config('SII_SYNC_MAX_WORKERS', default=4, cast=int)  # 1 = secuencial
+SII_SYNC_CHUNK_SIZE = config('SII_SYNC_CHUNK_SIZE', default=1000, cast=int)  # documentos por lote procesado en la BD
+SII_RATE_LIMIT_PER_SECOND = config('SII_RATE_LIMIT_PER_SECOND', default=5, cast=float)  # por host, 0 = sin límite
+SII_COOKIE_VALIDATION_TTL = config('SII_COOKIE_VALIDATION_TTL', default=300, cast=int)  # segundos, 0 = validar siempre
+SII_SESSION_TTL = config('SII_SESSION_TTL', default=8 * 3600, cast=int)  # segundos de vida de una sesión SII
+SII_SESSION_REFRESH_MARGIN = config('SII_SESSION_REFRESH_MARGIN', default=1800, cast=int)  # renovar sesiones que expiran antes de esto
+SII_SESSION_ACTIVITY_WINDOW = config('SII_SESSION_ACTIVITY_WINDOW', default=3600, cast=int)  # solo se renuevan sesiones usadas en estos segundos
+SII_LOGIN_LOCK_TIMEOUT = config('SII_LOGIN_LOCK_TIMEOUT', default=180, cast=int)  # segundos que un worker retiene el lock de login
+SII_LOGIN_WAIT_TIMEOUT = config('SII_LOGIN_WAIT_TIMEOUT', default=150, cast=int)  # segundos que otros workers esperan ese login
+
+# Pool de navegadores Chrome por proceso worker
+SII_BROWSER_POOL_ENABLED = config('SII_BROWSER_POOL_ENABLED', default=True, cast=bool)
+SII_BROWSER_POOL_SIZE = config('SII_BROWSER_POOL_SIZE', default=2, cast=int)  # Chrome simultáneos por proceso
+SII_BROWSER_MAX_USES = config('SII_BROWSER_MAX_USES', default=20, cast=int)  # préstamos antes de reciclar
+SII_BROWSER_IDLE_TIMEOUT = config('SII_BROWSER_IDLE_TIMEOUT', default=600, cast=int)  # segundos ocioso antes de cerrar
+SII_BROWSER_ACQUIRE_TIMEOUT = config('SII_BROWSER_ACQUIRE_TIMEOUT', default=120, cast=int)  # espera por un cupo libre
+SII_BROWSER_MAX_LEASE = config('SII_BROWSER_MAX_LEASE', default=0, cast=int)  # segundos tras los que se advierte de un préstamo largo (0 = sin aviso)
+SII_BROWSER_PREWARM = config('SII_BROWSER_PREWARM', default=0, cast=int)  # navegadores a iniciar al arrancar el worker
+SII_F29_BATCH_MAX_BROWSERS = config('SII_F29_BATCH_MAX_BROWSERS', default=2, cast=int)  # navegadores en paralelo por lote F29
+SII_F29_BATCH_MIN_FORMS_PER_BROWSER = config('SII_F29_BATCH_MIN_FORMS_PER_BROWSER', default=5, cast=int)  # formularios mínimos para abrir otro navegador
+
+# Documentos
+DOCUMENT_RAW_DATA_COMPRESSION = config('DOCUMENT_RAW_DATA_COMPRESSION', default=False, cast=bool)  # guardar raw_data comprimido con zlib
+DOCUMENT_TYPE_REGISTRY_TTL = config('DOCUMENT_TYPE_REGISTRY_TTL', default=300, cast=int)  # segundos que se reutiliza el registro de DocumentType
+
+# Procesos
+PROCESS_BULK_BATCH_SIZE = config('PROCESS_BULK_BATCH_SIZE', default=500, cast=int)  # filas por INSERT al instanciar procesos en lote
+
 # OpenAI Configuration
 OPENAI_API_KEY = config('OPENAI_API_KEY', default='')
 